@@ -12,6 +12,10 @@ from modules.auth import render_login_page, check_login, get_current_user, logou
 from modules.analytics import render_analytics_dashboard, render_module_analytics
 from modules.report_generator import render_report_generator
 from modules.teaching_design import render_teaching_design
+from modules.diagnostics import render_query_diagnostics
+from modules.db import run_query, run_parallel
+from modules.query_cache import clear_query_cache
+from modules.timestamps import format_times
 
 # 页面配置
 st.set_page_config(
@@ -590,7 +594,7 @@ def main():
         
         # 第二行：管理功能
         st.markdown("##### ⚙️ 管理功能")
-        nav_cols_2 = st.columns([1, 1, 1, 1, 1])
+        nav_cols_2 = st.columns([1, 1, 1, 1, 1, 1])
         with nav_cols_2[0]:
             if st.button("📄 学习报告", key="nav_report_t", use_container_width=True):
                 st.session_state.current_page = 'report_generator'
@@ -604,6 +608,9 @@ def main():
             if st.button("⚙️ 系统设置", key="nav_settings_t", use_container_width=True):
                 st.session_state.current_page = 'system_settings'
         with nav_cols_2[4]:
+            if st.button("🩺 查询诊断", key="nav_diagnostics_t", use_container_width=True):
+                st.session_state.current_page = 'query_diagnostics'
+        with nav_cols_2[5]:
             if st.button("🚪 退出登录", key="nav_logout_t", use_container_width=True):
                 logout()
                 st.rerun()
@@ -657,6 +664,8 @@ def main():
                 render_data_management()
             elif current == 'system_settings':
                 render_system_settings()
+            elif current == 'query_diagnostics':
+                render_query_diagnostics()
             else:
                 render_teacher_dashboard()
         else:
@@ -680,12 +689,15 @@ def main():
             st.session_state.current_page = 'home'
             st.rerun()
 
+# 教师端概览展示的四个模块
+DASHBOARD_MODULES = ["案例库", "知识图谱", "知识点掌握评估", "课中互动"]
+
 def render_teacher_dashboard():
     """渲染教师端数据概览首页"""
     try:
         import pandas as pd
         import plotly.express as px
-        from modules.analytics import get_activity_summary, get_daily_activity_trend
+        from modules.analytics import get_activity_summary, get_daily_activity_trend, get_student_leaderboard
         from modules.auth import check_neo4j_available, get_all_students, get_all_modules_statistics, get_single_module_statistics, get_neo4j_driver, get_neo4j_driver
         
         # 顶部标题和刷新按钮
@@ -702,7 +714,7 @@ def render_teacher_dashboard():
             """, unsafe_allow_html=True)
         with header_col2:
             if st.button("🔄 刷新数据", key="refresh_teacher_data", use_container_width=True):
-                st.cache_data.clear()
+                clear_query_cache()
                 st.rerun()
         
         # 显示加载进度
@@ -710,9 +722,23 @@ def render_teacher_dashboard():
             # 获取真实数据
             has_neo4j = check_neo4j_available()
             
-            # 获取数据
-            summary = get_activity_summary()
-            all_students = get_all_students() if has_neo4j else []
+            # 各区块的数据互不依赖，并行获取
+            tasks = {'summary': get_activity_summary}
+            if has_neo4j:
+                tasks['all_students'] = get_all_students
+                tasks['all_module_stats'] = get_all_modules_statistics
+                tasks['trend_data'] = lambda: get_daily_activity_trend(7)
+                tasks['leaderboard'] = get_student_leaderboard
+                for module in DASHBOARD_MODULES:
+                    tasks['module:' + module] = lambda module=module: get_single_module_statistics(module)
+            dashboard_data = run_parallel("app.dashboard", tasks, return_exceptions=True)
+            
+            # 排行榜的异常在排行榜区域单独提示，其余数据异常按加载失败处理
+            for key in ('summary', 'all_students'):
+                if isinstance(dashboard_data.get(key), Exception):
+                    raise dashboard_data[key]
+            summary = dashboard_data['summary']
+            all_students = dashboard_data.get('all_students', [])
     except Exception as e:
         st.error(f"⚠️ 教师端数据加载失败：{str(e)}")
         st.info("💡 提示：系统正在使用默认配置运行。如需连接数据库，请配置 config/settings.py 文件。")
@@ -776,6 +802,13 @@ def render_teacher_dashboard():
                 st.write(f"- 读取secrets失败: {e}")
                 st.write("- 将使用 config/settings.py 中的配置")
         
+        from modules.activity_writer import get_writer_stats
+        writer_stats = get_writer_stats()
+        st.write("**活动写入队列:**")
+        st.write(f"- 队列深度: {writer_stats['queue_depth']}，已写入: {writer_stats['written']}，丢弃: {writer_stats['dropped']}")
+        st.write(f"- 本地暂存: {writer_stats['spool_depth']} 条待回放（累计暂存 {writer_stats['spooled']}，已回放 {writer_stats['replayed']}，死信 {writer_stats['dead_letter_depth']}），降级中: {writer_stats['degraded']}，维护暂停: {writer_stats['paused']}")
+        st.write(f"- 刷新耗时: 最近 {writer_stats['last_flush_ms']}ms / 平均 {writer_stats['avg_flush_ms']}ms / 最大 {writer_stats['max_flush_ms']}ms")
+
         st.write("**查询结果:**")
         st.write(f"- summary数据: {summary}")
         st.write(f"- 学生列表长度: {len(all_students)}")
@@ -814,14 +847,15 @@ def render_teacher_dashboard():
     # 四个模块数据概览 - 调用真实数据
     st.markdown("### 📈 各模块学习数据")
     
-    modules = ["案例库", "知识图谱", "知识点掌握评估", "课中互动"]
+    modules = DASHBOARD_MODULES
     module_cols = st.columns(4)
     
     # 一次性获取所有模块统计（性能优化）
     all_module_stats = {}
     if has_neo4j:
-        from modules.auth import get_all_modules_statistics
-        all_module_stats = get_all_modules_statistics()
+        all_module_stats = dashboard_data['all_module_stats']
+        if isinstance(all_module_stats, Exception):
+            raise all_module_stats
         
         # 调试：显示模块统计信息
         with st.expander("🔍 模块统计调试信息", expanded=False):
@@ -862,7 +896,9 @@ def render_teacher_dashboard():
     with chart_col1:
         st.markdown("### 📊 近7天学习趋势")
         if has_neo4j:
-            trend_data = get_daily_activity_trend(7)
+            trend_data = dashboard_data['trend_data']
+            if isinstance(trend_data, Exception):
+                raise trend_data
             if trend_data:
                 df = pd.DataFrame(trend_data)
                 fig = px.line(df, x="date", y="count", markers=True, 
@@ -880,7 +916,9 @@ def render_teacher_dashboard():
             # 统计每个模块的访问学生数
             module_data = []
             for module in modules:
-                stats = get_single_module_statistics(module)
+                stats = dashboard_data['module:' + module]
+                if isinstance(stats, Exception):
+                    raise stats
                 module_data.append({
                     "模块": module,
                     "学生数": stats.get('unique_students', 0)
@@ -905,32 +943,24 @@ def render_teacher_dashboard():
     if has_neo4j:
         # 从数据库获取学生活动统计
         try:
-            driver = get_neo4j_driver()
-            with driver.session() as session:
-                result = session.run("""
-                    MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
-                    RETURN s.student_id as student_id, 
-                           s.name as name,
-                           count(a) as activity_count,
-                           count(DISTINCT date(a.timestamp)) as active_days
-                    ORDER BY activity_count DESC
-                    LIMIT 10
-                """)
-                
-                leaderboard = []
-                for i, record in enumerate(result):
-                    leaderboard.append({
-                        "排名": "🥇" if i == 0 else ("🥈" if i == 1 else ("🥉" if i == 2 else str(i+1))),
-                        "学号": record['student_id'],
-                        "姓名": record['name'] if record['name'] else "未设置",
-                        "学习记录数": record['activity_count'],
-                        "活跃天数": record['active_days']
-                    })
-                
-                if leaderboard:
-                    st.dataframe(pd.DataFrame(leaderboard), use_container_width=True, hide_index=True)
-                else:
-                    st.info("暂无学生学习数据")
+            result = dashboard_data['leaderboard']
+            if isinstance(result, Exception):
+                raise result
+            
+            leaderboard = []
+            for i, record in enumerate(result):
+                leaderboard.append({
+                    "排名": "🥇" if i == 0 else ("🥈" if i == 1 else ("🥉" if i == 2 else str(i+1))),
+                    "学号": record['student_id'],
+                    "姓名": record['name'] if record['name'] else "未设置",
+                    "学习记录数": record['activity_count'],
+                    "活跃天数": record['active_days']
+                })
+            
+            if leaderboard:
+                st.dataframe(pd.DataFrame(leaderboard), use_container_width=True, hide_index=True)
+            else:
+                st.info("暂无学生学习数据")
         except Exception as e:
             st.error(f"获取排行榜数据失败: {e}")
     else:
@@ -940,6 +970,7 @@ def render_home_page(user):
     """渲染首页"""
     # 导入必要的函数
     from modules.auth import check_neo4j_available, get_neo4j_driver
+    from modules.knowledge_graph import count_knowledge_points
     
     # 获取真实统计数据
     from data.cases import get_cases
@@ -952,10 +983,7 @@ def render_home_page(user):
     knowledge_points = 0
     if check_neo4j_available():
         try:
-            driver = get_neo4j_driver()
-            with driver.session() as session:
-                result = session.run("MATCH (k:glx_Knowledge) RETURN count(k) as count")
-                knowledge_points = result.single()['count']
+            knowledge_points = count_knowledge_points()
         except:
             knowledge_points = 0
     
@@ -1075,7 +1103,9 @@ def render_home_page(user):
 
 def render_module_analytics(module_name):
     """渲染教师端模块数据分析页面"""
-    from modules.auth import check_neo4j_available, get_all_students, get_student_activities, get_single_module_statistics, get_neo4j_driver
+    from modules.auth import check_neo4j_available, get_all_students, get_single_module_statistics, get_neo4j_driver
+    from modules.analytics import render_activity_pager, get_module_leaderboard
+    from modules.activity_snapshot import get_student_metrics
     from modules.ability_recommender import ABILITY_ID_TO_NAME
     import pandas as pd
     
@@ -1144,30 +1174,14 @@ def render_module_analytics(module_name):
             selected_student_id = student_options[selected_display]
             
             if selected_student_id:
-                # 获取该学生在该模块的活动记录
-                activities = get_student_activities(selected_student_id, module_name)
+                # 该学生在该模块的记录数和活跃天数（活动快照上向量化计算）
+                summary = get_student_metrics(selected_student_id, module_name)
             
                 st.markdown(f"#### 学生 {selected_student_id} 的{module_name}学习数据")
                 
                 # 统计数据
-                total_activities = len(activities)
-                # 从timestamp提取日期
-                unique_dates = set()
-                for a in activities:
-                    if 'timestamp' in a and a['timestamp']:
-                        try:
-                            # timestamp格式可能是: 
-                            # "2025-01-01 10:30:00" 或 "2026-01-05T16:40:02.977000000+00:00"
-                            ts = str(a['timestamp'])
-                            # 先尝试用T分割（ISO格式），再尝试用空格分割
-                            if 'T' in ts:
-                                date_str = ts.split('T')[0]
-                            else:
-                                date_str = ts.split(' ')[0]
-                            unique_dates.add(date_str)
-                        except:
-                            pass
-                unique_days = len(unique_dates)
+                total_activities = summary['total']
+                unique_days = summary['active_days']
                 
                 col1, col2, col3 = st.columns(3)
                 with col1:
@@ -1179,10 +1193,12 @@ def render_module_analytics(module_name):
                     st.metric("日均记录数", str(avg_per_day))
                 
                 # 学习记录列表
-                if activities:
-                    st.markdown("##### 📋 最近学习记录 (最新10条)")
+                if total_activities:
+                    st.markdown("##### 📋 学习记录（按时间倒序分页）")
+                    activities = render_activity_pager(f"module_{module_name}", selected_student_id, module_name)
                     records = []
-                    for act in activities[:10]:
+                    times = format_times([act.get('timestamp') for act in activities])
+                    for act, time in zip(activities, times):
                         # 将ID格式转换为中文名称
                         content = convert_id_to_name(act.get('content_name', '-'))
                         details = act.get('details', '-')
@@ -1198,7 +1214,7 @@ def render_module_analytics(module_name):
                         activity_type = activity_type.replace('病例', '案例')
                         
                         records.append({
-                            "时间": act['timestamp'],
+                            "时间": time,
                             "活动类型": activity_type,
                             "内容": content,
                             "详情": details
@@ -1249,29 +1265,20 @@ def render_module_analytics(module_name):
         # 显示活跃学生排行
         st.markdown(f"#### 🏆 {module_name}学习排行榜")
         try:
-            driver = get_neo4j_driver()
-            with driver.session() as session:
-                result = session.run("""
-                    MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
-                    WHERE COALESCE(a.module_name, a.module) = $module_name
-                    RETURN s.student_id as student_id, 
-                           count(a) as activity_count
-                    ORDER BY activity_count DESC
-                    LIMIT 10
-                """, module_name=module_name)
-                
-                ranking = []
-                for i, record in enumerate(result):
-                    ranking.append({
-                        "排名": "🥇" if i == 0 else ("🥈" if i == 1 else ("🥉" if i == 2 else str(i+1))),
-                        "学号": record['student_id'],
-                        "学习记录数": record['activity_count']
-                    })
-                
-                if ranking:
-                    st.dataframe(pd.DataFrame(ranking), use_container_width=True, hide_index=True)
-                else:
-                    st.info(f"暂无{module_name}学习数据")
+            result = get_module_leaderboard(module_name, 10)
+            
+            ranking = []
+            for i, record in enumerate(result):
+                ranking.append({
+                    "排名": "🥇" if i == 0 else ("🥈" if i == 1 else ("🥉" if i == 2 else str(i+1))),
+                    "学号": record['student_id'],
+                    "学习记录数": record['activity_count']
+                })
+            
+            if ranking:
+                st.dataframe(pd.DataFrame(ranking), use_container_width=True, hide_index=True)
+            else:
+                st.info(f"暂无{module_name}学习数据")
         except Exception as e:
             st.error(f"获取排行数据失败: {e}")
         
@@ -1307,29 +1314,20 @@ def render_module_analytics(module_name):
         st.markdown("##### 🏆 学习排行榜 (Top 10)")
         if has_neo4j:
             try:
-                driver = get_neo4j_driver()
-                with driver.session() as session:
-                    result = session.run("""
-                        MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
-                        WHERE COALESCE(a.module_name, a.module) = $module_name
-                        RETURN s.student_id as student_id, 
-                               count(a) as activity_count
-                        ORDER BY activity_count DESC
-                        LIMIT 10
-                    """, module_name=module_name)
-                    
-                    leaderboard = []
-                    for i, record in enumerate(result):
-                        leaderboard.append({
-                            "排名": "🥇" if i == 0 else ("🥈" if i == 1 else ("🥉" if i == 2 else str(i+1))),
-                            "学号": record['student_id'],
-                            "学习记录数": record['activity_count']
-                        })
-                    
-                    if leaderboard:
-                        st.dataframe(pd.DataFrame(leaderboard), use_container_width=True, hide_index=True)
-                    else:
-                        st.info(f"暂无{module_name}学习数据")
+                result = get_module_leaderboard(module_name, 10)
+                
+                leaderboard = []
+                for i, record in enumerate(result):
+                    leaderboard.append({
+                        "排名": "🥇" if i == 0 else ("🥈" if i == 1 else ("🥉" if i == 2 else str(i+1))),
+                        "学号": record['student_id'],
+                        "学习记录数": record['activity_count']
+                    })
+                
+                if leaderboard:
+                    st.dataframe(pd.DataFrame(leaderboard), use_container_width=True, hide_index=True)
+                else:
+                    st.info(f"暂无{module_name}学习数据")
             except Exception as e:
                 st.error(f"获取排行榜失败: {e}")
         else:
@@ -1340,6 +1338,16 @@ def render_data_management():
     import pandas as pd
     import io
     from modules.auth import get_neo4j_driver, check_neo4j_available
+    from modules.analytics import render_activity_pager
+    from modules.schema_migrations import module_field, type_field
+    from modules.rollups import counters_ready
+    from modules.db import run_single
+    from modules.exports import (
+        export_csv, preview_csv, open_export, ACTIVITY_COLUMNS, MODULE_ACTIVITY_COLUMNS
+    )
+    import os
+    import re
+    import time
     
     st.markdown("""
     <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
@@ -1351,12 +1359,52 @@ def render_data_management():
     </div>
     """, unsafe_allow_html=True)
     
+    from modules.storage import neo4j_enabled
+    if not neo4j_enabled():
+        st.info("ℹ️ 当前使用嵌入式存储，数据导出、批量删除、归档和数据修复需要 Neo4j 数据库")
+        return
+    
     has_neo4j = check_neo4j_available()
     
     if not has_neo4j:
         st.warning("⚠️ 数据库连接不可用，无法进行数据管理操作")
         return
     
+    # 批量删除任务进度（分批在后台执行，可取消）
+    from modules.deletion import (
+        dry_run_counts, start_deletion_job, cancel_deletion_job, get_deletion_status
+    )
+    
+    def describe_cold(counts):
+        cold = counts.get('cold_activities', 0)
+        return f"（另有冷归档中 {cold} 条）" if cold else ""
+    
+    deletion = get_deletion_status()
+    deletion_running = deletion['running']
+    if deletion_running:
+        deleted = deletion['deleted']
+        st.progress(deletion['progress'], text=f"⏳ 正在{deletion['label']}：已删除 {deleted.get('mfx_Student', 0)} 名学生、"
+                                              f"{deleted.get('mfx_Activity', 0)} 条学习记录")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("🔄 刷新进度", key="refresh_deletion", use_container_width=True):
+                st.rerun()
+        with col2:
+            if st.button("⏹️ 取消删除", key="cancel_deletion", use_container_width=True,
+                         disabled=deletion['cancel_requested']):
+                cancel_deletion_job()
+                st.rerun()
+    elif deletion['finished_at'] and time.time() - deletion['finished_at'] < 300:
+        deleted = deletion['deleted']
+        summary = f"{deleted.get('mfx_Student', 0)} 名学生、{deleted.get('mfx_Activity', 0)} 条学习记录"
+        if deletion['error']:
+            st.error(f"{deletion['label']}失败: {deletion['error']}（已删除 {summary}，可重新执行）")
+        elif deletion['cancelled']:
+            st.warning(f"{deletion['label']}已取消，已删除 {summary}"
+                       + ("；按天汇总需要重建（数据修复）" if deletion['scope'] != 'students' else ""))
+        else:
+            st.success(f"✅ {deletion['label']}完成：已删除 {summary}，相关缓存已失效")
+    
     # 创建选项卡
     tab1, tab2, tab3, tab4 = st.tabs(["📥 数据导出", "👥 学生管理", "📝 活动记录管理", "🔧 数据修复"])
     
@@ -1372,9 +1420,19 @@ def render_data_management():
             if st.button("📥 导出所有学生数据", key="export_students", use_container_width=True):
                 with st.spinner("正在导出学生数据..."):
                     try:
-                        driver = get_neo4j_driver()
-                        with driver.session() as session:
-                            result = session.run("""
+                        if counters_ready():
+                            result = run_query("app.export.students", """
+                                MATCH (s:mfx_Student)
+                                RETURN s.student_id as 学号, 
+                                       s.name as 姓名,
+                                       COALESCE(s.login_count, 0) as 登录次数,
+                                       COALESCE(s.activity_count, 0) as 学习记录数,
+                                       toString(s.last_login) as 最后登录时间,
+                                       toString(s.last_activity_at) as 最后学习时间
+                                ORDER BY s.student_id
+                            """)
+                        else:
+                            result = run_query("app.export.students.scan", """
                                 MATCH (s:mfx_Student)
                                 OPTIONAL MATCH (s)-[r:PERFORMED]->(a:mfx_Activity)
                                 WITH s, count(r) as activity_count, 
@@ -1387,7 +1445,7 @@ def render_data_management():
                                        toString(last_activity) as 最后学习时间
                                 ORDER BY s.student_id
                             """)
-                            data = [dict(record) for record in result]
+                        data = [dict(record) for record in result]
                         
                         if data:
                             df = pd.DataFrame(data)
@@ -1409,41 +1467,52 @@ def render_data_management():
         with col2:
             st.markdown("#### 📝 学习记录导出")
             if st.button("📥 导出所有学习记录", key="export_activities", use_container_width=True):
-                with st.spinner("正在导出学习记录..."):
-                    try:
-                        driver = get_neo4j_driver()
-                        with driver.session() as session:
-                            result = session.run("""
-                                MATCH (s:mfx_Student)-[r:PERFORMED]->(a:mfx_Activity)
-                                RETURN s.student_id as 学号,
-                                       s.name as 姓名,
-                                       COALESCE(a.module_name, a.module) as 学习模块,
-                                       COALESCE(a.activity_type, a.type) as 活动类型,
-                                       a.content_name as 内容名称,
-                                       toString(a.timestamp) as 学习时间,
-                                       a.details as 详情
-                                ORDER BY a.timestamp DESC
-                            """)
-                            data = [dict(record) for record in result]
-                        
-                        if data:
-                            df = pd.DataFrame(data)
-                            csv = df.to_csv(index=False, encoding='utf-8-sig')
-                            st.download_button(
-                                label="⬇️ 下载学习记录 CSV",
-                                data=csv,
-                                file_name=f"学习记录_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                                mime="text/csv",
-                                key="download_activities"
-                            )
-                            st.success(f"✅ 成功导出 {len(data)} 条学习记录")
-                            st.dataframe(df.head(100), use_container_width=True)
-                            if len(data) > 100:
-                                st.info(f"预览显示前100条，共{len(data)}条记录")
-                        else:
-                            st.warning("没有找到学习记录")
-                    except Exception as e:
-                        st.error(f"导出失败: {e}")
+                try:
+                    # 流式写入临时文件，内存占用与记录数无关（见 exports）
+                    total = run_single("app.export.activities.count", """
+                        MATCH (:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+                        RETURN count(a) as count
+                    """)['count']
+                    progress = st.progress(0.0, text="正在导出学习记录...")
+                    path, rows = export_csv("app.export.activities", f"""
+                        MATCH (s:mfx_Student)-[r:PERFORMED]->(a:mfx_Activity)
+                        RETURN s.student_id as 学号,
+                               s.name as 姓名,
+                               {module_field('a')} as 学习模块,
+                               {type_field('a')} as 活动类型,
+                               a.content_name as 内容名称,
+                               toString(a.timestamp) as 学习时间,
+                               a.details as 详情
+                        ORDER BY a.timestamp DESC
+                    """, ACTIVITY_COLUMNS, progress=lambda n: progress.progress(
+                        min(n / total, 1.0) if total else 1.0, text=f"正在导出学习记录... {n}/{total}"
+                    ))
+                    progress.empty()
+                    st.session_state.export_activities_file = {
+                        'path': path,
+                        'rows': rows,
+                        'file_name': f"学习记录_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                    }
+                except Exception as e:
+                    st.error(f"导出失败: {e}")
+            
+            export = st.session_state.get('export_activities_file')
+            if export and os.path.exists(export['path']):
+                if export['rows']:
+                    st.download_button(
+                        label="⬇️ 下载学习记录 CSV",
+                        data=open_export(export['path']),
+                        file_name=export['file_name'],
+                        mime="text/csv",
+                        key="download_activities",
+                        on_click="ignore"
+                    )
+                    st.success(f"✅ 成功导出 {export['rows']} 条学习记录")
+                    st.dataframe(preview_csv(export['path'], 100), use_container_width=True)
+                    if export['rows'] > 100:
+                        st.info(f"预览显示前100条，共{export['rows']}条记录")
+                else:
+                    st.warning("没有找到学习记录")
         
         st.markdown("---")
         
@@ -1453,15 +1522,13 @@ def render_data_management():
         # 添加调试工具
         with st.expander("🔧 调试工具：查看数据库中的模块名称", expanded=False):
             try:
-                driver = get_neo4j_driver()
-                with driver.session() as session:
-                    # 查询所有不同的模块名称(兼容新旧字段)
-                    result = session.run("""
-                        MATCH (a:mfx_Activity)
-                        RETURN DISTINCT COALESCE(a.module_name, a.module) as module_name, count(a) as count
-                        ORDER BY count DESC
-                    """)
-                    module_stats = [dict(record) for record in result]
+                # 查询所有不同的模块名称(兼容新旧字段)
+                result = run_query("app.export.module_names", f"""
+                    MATCH (a:mfx_Activity)
+                    RETURN DISTINCT {module_field('a')} as module_name, count(a) as count
+                    ORDER BY count DESC
+                """)
+                module_stats = [dict(record) for record in result]
                 
                 if module_stats:
                     st.write("**数据库中实际存储的模块名称及记录数：**")
@@ -1502,49 +1569,86 @@ def render_data_management():
         # 如果选择了模块，执行导出
         if display_module:
             st.markdown(f"**正在查看：{display_module}**")
-            with st.spinner(f"正在加载{display_module}数据..."):
-                try:
-                    driver = get_neo4j_driver()
-                    with driver.session() as session:
-                        # 添加调试信息
-                        st.write(f"🔍 查询参数: module_name = `{display_module}`")
-                        
-                        result = session.run("""
-                            MATCH (s:mfx_Student)-[r:PERFORMED]->(a:mfx_Activity)
-                            WHERE COALESCE(a.module_name, a.module) = $module
-                            RETURN s.student_id as 学号,
-                                   s.name as 姓名,
-                                   COALESCE(a.activity_type, a.type) as 活动类型,
-                                   a.content_name as 内容名称,
-                                   toString(a.timestamp) as 学习时间,
-                                   a.details as 详情
-                            ORDER BY a.timestamp DESC
-                        """, module=display_module)
-                        data = [dict(record) for record in result]
-                        
-                        st.write(f"🔍 查询结果: {len(data)}条记录")
+            try:
+                # 添加调试信息
+                st.write(f"🔍 查询参数: module_name = `{display_module}`")
+                
+                # 同一模块只在点击按钮时重新导出，其他重新运行复用已导出的文件
+                exports = st.session_state.setdefault('export_module_files', {})
+                export = exports.get(display_module)
+                if selected_module or not export or not os.path.exists(export['path']):
+                    progress = st.progress(0.0, text=f"正在导出{display_module}数据...")
+                    path, rows = export_csv("app.export.module_activities", f"""
+                        MATCH (s:mfx_Student)-[r:PERFORMED]->(a:mfx_Activity)
+                        WHERE {module_field('a')} = $module
+                        RETURN s.student_id as 学号,
+                               s.name as 姓名,
+                               {type_field('a')} as 活动类型,
+                               a.content_name as 内容名称,
+                               toString(a.timestamp) as 学习时间,
+                               a.details as 详情
+                        ORDER BY a.timestamp DESC
+                    """, MODULE_ACTIVITY_COLUMNS, {'module': display_module},
+                        progress=lambda n: progress.progress(1.0, text=f"正在导出{display_module}数据... {n}条"))
+                    progress.empty()
+                    export = exports[display_module] = {
+                        'path': path,
+                        'rows': rows,
+                        'file_name': f"{display_module}_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                    }
+                
+                st.write(f"🔍 查询结果: {export['rows']}条记录")
+                
+                if export['rows']:
+                    st.success(f"✅ {display_module}记录: {export['rows']}条")
+                    st.dataframe(preview_csv(export['path'], 50), use_container_width=True)
+                    if export['rows'] > 50:
+                        st.info(f"预览显示前50条，共{export['rows']}条记录")
                     
-                    if data:
-                        df = pd.DataFrame(data)
-                        csv = df.to_csv(index=False, encoding='utf-8-sig')
-                        
-                        st.success(f"✅ {display_module}记录: {len(data)}条")
-                        st.dataframe(df.head(50), use_container_width=True)
-                        if len(data) > 50:
-                            st.info(f"预览显示前50条，共{len(data)}条记录")
-                        
-                        st.download_button(
-                            label=f"⬇️ 下载{display_module}数据 CSV",
-                            data=csv,
-                            file_name=f"{display_module}_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                            mime="text/csv",
-                            key=f"download_{display_module}_csv"
-                        )
-                    else:
-                        st.warning(f"{display_module}暂无数据")
-                        st.info("💡 提示：展开上方的'调试工具'查看数据库中实际的模块名称")
-                except Exception as e:
-                    st.error(f"导出失败: {e}")
+                    st.download_button(
+                        label=f"⬇️ 下载{display_module}数据 CSV",
+                        data=open_export(export['path']),
+                        file_name=export['file_name'],
+                        mime="text/csv",
+                        key=f"download_{display_module}_csv",
+                        on_click="ignore"
+                    )
+                else:
+                    st.warning(f"{display_module}暂无数据")
+                    st.info("💡 提示：展开上方的'调试工具'查看数据库中实际的模块名称")
+            except Exception as e:
+                st.error(f"导出失败: {e}")
+        
+        st.markdown("---")
+        
+        # 列式归档（Parquet，按日期和模块分区，增量追加）
+        st.markdown("#### 🗄️ 列式归档（Parquet）")
+        from modules.archive import HAS_PYARROW, run_archive, get_archive_status
+        from config.settings import ARCHIVE_DIR
+        if not HAS_PYARROW:
+            st.info("💡 安装 pyarrow 后可将学习记录、学生和课堂回复归档为 Parquet 文件")
+        else:
+            status = get_archive_status()
+            watermark = status['watermark']
+            if watermark:
+                activities = status['datasets']['activities']
+                st.caption(f"上次归档: {watermark['updated_at']}，活动分区 {activities['days']} 天 / "
+                           f"{activities['files']} 个文件（{activities['size_mb']}MB），目录 {ARCHIVE_DIR}")
+            else:
+                st.caption(f"尚未归档，目录 {ARCHIVE_DIR}")
+            archive_col1, archive_col2 = st.columns(2)
+            with archive_col1:
+                incremental = st.button("🗄️ 增量归档", key="archive_incremental", use_container_width=True)
+            with archive_col2:
+                full = st.button("♻️ 全量重建归档", key="archive_full", use_container_width=True)
+            if incremental or full:
+                with st.spinner("正在归档..."):
+                    try:
+                        result = run_archive(full=full)
+                        st.success(f"✅ 归档完成：活动 {result['activities']} 条，回复 {result['replies']} 条，"
+                                   f"学生 {result['students']} 名，耗时 {result['elapsed_s']}s")
+                    except Exception as e:
+                        st.error(f"归档失败: {e}")
     
     # ===== 学生管理 =====
     with tab2:
@@ -1555,9 +1659,16 @@ def render_data_management():
         with col1:
             st.markdown("#### 📋 学生列表")
             try:
-                driver = get_neo4j_driver()
-                with driver.session() as session:
-                    result = session.run("""
+                if counters_ready():
+                    result = run_query("app.students.list", """
+                        MATCH (s:mfx_Student)
+                        RETURN s.student_id as student_id,
+                               s.name as name,
+                               COALESCE(s.activity_count, 0) as activity_count
+                        ORDER BY s.student_id
+                    """)
+                else:
+                    result = run_query("app.students.list.scan", """
                         MATCH (s:mfx_Student)
                         OPTIONAL MATCH (s)-[r:PERFORMED]->(a:mfx_Activity)
                         WITH s, count(r) as activity_count
@@ -1566,7 +1677,7 @@ def render_data_management():
                                activity_count
                         ORDER BY s.student_id
                     """)
-                    students = [dict(record) for record in result]
+                students = [dict(record) for record in result]
                 
                 if students:
                     df = pd.DataFrame(students)
@@ -1582,40 +1693,25 @@ def render_data_management():
             st.markdown("#### 🗑️ 删除学生")
             st.warning("⚠️ 删除操作不可恢复，请谨慎操作！")
             
-            student_id_to_delete = st.text_input("输入要删除的学号", key="delete_student_id")
+            student_ids_text = st.text_area("输入要删除的学号（多个学号用逗号、空格或换行分隔）", key="delete_student_id")
+            student_ids_to_delete = [sid for sid in re.split(r'[\s,，]+', student_ids_text) if sid]
             
-            if st.button("🗑️ 删除该学生", key="delete_student_btn", type="primary"):
-                if student_id_to_delete:
-                    if st.session_state.get('confirm_delete') != student_id_to_delete:
-                        st.session_state.confirm_delete = student_id_to_delete
-                        st.warning(f"⚠️ 确认删除学号为 {student_id_to_delete} 的学生？再次点击确认删除。")
-                    else:
+            if st.button("🗑️ 删除学生", key="delete_student_btn", type="primary", disabled=deletion_running):
+                if student_ids_to_delete:
+                    if st.session_state.get('confirm_delete') != student_ids_to_delete:
+                        # 第一次点击只统计将要删除的数据
                         try:
-                            driver = get_neo4j_driver()
-                            with driver.session() as session:
-                                # 先删除关联的活动记录
-                                session.run("""
-                                    MATCH (s:mfx_Student {student_id: $student_id})-[r:PERFORMED]->(a:mfx_Activity)
-                                    DELETE r, a
-                                """, student_id=student_id_to_delete)
-                                
-                                # 再删除学生节点
-                                result = session.run("""
-                                    MATCH (s:mfx_Student {student_id: $student_id})
-                                    DELETE s
-                                    RETURN count(s) as deleted_count
-                                """, student_id=student_id_to_delete)
-                                
-                                deleted = result.single()['deleted_count']
-                                
-                            if deleted > 0:
-                                st.success(f"✅ 已删除学号 {student_id_to_delete} 及其所有学习记录")
-                                st.session_state.confirm_delete = None
-                                st.rerun()
-                            else:
-                                st.error(f"未找到学号为 {student_id_to_delete} 的学生")
+                            counts = dry_run_counts('students', student_ids_to_delete)
+                            st.session_state.confirm_delete = student_ids_to_delete
+                            st.warning(f"⚠️ 将删除 {counts['mfx_Student']} 名学生、{counts['mfx_Activity']} 条学习记录"
+                                       f"{describe_cold(counts)}，再次点击确认删除。")
                         except Exception as e:
-                            st.error(f"删除失败: {e}")
+                            st.error(f"统计失败: {e}")
+                    else:
+                        # 分批删除在后台执行，进度显示在页面顶部
+                        start_deletion_job('students', student_ids_to_delete)
+                        st.session_state.confirm_delete = None
+                        st.rerun()
                 else:
                     st.warning("请输入学号")
     
@@ -1628,173 +1724,151 @@ def render_data_management():
         with col1:
             st.markdown("#### 📊 最近活动记录")
             try:
-                driver = get_neo4j_driver()
-                with driver.session() as session:
-                    result = session.run("""
-                        MATCH (s:mfx_Student)-[r:PERFORMED]->(a:mfx_Activity)
-                        RETURN s.student_id as 学号,
-                               a.module_name as 模块,
-                               a.activity_type as 类型,
-                               toString(a.timestamp) as 时间
-                        ORDER BY a.timestamp DESC
-                        LIMIT 100
-                    """)
-                    activities = [dict(record) for record in result]
+                activities = render_activity_pager("data_management")
                 
                 if activities:
-                    df = pd.DataFrame(activities)
+                    df = pd.DataFrame([{
+                        '学号': a['student_id'],
+                        '模块': a['module'],
+                        '类型': a['activity_type'],
+                    } for a in activities])
+                    df['时间'] = format_times([a['timestamp'] for a in activities])
                     st.dataframe(df, use_container_width=True)
-                    st.info(f"显示最近100条记录")
                 else:
                     st.warning("暂无活动记录")
             except Exception as e:
                 st.error(f"获取活动记录失败: {e}")
+            
+            # 活动保留：早于保留期的活动移到冷归档，汇总不受影响
+            st.markdown("#### 🧊 活动保留与冷归档")
+            from modules.retention import HAS_PYARROW as HAS_COLD_ARCHIVE, evict_activities, get_retention_status
+            retention = get_retention_status()
+            if retention['cold_files']:
+                st.caption(f"冷归档 {retention['cold_range'][0]} ~ {retention['cold_range'][1]}，"
+                           f"{retention['cold_days']} 天 / {retention['cold_files']} 个文件（{retention['cold_size_mb']}MB）")
+            if retention['retention_days']:
+                st.caption(f"自动保留最近 {retention['retention_days']} 天，上次执行: {retention['last_run_at'] or '-'}")
+            if not HAS_COLD_ARCHIVE:
+                st.info("💡 安装 pyarrow 后可将早期活动移到冷归档")
+            else:
+                keep_days = st.number_input("保留最近天数", min_value=1, value=retention['retention_days'] or 180,
+                                            key="retention_days")
+                if st.button(f"🧊 将 {keep_days} 天前的活动移到冷归档", key="evict_activities"):
+                    with st.spinner("正在移出..."):
+                        try:
+                            moved = evict_activities(days=int(keep_days))
+                            st.success(f"✅ 已移出 {moved} 条活动到冷归档")
+                        except Exception as e:
+                            st.error(f"移出失败: {e}")
         
         with col2:
             st.markdown("#### 🗑️ 清除数据")
             st.error("⚠️ 危险操作区域")
             
-            if st.button("🗑️ 清除所有学习记录", key="clear_all_activities", type="primary"):
+            if st.button("🗑️ 清除所有学习记录", key="clear_all_activities", type="primary", disabled=deletion_running):
                 if st.session_state.get('confirm_clear_activities') != True:
-                    st.session_state.confirm_clear_activities = True
-                    st.warning("⚠️ 将删除所有学习记录（不删除学生）！再次点击确认。")
-                else:
                     try:
-                        driver = get_neo4j_driver()
-                        with driver.session() as session:
-                            # 先统计数量
-                            count_result = session.run("MATCH (a:mfx_Activity) RETURN count(a) as count")
-                            deleted = count_result.single()['count']
-                            # 再删除
-                            session.run("MATCH (a:mfx_Activity) DETACH DELETE a")
-                        
-                        # 清除相关缓存
-                        st.cache_data.clear()
-                        
-                        st.success(f"✅ 已清除 {deleted} 条学习记录，缓存已清空")
-                        st.session_state.confirm_clear_activities = False
-                        st.rerun()
+                        counts = dry_run_counts('activities')
+                        st.session_state.confirm_clear_activities = True
+                        st.warning(f"⚠️ 将删除 {counts['mfx_Activity']} 条学习记录{describe_cold(counts)}"
+                                   f"（不删除学生）！再次点击确认。")
                     except Exception as e:
-                        st.error(f"清除失败: {e}")
+                        st.error(f"统计失败: {e}")
+                else:
+                    start_deletion_job('activities')
+                    st.session_state.confirm_clear_activities = False
+                    st.rerun()
             
             st.markdown("<br>", unsafe_allow_html=True)
             
-            if st.button("🗑️ 清除所有数据", key="clear_all_data", type="primary"):
+            if st.button("🗑️ 清除所有数据", key="clear_all_data", type="primary", disabled=deletion_running):
                 if st.session_state.get('confirm_clear_all') != True:
-                    st.session_state.confirm_clear_all = True
-                    st.error("⚠️ 将删除所有学生和学习记录！再次点击确认。")
-                else:
                     try:
-                        driver = get_neo4j_driver()
-                        with driver.session() as session:
-                            # 先统计数量
-                            count_result = session.run("""
-                                MATCH (n)
-                                WHERE n:mfx_Student OR n:mfx_Activity
-                                RETURN count(n) as count
-                            """)
-                            deleted = count_result.single()['count']
-                            # 再删除
-                            session.run("""
-                                MATCH (n)
-                                WHERE n:mfx_Student OR n:mfx_Activity
-                                DETACH DELETE n
-                            """)
-                        
-                        # 清除相关缓存
-                        st.cache_data.clear()
-                        
-                        st.success(f"✅ 已清除 {deleted} 个节点（学生和活动记录），缓存已清空")
-                        st.session_state.confirm_clear_all = False
-                        st.rerun()
+                        counts = dry_run_counts('all')
+                        st.session_state.confirm_clear_all = True
+                        st.error(f"⚠️ 将删除 {counts['mfx_Student']} 名学生和 {counts['mfx_Activity']} 条学习记录"
+                                 f"{describe_cold(counts)}！再次点击确认。")
                     except Exception as e:
-                        st.error(f"清除失败: {e}")
+                        st.error(f"统计失败: {e}")
+                else:
+                    start_deletion_job('all')
+                    st.session_state.confirm_clear_all = False
+                    st.rerun()
     
     # ===== 数据修复 =====
     with tab4:
         st.markdown("### 🔧 数据修复工具")
         st.warning("⚠️ 此工具用于修复历史数据中的字段不一致问题")
         
+        from modules.schema_migrations import (
+            count_legacy_activities, start_field_normalization, get_normalization_status
+        )
+        
         st.markdown("#### 问题诊断")
         
         try:
-            driver = get_neo4j_driver()
-            with driver.session() as session:
-                # 检查 module 字段（旧字段名）
-                result1 = session.run("""
-                    MATCH (a:mfx_Activity)
-                    WHERE a.module IS NOT NULL
-                    RETURN count(a) as count
-                """)
-                old_field_count = result1.single()['count']
-                
-                # 检查 module_name 字段（新字段名）
-                result2 = session.run("""
-                    MATCH (a:mfx_Activity)
-                    WHERE a.module_name IS NOT NULL
-                    RETURN count(a) as count
-                """)
-                new_field_count = result2.single()['count']
-                
-                # 检查 activity_type 字段
-                result3 = session.run("""
-                    MATCH (a:mfx_Activity)
-                    WHERE a.activity_type IS NOT NULL
-                    RETURN count(a) as count
-                """)
-                activity_type_count = result3.single()['count']
-                
-                # 检查 type 字段（旧字段名）
-                result4 = session.run("""
-                    MATCH (a:mfx_Activity)
-                    WHERE a.type IS NOT NULL
-                    RETURN count(a) as count
-                """)
-                old_type_count = result4.single()['count']
-                
-                st.write("**字段使用情况：**")
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.metric("使用旧字段 'module' 的记录", old_field_count)
-                    st.metric("使用新字段 'module_name' 的记录", new_field_count)
-                with col2:
-                    st.metric("使用旧字段 'type' 的记录", old_type_count)
-                    st.metric("使用新字段 'activity_type' 的记录", activity_type_count)
+            # 仍使用旧字段名 module / type 的记录
+            legacy_count = count_legacy_activities()
+            
+            status = get_normalization_status()
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("使用旧字段 'module' / 'type' 的记录", legacy_count)
+            with col2:
+                st.metric("查询兼容旧字段", "是" if status['legacy_fields_enabled'] else "否")
+            
+            if status['running']:
+                st.info(f"⏳ 正在后台分批修复：已修复 {status['updated']} 条，剩余 {status['remaining']} 条")
+                if st.button("🔄 刷新进度", key="refresh_fix_fields"):
+                    st.rerun()
+            elif status['error']:
+                st.error(f"上次修复中断: {status['error']}（可重新执行，已修复的记录不会重复处理）")
+            
+            if legacy_count > 0 and not status['running']:
+                st.error(f"⚠️ 发现 {legacy_count} 条使用旧字段名的记录，需要修复")
                 
-                if old_field_count > 0 or old_type_count > 0:
-                    st.error(f"⚠️ 发现 {old_field_count} 条使用旧字段名的记录，需要修复")
-                    
-                    if st.button("🔧 修复历史数据字段名", key="fix_fields", type="primary"):
-                        with st.spinner("正在修复数据..."):
-                            try:
-                                # 修复 module -> module_name
-                                session.run("""
-                                    MATCH (a:mfx_Activity)
-                                    WHERE a.module IS NOT NULL
-                                    SET a.module_name = a.module
-                                    REMOVE a.module
-                                """)
-                                
-                                # 修复 type -> activity_type
-                                session.run("""
-                                    MATCH (a:mfx_Activity)
-                                    WHERE a.type IS NOT NULL
-                                    SET a.activity_type = a.type
-                                    REMOVE a.type
-                                """)
-                                
-                                st.success("✅ 字段名修复完成！")
-                                st.info("💡 页面将在3秒后刷新...")
-                                import time
-                                time.sleep(3)
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"修复失败: {e}")
-                else:
+                if st.button("🔧 修复历史数据字段名", key="fix_fields", type="primary"):
+                    # 分批事务在后台执行，页面不必等待
+                    start_field_normalization()
+                    st.success("✅ 已开始后台修复，完成后查询会自动切换为索引字段")
+                    st.rerun()
+            elif legacy_count == 0 and not status['running']:
+                if status['normalized']:
                     st.success("✅ 所有数据字段名正确，无需修复")
+                else:
+                    st.success("✅ 所有数据字段名正确")
+                    if st.button("✅ 标记归一化完成", key="mark_fields_normalized"):
+                        start_field_normalization()
+                        st.rerun()
                     
         except Exception as e:
             st.error(f"诊断失败: {e}")
+        
+        st.markdown("---")
+        st.markdown("#### 按天汇总与学生计数")
+        
+        from modules.rollups import rollups_ready, sketches_ready, backfill_rollups
+        if rollups_ready():
+            st.success("✅ 按天汇总已启用，概况卡片和趋势图读取汇总节点")
+        else:
+            st.warning("⚠️ 按天汇总尚未回填，概况卡片和趋势图仍直接统计活动日志")
+        if counters_ready():
+            st.success("✅ 学生计数已启用，学生列表、排行榜和导出读取学生节点上的计数")
+        else:
+            st.warning("⚠️ 学生计数尚未回填，学生列表、排行榜和导出仍逐个统计活动")
+        if sketches_ready():
+            st.success("✅ 去重计数草图已启用，各模块学生数和近7天活跃学生数由草图合并估算")
+        else:
+            st.warning("⚠️ 去重计数草图尚未回填，各模块学生数和活跃学生数仍逐条去重统计")
+        
+        if st.button("🔁 重建汇总与计数", key="backfill_rollups"):
+            with st.spinner("正在根据历史活动重建汇总..."):
+                try:
+                    daily_count, student_count = backfill_rollups()
+                    st.success(f"✅ 重建完成：模块日汇总 {daily_count} 个，学生日汇总 {student_count} 个")
+                except Exception as e:
+                    st.error(f"重建失败: {e}")
 
 def render_system_settings():
     """渲染系统设置页面（仅教师可用）"""
@@ -0,0 +1,177 @@
+"""
+存储后端基准测试
+用同一组负载比较各存储后端（见 modules/storage）的写入吞吐、查询延迟和并发读取吞吐：
+
+    python benchmark_storage.py                          # 只测嵌入式后端（临时数据库文件）
+    python benchmark_storage.py --backends sqlite,neo4j  # 同时测 Neo4j（需要可用的数据库）
+    python benchmark_storage.py --students 200 --activities 20000 --reads 100 --threads 8
+
+默认关闭查询结果缓存，测的是后端本身；--with-cache 时保留缓存。
+Neo4j 的测试数据使用 bench_ 前缀的学号，测试结束后删除。
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+MODULES = ["案例库", "知识图谱", "知识点掌握评估", "课中互动"]
+ACTIVITY_TYPES = ["查看案例", "保存案例", "查看知识点", "回答问题", "AI推荐"]
+
+def build_workload(students, activities, days):
+    """生成登录和活动事件（时间均匀分布在最近 days 天内）"""
+    from modules.activity_writer import build_activity_event, build_login_event
+
+    rng = random.Random(42)
+    student_ids = [f"bench_{i:05d}" for i in range(students)]
+    now = datetime.now(timezone.utc)
+    events = [build_login_event(sid, f"测试学生{i}") for i, sid in enumerate(student_ids)]
+    for _ in range(activities):
+        event = build_activity_event(
+            rng.choice(student_ids), rng.choice(ACTIVITY_TYPES), rng.choice(MODULES),
+            content_id=f"c{rng.randint(1, 200)}", content_name=f"内容{rng.randint(1, 200)}"
+        )
+        event['timestamp'] = (now - timedelta(seconds=rng.uniform(0, days * 86400))).isoformat()
+        events.append(event)
+    return student_ids, events
+
+def summarize(samples_ms):
+    ordered = sorted(samples_ms)
+    return {
+        'n': len(ordered),
+        'p50': statistics.median(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max': ordered[-1],
+    }
+
+def read_operations(store, student_ids, question_id):
+    """各读接口的调用（每次调用随机取参数）"""
+    rng = random.Random(7)
+
+    def pages():
+        # 连续翻 5 页
+        cursor = None
+        for _ in range(5):
+            _, cursor = store.get_student_activities_page(rng.choice(student_ids), None, cursor)
+            if cursor is None:
+                break
+
+    return {
+        'get_all_students': lambda: store.get_all_students(),
+        'get_student_activities_page x5': pages,
+        'get_student_activity_summary': lambda: store.get_student_activity_summary(rng.choice(student_ids)),
+        'get_module_statistics': lambda: store.get_module_statistics(),
+        'get_single_module_statistics': lambda: store.get_single_module_statistics(rng.choice(MODULES)),
+        'get_activity_summary': lambda: store.get_activity_summary(),
+        'get_daily_activity_trend': lambda: store.get_daily_activity_trend(30),
+        'get_active_question': lambda: store.get_active_question(),
+        'get_recent_replies': lambda: store.get_recent_replies(question_id, 20),
+    }
+
+def run_backend(name, args):
+    from modules.activity_writer import build_reply_event
+    from modules.storage import get_store
+
+    store = get_store(name)
+    temp_dir = None
+    if name == 'sqlite':
+        temp_dir = tempfile.mkdtemp(prefix="storage_bench_")
+        store.use_database(os.path.join(temp_dir, "bench.db"))
+
+    student_ids, events = build_workload(args.students, args.activities, args.days)
+    results = {'backend': name, 'reads': {}}
+    try:
+        # 写入吞吐：按批写入
+        start = time.perf_counter()
+        for i in range(0, len(events), args.batch_size):
+            store.write_events(events[i:i + args.batch_size])
+        elapsed = time.perf_counter() - start
+        results['write_events_per_s'] = len(events) / elapsed if elapsed > 0 else 0.0
+        print(f"  写入 {len(events)} 条事件: {elapsed:.2f}s（{results['write_events_per_s']:.0f} 条/秒）")
+
+        question_id = store.create_question("基准测试问题")
+        store.write_events([build_reply_event(question_id, f"测试学生{i}", "回复内容" * 5) for i in range(50)])
+
+        # 单线程延迟
+        operations = read_operations(store, student_ids, question_id)
+        for op_name, op in operations.items():
+            samples = []
+            for _ in range(args.reads):
+                t = time.perf_counter()
+                op()
+                samples.append((time.perf_counter() - t) * 1000)
+            results['reads'][op_name] = summarize(samples)
+
+        # 并发读取吞吐：多线程混合调用各读接口
+        ops = list(operations.values())
+        deadline = time.perf_counter() + args.duration
+
+        def worker(seed):
+            rng = random.Random(seed)
+            count = 0
+            while time.perf_counter() < deadline:
+                rng.choice(ops)()
+                count += 1
+            return count
+
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            total = sum(executor.map(worker, range(args.threads)))
+        results['read_ops_per_s'] = total / args.duration
+    finally:
+        if name == 'neo4j':
+            for sid in student_ids:
+                store.delete_student_data(sid)
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    return results
+
+def print_report(all_results):
+    backends = [r['backend'] for r in all_results]
+    print("\n" + "=" * 80)
+    print("写入吞吐（条/秒）: " + "  ".join(f"{r['backend']}={r['write_events_per_s']:.0f}" for r in all_results))
+    print("并发读取吞吐（次/秒）: " + "  ".join(f"{r['backend']}={r['read_ops_per_s']:.0f}" for r in all_results))
+    print("\n查询延迟（毫秒，p50 / p95 / max）")
+    header = f"{'接口':<34}" + "".join(f"{b:>26}" for b in backends)
+    print(header)
+    print("-" * len(header))
+    for op_name in all_results[0]['reads']:
+        row = f"{op_name:<34}"
+        for r in all_results:
+            s = r['reads'][op_name]
+            row += f"{s['p50']:>10.2f} /{s['p95']:>6.2f} /{s['max']:>6.1f}"
+        print(row)
+
+def main():
+    parser = argparse.ArgumentParser(description="存储后端基准测试")
+    parser.add_argument("--backends", default="sqlite", help="逗号分隔的后端名称（sqlite, neo4j）")
+    parser.add_argument("--students", type=int, default=100)
+    parser.add_argument("--activities", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=30, help="活动时间分布的天数")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=50, help="每个读接口的调用次数")
+    parser.add_argument("--threads", type=int, default=4, help="并发读取的线程数")
+    parser.add_argument("--duration", type=float, default=5.0, help="并发读取的持续时间（秒）")
+    parser.add_argument("--with-cache", action="store_true", help="保留查询结果缓存")
+    args = parser.parse_args()
+
+    if not args.with_cache:
+        import modules.query_cache
+        modules.query_cache.QUERY_CACHE_ENABLED = False
+
+    all_results = []
+    for name in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        print(f"\n▶ 后端 {name}")
+        try:
+            all_results.append(run_backend(name, args))
+        except Exception as e:
+            print(f"❌ 后端 {name} 测试失败: {e}")
+    if all_results:
+        print_report(all_results)
+
+if __name__ == "__main__":
+    main()
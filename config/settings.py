@@ -41,6 +41,143 @@ NEO4J_URI = get_secret("NEO4J_URI", "bolt://47.110.83.32:11001")
 NEO4J_USERNAME = get_secret("NEO4J_USERNAME", "neo4j")
 NEO4J_PASSWORD = get_secret("NEO4J_PASSWORD", "mima123456")
 
+# 活动日志异步写入配置
+# log_activity 只入队，后台线程每隔 FLUSH_INTERVAL 毫秒或累计 BATCH_SIZE 条时批量写入
+ACTIVITY_FLUSH_INTERVAL_MS = int(get_secret("ACTIVITY_FLUSH_INTERVAL_MS", 500))
+ACTIVITY_FLUSH_BATCH_SIZE = int(get_secret("ACTIVITY_FLUSH_BATCH_SIZE", 200))
+ACTIVITY_QUEUE_MAXSIZE = int(get_secret("ACTIVITY_QUEUE_MAXSIZE", 10000))
+
+# 本地事件暂存配置
+# Neo4j 写入失败或超出延迟预算时事件落盘到本地日志，冷却期内直接落盘，恢复后批量回放
+ACTIVITY_SPOOL_PATH = get_secret(
+    "ACTIVITY_SPOOL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "spool", "activity_spool.db")
+)
+ACTIVITY_WRITE_BUDGET_MS = int(get_secret("ACTIVITY_WRITE_BUDGET_MS", 2000))
+ACTIVITY_DEGRADED_COOLDOWN_S = int(get_secret("ACTIVITY_DEGRADED_COOLDOWN_S", 30))
+ACTIVITY_SPOOL_REPLAY_BATCH = int(get_secret("ACTIVITY_SPOOL_REPLAY_BATCH", 500))
+# 回放时因数据或语句错误（非连接故障）单独写入仍失败的事件，失败达到次数后移到死信表，不再阻塞回放
+ACTIVITY_SPOOL_MAX_ATTEMPTS = int(get_secret("ACTIVITY_SPOOL_MAX_ATTEMPTS", 5))
+
+# 启动时自动执行结构迁移（约束和索引），也可以用 python -m modules.schema_migrations 手动执行
+SCHEMA_AUTO_MIGRATE = str(get_secret("SCHEMA_AUTO_MIGRATE", "true")).lower() in ("1", "true", "yes")
+
+# 活动字段兼容模式：auto 表示历史字段归一化完成前查询兼容旧字段 module / type，
+# 完成后改用可走索引的 module_name / activity_type；也可强制 true / false
+ACTIVITY_LEGACY_FIELDS = get_secret("ACTIVITY_LEGACY_FIELDS", "auto")
+FIELD_NORMALIZE_BATCH_SIZE = int(get_secret("FIELD_NORMALIZE_BATCH_SIZE", 1000))
+
+# 查询网关配置
+# 超过 SLOW_MS 的查询记入慢查询日志；PROFILE 开启后读查询以 PROFILE 执行并统计 db hits
+QUERY_SLOW_MS = int(get_secret("QUERY_SLOW_MS", 500))
+QUERY_SLOW_LOG_SIZE = int(get_secret("QUERY_SLOW_LOG_SIZE", 200))
+QUERY_PROFILE = str(get_secret("QUERY_PROFILE", "false")).lower() in ("1", "true", "yes")
+
+# 查询结果缓存（进程内所有会话共享，TTL 按查询配置见 modules/query_cache.py，写入时按数据标签失效）
+QUERY_CACHE_ENABLED = str(get_secret("QUERY_CACHE_ENABLED", "true")).lower() in ("1", "true", "yes")
+QUERY_CACHE_MAX_ENTRIES = int(get_secret("QUERY_CACHE_MAX_ENTRIES", 512))
+
+# 相同读查询合并：并发的相同查询（名称+参数）共享一次数据库调用，
+# 完成后 COALESCE_WINDOW 毫秒内到达的相同查询也直接复用结果
+QUERY_COALESCE_WINDOW_MS = int(get_secret("QUERY_COALESCE_WINDOW_MS", 200))
+
+# 页面内互不依赖的读查询并行执行的线程数（应小于 Neo4j 连接池大小）
+QUERY_PARALLEL_WORKERS = int(get_secret("QUERY_PARALLEL_WORKERS", 4))
+
+# 数据库健康监测：连续 FAILURE_THRESHOLD 次连接失败后熔断，熔断期间查询立即失败；
+# 后台每 PROBE_INTERVAL 秒探测一次，熔断后按 BACKOFF_BASE 起指数退避（不超过 BACKOFF_MAX）重新探测；
+# 探测延迟的加权平均超过 DEGRADED_LATENCY 毫秒时视为降级，同步写入改为后台批量写入
+HEALTH_FAILURE_THRESHOLD = int(get_secret("HEALTH_FAILURE_THRESHOLD", 3))
+HEALTH_PROBE_INTERVAL_S = int(get_secret("HEALTH_PROBE_INTERVAL_S", 30))
+HEALTH_BACKOFF_BASE_S = int(get_secret("HEALTH_BACKOFF_BASE_S", 2))
+HEALTH_BACKOFF_MAX_S = int(get_secret("HEALTH_BACKOFF_MAX_S", 60))
+HEALTH_DEGRADED_LATENCY_MS = int(get_secret("HEALTH_DEGRADED_LATENCY_MS", 1000))
+
+# 托管事务：单个事务的超时（秒，0 表示不限制），以及驱动遇到瞬时错误时自动重试的总时长上限（秒）
+# 读事务在 neo4j:// 路由地址下由驱动分发到从节点/只读副本
+QUERY_TIMEOUT_S = int(get_secret("QUERY_TIMEOUT_S", 30))
+QUERY_RETRY_MAX_S = int(get_secret("QUERY_RETRY_MAX_S", 5))
+
+# 读己之写：会话有排队未写出的回复或登录事件时，读取前最多等待写入线程的时间（毫秒）
+CONSISTENCY_WAIT_MS = int(get_secret("CONSISTENCY_WAIT_MS", 500))
+
+# Neo4j 连接池：初始大小、自动扩容上限、连接寿命（秒）和获取连接的超时（秒）
+# 获取连接等待超过 POOL_WAIT_LOG_MS 毫秒时记录查询名称；POOL_AUTO_GROW 开启时并发打满后自动扩容
+NEO4J_POOL_SIZE = int(get_secret("NEO4J_POOL_SIZE", 20))
+NEO4J_POOL_MAX_SIZE = int(get_secret("NEO4J_POOL_MAX_SIZE", 100))
+NEO4J_CONNECTION_LIFETIME_S = int(get_secret("NEO4J_CONNECTION_LIFETIME_S", 300))
+NEO4J_ACQUISITION_TIMEOUT_S = int(get_secret("NEO4J_ACQUISITION_TIMEOUT_S", 15))
+POOL_WAIT_LOG_MS = int(get_secret("POOL_WAIT_LOG_MS", 100))
+POOL_AUTO_GROW = str(get_secret("POOL_AUTO_GROW", "true")).lower() in ("1", "true", "yes")
+
+# 异步查询：页面上互不依赖的多个读查询在事件循环线程上以协程并发执行（需要 neo4j 异步驱动），
+# 关闭后退回线程池并行
+QUERY_ASYNC_ENABLED = str(get_secret("QUERY_ASYNC_ENABLED", "true")).lower() in ("1", "true", "yes")
+
+# 活动记录分页：每页条数（按 (时间, 活动ID) 游标翻页，不随历史记录增长而变慢）
+ACTIVITY_PAGE_SIZE = int(get_secret("ACTIVITY_PAGE_SIZE", 20))
+
+# 存储后端：neo4j（图数据库，默认）或 sqlite（嵌入式，不需要数据库服务，适合小规模部署和 CI）
+# 嵌入式数据保存在 EMBEDDED_DB_PATH；安装了 duckdb 且 EMBEDDED_ANALYTICS_DUCKDB 开启时统计查询由 DuckDB 执行
+STORAGE_BACKEND = str(get_secret("STORAGE_BACKEND", "neo4j")).lower()
+EMBEDDED_DB_PATH = get_secret(
+    "EMBEDDED_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "embedded", "storage.db")
+)
+EMBEDDED_ANALYTICS_DUCKDB = str(get_secret("EMBEDDED_ANALYTICS_DUCKDB", "true")).lower() in ("1", "true", "yes")
+
+# 活动快照：模块/学生统计使用的进程内列式快照，最多每 SNAPSHOT_REFRESH_S 秒增量刷新一次，
+# 增量读取回看 SNAPSHOT_LOOKBACK_S 秒（晚到的事件），每 SNAPSHOT_REBUILD_S 秒全量重建
+SNAPSHOT_REFRESH_S = int(get_secret("SNAPSHOT_REFRESH_S", 5))
+SNAPSHOT_LOOKBACK_S = int(get_secret("SNAPSHOT_LOOKBACK_S", 300))
+SNAPSHOT_REBUILD_S = int(get_secret("SNAPSHOT_REBUILD_S", 900))
+SNAPSHOT_FETCH_BATCH = int(get_secret("SNAPSHOT_FETCH_BATCH", 5000))
+
+# 时间戳归一化：旧版本写入的不带时区的字符串时间（如 "2025-01-01 10:30:00"）按此时区解析，
+# 与 Neo4j datetime() 的默认时区一致；历史数据按北京时间写入的可设为 +08:00
+NAIVE_TIMESTAMP_TZ = get_secret("NAIVE_TIMESTAMP_TZ", "+00:00")
+TIMESTAMP_BACKFILL_BATCH_SIZE = int(get_secret("TIMESTAMP_BACKFILL_BATCH_SIZE", 1000))
+
+# 去重计数草图：每个 (日期, 模块) 的 HyperLogLog 有 2^HLL_PRECISION 个寄存器（12 时误差约 1.6%），
+# 修改后需要重建汇总；各进程的草图缓存每 SKETCH_REFRESH_S 秒增量刷新，每 SKETCH_RELOAD_S 秒全量重读
+HLL_PRECISION = int(get_secret("HLL_PRECISION", 12))
+SKETCH_REFRESH_S = int(get_secret("SKETCH_REFRESH_S", 10))
+SKETCH_RELOAD_S = int(get_secret("SKETCH_RELOAD_S", 900))
+
+# 学习会话：相邻活动间隔超过 SESSION_GAP_S 秒视为新会话，会话最后一条活动按 SESSION_TAIL_S 秒计时长；
+# 会话汇总最多每 SESSION_REFRESH_S 秒增量重算一次
+SESSION_GAP_S = int(get_secret("SESSION_GAP_S", 1800))
+SESSION_TAIL_S = int(get_secret("SESSION_TAIL_S", 60))
+SESSION_REFRESH_S = int(get_secret("SESSION_REFRESH_S", 60))
+
+# 数据导出：驱动每批拉取 EXPORT_FETCH_SIZE 条记录，逐行写入 EXPORT_DIR（为空时使用系统临时目录）下的 CSV 文件，
+# 导出文件超过 EXPORT_TTL_S 秒没有被页面展示（下载窗口）后清理
+EXPORT_FETCH_SIZE = int(get_secret("EXPORT_FETCH_SIZE", 2000))
+EXPORT_DIR = get_secret("EXPORT_DIR", "")
+EXPORT_TTL_S = int(get_secret("EXPORT_TTL_S", 3600))
+
+# 列式归档（需要 pyarrow）：活动和课堂回复按日期（活动另按模块）分区写入 ARCHIVE_DIR 下的 zstd 压缩 Parquet，
+# 每批 ARCHIVE_BATCH_ROWS 条；只归档 ARCHIVE_SETTLE_S 秒之前的数据，给写入队列和本地暂存的晚到事件留出时间
+ARCHIVE_DIR = get_secret(
+    "ARCHIVE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "archive")
+)
+ARCHIVE_BATCH_ROWS = int(get_secret("ARCHIVE_BATCH_ROWS", 50000))
+ARCHIVE_SETTLE_S = int(get_secret("ARCHIVE_SETTLE_S", 600))
+
+# 活动保留：图中只保留最近 ACTIVITY_RETENTION_DAYS 天的活动（0 表示不限），更早的活动每 RETENTION_INTERVAL_S 秒
+# 按 RETENTION_BATCH_SIZE 条一批移到 COLD_ARCHIVE_DIR 下的 Parquet 冷归档（需要 pyarrow）
+ACTIVITY_RETENTION_DAYS = int(get_secret("ACTIVITY_RETENTION_DAYS", 0))
+RETENTION_BATCH_SIZE = int(get_secret("RETENTION_BATCH_SIZE", 5000))
+RETENTION_INTERVAL_S = int(get_secret("RETENTION_INTERVAL_S", 3600))
+COLD_ARCHIVE_DIR = get_secret("COLD_ARCHIVE_DIR", os.path.join(ARCHIVE_DIR, "cold"))
+
+# 批量删除：每轮最多删除 DELETE_CHUNK_SIZE 个节点，按 DELETE_BATCH_SIZE 个一个事务提交；
+# 删除学生时每 DELETE_STUDENT_GROUP 名学生一组
+DELETE_BATCH_SIZE = int(get_secret("DELETE_BATCH_SIZE", 1000))
+DELETE_CHUNK_SIZE = int(get_secret("DELETE_CHUNK_SIZE", 20000))
+DELETE_STUDENT_GROUP = int(get_secret("DELETE_STUDENT_GROUP", 100))
+
 # Elasticsearch配置
 ELASTICSEARCH_CLOUD_ID = get_secret("ELASTICSEARCH_CLOUD_ID", "41ed8f6c58a942fb9aea8f6804841099:dXMtY2VudHJhbDEuZ2NwLmNsb3VkLmVzLmlvOjQ0MyQ1ZTRhNGI5ZGNlZjc0NDI4YjI3MWEzZDg3YzRmZjY2OCRlZjhhODRlYjliNzc0YjM3ODk0NWQ3ZTQ3OWVkOWRkNQ==")
 ELASTICSEARCH_USERNAME = get_secret("ELASTICSEARCH_USERNAME", "elastic")
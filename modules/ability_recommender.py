@@ -26,9 +26,10 @@ def get_ability_name(ability_id):
     """将能力ID转换为中文名称"""
     return ABILITY_ID_TO_NAME.get(ability_id, ability_id)
 def check_neo4j_available():
-    """检查Neo4j是否可用"""
+    """检查Neo4j是否可用（本模块只支持图数据库，嵌入式存储模式下不可用）"""
     from modules.auth import check_neo4j_available as auth_check
-    return auth_check()
+    from modules.storage import neo4j_enabled
+    return neo4j_enabled() and auth_check()
 
 def get_neo4j_driver():
     """获取Neo4j连接（复用auth模块的缓存连接）"""
@@ -62,20 +63,14 @@ def get_all_abilities():
     if not check_neo4j_available():
         return []
     
+    from modules.db import run_query
+    
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            result = session.run("""
-                MATCH (a:mfx_Ability)
-                RETURN a.id as id, a.name as name, a.category as category, a.description as description
-                ORDER BY a.category, a.name
-            """)
-            
-            abilities = [dict(record) for record in result]
-        
-        # 不关闭driver，保持连接池复用
-        return abilities
+        return run_query("ability.get_all_abilities", """
+            MATCH (a:mfx_Ability)
+            RETURN a.id as id, a.name as name, a.category as category, a.description as description
+            ORDER BY a.category, a.name
+        """)
     except Exception:
         return []
 
@@ -86,21 +81,16 @@ def analyze_learning_path(selected_abilities, mastery_levels, abilities_info=Non
     # 尝试从Neo4j获取知识点数据
     if check_neo4j_available():
         try:
-            driver = get_neo4j_driver()
+            from modules.db import run_query
             
             # 获取能力需要的知识点
-            with driver.session() as session:
-                result = session.run("""
+            required_knowledge = run_query("ability.required_knowledge", """
                 MATCH (a:mfx_Ability)-[r:REQUIRES]->(k:mfx_Knowledge)
                 WHERE a.id IN $abilities
                 RETURN k.id as kp_id, k.name as kp_name, k.difficulty as difficulty, 
                        collect(a.name) as required_by, max(r.weight) as max_weight
                 ORDER BY max_weight DESC
             """, abilities=selected_abilities)
-            
-                required_knowledge = [dict(record) for record in result]
-            
-            # 不关闭driver，保持连接池复用
         except Exception:
             required_knowledge = []
     
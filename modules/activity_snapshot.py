@@ -0,0 +1,189 @@
+"""
+活动快照模块
+进程内所有会话共享的活动日志列式快照（pandas DataFrame）：
+module / activity_type 为分类类型，ts 为 int64 毫秒时间戳（UTC）。
+按高水位增量刷新：每次只读取高水位之前 SNAPSHOT_LOOKBACK_S 秒之后的活动
+（兼顾写入队列中晚到的事件），按活动 ID 去重后追加；删除活动后调用 invalidate_snapshot()（推进快照代数，
+刷新期间被失效时丢弃这次读到的结果，不把删除前的快照写回），
+另外每 SNAPSHOT_REBUILD_S 秒全量重建一次，兜底本地暂存回放的历史事件和其他途径的删除。
+模块和学生的统计都在快照上做向量化的过滤和分组聚合，不再逐条遍历活动字典。
+"""
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from config.settings import (
+    SNAPSHOT_REFRESH_S, SNAPSHOT_LOOKBACK_S, SNAPSHOT_REBUILD_S, SNAPSHOT_FETCH_BATCH
+)
+
+COLUMNS = ['id', 'student_id', 'student_name', 'module', 'activity_type', 'content_name', 'ts']
+CATEGORY_COLUMNS = ['module', 'activity_type']
+
+DAY_MS = 86400 * 1000
+
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_frame = None
+_refreshed_at = 0.0
+_built_at = 0.0
+# 快照代数：每次失效加一，刷新开始和写回时不一致说明期间有删除
+_generation = 0
+_stats = {
+    'refreshes': 0,
+    'rebuilds': 0,
+    'appended': 0,
+    'discarded': 0,
+    'last_refresh_ms': 0.0,
+}
+
+def _to_frame(rows):
+    """记录字典列表转为列式 DataFrame"""
+    frame = pd.DataFrame.from_records(rows, columns=COLUMNS)
+    frame['ts'] = frame['ts'].astype('int64')
+    for column in CATEGORY_COLUMNS:
+        frame[column] = frame[column].astype('category')
+    return frame
+
+def _fetch(since_ms=None):
+    """从存储后端分批读取 since_ms 之后（为空时读取全部）的活动"""
+    from modules.storage import get_store
+    store = get_store()
+    rows, after = store.get_activities_since(since_ms=since_ms, limit=SNAPSHOT_FETCH_BATCH)
+    batch = rows
+    while len(batch) >= SNAPSHOT_FETCH_BATCH:
+        batch, after = store.get_activities_since(after=after, limit=SNAPSHOT_FETCH_BATCH)
+        rows.extend(batch)
+    return _to_frame(rows)
+
+def _append(frame, new):
+    """追加新活动（按 ID 去掉回看窗口内已有的记录），分类列合并类别"""
+    if new.empty:
+        return frame
+    overlap = frame['ts'].values >= new['ts'].values.min()
+    if overlap.any():
+        new = new[~new['id'].isin(frame['id'].values[overlap])]
+        if new.empty:
+            return frame
+    combined = pd.concat([frame.drop(columns=CATEGORY_COLUMNS), new.drop(columns=CATEGORY_COLUMNS)],
+                         ignore_index=True)
+    for column in CATEGORY_COLUMNS:
+        combined[column] = union_categoricals([frame[column], new[column]], ignore_order=True)
+    _stats['appended'] += len(new)
+    return combined[COLUMNS]
+
+def _refresh():
+    """全量重建或按高水位增量刷新，期间快照被失效时丢弃结果并返回 False"""
+    global _frame, _refreshed_at, _built_at
+    start = time.perf_counter()
+    now = time.monotonic()
+    with _lock:
+        frame = _frame
+        generation = _generation
+    rebuilt = frame is None or now - _built_at >= SNAPSHOT_REBUILD_S
+    if rebuilt:
+        frame = _fetch()
+    elif not frame.empty:
+        high_water = int(frame['ts'].values.max())
+        frame = _append(frame, _fetch(high_water - SNAPSHOT_LOOKBACK_S * 1000))
+    else:
+        frame = _fetch()
+    with _lock:
+        if _generation != generation:
+            _stats['discarded'] += 1
+            return False
+        _frame = frame
+        _refreshed_at = now
+        if rebuilt:
+            _built_at = now
+            _stats['rebuilds'] += 1
+        _stats['refreshes'] += 1
+        _stats['last_refresh_ms'] = (time.perf_counter() - start) * 1000
+    return True
+
+def get_activity_frame():
+    """
+    当前的活动快照（只读，调用方不要修改）
+    距上次刷新超过 SNAPSHOT_REFRESH_S 秒时先刷新；其他线程正在刷新时直接返回现有快照
+    """
+    if _frame is not None and time.monotonic() - _refreshed_at < SNAPSHOT_REFRESH_S:
+        return _frame
+    if _refresh_lock.acquire(blocking=_frame is None):
+        try:
+            if _frame is None or time.monotonic() - _refreshed_at >= SNAPSHOT_REFRESH_S:
+                # 刷新期间被失效时按失效后的状态重新读取一次
+                if not _refresh():
+                    _refresh()
+        except Exception as e:
+            print(f"[活动快照] 刷新失败: {e}")
+        finally:
+            _refresh_lock.release()
+    return _frame if _frame is not None else _to_frame([])
+
+def invalidate_snapshot():
+    """活动被删除后调用，下次读取时全量重建；正在进行的刷新结果作废"""
+    global _frame, _generation
+    with _lock:
+        _frame = None
+        _generation += 1
+
+def _select(frame, student_id=None, module=None):
+    mask = np.ones(len(frame), dtype=bool)
+    if student_id:
+        mask &= (frame['student_id'] == student_id).values
+    if module:
+        mask &= (frame['module'] == module).values
+    return frame[mask]
+
+def _today_start_ms():
+    now_ms = int(time.time() * 1000)
+    return now_ms - now_ms % DAY_MS
+
+def format_ts(ts):
+    """毫秒时间戳列转为本地显示的字符串列"""
+    return pd.to_datetime(ts, unit='ms', utc=True).dt.strftime('%Y-%m-%d %H:%M')
+
+def get_student_metrics(student_id, module=None):
+    """学生（可限定模块）的记录数、活跃天数（UTC 日期）和学习内容数"""
+    rows = _select(get_activity_frame(), student_id, module)
+    total = len(rows)
+    active_days = int(np.unique(rows['ts'].values // DAY_MS).size)
+    return {
+        'total': total,
+        'active_days': active_days,
+        'content_count': int(rows['content_name'].nunique()),
+        'avg_per_day': round(total / active_days, 1) if active_days else 0,
+    }
+
+def get_module_metrics(module, top_n=5, recent_n=20):
+    """
+    模块的统计：记录数、学生数、今日记录数、行为类型分布、热门内容和最近记录
+    行为类型分布和热门内容为 Series（按次数倒序），最近记录为 DataFrame（时间已格式化）
+    """
+    rows = _select(get_activity_frame(), module=module)
+    type_counts = rows['activity_type'].value_counts()
+    recent = rows.nlargest(recent_n, 'ts')[['student_name', 'activity_type', 'content_name', 'ts']]
+    recent = recent.assign(timestamp=format_ts(recent['ts'])).drop(columns='ts')
+    recent['activity_type'] = recent['activity_type'].astype(object)
+    return {
+        'total_activities': len(rows),
+        'unique_students': int(rows['student_id'].nunique()),
+        'today_count': int((rows['ts'].values >= _today_start_ms()).sum()),
+        'type_counts': type_counts[type_counts > 0],
+        'top_content': rows['content_name'].value_counts().head(top_n),
+        'recent': recent,
+    }
+
+def get_snapshot_stats():
+    """快照大小和刷新统计"""
+    frame = _frame
+    with _lock:
+        stats = dict(_stats)
+    stats['rows'] = len(frame) if frame is not None else 0
+    stats['memory_mb'] = round(float(frame.memory_usage(deep=True).sum()) / 1024 / 1024, 2) if frame is not None else 0.0
+    stats['high_water'] = int(frame['ts'].max()) if frame is not None and not frame.empty else None
+    stats['last_refresh_ms'] = round(stats['last_refresh_ms'], 1)
+    return stats
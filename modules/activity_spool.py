@@ -0,0 +1,142 @@
+"""
+本地事件暂存模块
+Neo4j 不可用或写入超出延迟预算时，把事件追加到本地 SQLite（WAL 模式）日志，
+数据库恢复后由写入线程按批回放，事件 ID 保证回放幂等。
+单独写入仍因数据或语句错误失败的事件累计失败次数，达到上限后移到死信表（dead_letter），不再阻塞回放
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config.settings import ACTIVITY_SPOOL_PATH
+
+_spool_lock = threading.Lock()
+_spool_conn = None
+
+def _get_connection():
+    """获取暂存库连接（进程内复用，首次使用时建表）"""
+    global _spool_conn
+    if _spool_conn is not None:
+        return _spool_conn
+    os.makedirs(os.path.dirname(ACTIVITY_SPOOL_PATH), exist_ok=True)
+    conn = sqlite3.connect(ACTIVITY_SPOOL_PATH, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS spool (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            spooled_at REAL NOT NULL
+        )
+    """)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(spool)")}
+    if 'attempts' not in columns:
+        conn.execute("ALTER TABLE spool ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dead_letter (
+            seq INTEGER PRIMARY KEY,
+            event_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            spooled_at REAL NOT NULL,
+            attempts INTEGER NOT NULL,
+            error TEXT,
+            failed_at REAL NOT NULL
+        )
+    """)
+    _spool_conn = conn
+    return conn
+
+def spool_events(events):
+    """追加事件到本地日志（同一事件 ID 只保存一次），返回写入条数"""
+    if not events:
+        return 0
+    rows = [
+        (e['id'], e['kind'], json.dumps(e, ensure_ascii=False), time.time())
+        for e in events
+    ]
+    with _spool_lock:
+        conn = _get_connection()
+        before = conn.total_changes
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO spool (event_id, kind, payload, spooled_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return conn.total_changes - before
+
+def read_spooled(limit):
+    """按写入顺序读取最早的一批暂存事件，返回 [(seq, event), ...]"""
+    with _spool_lock:
+        conn = _get_connection()
+        rows = conn.execute(
+            "SELECT seq, payload FROM spool ORDER BY seq LIMIT ?", (limit,)
+        ).fetchall()
+    return [(seq, json.loads(payload)) for seq, payload in rows]
+
+def ack_spooled(seqs):
+    """回放成功后删除对应的暂存事件"""
+    if not seqs:
+        return
+    with _spool_lock:
+        conn = _get_connection()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany("DELETE FROM spool WHERE seq = ?", [(s,) for s in seqs])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+def record_failure(seq):
+    """记录一条暂存事件写入失败，返回累计失败次数"""
+    with _spool_lock:
+        conn = _get_connection()
+        conn.execute("UPDATE spool SET attempts = attempts + 1 WHERE seq = ?", (seq,))
+        row = conn.execute("SELECT attempts FROM spool WHERE seq = ?", (seq,)).fetchone()
+    return row[0] if row else 0
+
+def dead_letter(seq, error):
+    """把一条暂存事件移到死信表（保留原始内容和最后的错误，需要时人工处理）"""
+    with _spool_lock:
+        conn = _get_connection()
+        conn.execute("BEGIN")
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO dead_letter
+                    (seq, event_id, kind, payload, spooled_at, attempts, error, failed_at)
+                SELECT seq, event_id, kind, payload, spooled_at, attempts, ?, ? FROM spool WHERE seq = ?
+            """, (str(error)[:2000], time.time(), seq))
+            conn.execute("DELETE FROM spool WHERE seq = ?", (seq,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+def dead_letter_size():
+    """死信表中的事件数"""
+    try:
+        with _spool_lock:
+            conn = _get_connection()
+            return conn.execute("SELECT count(*) FROM dead_letter").fetchone()[0]
+    except Exception:
+        return 0
+
+def spool_size():
+    """当前暂存的事件数"""
+    try:
+        with _spool_lock:
+            conn = _get_connection()
+            return conn.execute("SELECT count(*) FROM spool").fetchone()[0]
+    except Exception:
+        return 0
@@ -0,0 +1,470 @@
+"""
+活动日志异步写入模块
+log_activity 只把事件放入进程内队列，由后台线程批量写入 Neo4j，
+页面渲染不再等待数据库写入的往返时间。
+写入失败、超出延迟预算或数据库熔断时事件转存到本地暂存日志（见 activity_spool），
+数据库恢复后由同一线程批量回放：空闲时整批回放，持续有新事件时每次写入成功后顺带回放一批。
+只有连接类故障（见 health.CONNECTIVITY_ERRORS）进入降级；数据或语句错误不降级，
+回放时整批失败的改为逐条写入，单独仍失败的事件累计次数，达到 ACTIVITY_SPOOL_MAX_ATTEMPTS 后移到死信表。
+入队的事件按顺序编号；需要读己之写的事件（write_now 降级为排队时）登记到会话，
+会话下一次读取前等待它刷出（见 consistency）。普通活动事件不登记，读取路径不等待写入。
+"""
+
+import atexit
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from config.settings import (
+    ACTIVITY_FLUSH_INTERVAL_MS, ACTIVITY_FLUSH_BATCH_SIZE, ACTIVITY_QUEUE_MAXSIZE,
+    ACTIVITY_WRITE_BUDGET_MS, ACTIVITY_DEGRADED_COOLDOWN_S, ACTIVITY_SPOOL_REPLAY_BATCH,
+    ACTIVITY_SPOOL_MAX_ATTEMPTS
+)
+from modules.activity_spool import (
+    spool_events, read_spooled, ack_spooled, spool_size, record_failure, dead_letter, dead_letter_size
+)
+from modules.health import CONNECTIVITY_ERRORS, DatabaseUnavailable, is_available, is_latency_degraded
+from modules.pool import PoolTimeout
+from modules.query_cache import TAG_STUDENT, TAG_ACTIVITY, TAG_REPLY, get_write_seq
+from modules.rollups import ROLLUP_WRITE_CLAUSE
+from modules.sketches import SKETCH_WRITE_QUERY, sketch_updates
+
+# 各类事件的批量写入语句，均以事件 ID 去重，重复回放不会产生重复数据
+# 活动和回复记录写入时间 ingested_ms（数据库时钟），增量归档据此补录晚到的回放事件
+WRITE_QUERIES = {
+    # 学习活动：活动节点 id 即事件 ID，同一事务内更新按天汇总
+    'activity': """
+        UNWIND $events AS e
+        OPTIONAL MATCH (dup:mfx_Activity {id: e.id})
+        WITH e WHERE dup IS NULL
+        MERGE (s:mfx_Student {student_id: e.student_id})
+        CREATE (a:mfx_Activity {
+            id: e.id,
+            activity_type: e.activity_type,
+            module_name: e.module_name,
+            content_id: e.content_id,
+            content_name: e.content_name,
+            details: e.details,
+            timestamp: datetime(e.timestamp),
+            ts_ms: datetime(e.timestamp).epochMillis,
+            ingested_ms: timestamp()
+        })
+        CREATE (s)-[:PERFORMED]->(a)
+    """ + ROLLUP_WRITE_CLAUSE,
+    # 课堂回复：REPLIED 关系的 id 即事件 ID
+    'reply': """
+        UNWIND $events AS e
+        MATCH (q:mfx_Question {id: e.question_id})
+        MERGE (s:mfx_Student {name: e.student_name})
+        MERGE (s)-[r:REPLIED {id: e.id}]->(q)
+        ON CREATE SET r.content = e.content,
+                      r.timestamp = datetime(e.timestamp),
+                      r.length = size(e.content),
+                      r.ingested_ms = timestamp()
+    """,
+    # 学生登录：学生节点保留最近 20 个登录事件 ID 用于去重
+    'login': """
+        UNWIND $events AS e
+        MERGE (s:mfx_Student {student_id: e.student_id})
+        WITH s, e WHERE NOT e.id IN COALESCE(s.login_events, [])
+        SET s.name = e.name,
+            s.last_login = CASE
+                WHEN s.last_login IS NULL OR s.last_login < datetime(e.timestamp)
+                THEN datetime(e.timestamp) ELSE s.last_login END,
+            s.login_count = COALESCE(s.login_count, 0) + 1,
+            s.login_events = (COALESCE(s.login_events, []) + e.id)[-20..]
+    """,
+}
+
+# 各类事件写入后失效的缓存标签
+INVALIDATES = {
+    'activity': (TAG_STUDENT, TAG_ACTIVITY),
+    'reply': (TAG_STUDENT, TAG_REPLY),
+    'login': (TAG_STUDENT,),
+}
+
+_queue = queue.Queue(maxsize=ACTIVITY_QUEUE_MAXSIZE)
+# 队列中的立即刷新标记：等待读己之写的会话放入，写入线程不再等凑满一批
+_FLUSH_NOW = object()
+_writer_thread = None
+_writer_lock = threading.Lock()
+_flush_lock = threading.Lock()
+
+# 入队序号和已处理（写入或转存）的事件数：写入线程按入队顺序处理，已处理数不小于序号即已刷出
+_enqueue_lock = threading.Lock()
+_enqueued_seq = 0
+_processed_cond = threading.Condition()
+_processed_seq = 0
+_processed_bookmarks = None
+# 最近一次成功批量写入完成时的写入序号（不是全局最新序号，避免会话跳过其他人写入后的缓存）
+_processed_write_seq = 0
+
+# 写入降级截止时间：在此之前所有写入直接落盘，避免每次都等待连接超时
+_degraded_until = 0.0
+# 本地暂存中可能还有待回放的事件（启动时按有处理，读到空后清除，转存时重新置位）
+_spool_pending = True
+# 维护任务（回填汇总、重建草图）暂停写入的层数，暂停期间写入线程把事件转存本地
+_pause_lock = threading.Lock()
+_paused = 0
+
+# 写入统计（供教师端调试面板查看）
+_stats_lock = threading.Lock()
+_stats = {
+    'enqueued': 0,
+    'written': 0,
+    'dropped': 0,
+    'spooled': 0,
+    'replayed': 0,
+    'dead_lettered': 0,
+    'flushes': 0,
+    'failed_flushes': 0,
+    'last_flush_ms': 0.0,
+    'max_flush_ms': 0.0,
+    'total_flush_ms': 0.0,
+}
+
+def _incr(key, value=1):
+    with _stats_lock:
+        _stats[key] += value
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+def build_activity_event(student_id, activity_type, module_name, content_id=None, content_name=None, details=None):
+    """构造一条活动事件（ID 和时间戳在客户端生成，入队时即确定）"""
+    return {
+        'kind': 'activity',
+        'id': str(uuid.uuid4()),
+        'student_id': student_id,
+        'activity_type': activity_type,
+        'module_name': module_name,
+        'content_id': content_id,
+        'content_name': content_name,
+        'details': details,
+        'timestamp': _now_iso(),
+    }
+
+def build_reply_event(question_id, student_name, content):
+    """构造一条课堂回复事件"""
+    return {
+        'kind': 'reply',
+        'id': str(uuid.uuid4()),
+        'question_id': question_id,
+        'student_name': student_name,
+        'content': content,
+        'timestamp': _now_iso(),
+    }
+
+def build_login_event(student_id, student_name):
+    """构造一条学生登录事件"""
+    return {
+        'kind': 'login',
+        'id': str(uuid.uuid4()),
+        'student_id': student_id,
+        'name': student_name,
+        'timestamp': _now_iso(),
+    }
+
+def is_write_degraded():
+    """写入路径是否处于降级冷却期（或数据库熔断中）"""
+    return time.monotonic() < _degraded_until or not is_available()
+
+def is_outage(error):
+    """是否为数据库故障（连接失败、熔断、连接池已满），只有这类错误进入降级；数据或语句错误不降级"""
+    return isinstance(error, CONNECTIVITY_ERRORS + (DatabaseUnavailable, PoolTimeout))
+
+def _mark_degraded(reason):
+    global _degraded_until
+    _degraded_until = time.monotonic() + ACTIVITY_DEGRADED_COOLDOWN_S
+    print(f"[活动写入] 进入降级模式 {ACTIVITY_DEGRADED_COOLDOWN_S}s，事件改为本地暂存: {reason}")
+
+def enqueue_activity(event, track=False):
+    """
+    将活动事件放入写入队列，队列已满时丢弃并计数，不阻塞调用方
+    track 为 True 时登记到当前会话，会话下一次读取前等待该事件刷出（只用于用户马上要读回的写入）
+    """
+    global _enqueued_seq
+    from modules.consistency import note_enqueued
+
+    _ensure_writer_started()
+    try:
+        with _enqueue_lock:
+            _queue.put_nowait(event)
+            _enqueued_seq += 1
+            seq = _enqueued_seq
+        _incr('enqueued')
+        if track:
+            note_enqueued(seq)
+        return True
+    except queue.Full:
+        _incr('dropped')
+        print(f"[活动写入] 队列已满({ACTIVITY_QUEUE_MAXSIZE})，丢弃事件: {event.get('activity_type')}")
+        return False
+
+def _ensure_writer_started():
+    """按需启动后台写入线程（每个进程一个）"""
+    global _writer_thread
+    if _writer_thread is not None and _writer_thread.is_alive():
+        return
+    with _writer_lock:
+        if _writer_thread is not None and _writer_thread.is_alive():
+            return
+        _writer_thread = threading.Thread(target=_writer_loop, name="activity-writer", daemon=True)
+        _writer_thread.start()
+
+def _collect_batch(first_event):
+    """以第一条事件为起点，在刷新间隔内尽量凑满一批"""
+    batch = [first_event]
+    deadline = time.monotonic() + ACTIVITY_FLUSH_INTERVAL_MS / 1000.0
+    while len(batch) < ACTIVITY_FLUSH_BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            event = _queue.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if event is _FLUSH_NOW:
+            break
+        batch.append(event)
+    return batch
+
+def _writer_loop():
+    """后台写入循环：有新事件时批量写入并回放一批本地暂存，空闲时回放全部暂存"""
+    idle_timeout = max(ACTIVITY_FLUSH_INTERVAL_MS / 1000.0, 1.0)
+    while True:
+        try:
+            first_event = _queue.get(timeout=idle_timeout)
+        except queue.Empty:
+            _replay_spool()
+            continue
+        if first_event is _FLUSH_NOW:
+            continue
+        batch = _collect_batch(first_event)
+        if _write_batch(batch) and _spool_pending:
+            # 持续有课堂流量时空闲回放不会触发，每次写入成功后回放一批，逐步清空暂存
+            _replay_spool(max_batches=1)
+
+def _run_write(events):
+    """在一个事务中按类型写入一批事件，返回耗时（毫秒）"""
+    from modules.db import run_in_transaction
+
+    by_kind = {}
+    for e in events:
+        by_kind.setdefault(e.get('kind', 'activity'), []).append(e)
+
+    name = "activity_writer." + "+".join(sorted(by_kind))
+    invalidates = tuple({tag for kind in by_kind for tag in INVALIDATES[kind]})
+    statements = [(WRITE_QUERIES[kind], {'events': kind_events}) for kind, kind_events in by_kind.items()]
+    if 'activity' in by_kind:
+        # 同一事务内合并 (日期, 模块) 去重计数草图
+        statements.append((SKETCH_WRITE_QUERY, {'sketches': sketch_updates(by_kind['activity'])}))
+    return run_in_transaction(name, statements, invalidates=invalidates)
+
+def _spool(events, reason):
+    global _spool_pending
+    try:
+        spool_events(events)
+        _spool_pending = True
+        _incr('spooled', len(events))
+    except Exception as e:
+        _incr('dropped', len(events))
+        print(f"[活动写入] 本地暂存失败，丢弃 {len(events)} 条事件 ({reason}): {e}")
+
+def _mark_processed(count, bookmarks=None, write_seq=None):
+    """一批入队事件已写入或转存，唤醒等待这些事件的会话"""
+    global _processed_seq, _processed_bookmarks, _processed_write_seq
+    with _processed_cond:
+        _processed_seq += count
+        if bookmarks is not None:
+            _processed_bookmarks = bookmarks
+        if write_seq is not None:
+            _processed_write_seq = max(_processed_write_seq, write_seq)
+        _processed_cond.notify_all()
+
+def wait_for_flush(seq, timeout):
+    """
+    等待序号不大于 seq 的入队事件处理完成（最多 timeout 秒），
+    返回 (最近一次批量写入完成时的写入序号, 该次写入后的 bookmark)
+    """
+    if _processed_seq < seq:
+        try:
+            _queue.put_nowait(_FLUSH_NOW)
+        except queue.Full:
+            pass
+    with _processed_cond:
+        _processed_cond.wait_for(lambda: _processed_seq >= seq, timeout)
+        return _processed_write_seq, _processed_bookmarks
+
+def _write_batch(batch):
+    """将一批事件写入 Neo4j，失败或降级时转存本地，返回是否写入了数据库"""
+    if not batch:
+        return False
+    write_seq = None
+    try:
+        with _flush_lock:
+            if _paused:
+                _spool(batch, "维护暂停")
+                return False
+            if is_write_degraded():
+                _spool(batch, "降级中")
+                return False
+            try:
+                elapsed_ms = _run_write(batch)
+            except Exception as e:
+                _incr('failed_flushes')
+                if is_outage(e):
+                    _mark_degraded(e)
+                else:
+                    # 批中可能有问题事件，转存后由回放逐条定位，其余写入不受影响
+                    print(f"[活动写入] 批量写入失败，转存后逐条回放: {e}")
+                _spool(batch, "写入失败")
+                return False
+            write_seq = get_write_seq()
+            with _stats_lock:
+                _stats['written'] += len(batch)
+                _stats['flushes'] += 1
+                _stats['last_flush_ms'] = elapsed_ms
+                _stats['total_flush_ms'] += elapsed_ms
+                _stats['max_flush_ms'] = max(_stats['max_flush_ms'], elapsed_ms)
+            if elapsed_ms > ACTIVITY_WRITE_BUDGET_MS:
+                _mark_degraded(f"写入耗时 {elapsed_ms:.0f}ms 超出预算 {ACTIVITY_WRITE_BUDGET_MS}ms")
+            return True
+    finally:
+        from modules.db import last_write_bookmarks
+        _mark_processed(len(batch), last_write_bookmarks(), write_seq)
+
+@contextmanager
+def writes_paused():
+    """
+    暂停后台写入（回填汇总等维护任务期间使用），期间写入线程照常消费队列，
+    把事件转存到本地暂存，恢复后回放；维护任务耗时再长队列也不会积满丢弃事件
+    """
+    global _paused
+    with _pause_lock:
+        _paused += 1
+    try:
+        # 等待已开始的批量写入完成，之后的批次看到暂停标记直接转存
+        with _flush_lock:
+            pass
+        yield
+    finally:
+        with _pause_lock:
+            _paused -= 1
+
+def write_now(event):
+    """
+    同步写入单个事件（登录、课堂回复等需要立即可见的写入）
+    降级期间或写入失败时直接转存本地，返回是否已写入数据库；
+    数据库延迟偏高时改为放入后台写入队列，不让页面等待
+    """
+    if not is_write_degraded() and is_latency_degraded():
+        enqueue_activity(event, track=True)
+        return False
+    if not is_write_degraded():
+        try:
+            elapsed_ms = _run_write([event])
+            _incr('written')
+            if elapsed_ms > ACTIVITY_WRITE_BUDGET_MS:
+                _mark_degraded(f"写入耗时 {elapsed_ms:.0f}ms 超出预算 {ACTIVITY_WRITE_BUDGET_MS}ms")
+            return True
+        except Exception as e:
+            _incr('failed_flushes')
+            if is_outage(e):
+                _mark_degraded(e)
+    _spool([event], "同步写入未完成")
+    _ensure_writer_started()
+    return False
+
+def _replay_spool(max_batches=None):
+    """数据库可用时按批回放本地暂存的事件，max_batches 限制本次最多回放的批数"""
+    global _spool_pending
+    if _paused or is_write_degraded():
+        return
+    batches = 0
+    with _flush_lock:
+        while (max_batches is None or batches < max_batches) and not _paused:
+            try:
+                rows = read_spooled(ACTIVITY_SPOOL_REPLAY_BATCH)
+            except Exception as e:
+                print(f"[活动写入] 读取本地暂存失败: {e}")
+                return
+            if not rows:
+                _spool_pending = False
+                return
+            try:
+                _run_write([event for _, event in rows])
+            except Exception as e:
+                if is_outage(e):
+                    _mark_degraded(e)
+                else:
+                    _replay_one_by_one(rows, e)
+                return
+            ack_spooled([seq for seq, _ in rows])
+            _incr('replayed', len(rows))
+            print(f"[活动写入] 已回放 {len(rows)} 条暂存事件")
+            batches += 1
+            if len(rows) < ACTIVITY_SPOOL_REPLAY_BATCH or not _queue.empty():
+                return
+
+def _replay_one_by_one(rows, batch_error):
+    """
+    整批回放因数据或语句错误失败时逐条写入（调用方持有 _flush_lock）：
+    成功的确认删除，失败的累计次数，达到 ACTIVITY_SPOOL_MAX_ATTEMPTS 后移到死信表
+    """
+    print(f"[活动写入] 回放 {len(rows)} 条暂存事件失败，改为逐条写入: {batch_error}")
+    written = []
+    try:
+        for seq, event in rows:
+            try:
+                _run_write([event])
+            except Exception as e:
+                if is_outage(e):
+                    _mark_degraded(e)
+                    return
+                attempts = record_failure(seq)
+                if attempts >= ACTIVITY_SPOOL_MAX_ATTEMPTS:
+                    dead_letter(seq, e)
+                    _incr('dead_lettered')
+                    print(f"[活动写入] 事件 {event.get('id')} 写入失败 {attempts} 次，移到死信表: {e}")
+                continue
+            written.append(seq)
+    finally:
+        ack_spooled(written)
+        _incr('replayed', len(written))
+
+def flush_pending(timeout=5.0):
+    """同步写出队列中剩余的事件（进程退出时调用），无法写入的转存本地"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        batch = []
+        while len(batch) < ACTIVITY_FLUSH_BATCH_SIZE:
+            try:
+                event = _queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is not _FLUSH_NOW:
+                batch.append(event)
+        if not batch:
+            return
+        _write_batch(batch)
+
+atexit.register(flush_pending)
+
+def get_writer_stats():
+    """获取写入队列统计：队列深度、刷新延迟、丢弃/暂存/回放事件数"""
+    with _stats_lock:
+        stats = dict(_stats)
+    total_ms = stats.pop('total_flush_ms')
+    stats['avg_flush_ms'] = round(total_ms / stats['flushes'], 1) if stats['flushes'] else 0.0
+    stats['last_flush_ms'] = round(stats['last_flush_ms'], 1)
+    stats['max_flush_ms'] = round(stats['max_flush_ms'], 1)
+    stats['queue_depth'] = _queue.qsize()
+    stats['spool_depth'] = spool_size()
+    stats['dead_letter_depth'] = dead_letter_size()
+    stats['degraded'] = is_write_degraded()
+    stats['paused'] = _paused > 0
+    return stats
@@ -7,16 +7,34 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from modules.auth import (
-    get_all_students, get_student_activities, get_module_statistics,
+    get_all_students, get_student_activities, get_student_activities_page, get_module_statistics,
     delete_student_data, delete_all_activities, check_neo4j_available,
     get_single_module_statistics, get_neo4j_driver
 )
+from modules.db import run_query
+from modules.async_db import gather_queries
+from modules.schema_migrations import module_field
+from modules.rollups import rollups_ready, sketches_ready, counters_ready
+from modules.sketches import unique_students
+from modules.storage import embedded_store
+from modules.activity_snapshot import get_module_metrics, get_student_metrics
+from modules.timestamps import format_times, format_time
+from modules.sessions import get_student_sessions, format_duration
 from config.settings import *
 
+def _cold_module_counts():
+    """冷归档各模块的活动数（没有冷归档时为空）"""
+    from modules.retention import cold_enabled, cold_module_counts
+    return cold_module_counts() if cold_enabled() else {}
+
 def get_activity_summary():
     """获取活动概况"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_activity_summary()
+    
     if not check_neo4j_available():
         return {
             'total_students': 0,
@@ -26,39 +44,61 @@ def get_activity_summary():
         }
     
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            # 总学生数
-            result = session.run("MATCH (s:mfx_Student) RETURN count(s) as count")
-            total_students = result.single()['count']
+        if rollups_ready():
+            # 活动总数读取模块日汇总（包括已移到冷归档的活动）
+            total_query = ("analytics.summary.total_activities", """
+                MATCH (d:mfx_DailyStat)
+                RETURN COALESCE(sum(d.count), 0) as count
+            """)
             
-            # 总活动数
-            result = session.run("MATCH (a:mfx_Activity) RETURN count(a) as count")
-            total_activities = result.single()['count']
+            # 今日活动数（读取当天的模块日汇总）
+            today_query = ("analytics.summary.today_activities", """
+                MATCH (d:mfx_DailyStat {day: date()})
+                RETURN COALESCE(sum(d.count), 0) as count
+            """)
             
-            # 今日活动数
-            result = session.run("""
+            # 活跃学生数（近7天有学生日汇总的学生）
+            active_query = ("analytics.summary.active_students", """
+                MATCH (sd:mfx_StudentDay)
+                WHERE sd.day > date() - duration('P7D')
+                RETURN count(DISTINCT sd.student_id) as count
+            """)
+        else:
+            # 汇总尚未回填时直接统计活动日志（冷归档中的活动数在下面加上）
+            total_query = ("analytics.summary.total_activities.scan",
+                           "MATCH (a:mfx_Activity) RETURN count(a) as count")
+            
+            today_query = ("analytics.summary.today_activities.scan", """
                 MATCH (a:mfx_Activity)
                 WHERE date(a.timestamp) = date()
                 RETURN count(a) as count
             """)
-            today_activities = result.single()['count']
             
-            # 活跃学生数（7天内）
-            result = session.run("""
+            active_query = ("analytics.summary.active_students.scan", """
                 MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
                 WHERE a.timestamp > datetime() - duration('P7D')
                 RETURN count(DISTINCT s) as count
             """)
-            active_students = result.single()['count']
         
-        return {
-            'total_students': total_students,
-            'total_activities': total_activities,
-            'today_activities': today_activities,
-            'active_students': active_students
+        queries = {
+            'total_students': ("analytics.summary.total_students",
+                               "MATCH (s:mfx_Student) RETURN count(s) as count"),
+            'total_activities': total_query,
+            'today_activities': today_query,
         }
+        if not sketches_ready():
+            queries['active_students'] = active_query
+        
+        # 各项统计互不依赖，并发查询
+        results = gather_queries("analytics.summary", queries)
+        summary = {key: records[0]['count'] for key, records in results.items()}
+        if not rollups_ready():
+            summary['total_activities'] += sum(_cold_module_counts().values())
+        if 'active_students' not in summary:
+            # 活跃学生数（近7天的去重计数草图合并估算）
+            today = datetime.now(timezone.utc).date()
+            summary['active_students'] = unique_students(start_day=today - timedelta(days=6), end_day=today)
+        return summary
     except Exception:
         return {
             'total_students': 0,
@@ -69,27 +109,36 @@ def get_activity_summary():
 
 def get_daily_activity_trend(days=7):
     """获取每日活动趋势"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_daily_activity_trend(days)
+    
     if not check_neo4j_available():
         return []
     
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            result = session.run("""
+        if rollups_ready():
+            result = run_query("analytics.daily_trend", """
+                MATCH (d:mfx_DailyStat)
+                WHERE d.day > date() - duration('P' + $days + 'D')
+                RETURN d.day as date, sum(d.count) as count
+                ORDER BY date
+            """, days=str(days))
+        else:
+            result = run_query("analytics.daily_trend.scan", """
                 MATCH (a:mfx_Activity)
                 WHERE a.timestamp > datetime() - duration('P' + $days + 'D')
                 RETURN date(a.timestamp) as date, count(*) as count
                 ORDER BY date
             """, days=str(days))
-            
-            # 将Date对象转换为字符串
-            trend = []
-            for record in result:
-                trend.append({
-                    'date': str(record['date']) if record['date'] else None,
-                    'count': record['count']
-                })
+        
+        # 将Date对象转换为字符串
+        trend = []
+        for record in result:
+            trend.append({
+                'date': str(record['date']) if record['date'] else None,
+                'count': record['count']
+            })
         
         return trend
     except Exception as e:
@@ -98,115 +147,110 @@ def get_daily_activity_trend(days=7):
 
 def get_module_usage():
     """获取各模块使用情况"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_module_usage()
+    
     if not check_neo4j_available():
         return []
     
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            result = session.run("""
-                MATCH (a:mfx_Activity)
-                RETURN a.module as module, count(*) as count
+        if rollups_ready():
+            # 读取模块日汇总（包括已移到冷归档的活动）
+            return run_query("analytics.module_usage", """
+                MATCH (d:mfx_DailyStat)
+                RETURN d.module_name as module, sum(d.count) as count
                 ORDER BY count DESC
             """)
-            
-            usage = [dict(record) for record in result]
-        
-        return usage
+        result = run_query("analytics.module_usage.scan", f"""
+            MATCH (a:mfx_Activity)
+            RETURN {module_field('a')} as module, count(*) as count
+        """)
+        # 汇总尚未回填时加上冷归档中的活动数
+        counts = {record['module']: record['count'] for record in result}
+        for module, count in _cold_module_counts().items():
+            module = module or None
+            counts[module] = counts.get(module, 0) + count
+        return [{'module': module, 'count': count}
+                for module, count in sorted(counts.items(), key=lambda item: item[1], reverse=True)]
     except Exception:
         return []
 
 def get_popular_content(module=None, limit=10):
     """获取热门学习内容"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_popular_content(module, limit)
+    
     if not check_neo4j_available():
         return []
     
     try:
-        driver = get_neo4j_driver()
+        query = """
+            MATCH (a:mfx_Activity)
+            WHERE a.content_name IS NOT NULL
+        """
+        params = {"limit": limit}
         
-        with driver.session() as session:
-            query = """
-                MATCH (a:mfx_Activity)
-                WHERE a.content_name IS NOT NULL
-            """
-            params = {"limit": limit}
-            
-            if module:
-                query += " AND a.module = $module"
-                params["module"] = module
-            
-            query += """
-                RETURN a.module as module,
-                       a.content_name as content_name,
-                       count(*) as view_count,
-                       count(DISTINCT a.content_id) as unique_views
-                ORDER BY view_count DESC
-                LIMIT $limit
-            """
-            
-            result = session.run(query, **params)
-            content = [dict(record) for record in result]
+        if module:
+            query += f" AND {module_field('a')} = $module"
+            params["module"] = module
+        
+        query += f"""
+            RETURN {module_field('a')} as module,
+                   a.content_name as content_name,
+                   count(*) as view_count,
+                   count(DISTINCT a.content_id) as unique_views
+            ORDER BY view_count DESC
+            LIMIT $limit
+        """
         
-        return content
+        return run_query("analytics.popular_content", query, params)
     except Exception:
         return []
 
 def get_student_learning_profile(student_id):
     """获取学生学习画像"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_student_learning_profile(student_id)
+    
     if not check_neo4j_available():
         return None
     
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            # 基本信息
-            result = session.run("""
+        # 基本信息、各模块活动统计、学习时间分布和查看的内容互不依赖，并发查询
+        params = {'student_id': student_id}
+        profile = gather_queries("analytics.profile", {
+            'info': ("analytics.profile.info", """
                 MATCH (s:mfx_Student {student_id: $student_id})
                 RETURN s.name as name, s.last_login as last_login, s.login_count as login_count
-            """, student_id=student_id)
-            
-            student_info = dict(result.single()) if result.peek() else None
-            
-            if not student_info:
-                return None
-            
-            # 各模块活动统计
-            result = session.run("""
-                MATCH (s:mfx_Student {student_id: $student_id})-[:PERFORMED]->(a:mfx_Activity)
-                RETURN a.module as module, count(*) as count
+            """, params),
+            'module_stats': ("analytics.profile.module_stats", f"""
+                MATCH (s:mfx_Student {{student_id: $student_id}})-[:PERFORMED]->(a:mfx_Activity)
+                RETURN {module_field('a')} as module, count(*) as count
                 ORDER BY count DESC
-            """, student_id=student_id)
-            
-            module_stats = [dict(record) for record in result]
-            
-            # 学习时间分布
-            result = session.run("""
+            """, params),
+            'time_distribution': ("analytics.profile.time_distribution", """
                 MATCH (s:mfx_Student {student_id: $student_id})-[:PERFORMED]->(a:mfx_Activity)
                 RETURN a.timestamp.hour as hour, count(*) as count
                 ORDER BY hour
-            """, student_id=student_id)
-            
-            time_distribution = [dict(record) for record in result]
-            
-            # 查看的内容
-            result = session.run("""
-                MATCH (s:mfx_Student {student_id: $student_id})-[:PERFORMED]->(a:mfx_Activity)
+            """, params),
+            'recent_content': ("analytics.profile.recent_content", f"""
+                MATCH (s:mfx_Student {{student_id: $student_id}})-[:PERFORMED]->(a:mfx_Activity)
                 WHERE a.content_name IS NOT NULL
-                RETURN a.module as module, a.content_name as content, a.timestamp as time
+                RETURN {module_field('a')} as module, a.content_name as content, toString(a.timestamp) as time
                 ORDER BY a.timestamp DESC
                 LIMIT 20
-            """, student_id=student_id)
-            
-            # 将timestamp转换为字符串
-            recent_content = []
-            for record in result:
-                recent_content.append({
-                    'module': record['module'],
-                    'content': record['content'],
-                    'time': str(record['time']) if record['time'] else None
-                })
+            """, params),
+        })
+        student_info = profile['info'][0] if profile['info'] else None
+        if not student_info:
+            return None
+        
+        module_stats = profile['module_stats']
+        time_distribution = profile['time_distribution']
+        recent_content = profile['recent_content']
         
         return {
             'info': student_info,
@@ -219,39 +263,36 @@ def get_student_learning_profile(student_id):
 
 def get_classroom_interaction_stats():
     """获取课中互动统计"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_classroom_interaction_stats()
+    
     if not check_neo4j_available():
         return {'questions': [], 'participation': []}
     
     try:
-        driver = get_neo4j_driver()
+        # 问题统计
+        questions = run_query("analytics.classroom.questions", """
+            MATCH (q:mfx_Question)
+            OPTIONAL MATCH (s:mfx_Student)-[r:REPLIED]->(q)
+            RETURN q.id as question_id,
+                   q.text as question_text,
+                   q.created_at as created_at,
+                   q.status as status,
+                   count(r) as reply_count
+            ORDER BY q.created_at DESC
+            LIMIT 20
+        """)
         
-        with driver.session() as session:
-            # 问题统计
-            result = session.run("""
-                MATCH (q:mfx_Question)
-                OPTIONAL MATCH (s:mfx_Student)-[r:REPLIED]->(q)
-                RETURN q.id as question_id,
-                       q.text as question_text,
-                       q.created_at as created_at,
-                       q.status as status,
-                       count(r) as reply_count
-                ORDER BY q.created_at DESC
-                LIMIT 20
-            """)
-            
-            questions = [dict(record) for record in result]
-            
-            # 学生参与度
-            result = session.run("""
-                MATCH (s:mfx_Student)-[r:REPLIED]->(q:mfx_Question)
-                RETURN s.name as student_name,
-                       s.student_id as student_id,
-                       count(r) as reply_count
-                ORDER BY reply_count DESC
-                LIMIT 20
-            """)
-            
-            participation = [dict(record) for record in result]
+        # 学生参与度
+        participation = run_query("analytics.classroom.participation", """
+            MATCH (s:mfx_Student)-[r:REPLIED]->(q:mfx_Question)
+            RETURN s.name as student_name,
+                   s.student_id as student_id,
+                   count(r) as reply_count
+            ORDER BY reply_count DESC
+            LIMIT 20
+        """)
         
         return {
             'questions': questions,
@@ -260,6 +301,58 @@ def get_classroom_interaction_stats():
     except Exception:
         return {'questions': [], 'participation': []}
 
+def get_student_leaderboard(limit=10):
+    """学习排行榜：活动数最多的学生及其活跃天数"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_student_leaderboard(limit)
+    
+    if counters_ready():
+        # 学生计数取前N，活跃天数为学生日汇总节点数
+        return run_query("app.dashboard.leaderboard", """
+            MATCH (s:mfx_Student)
+            WHERE s.activity_count > 0
+            WITH s ORDER BY s.activity_count DESC LIMIT $limit
+            OPTIONAL MATCH (sd:mfx_StudentDay {student_id: s.student_id})
+            RETURN s.student_id as student_id, 
+                   s.name as name,
+                   s.activity_count as activity_count,
+                   count(sd) as active_days
+            ORDER BY activity_count DESC
+        """, limit=limit)
+    return run_query("app.dashboard.leaderboard.scan", """
+        MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+        RETURN s.student_id as student_id, 
+               s.name as name,
+               count(a) as activity_count,
+               count(DISTINCT date(a.timestamp)) as active_days
+        ORDER BY activity_count DESC
+        LIMIT $limit
+    """, limit=limit)
+
+def get_module_leaderboard(module_name, limit=10):
+    """单个模块的学习排行榜：该模块活动数最多的学生"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_module_leaderboard(module_name, limit)
+    
+    if counters_ready():
+        return run_query("app.module.leaderboard", """
+            MATCH (sm:mfx_StudentModule {module_name: $module_name})
+            RETURN sm.student_id as student_id, 
+                   sm.count as activity_count
+            ORDER BY activity_count DESC
+            LIMIT $limit
+        """, module_name=module_name, limit=limit)
+    return run_query("app.module.leaderboard.scan", f"""
+        MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+        WHERE {module_field('a')} = $module_name
+        RETURN s.student_id as student_id, 
+               count(a) as activity_count
+        ORDER BY activity_count DESC
+        LIMIT $limit
+    """, module_name=module_name, limit=limit)
+
 def render_analytics_dashboard():
     """渲染数据分析面板"""
     st.title("📊 学习数据分析")
@@ -352,9 +445,7 @@ def render_student_list():
         
         # 格式化显示
         df_display = df.copy()
-        df_display['last_login'] = df_display['last_login'].apply(
-            lambda x: x.strftime('%Y-%m-%d %H:%M') if hasattr(x, 'strftime') else str(x) if x else '-'
-        )
+        df_display['last_login'] = format_times(df_display['last_login'])
         
         st.dataframe(
             df_display,
@@ -404,10 +495,20 @@ def render_student_profile():
             with col2:
                 st.metric("登录次数", profile['info']['login_count'] or 0)
             with col3:
-                last_login = profile['info']['last_login']
-                if hasattr(last_login, 'strftime'):
-                    last_login = last_login.strftime('%Y-%m-%d %H:%M')
-                st.metric("最后登录", last_login or '-')
+                st.metric("最后登录", format_time(profile['info']['last_login']))
+            
+            # 学习会话汇总（按不活跃间隔切分，见 sessions 模块）
+            sessions = get_student_sessions(student_id)
+            if sessions:
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("🕒 学习会话数", sessions['session_count'])
+                with col2:
+                    st.metric("⏱️ 总学习时长", format_duration(sessions['total_seconds']))
+                with col3:
+                    st.metric("📏 平均会话时长", format_duration(sessions['avg_seconds']))
+                with col4:
+                    st.metric("🏆 最长会话", format_duration(sessions['longest_seconds']))
             
             col1, col2 = st.columns(2)
             
@@ -429,13 +530,21 @@ def render_student_profile():
                     fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
                     st.plotly_chart(fig, use_container_width=True)
             
+            # 各模块学习时长
+            if sessions and sessions['module_seconds']:
+                df = pd.DataFrame(
+                    [{'module': m or '未知', 'minutes': round(s / 60, 1)} for m, s in sessions['module_seconds'].items()]
+                ).sort_values('minutes', ascending=False)
+                fig = px.bar(df, x='module', y='minutes', title='各模块学习时长',
+                            labels={'module': '模块', 'minutes': '分钟'})
+                fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+                st.plotly_chart(fig, use_container_width=True)
+            
             # 最近学习内容
             st.subheader("📚 最近学习内容")
             if profile['recent_content']:
                 df = pd.DataFrame(profile['recent_content'])
-                df['time'] = df['time'].apply(
-                    lambda x: x.strftime('%Y-%m-%d %H:%M') if hasattr(x, 'strftime') else str(x)
-                )
+                df['time'] = format_times(df['time'])
                 st.dataframe(df, use_container_width=True, hide_index=True)
             else:
                 st.info("暂无学习记录")
@@ -548,23 +657,8 @@ def render_module_analytics(module_name):
     """渲染特定模块的数据分析页面"""
     st.title(f"📊 {module_name} - 学习数据分析")
     
-    # 获取该模块的独立统计数据
-    module_data = get_single_module_statistics(module_name)
-    
-    # 如果数据库没有数据，尝试从活动记录中计算
-    if not module_data:
-        activities = get_student_activities(limit=1000)
-        module_activities = [a for a in activities if a.get('module') == module_name]
-        unique_students = len(set(a.get('student_id') for a in module_activities if a.get('student_id')))
-        today = datetime.now().strftime('%Y-%m-%d')
-        today_activities = [a for a in module_activities if str(a.get('timestamp', ''))[:10] == today]
-        
-        module_data = {
-            'module': module_name,
-            'total_activities': len(module_activities),
-            'unique_students': unique_students,
-            'today_count': len(today_activities)
-        }
+    # 该模块的统计（活动快照上向量化计算）
+    module_data = get_module_metrics(module_name)
     
     # 概览卡片
     col1, col2, col3, col4 = st.columns(4)
@@ -601,11 +695,10 @@ def render_module_overview(module_name):
     """渲染模块整体数据"""
     st.subheader(f"📈 {module_name} - 整体学习数据")
     
-    # 获取该模块的活动数据 - 使用module参数筛选
-    activities = get_student_activities(module=module_name, limit=500)
-    module_activities = activities  # 已经是该模块的数据
+    # 该模块的行为分布、热门内容和最近记录（活动快照上向量化计算）
+    metrics = get_module_metrics(module_name)
     
-    if not module_activities:
+    if not metrics['total_activities']:
         st.info(f"📊 {module_name}暂无学习数据记录")
         st.markdown("""
         **提示：** 当学生在此模块进行学习活动后，系统会自动记录并在此展示：
@@ -620,15 +713,12 @@ def render_module_overview(module_name):
     with col1:
         # 活动类型分布
         st.markdown("#### 📊 学习行为分布")
-        activity_types = {}
-        for a in module_activities:
-            t = a.get('activity_type', '其他')
-            activity_types[t] = activity_types.get(t, 0) + 1
+        activity_types = metrics['type_counts']
         
-        if activity_types:
+        if not activity_types.empty:
             fig = px.pie(
-                values=list(activity_types.values()),
-                names=list(activity_types.keys()),
+                values=activity_types.values,
+                names=activity_types.index.astype(str),
                 title=f'{module_name} - 学习行为类型分布'
             )
             fig.update_layout(paper_bgcolor='rgba(0,0,0,0)')
@@ -637,28 +727,46 @@ def render_module_overview(module_name):
     with col2:
         # 热门内容
         st.markdown("#### 🔥 热门学习内容")
-        content_counts = {}
-        for a in module_activities:
-            c = a.get('content_name')
-            if c:
-                content_counts[c] = content_counts.get(c, 0) + 1
+        top_content = metrics['top_content']
         
-        if content_counts:
-            sorted_content = sorted(content_counts.items(), key=lambda x: x[1], reverse=True)[:5]
-            for i, (name, count) in enumerate(sorted_content, 1):
+        if not top_content.empty:
+            for i, (name, count) in enumerate(top_content.items(), 1):
                 st.markdown(f"**{i}. {name}** - {count}次访问")
         else:
             st.info("暂无内容访问记录")
     
     # 最近活动记录
     st.markdown(f"#### 📝 {module_name} - 最近学习记录")
-    df = pd.DataFrame(module_activities[:20])
-    display_cols = ['student_name', 'activity_type', 'content_name', 'timestamp']
-    display_cols = [c for c in display_cols if c in df.columns]
-    if display_cols:
-        df_display = df[display_cols].copy()
-        df_display.columns = ['学生', '行为', '内容', '时间'][:len(display_cols)]
-        st.dataframe(df_display, use_container_width=True, hide_index=True)
+    df_display = metrics['recent'][['student_name', 'activity_type', 'content_name', 'timestamp']].copy()
+    df_display.columns = ['学生', '行为', '内容', '时间']
+    st.dataframe(df_display, use_container_width=True, hide_index=True)
+
+def render_activity_pager(key, student_id=None, module=None):
+    """
+    活动记录翻页：每页起点的续页令牌保存在 session_state，筛选条件变化时回到第一页
+    显示上一页/下一页按钮，返回当前页的记录
+    """
+    state_key = f"_activity_pager_{key}"
+    pager = st.session_state.get(state_key)
+    if pager is None or pager['filter'] != (student_id, module):
+        pager = {'filter': (student_id, module), 'cursors': [None]}
+        st.session_state[state_key] = pager
+    cursors = pager['cursors']
+    
+    activities, next_cursor = get_student_activities_page(student_id, module, cursors[-1])
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("⬅️ 上一页", key=f"{key}_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        st.caption(f"第 {len(cursors)} 页")
+    with col3:
+        if st.button("下一页 ➡️", key=f"{key}_next", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
+    return activities
 
 def render_module_student_detail(module_name):
     """渲染模块个人数据"""
@@ -679,27 +787,32 @@ def render_module_student_detail(module_name):
         student = student_options[selected]
         student_id = student.get('student_id', '')
         
-        # 获取该学生在此模块的活动 - 使用module参数
-        student_module_activities = get_student_activities(student_id=student_id, module=module_name, limit=100)
+        # 该学生在此模块的访问次数和学习内容数（活动快照上向量化计算）
+        summary = get_student_metrics(student_id, module_name)
+        
+        sessions = get_student_sessions(student_id)
+        module_seconds = sessions['module_seconds'].get(module_name, 0) if sessions else 0
         
         # 学生数据卡片
-        col1, col2, col3 = st.columns(3)
+        col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric(f"📊 {module_name}访问次数", len(student_module_activities))
+            st.metric(f"📊 {module_name}访问次数", summary['total'])
         with col2:
-            content_viewed = len(set(a.get('content_name') for a in student_module_activities if a.get('content_name')))
-            st.metric("📚 学习内容数", content_viewed)
+            st.metric("📚 学习内容数", summary['content_count'])
         with col3:
+            st.metric("⏱️ 模块学习时长", format_duration(module_seconds))
+        with col4:
             st.metric("🔑 总登录次数", student.get('login_count', 0) or student.get('activity_count', 0) or 0)
         
-        if not student_module_activities:
+        if not summary['total']:
             st.info(f"该学生在 {module_name} 模块暂无学习记录")
             return
         
-        # 活动时间线
+        # 活动时间线（分页）
         st.markdown(f"#### 📅 {module_name} - 学习时间线")
         
-        for activity in student_module_activities[:10]:
+        timeline = render_activity_pager(f"detail_{module_name}", student_id, module_name)
+        for activity, time in zip(timeline, format_times([a.get('timestamp') for a in timeline])):
             action = activity.get('activity_type', '')
             icon = "📖"
             if "查看" in action:
@@ -712,9 +825,6 @@ def render_module_student_detail(module_name):
                 icon = "🤖"
             
             content = activity.get('content_name', '')
-            time = activity.get('timestamp', '')
-            if hasattr(time, 'strftime'):
-                time = time.strftime('%Y-%m-%d %H:%M')
             
             st.markdown(f"""
             <div style="padding: 10px; margin: 5px 0; background: #f8f9fa; border-left: 3px solid #4ECDC4; border-radius: 5px;">
@@ -724,6 +834,7 @@ def render_module_student_detail(module_name):
             """, unsafe_allow_html=True)
         
         # 导出该学生数据
+        student_module_activities = get_student_activities(student_id=student_id, module=module_name, limit=100)
         df = pd.DataFrame(student_module_activities)
         csv = df.to_csv(index=False, encoding='utf-8-sig')
         st.download_button(
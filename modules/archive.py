@@ -0,0 +1,382 @@
+"""
+列式归档模块
+把活动日志、学生和课堂回复导出为 zstd 压缩的 Parquet 文件（需要 pyarrow），离线分析直接按分区读取：
+
+    ARCHIVE_DIR/activities/day=2025-01-01/module=案例库/part-<批次>.parquet
+    ARCHIVE_DIR/replies/day=2025-01-01/part-<批次>.parquet
+    ARCHIVE_DIR/students/students.parquet       每次归档整体替换
+
+增量归档：水位（_watermark.json）记录上次归档到的毫秒时间戳，每次只读取水位之后、
+ARCHIVE_SETTLE_S 秒之前的活动和回复，写成新的分区文件，不改写已有文件。
+一次归档的文件先写入暂存目录，全部成功后写入发布清单（含新水位），再移动到正式位置并推进水位：
+写文件中途失败时丢弃暂存；发布中途中断时下次归档先按清单完成上次的发布，已移动的文件不会重复追加。
+活动按 ts_ms 索引范围读取，还没有回填 ts_ms 的历史活动（见 schema_migrations）不会被归档。
+水位按数据库时钟计算；晚于水位才回放的历史事件（时间早于水位）按写入时间 ingested_ms 在下次增量归档时补录。
+移到冷归档的活动（见 retention）已不在图中，以相同的列和分区保存在 COLD_ARCHIVE_DIR 下；
+全量重建时先从冷归档写入这些活动，再读取图中的活动，不会丢失已移出的历史。
+
+    python -m modules.archive           # 增量归档
+    python -m modules.archive --full    # 清空后全量归档（含冷归档）
+    python -m modules.archive --status  # 查看水位和分区数
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+
+from config.settings import ARCHIVE_DIR, ARCHIVE_BATCH_ROWS, ARCHIVE_SETTLE_S
+
+# 可选导入pyarrow（Parquet 写入）
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+    pa = None
+    pq = None
+
+COMPRESSION = 'zstd'
+
+_WATERMARK_FILE = '_watermark.json'
+_STAGING_DIR = '_staging'
+_MANIFEST_FILE = '_manifest.json'
+
+def _schemas():
+    """各数据集的列类型（分区列 day / module 写在目录名中）"""
+    ts = pa.timestamp('ms', tz='UTC')
+    return {
+        'activities': pa.schema([
+            ('id', pa.string()),
+            ('student_id', pa.string()),
+            ('student_name', pa.string()),
+            ('activity_type', pa.string()),
+            ('content_id', pa.string()),
+            ('content_name', pa.string()),
+            ('details', pa.string()),
+            ('ts', ts),
+            ('day', pa.string()),
+            ('module', pa.string()),
+        ]),
+        'replies': pa.schema([
+            ('id', pa.string()),
+            ('student_id', pa.string()),
+            ('student_name', pa.string()),
+            ('question_id', pa.string()),
+            ('question_text', pa.string()),
+            ('content', pa.string()),
+            ('length', pa.int64()),
+            ('ts', ts),
+            ('day', pa.string()),
+        ]),
+        'students': pa.schema([
+            ('student_id', pa.string()),
+            ('name', pa.string()),
+            ('login_count', pa.int64()),
+            ('activity_count', pa.int64()),
+            ('last_login', ts),
+            ('last_activity_at', ts),
+        ]),
+    }
+
+PARTITIONS = {
+    'activities': ['day', 'module'],
+    'replies': ['day'],
+}
+
+# 活动和回复按毫秒时间戳读取 (since_ms, until_ms]，时间戳与日期都按 UTC
+# 活动直接按 ts_ms 过滤，走 ts_ms 索引的范围查找，增量归档只读取水位之后的活动
+# 写入时间（ingested_ms，数据库时钟）晚于 until_ms 的记录留给下次归档，由下次的晚到查询补录
+_ACTIVITY_RETURN = """
+    MATCH (s:mfx_Student)-[:PERFORMED]->(a)
+    RETURN COALESCE(a.id, '') as id,
+           s.student_id as student_id,
+           s.name as student_name,
+           {module} as module,
+           {type} as activity_type,
+           a.content_id as content_id,
+           a.content_name as content_name,
+           a.details as details,
+           a.ts_ms as ts,
+           toString(date(a.timestamp)) as day
+"""
+
+_ACTIVITY_QUERY = """
+    MATCH (a:mfx_Activity)
+    WHERE a.ts_ms > $since_ms AND a.ts_ms <= $until_ms
+      AND (a.ingested_ms IS NULL OR a.ingested_ms <= $until_ms)
+""" + _ACTIVITY_RETURN
+
+# 晚到的活动：上次归档之后才写入（如写入队列回放），时间却不晚于上次水位，按 ingested_ms 索引读取
+_LATE_ACTIVITY_QUERY = """
+    MATCH (a:mfx_Activity)
+    WHERE a.ingested_ms > $since_ingested_ms AND a.ingested_ms <= $until_ms
+      AND a.ts_ms <= $since_ms
+""" + _ACTIVITY_RETURN
+
+_REPLY_RETURN = """
+    RETURN COALESCE(r.id, '') as id,
+           s.student_id as student_id,
+           s.name as student_name,
+           q.id as question_id,
+           q.text as question_text,
+           r.content as content,
+           r.length as length,
+           ts,
+           toString(date(r.timestamp)) as day
+"""
+
+_REPLY_QUERY = """
+    MATCH (s:mfx_Student)-[r:REPLIED]->(q:mfx_Question)
+    WITH s, r, q, r.timestamp.epochMillis AS ts
+    WHERE ts > $since_ms AND ts <= $until_ms
+      AND (r.ingested_ms IS NULL OR r.ingested_ms <= $until_ms)
+""" + _REPLY_RETURN
+
+_LATE_REPLY_QUERY = """
+    MATCH (s:mfx_Student)-[r:REPLIED]->(q:mfx_Question)
+    WHERE r.ingested_ms > $since_ingested_ms AND r.ingested_ms <= $until_ms
+    WITH s, r, q, r.timestamp.epochMillis AS ts
+    WHERE ts <= $since_ms
+""" + _REPLY_RETURN
+
+_STUDENT_QUERY = """
+    MATCH (s:mfx_Student)
+    RETURN s.student_id as student_id,
+           s.name as name,
+           COALESCE(s.login_count, 0) as login_count,
+           s.activity_count as activity_count,
+           s.last_login.epochMillis as last_login,
+           s.last_activity_at.epochMillis as last_activity_at
+"""
+
+def _require_pyarrow():
+    if not HAS_PYARROW:
+        raise RuntimeError("列式归档需要安装 pyarrow（pip install pyarrow）")
+
+def _watermark_path():
+    return os.path.join(ARCHIVE_DIR, _WATERMARK_FILE)
+
+def load_watermark():
+    """上次归档的水位 {'activities_ms', 'replies_ms', 'updated_at'}，没有归档过时为 None"""
+    try:
+        with open(_watermark_path(), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_json(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def _save_watermark(watermark):
+    _write_json(_watermark_path(), watermark)
+
+def _text(value):
+    return None if value is None else str(value)
+
+def _write_batches(dataset, rows, staging, run_id):
+    """逐批把记录写入暂存目录下的分区文件，返回写入的记录数"""
+    schema = _schemas()[dataset]
+    written = 0
+    batch = []
+    index = 0
+
+    def flush():
+        table = pa.Table.from_pylist(batch, schema=schema)
+        pq.write_to_dataset(
+            table, os.path.join(staging, dataset), partition_cols=PARTITIONS[dataset],
+            compression=COMPRESSION, basename_template=f"part-{run_id}-{index:05d}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore'
+        )
+
+    for row in rows:
+        for column in schema.names:
+            if column not in ('ts', 'length'):
+                row[column] = _text(row.get(column))
+        batch.append(row)
+        if len(batch) >= ARCHIVE_BATCH_ROWS:
+            flush()
+            written += len(batch)
+            batch = []
+            index += 1
+    if batch:
+        flush()
+        written += len(batch)
+    return written
+
+def _cold_rows():
+    """逐批读取冷归档中的全部活动（见 retention），冷归档为空时不产生记录"""
+    from modules import retention
+
+    if not retention.cold_enabled():
+        return
+    for batch in retention._dataset().to_batches(batch_size=ARCHIVE_BATCH_ROWS):
+        yield from batch.to_pylist()
+
+def _chain(*sources):
+    for rows in sources:
+        yield from rows
+
+def _write_students(staging):
+    from modules.db import stream_query
+    rows = list(stream_query("archive.students", _STUDENT_QUERY))
+    table = pa.Table.from_pylist(rows, schema=_schemas()['students'])
+    os.makedirs(os.path.join(staging, 'students'), exist_ok=True)
+    pq.write_table(table, os.path.join(staging, 'students', 'students.parquet'), compression=COMPRESSION)
+    return len(rows)
+
+def _publish(staging, watermark):
+    """
+    先在暂存目录写入发布清单（新水位），再把文件移动到正式位置（学生表整体替换，分区文件按新文件名追加），
+    最后推进水位；重复执行只移动剩余的暂存文件，中途中断后可按清单重新执行
+    """
+    manifest = os.path.join(staging, _MANIFEST_FILE)
+    if not os.path.exists(manifest):
+        _write_json(manifest, watermark)
+    for root, _, files in os.walk(staging):
+        relative = os.path.relpath(root, staging)
+        target = os.path.join(ARCHIVE_DIR, relative)
+        for file_name in files:
+            if root == staging and file_name.startswith(_MANIFEST_FILE):
+                continue
+            os.makedirs(target, exist_ok=True)
+            os.replace(os.path.join(root, file_name), os.path.join(target, file_name))
+    _save_watermark(watermark)
+    shutil.rmtree(staging, ignore_errors=True)
+
+def _resume_staging():
+    """处理上次归档留下的暂存目录：有发布清单的完成发布，没有的（写文件中途失败）直接丢弃"""
+    root = os.path.join(ARCHIVE_DIR, _STAGING_DIR)
+    if not os.path.isdir(root):
+        return
+    pending = []
+    for run_id in os.listdir(root):
+        staging = os.path.join(root, run_id)
+        try:
+            with open(os.path.join(staging, _MANIFEST_FILE), encoding='utf-8') as f:
+                pending.append((json.load(f), staging))
+        except (FileNotFoundError, NotADirectoryError, ValueError):
+            shutil.rmtree(staging, ignore_errors=True)
+    for watermark, staging in sorted(pending, key=lambda item: item[0].get('activities_ms', 0)):
+        print(f"[列式归档] 继续完成上次中断的发布（水位 {watermark.get('activities_ms')}）")
+        _publish(staging, watermark)
+
+def clear_archive():
+    """删除全部归档文件和水位"""
+    for name in ('activities', 'replies', 'students', _STAGING_DIR):
+        shutil.rmtree(os.path.join(ARCHIVE_DIR, name), ignore_errors=True)
+    try:
+        os.remove(_watermark_path())
+    except FileNotFoundError:
+        pass
+
+def run_archive(full=False):
+    """
+    增量归档水位之后的活动和回复（含上次归档后才写入的晚到记录），并替换学生表；
+    full 为 True 时清空后全量归档（冷归档中的活动一并写入）
+    返回 {'activities', 'replies', 'students', 'until_ms', 'elapsed_s'}
+    """
+    from modules.db import run_single, stream_query
+    from modules.schema_migrations import module_field, type_field
+
+    _require_pyarrow()
+    start = time.perf_counter()
+    if full:
+        clear_archive()
+    _resume_staging()
+
+    watermark = load_watermark() or {}
+    # 水位与 ingested_ms 使用同一个（数据库）时钟
+    until_ms = run_single("archive.now", "RETURN timestamp() as now_ms")['now_ms'] - ARCHIVE_SETTLE_S * 1000
+    run_id = uuid.uuid4().hex[:12]
+    staging = os.path.join(ARCHIVE_DIR, _STAGING_DIR, run_id)
+    os.makedirs(staging, exist_ok=True)
+
+    def read(dataset, query, late_query):
+        fields = {'module': module_field('a'), 'type': type_field('a')} if dataset == 'activities' else {}
+        since_ms = watermark.get(f'{dataset}_ms', -1)
+        sources = [stream_query(f"archive.{dataset}", query.format(**fields), since_ms=since_ms, until_ms=until_ms)]
+        if since_ms >= 0:
+            # 补录上次归档之后写入、时间不晚于上次水位的记录（旧水位没有 ingested_ms 时从头按写入时间查找）
+            sources.append(stream_query(
+                f"archive.{dataset}.late", late_query.format(**fields), since_ms=since_ms, until_ms=until_ms,
+                since_ingested_ms=watermark.get('ingested_ms', -1)
+            ))
+        return sources
+
+    try:
+        activity_sources = read('activities', _ACTIVITY_QUERY, _LATE_ACTIVITY_QUERY)
+        if full:
+            activity_sources.insert(0, _cold_rows())
+        activities = _write_batches('activities', _chain(*activity_sources), staging, run_id)
+        replies = _write_batches('replies', _chain(*read('replies', _REPLY_QUERY, _LATE_REPLY_QUERY)),
+                                 staging, run_id)
+        students = _write_students(staging)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    _publish(staging, {
+        'activities_ms': until_ms,
+        'replies_ms': until_ms,
+        'ingested_ms': until_ms,
+        'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    })
+    elapsed = round(time.perf_counter() - start, 1)
+    print(f"[列式归档] 活动 {activities} 条，回复 {replies} 条，学生 {students} 名，耗时 {elapsed}s")
+    return {
+        'activities': activities,
+        'replies': replies,
+        'students': students,
+        'until_ms': until_ms,
+        'elapsed_s': elapsed,
+    }
+
+def get_archive_status():
+    """水位、各数据集的分区数和文件大小（供数据管理页面展示）"""
+    status = {'watermark': load_watermark(), 'datasets': {}}
+    for name in ('activities', 'replies', 'students'):
+        root = os.path.join(ARCHIVE_DIR, name)
+        files = 0
+        size = 0
+        days = set()
+        for path, _, file_names in os.walk(root):
+            parquet = [f for f in file_names if f.endswith('.parquet')]
+            if not parquet:
+                continue
+            files += len(parquet)
+            size += sum(os.path.getsize(os.path.join(path, f)) for f in parquet)
+            day = next((part for part in os.path.relpath(path, root).split(os.sep) if part.startswith('day=')), None)
+            if day:
+                days.add(day)
+        status['datasets'][name] = {'files': files, 'days': len(days), 'size_mb': round(size / 1024 / 1024, 2)}
+    return status
+
+def main():
+    """命令行入口"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="活动日志列式归档（Parquet）")
+    parser.add_argument("--full", action="store_true", help="清空已有归档后全量归档（含冷归档中的活动）")
+    parser.add_argument("--status", action="store_true", help="只显示水位和分区统计")
+    args = parser.parse_args()
+
+    if args.status:
+        status = get_archive_status()
+        print(f"水位: {status['watermark']}")
+        for name, info in status['datasets'].items():
+            print(f"  {name}: {info['files']} 个文件，{info['days']} 天，{info['size_mb']}MB")
+        return 0
+
+    result = run_archive(full=args.full)
+    print(f"✅ 归档完成：活动 {result['activities']} 条，回复 {result['replies']} 条，学生 {result['students']} 名")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,211 @@
+"""
+异步查询模块
+基于 AsyncGraphDatabase 的读查询路径，运行在专用的事件循环线程上：
+页面需要的多个互不依赖的聚合查询以协程并发执行（asyncio.gather），不必每个查询占用一个线程。
+对外只提供同步接口 gather_queries，Streamlit 渲染函数的写法不变。
+与同步网关（见 db）共用结果缓存、熔断器、读己之写、查询统计和连接名额（见 pool），
+两个驱动同时使用中的连接数不超过连接池大小；相同查询在事件循环内合并执行。
+同步驱动被重建或重置时异步驱动一起丢弃，下次查询时按新的连接池大小重新创建。
+未安装异步驱动、关闭 QUERY_ASYNC_ENABLED 或使用嵌入式存储时退回线程池并行（run_parallel）。
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+from config.settings import QUERY_ASYNC_ENABLED, QUERY_RETRY_MAX_S, QUERY_TIMEOUT_S
+from modules.query_cache import get_policy, make_key, cache_get, cache_put, tag_snapshot, get_write_seq
+from modules.health import DatabaseUnavailable, CircuitOpenError, allow_request, record_success, record_failure
+from modules.consistency import read_requirements, uses_routing
+from modules.storage import neo4j_enabled
+
+# 可选导入Neo4j异步驱动
+try:
+    from neo4j import AsyncGraphDatabase
+    HAS_ASYNC_NEO4J = True
+except ImportError:
+    HAS_ASYNC_NEO4J = False
+    AsyncGraphDatabase = None
+
+_loop = None
+_loop_lock = threading.Lock()
+
+# 以下状态只在事件循环线程中访问
+_driver = None
+_inflight = {}
+
+def is_async_enabled():
+    return QUERY_ASYNC_ENABLED and HAS_ASYNC_NEO4J and neo4j_enabled()
+
+def _ensure_loop():
+    """按需启动事件循环线程（每个进程一个）"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="neo4j-async", daemon=True).start()
+                _loop = loop
+    return _loop
+
+def _get_driver(config):
+    """异步驱动（在事件循环线程中创建，连接池参数与同步驱动一致）"""
+    global _driver
+    if _driver is None:
+        if not config['uri']:
+            raise DatabaseUnavailable("Neo4j驱动不可用")
+        from modules.pool import driver_pool_config
+        _driver = AsyncGraphDatabase.driver(
+            config['uri'],
+            auth=(config['username'], config['password']),
+            connection_timeout=10,
+            max_transaction_retry_time=QUERY_RETRY_MAX_S,
+            **driver_pool_config()
+        )
+    return _driver
+
+def _swap_driver(grace_s):
+    """（事件循环线程中）丢弃当前异步驱动；grace_s 为空时立即关闭，否则等占用的名额释放后关闭"""
+    global _driver
+    driver, _driver = _driver, None
+    if driver is None:
+        return
+    loop = asyncio.get_running_loop()
+
+    def close():
+        asyncio.run_coroutine_threadsafe(driver.close(), loop)
+
+    if grace_s is None:
+        close()
+    else:
+        from modules.pool import retire_driver
+        retire_driver(driver, grace_s, close=close)
+
+def reset_async_driver(grace_s=None):
+    """同步驱动重建（扩容）或重置（探测失败）时调用，异步驱动随后按新配置重新创建"""
+    if _loop is None:
+        return
+    _loop.call_soon_threadsafe(_swap_driver, grace_s)
+
+async def _execute(name, cypher, parameters, config, bookmarks):
+    """以异步读事务执行一条查询，返回记录字典列表"""
+    from modules.db import _record, _sum_db_hits, _with_timeout, is_profiling
+
+    if not allow_request():
+        raise CircuitOpenError("Neo4j熔断中")
+    parameters = parameters or {}
+    profile = is_profiling()
+    text = "PROFILE " + cypher if profile else cypher
+    attempts = [0]
+
+    async def work(tx):
+        attempts[0] += 1
+        result = await tx.run(text, parameters)
+        records = [dict(record) async for record in result]
+        return records, await result.consume()
+
+    session_config = {'bookmarks': bookmarks} if bookmarks is not None else {}
+    start = time.perf_counter()
+    try:
+        from modules.pool import acquire_slot, release_slot
+        driver = _get_driver(config)
+        # 连接名额与同步网关共用，等待名额时不阻塞事件循环
+        await asyncio.to_thread(acquire_slot, name, driver)
+        try:
+            async with driver.session(**session_config) as session:
+                records, summary = await session.execute_read(_with_timeout(work))
+        finally:
+            release_slot(driver)
+    except Exception as e:
+        record_failure(e)
+        _record(name, (time.perf_counter() - start) * 1000, error=e, parameters=parameters,
+                retries=max(attempts[0] - 1, 0))
+        raise
+    record_success()
+    db_hits = _sum_db_hits(summary.profile) if profile else None
+    _record(name, (time.perf_counter() - start) * 1000, len(records), db_hits, parameters=parameters,
+            retries=max(attempts[0] - 1, 0))
+    return records
+
+async def _run_query(name, cypher, parameters, config, min_seq, bookmarks):
+    """单条读查询：先查缓存，再合并事件循环内相同的执行中查询，最后访问数据库"""
+    from modules.db import _incr_stat, _copy
+
+    key = make_key(name, cypher, parameters)
+    policy = get_policy(name)
+    if policy is not None:
+        ttl, tags = policy
+        cached = cache_get(key, tags, min_fresh=min_seq if uses_routing() else 0)
+        if cached is not None:
+            _incr_stat(name, 'cache_hits')
+            return cached
+
+    call = _inflight.get(key)
+    if call is not None and call[0] >= min_seq:
+        _incr_stat(name, 'coalesced')
+        return _copy(await asyncio.shield(call[1]))
+
+    fresh = min_seq if uses_routing() else get_write_seq()
+    versions = tag_snapshot(policy[1]) if policy is not None else None
+    task = asyncio.ensure_future(_execute(name, cypher, parameters, config, bookmarks))
+    _inflight[key] = (fresh, task)
+    try:
+        records = await asyncio.shield(task)
+    finally:
+        if _inflight.get(key, (None, None))[1] is task:
+            del _inflight[key]
+    if policy is not None:
+        cache_put(key, versions, policy[0], records, fresh=fresh)
+    return _copy(records)
+
+async def _timed(spec, config, min_seq, bookmarks):
+    """执行一条查询，返回 (结果, 异常, 耗时毫秒)"""
+    name, cypher = spec[0], spec[1]
+    parameters = spec[2] if len(spec) > 2 else None
+    start = time.perf_counter()
+    try:
+        records = await _run_query(name, cypher, parameters, config, min_seq, bookmarks)
+        return records, None, (time.perf_counter() - start) * 1000
+    except Exception as e:
+        return None, e, (time.perf_counter() - start) * 1000
+
+async def _gather(queries, config, min_seq, bookmarks):
+    keys = list(queries)
+    outcomes = await asyncio.gather(*[_timed(queries[key], config, min_seq, bookmarks) for key in keys])
+    return dict(zip(keys, outcomes))
+
+def gather_queries(page, queries, return_exceptions=False):
+    """
+    并发执行一组互不依赖的读查询 {键: (查询名称, 语句[, 参数])}，全部完成后返回 {键: 记录字典列表}
+    异常处理与 run_parallel 相同：return_exceptions 为 True 时异常作为结果返回，否则抛出第一个异常
+    """
+    from modules.db import run_parallel, run_query, _record_page
+
+    if not is_async_enabled():
+        return run_parallel(page, {
+            key: (lambda spec=spec: run_query(*spec)) for key, spec in queries.items()
+        }, return_exceptions=return_exceptions)
+
+    from modules.auth import _get_neo4j_config
+    # 会话状态和配置只能在调用方线程读取
+    min_seq, bookmarks = read_requirements()
+    config = _get_neo4j_config()
+    start = time.perf_counter()
+    future = asyncio.run_coroutine_threadsafe(_gather(queries, config, min_seq, bookmarks), _ensure_loop())
+    try:
+        outcomes = future.result(timeout=QUERY_TIMEOUT_S)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"页面 {page} 的并发查询超过 {QUERY_TIMEOUT_S}s 未完成")
+    wall_ms = (time.perf_counter() - start) * 1000
+    _record_page(page, wall_ms, sum(ms for _, _, ms in outcomes.values()), len(queries))
+
+    results = {}
+    for key, (value, error, _) in outcomes.items():
+        if error is not None:
+            if not return_exceptions:
+                raise error
+            value = error
+        results[key] = value
+    return results
@@ -3,9 +3,13 @@
 处理学生登录和教师登录验证
 """
 
+import base64
+import json
 import streamlit as st
 from datetime import datetime
 
+from modules.storage import embedded_store, neo4j_enabled
+
 # 可选导入Neo4j（仅本地开发需要）
 try:
     from neo4j import GraphDatabase
@@ -91,240 +95,385 @@ TEACHER_PASSWORD = "admin888"
 
 # 全局缓存的Neo4j驱动（避免重复创建连接）
 _cached_driver = None
-_driver_last_check = 0  # 上次检查时间戳
 
 def get_neo4j_driver():
-    """获取Neo4j连接（使用缓存避免重复连接）"""
-    global _cached_driver, _driver_last_check
-    import time
+    """获取Neo4j连接（使用缓存避免重复连接，连接是否可用由健康监测模块后台探测）"""
+    global _cached_driver
     
     # 获取配置（延迟加载）
     config = _get_neo4j_config()
-    neo4j_uri = config['uri']
-    neo4j_username = config['username']
-    neo4j_password = config['password']
     
-    # 云端部署时跳过Neo4j
-    if not HAS_NEO4J or not neo4j_uri:
+    # 云端部署或使用嵌入式存储时跳过Neo4j
+    if not HAS_NEO4J or not config['uri'] or not neo4j_enabled():
         return None
     
-    current_time = time.time()
-    
-    # 如果已有缓存的driver，且距离上次检查不超过60秒，直接返回
     if _cached_driver is not None:
-        if current_time - _driver_last_check < 60:
-            return _cached_driver
-        try:
-            # 验证连接是否仍然有效（每60秒检查一次）
-            _cached_driver.verify_connectivity()
-            _driver_last_check = current_time
-            return _cached_driver
-        except:
-            # 连接失效，重新创建
-            try:
-                _cached_driver.close()
-            except:
-                pass
-            _cached_driver = None
+        return _cached_driver
     
     # 创建新的driver
     try:
-        _cached_driver = GraphDatabase.driver(
-            neo4j_uri, 
-            auth=(neo4j_username, neo4j_password),
-            max_connection_lifetime=300,  # 5分钟
-            connection_timeout=10,
-            max_connection_pool_size=10
-        )
-        _driver_last_check = current_time
+        _cached_driver = _create_driver(config)
         return _cached_driver
     except Exception as e:
         print(f"Neo4j连接创建失败: {e}")
         return None
 
-# 全局变量：标记Neo4j是否可用
-_neo4j_available = None
-_neo4j_error = None
+def _create_driver(config, pool_size=None):
+    """按配置创建驱动（连接池参数见 pool 模块）"""
+    from config.settings import QUERY_RETRY_MAX_S
+    from modules.pool import driver_pool_config
+    pool_config = driver_pool_config()
+    if pool_size is not None:
+        pool_config['max_connection_pool_size'] = pool_size
+    return GraphDatabase.driver(
+        config['uri'], 
+        auth=(config['username'], config['password']),
+        connection_timeout=10,
+        max_transaction_retry_time=QUERY_RETRY_MAX_S,  # 托管事务瞬时错误的重试总时长
+        **pool_config
+    )
+
+def get_cached_driver():
+    """当前缓存的驱动（不创建新驱动）"""
+    return _cached_driver
+
+def rebuild_neo4j_driver(pool_size):
+    """以新的连接池大小重建驱动，旧驱动等进行中的查询（包括流式导出）全部结束后再关闭"""
+    global _cached_driver
+    from config.settings import QUERY_TIMEOUT_S
+    from modules.pool import retire_driver
+    new_driver = _create_driver(_get_neo4j_config(), pool_size)
+    old_driver, _cached_driver = _cached_driver, new_driver
+    if old_driver is not None:
+        retire_driver(old_driver, QUERY_TIMEOUT_S)
+    # 异步驱动按新的连接池大小重新创建
+    from modules.async_db import reset_async_driver
+    reset_async_driver(QUERY_TIMEOUT_S)
+
+def reset_neo4j_driver():
+    """关闭并丢弃缓存的驱动（健康探测失败后调用，下次使用时重新创建）"""
+    global _cached_driver
+    driver, _cached_driver = _cached_driver, None
+    if driver is not None:
+        try:
+            driver.close()
+        except Exception:
+            pass
+    from modules.async_db import reset_async_driver
+    reset_async_driver()
+
+# 连接成功后是否已启动结构迁移
+_migrations_started = False
 
 def check_neo4j_available():
-    """检查Neo4j是否可用"""
-    global _neo4j_available, _neo4j_error
+    """检查Neo4j是否可用（读取健康监测的熔断器状态，不访问数据库）"""
+    # 嵌入式存储不依赖数据库服务
+    if embedded_store() is not None:
+        return True
+    
+    global _migrations_started
     
-    # 如果 Streamlit 还没准备好，返回 None（不缓存结果）
+    # 如果 Streamlit 还没准备好，返回 False
     if not _is_streamlit_ready():
         return False
     
-    if _neo4j_available is not None:
-        return _neo4j_available
+    from modules.health import ensure_monitor_started, is_available
+    # 首次调用时同步探测一次，之后由后台线程探测
+    ensure_monitor_started()
+    available = is_available()
+    if available and not _migrations_started:
+        _migrations_started = True
+        _start_schema_migrations()
+    return available
+
+def _start_schema_migrations():
+    """连接成功后在后台执行结构迁移（创建约束和索引）"""
     try:
-        driver = get_neo4j_driver()
-        if driver is None:
-            _neo4j_available = False
-            _neo4j_error = "无法创建Neo4j驱动：get_neo4j_driver()返回None"
-            print(f"[Neo4j检查失败] {_neo4j_error}")
-            return False
-            
-        with driver.session() as session:
-            result = session.run("RETURN 1")
-            result.single()
-        # 不关闭driver，保持连接池复用
-        _neo4j_available = True
-        _neo4j_error = None
-        print("[Neo4j检查成功] 连接正常")
+        from config.settings import SCHEMA_AUTO_MIGRATE
+        if SCHEMA_AUTO_MIGRATE:
+            from modules.schema_migrations import ensure_schema_async
+            ensure_schema_async()
     except Exception as e:
-        _neo4j_available = False
-        _neo4j_error = str(e)
-        print(f"[Neo4j检查失败] {e}")
-    return _neo4j_available
+        print(f"[结构迁移] 启动失败: {e}")
 
 def get_neo4j_error():
     """获取Neo4j连接错误信息"""
-    return _neo4j_error
+    from modules.health import get_last_error
+    return get_last_error()
 
 def register_student(student_id, student_name):
-    """注册或更新学生信息"""
+    """注册或更新学生信息（数据库不可用时暂存本地，恢复后回放）"""
+    store = embedded_store()
+    if store is not None:
+        from modules.activity_writer import build_login_event
+        try:
+            store.write_events([build_login_event(student_id, student_name)])
+        except Exception as e:
+            print(f"学生登录记录失败: {e}")
+        return
+    
+    if not HAS_NEO4J:
+        return
+    
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            session.run("""
-                MERGE (s:mfx_Student {student_id: $student_id})
-                SET s.name = $name,
-                    s.last_login = datetime(),
-                    s.login_count = COALESCE(s.login_count, 0) + 1
-            """, student_id=student_id, name=student_name)
-        
-        # 不关闭driver，保持连接池复用
+        from modules.activity_writer import build_login_event, write_now
+        write_now(build_login_event(student_id, student_name))
     except Exception as e:
-        print(f"Neo4j连接失败，跳过学生注册: {e}")
-        pass
+        print(f"学生登录记录失败，跳过学生注册: {e}")
 
 def log_activity(student_id, activity_type, module_name, content_id=None, content_name=None, details=None):
-    """记录学生学习活动"""
-    # 如果Neo4j不可用，直接跳过
-    if not check_neo4j_available():
+    """记录学生学习活动（仅入队，由后台线程批量写入，写入失败时暂存本地）"""
+    store = embedded_store()
+    if store is not None:
+        from modules.activity_writer import build_activity_event
+        try:
+            store.write_events([build_activity_event(
+                student_id, activity_type, module_name,
+                content_id=content_id, content_name=content_name, details=details
+            )])
+        except Exception as e:
+            print(f"[活动写入] 写入失败: {e}")
+        return
+    
+    if not HAS_NEO4J:
         return
     
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            session.run("""
-                MERGE (s:mfx_Student {student_id: $student_id})
-                CREATE (a:mfx_Activity {
-                    id: randomUUID(),
-                    activity_type: $activity_type,
-                    module_name: $module_name,
-                    content_id: $content_id,
-                    content_name: $content_name,
-                    details: $details,
-                    timestamp: datetime()
-                })
-                CREATE (s)-[:PERFORMED]->(a)
-            """, student_id=student_id, activity_type=activity_type, 
-                module_name=module_name, content_id=content_id,
-                content_name=content_name, details=details)
+        from modules.activity_writer import build_activity_event, enqueue_activity
+        enqueue_activity(build_activity_event(
+            student_id, activity_type, module_name,
+            content_id=content_id, content_name=content_name, details=details
+        ))
     except Exception as e:
-        pass
+        print(f"[活动写入] 入队失败: {e}")
 
 def get_all_students():
     """获取所有学生列表"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_all_students()
+    
     if not check_neo4j_available():
         return []
     
+    from modules.db import run_query
+    from modules.rollups import counters_ready
+    
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            result = session.run("""
+        if counters_ready():
+            # 直接读取学生节点上的计数，不再遍历活动
+            return run_query("auth.get_all_students", """
                 MATCH (s:mfx_Student)
-                OPTIONAL MATCH (s)-[:PERFORMED]->(a:mfx_Activity)
-                WITH s, count(a) as activity_count
                 RETURN s.student_id as student_id, 
                        s.name as name,
-                       activity_count
+                       COALESCE(s.activity_count, 0) as activity_count
                 ORDER BY activity_count DESC
             """)
-            
-            students = [dict(record) for record in result]
-        
-        return students
+        return run_query("auth.get_all_students.scan", """
+            MATCH (s:mfx_Student)
+            OPTIONAL MATCH (s)-[:PERFORMED]->(a:mfx_Activity)
+            WITH s, count(a) as activity_count
+            RETURN s.student_id as student_id, 
+                   s.name as name,
+                   activity_count
+            ORDER BY activity_count DESC
+        """)
     except:
         return []
 
+def _activity_query(student_id=None, module=None, cursor=None):
+    """
+    活动记录查询的公共部分（MATCH/WHERE/RETURN），按 (毫秒时间戳, 活动ID) 倒序
+    排序和续页使用 ts_ms_field()，还没有回填 ts_ms 的字符串 / LocalDateTime 时间同样参与排序，不会被跳过
+    """
+    from modules.schema_migrations import module_field, type_field, ts_ms_field
+    
+    module_expr = module_field('a')
+    query = """
+        MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+        WHERE 1=1
+    """
+    params = {}
+    
+    if student_id:
+        query += " AND s.student_id = $student_id"
+        params["student_id"] = student_id
+    
+    if module:
+        query += f" AND {module_expr} = $module"
+        params["module"] = module
+    
+    if cursor:
+        # 已回填的活动先按 ts_ms 索引范围过滤，再从上一页最后一条之后继续（时间相同时按活动ID区分）
+        query += " AND (a.ts_ms IS NULL OR a.ts_ms <= $cursor_ms)"
+        params["cursor_ms"], params["cursor_id"] = cursor
+    
+    query += f"""
+        WITH s, a, {ts_ms_field('a')} as ts_key, COALESCE(a.id, '') as activity_id
+    """
+    if cursor:
+        query += """
+        WHERE ts_key < $cursor_ms OR (ts_key = $cursor_ms AND activity_id < $cursor_id)
+        """
+    
+    # 时间在查询中转为字符串（驱动不必构造时间对象），显示时用 timestamps.format_times；ts_key 供续页令牌使用
+    query += f"""
+        RETURN s.student_id as student_id,
+               s.name as student_name,
+               {type_field('a')} as activity_type,
+               {module_expr} as module,
+               a.content_id as content_id,
+               a.content_name as content_name,
+               a.details as details,
+               toString(a.timestamp) as timestamp,
+               activity_id,
+               ts_key
+        ORDER BY ts_key DESC, activity_id DESC
+        LIMIT $limit
+    """
+    return query, params
+
+def encode_activity_cursor(timestamp, activity_id):
+    """把 (排序键, 活动ID) 编码为续页令牌（Neo4j 为毫秒时间戳，嵌入式存储为规范时间字符串）"""
+    raw = json.dumps([timestamp, activity_id or ''], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_activity_cursor(token, key_type=str):
+    """解析续页令牌，无效令牌（包括排序键类型不是 key_type 的旧令牌）返回 None（从第一页开始）"""
+    try:
+        timestamp, activity_id = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        if not isinstance(timestamp, key_type) or isinstance(timestamp, bool):
+            return None
+        return timestamp, str(activity_id)
+    except Exception:
+        return None
+
 def get_student_activities(student_id=None, module=None, limit=100):
     """获取学生活动记录"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_student_activities(student_id, module, limit)
+    
     if not check_neo4j_available():
         return []
     
+    from modules.db import run_query
+    
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            query = """
-                MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
-                WHERE 1=1
-            """
-            params = {"limit": limit}
-            
-            if student_id:
-                query += " AND s.student_id = $student_id"
-                params["student_id"] = student_id
-            
-            if module:
-                query += " AND COALESCE(a.module_name, a.module) = $module"
-                params["module"] = module
-            
-            query += """
-                RETURN s.student_id as student_id,
-                       s.name as student_name,
-                       COALESCE(a.activity_type, a.type) as activity_type,
-                       COALESCE(a.module_name, a.module) as module,
-                       a.content_id as content_id,
-                       a.content_name as content_name,
-                       a.details as details,
-                       a.timestamp as timestamp
-                ORDER BY a.timestamp DESC
-                LIMIT $limit
-            """
-            
-            result = session.run(query, **params)
-            activities = []
-            for record in result:
-                activity = dict(record)
-                # 将timestamp转换为字符串，避免Date序列化问题
-                if 'timestamp' in activity and activity['timestamp']:
-                    activity['timestamp'] = str(activity['timestamp'])
-                activities.append(activity)
-        
+        query, params = _activity_query(student_id, module)
+        params["limit"] = limit
+        activities = run_query("auth.get_student_activities", query, params)
+        for activity in activities:
+            del activity['ts_key']
         return activities
     except Exception as e:
         print(f"获取学生活动失败: {e}")
         return []
 
+def get_student_activities_page(student_id=None, module=None, cursor=None, page_size=None):
+    """
+    按游标分页获取学生活动记录，返回 (本页记录, 下一页令牌)
+    cursor 为上一页返回的令牌（None 表示第一页），没有更多记录时下一页令牌为 None
+    """
+    store = embedded_store()
+    if store is not None:
+        return store.get_student_activities_page(student_id, module, cursor, page_size)
+    
+    from config.settings import ACTIVITY_PAGE_SIZE
+    page_size = page_size or ACTIVITY_PAGE_SIZE
+    if not check_neo4j_available():
+        return [], None
+    
+    from modules.db import run_query
+    
+    try:
+        query, params = _activity_query(student_id, module, decode_activity_cursor(cursor, int) if cursor else None)
+        # 多取一条判断是否还有下一页
+        params["limit"] = page_size + 1
+        activities = run_query("auth.get_student_activities.page", query, params)
+        next_cursor = None
+        if len(activities) > page_size:
+            activities = activities[:page_size]
+            last = activities[-1]
+            next_cursor = encode_activity_cursor(last['ts_key'], last['activity_id'])
+        for activity in activities:
+            del activity['ts_key']
+        return activities, next_cursor
+    except Exception as e:
+        print(f"分页获取学生活动失败: {e}")
+        return [], None
+
+def get_student_activity_summary(student_id=None, module=None):
+    """活动记录的总数、活跃天数和学习内容数（在数据库中聚合，不取回明细）"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_student_activity_summary(student_id, module)
+    
+    empty = {'total': 0, 'active_days': 0, 'content_count': 0}
+    if not check_neo4j_available():
+        return empty
+    
+    from modules.db import run_single
+    from modules.schema_migrations import module_field
+    
+    try:
+        query = """
+            MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+            WHERE 1=1
+        """
+        params = {}
+        if student_id:
+            query += " AND s.student_id = $student_id"
+            params["student_id"] = student_id
+        if module:
+            query += f" AND {module_field('a')} = $module"
+            params["module"] = module
+        query += """
+            RETURN count(a) as total,
+                   count(DISTINCT date(a.timestamp)) as active_days,
+                   count(DISTINCT a.content_name) as content_count
+        """
+        return run_single("auth.get_student_activities.summary", query, params) or empty
+    except Exception as e:
+        print(f"获取活动汇总失败: {e}")
+        return empty
+
 def get_module_statistics():
     """获取各模块使用统计"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_module_statistics()
+    
     if not check_neo4j_available():
         return []
     
+    from modules.db import run_query
+    from modules.schema_migrations import module_field
+    from modules.rollups import sketches_ready
+    
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            # 获取每个模块的详细统计
-            result = session.run("""
-                MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
-                WITH COALESCE(a.module_name, a.module) as module, 
-                     count(a) as total_activities,
-                     count(DISTINCT s) as unique_students,
-                     collect(DISTINCT s.student_id) as student_ids
-                RETURN module, total_activities, unique_students, 0 as today_count
+        if sketches_ready():
+            # 活动数读取模块日汇总，学生数由去重计数草图估算
+            from modules.sketches import unique_students_by_module
+            result = run_query("auth.get_module_statistics.rollup", """
+                MATCH (d:mfx_DailyStat)
+                RETURN d.module_name as module, sum(d.count) as total_activities
                 ORDER BY total_activities DESC
             """)
-            
-            stats = [dict(record) for record in result]
+            unique = unique_students_by_module()
+            return [dict(record, unique_students=unique.get(record['module'], 0), today_count=0)
+                    for record in result]
         
-        return stats
+        # 获取每个模块的详细统计
+        return run_query("auth.get_module_statistics", f"""
+            MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+            WITH {module_field('a')} as module, 
+                 count(a) as total_activities,
+                 count(DISTINCT s) as unique_students,
+                 collect(DISTINCT s.student_id) as student_ids
+            RETURN module, total_activities, unique_students, 0 as today_count
+            ORDER BY total_activities DESC
+        """)
     except:
         return []
 
@@ -333,28 +482,46 @@ def get_all_modules_statistics():
     if not check_neo4j_available():
         return {}
     
+    from modules.db import run_query
+    from modules.schema_migrations import module_field
+    from modules.rollups import sketches_ready
+    
+    store = embedded_store()
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            result = session.run("""
+        if store is not None:
+            result = [
+                {'module': record['module'], 'total_visits': record['total_activities'],
+                 'unique_students': record['unique_students']}
+                for record in store.get_module_statistics()
+            ]
+        elif sketches_ready():
+            # 访问次数读取模块日汇总，学生数由去重计数草图估算
+            from modules.sketches import unique_students_by_module
+            result = run_query("auth.get_all_modules_statistics.rollup", """
+                MATCH (d:mfx_DailyStat)
+                RETURN d.module_name as module, sum(d.count) as total_visits
+            """)
+            unique = unique_students_by_module()
+            result = [dict(record, unique_students=unique.get(record['module'], 0)) for record in result]
+        else:
+            result = run_query("auth.get_all_modules_statistics", f"""
                 MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
-                WITH COALESCE(a.module_name, a.module) as module, count(a) as total_visits, count(DISTINCT s) as unique_students
+                WITH {module_field('a')} as module, count(a) as total_visits, count(DISTINCT s) as unique_students
                 RETURN module, total_visits, unique_students
             """)
-            
-            stats_dict = {}
-            for record in result:
-                module = record['module']
-                total_visits = record['total_visits']
-                unique_students = record['unique_students']
-                avg_visits = round(total_visits / unique_students, 1) if unique_students > 0 else 0
-                stats_dict[module] = {
-                    'module': module,
-                    'total_visits': total_visits,
-                    'unique_students': unique_students,
-                    'avg_visits_per_student': avg_visits
-                }
+        
+        stats_dict = {}
+        for record in result:
+            module = record['module']
+            total_visits = record['total_visits']
+            unique_students = record['unique_students']
+            avg_visits = round(total_visits / unique_students, 1) if unique_students > 0 else 0
+            stats_dict[module] = {
+                'module': module,
+                'total_visits': total_visits,
+                'unique_students': unique_students,
+                'avg_visits_per_student': avg_visits
+            }
         
         return stats_dict
     except Exception as e:
@@ -363,6 +530,10 @@ def get_all_modules_statistics():
 
 def get_single_module_statistics(module_name):
     """获取单个模块的详细统计"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_single_module_statistics(module_name)
+    
     if not check_neo4j_available():
         return {
             'module': module_name,
@@ -372,35 +543,51 @@ def get_single_module_statistics(module_name):
             'recent_7d_visits': 0
         }
     
+    from modules.async_db import gather_queries
+    from modules.schema_migrations import module_field
+    from modules.rollups import sketches_ready
+    
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            # 总访问次数和学生数
-            result = session.run("""
+        params = {'module': module_name}
+        use_sketches = sketches_ready()
+        if use_sketches:
+            # 访问次数读取模块日汇总，学生数由去重计数草图估算
+            totals_query = ("auth.get_single_module_statistics.totals.rollup", """
+                MATCH (d:mfx_DailyStat {module_name: $module})
+                RETURN COALESCE(sum(d.count), 0) as total_activities
+            """, params)
+        else:
+            totals_query = ("auth.get_single_module_statistics.totals", f"""
                 MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
-                WHERE COALESCE(a.module_name, a.module) = $module
+                WHERE {module_field('a')} = $module
                 RETURN count(a) as total_activities,
                        count(DISTINCT s) as unique_students
-            """, module=module_name)
-            
-            record = result.single()
-            total_activities = record['total_activities'] if record else 0
-            unique_students = record['unique_students'] if record else 0
-            
-            # 计算人均访问次数
-            avg_visits = round(total_activities / unique_students, 1) if unique_students > 0 else 0
-            
-            # 近7天访问
-            result = session.run("""
+            """, params)
+        
+        # 总访问次数、学生数和近7天访问互不依赖，并发查询
+        results = gather_queries("auth.get_single_module_statistics", {
+            'totals': totals_query,
+            'recent': ("auth.get_single_module_statistics.recent", f"""
                 MATCH (a:mfx_Activity)
-                WHERE COALESCE(a.module_name, a.module) = $module
+                WHERE {module_field('a')} = $module
                   AND a.timestamp > datetime() - duration('P7D')
                 RETURN count(a) as recent_count
-            """, module=module_name)
-            
-            record = result.single()
-            recent_count = record['recent_count'] if record else 0
+            """, params),
+        })
+        
+        record = results['totals'][0] if results['totals'] else None
+        total_activities = record['total_activities'] if record else 0
+        if use_sketches:
+            from modules import sketches
+            unique_students = sketches.unique_students(module_name)
+        else:
+            unique_students = record['unique_students'] if record else 0
+        
+        # 计算人均访问次数
+        avg_visits = round(total_activities / unique_students, 1) if unique_students > 0 else 0
+        
+        record = results['recent'][0] if results['recent'] else None
+        recent_count = record['recent_count'] if record else 0
         
         return {
             'module': module_name,
@@ -420,38 +607,44 @@ def get_single_module_statistics(module_name):
         }
 
 def delete_student_data(student_id):
-    """删除学生及其所有活动数据"""
+    """删除学生及其所有活动数据，student_id 也可以是学号列表（分批删除多名学生，见 deletion）"""
+    from modules.activity_snapshot import invalidate_snapshot
+    
+    student_ids = [student_id] if isinstance(student_id, str) else list(student_id)
+    store = embedded_store()
+    if store is not None:
+        for sid in student_ids:
+            store.delete_student_data(sid)
+        invalidate_snapshot()
+        return
+    
     if not check_neo4j_available():
         return
     
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            # 删除活动记录
-            session.run("""
-                MATCH (s:mfx_Student {student_id: $student_id})-[:PERFORMED]->(a:mfx_Activity)
-                DETACH DELETE a
-            """, student_id=student_id)
-            
-            # 删除学生节点
-            session.run("""
-                MATCH (s:mfx_Student {student_id: $student_id})
-                DETACH DELETE s
-            """, student_id=student_id)
+        # 汇总扣除、分批删除活动和学生、会话汇总、冷归档和草图重建
+        from modules.deletion import run_deletion
+        run_deletion('students', student_ids)
     except:
         pass
 
 def delete_all_activities():
     """删除所有活动记录"""
+    from modules.activity_snapshot import invalidate_snapshot
+    
+    store = embedded_store()
+    if store is not None:
+        store.delete_all_activities()
+        invalidate_snapshot()
+        return
+    
     if not check_neo4j_available():
         return
     
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            session.run("MATCH (a:mfx_Activity) DETACH DELETE a")
+        # 分批删除活动，完成后清空汇总、学习会话汇总和冷归档
+        from modules.deletion import run_deletion
+        run_deletion('activities')
     except:
         pass
 
@@ -537,7 +730,4 @@ def logout():
     keys_to_clear = list(st.session_state.keys())
     for key in keys_to_clear:
         del st.session_state[key]
-    
-    # 重置Neo4j可用性检查
-    global _neo4j_available
-    _neo4j_available = None
+
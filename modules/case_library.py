@@ -5,6 +5,8 @@
 
 import streamlit as st
 
+from modules.storage import embedded_store
+
 # 可选导入Elasticsearch（仅本地开发需要）
 try:
     from elasticsearch import Elasticsearch
@@ -106,32 +108,32 @@ def search_cases(query="", difficulty=None):
 
 def get_case_detail(case_id):
     """从Neo4j获取案例详情"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_case_detail(case_id)
+    
     if not check_neo4j_available():
         return None
     
+    from modules.db import run_query, run_single
+    
     try:
-        driver = get_neo4j_driver()
+        # 获取案例基本信息
+        case = run_single("case_library.get_case_detail", """
+            MATCH (c:mfx_Case {id: $case_id})
+            RETURN c
+        """, case_id=case_id)
         
-        with driver.session() as session:
-            # 获取案例基本信息
-            result = session.run("""
-                MATCH (c:mfx_Case {id: $case_id})
-                RETURN c
-            """, case_id=case_id)
-            
-            case = result.single()
-            if not case:
-                return None
-            
-            case_data = dict(case['c'])
-            
-            # 获取关联的知识点
-            result = session.run("""
-                MATCH (c:mfx_Case {id: $case_id})-[:RELATES_TO]->(k:mfx_Knowledge)
-                RETURN k.id as id, k.name as name
-            """, case_id=case_id)
-            
-            case_data['knowledge_points'] = [dict(record) for record in result]
+        if not case:
+            return None
+        
+        case_data = dict(case['c'])
+        
+        # 获取关联的知识点
+        case_data['knowledge_points'] = run_query("case_library.get_case_knowledge", """
+            MATCH (c:mfx_Case {id: $case_id})-[:RELATES_TO]->(k:mfx_Knowledge)
+            RETURN k.id as id, k.name as name
+        """, case_id=case_id)
         
         return case_data
     except Exception:
@@ -8,6 +8,8 @@ from datetime import datetime
 from openai import OpenAI
 from streamlit_autorefresh import st_autorefresh
 from config.settings import *
+from modules.storage import embedded_store
+from modules.timestamps import format_times
 
 def check_neo4j_available():
     """检查Neo4j是否可用"""
@@ -43,96 +45,93 @@ def log_interaction_activity(activity_type, content_id=None, content_name=None,
 
 def create_question(question_text):
     """教师创建问题"""
+    store = embedded_store()
+    if store is not None:
+        return store.create_question(question_text)
+    
     if not check_neo4j_available():
         return None
     
+    from modules.db import run_write
+    from modules.query_cache import TAG_QUESTION
+    
     try:
-        driver = get_neo4j_driver()
+        # 先关闭所有活跃问题
+        run_write("classroom.close_active_questions",
+                  "MATCH (q:mfx_Question {status: 'active'}) SET q.status = 'closed'",
+                  invalidates=(TAG_QUESTION,))
         
-        with driver.session() as session:
-            # 先关闭所有活跃问题
-            session.run("MATCH (q:mfx_Question {status: 'active'}) SET q.status = 'closed'")
-            
-            # 创建新问题
-            result = session.run("""
-                CREATE (q:mfx_Question {
-                    id: randomUUID(),
-                    text: $text,
-                    created_at: datetime(),
-                    status: 'active'
-                })
-                RETURN q.id as id
-            """, text=question_text)
-            
-            question_id = result.single()['id']
+        # 创建新问题
+        result = run_write("classroom.create_question", """
+            CREATE (q:mfx_Question {
+                id: randomUUID(),
+                text: $text,
+                created_at: datetime(),
+                status: 'active'
+            })
+            RETURN q.id as id
+        """, text=question_text, invalidates=(TAG_QUESTION,))
         
-        return question_id
+        return result['records'][0]['id']
     except Exception:
         return None
 
 def get_active_question():
     """获取当前活跃问题"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_active_question()
+    
     if not check_neo4j_available():
         return None
     
+    from modules.db import run_single
+    
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            result = session.run("""
-                MATCH (q:mfx_Question {status: 'active'})
-                RETURN q.id as id, q.text as text, q.created_at as created_at
-                ORDER BY q.created_at DESC
-                LIMIT 1
-            """)
-            
-            record = result.single()
-            question = dict(record) if record else None
-        
-        return question
+        return run_single("classroom.get_active_question", """
+            MATCH (q:mfx_Question {status: 'active'})
+            RETURN q.id as id, q.text as text, q.created_at as created_at
+            ORDER BY q.created_at DESC
+            LIMIT 1
+        """)
     except Exception:
         return None
 
 def submit_reply(question_id, student_name, content):
-    """学生提交回复"""
-    if not check_neo4j_available():
+    """学生提交回复（数据库不可用时暂存本地，恢复后回放）"""
+    store = embedded_store()
+    if store is not None:
+        from modules.activity_writer import build_reply_event
+        try:
+            store.write_events([build_reply_event(question_id, student_name, content)])
+        except Exception as e:
+            print(f"[课中互动] 提交回复失败: {e}")
         return
     
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            session.run("""
-                MATCH (q:mfx_Question {id: $question_id})
-                MERGE (s:mfx_Student {name: $student_name})
-                CREATE (s)-[:REPLIED {
-                    content: $content,
-                    timestamp: datetime(),
-                    length: size($content)
-                }]->(q)
-            """, question_id=question_id, student_name=student_name, content=content)
-    except Exception:
-        pass
+        from modules.activity_writer import build_reply_event, write_now
+        write_now(build_reply_event(question_id, student_name, content))
+    except Exception as e:
+        print(f"[课中互动] 提交回复失败: {e}")
 
 def get_recent_replies(question_id, limit=20):
     """获取最新回复"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_recent_replies(question_id, limit)
+    
     if not check_neo4j_available():
         return []
     
+    from modules.db import run_query
+    
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            result = session.run("""
-                MATCH (s:mfx_Student)-[r:REPLIED]->(q:mfx_Question {id: $question_id})
-                RETURN s.name as student_name, r.content as content, r.timestamp as timestamp
-                ORDER BY r.timestamp DESC
-                LIMIT $limit
-            """, question_id=question_id, limit=limit)
-            
-            replies = [dict(record) for record in result]
-        
-        return replies
+        return run_query("classroom.get_recent_replies", """
+            MATCH (s:mfx_Student)-[r:REPLIED]->(q:mfx_Question {id: $question_id})
+            RETURN s.name as student_name, r.content as content, r.timestamp as timestamp
+            ORDER BY r.timestamp DESC
+            LIMIT $limit
+        """, question_id=question_id, limit=limit)
     except Exception:
         return []
 
@@ -210,8 +209,8 @@ def render_classroom_interaction():
             replies = get_recent_replies(current_q['id'])
             
             if replies:
-                for reply in replies:
-                    timestamp = reply['timestamp'].strftime("%H:%M:%S") if hasattr(reply['timestamp'], 'strftime') else str(reply['timestamp'])
+                times = format_times([reply['timestamp'] for reply in replies], "%H:%M:%S")
+                for reply, timestamp in zip(replies, times):
                     st.markdown(f"""
                     <div style="background: #f0f0f0; padding: 10px; margin: 5px 0; border-radius: 5px;">
                         <strong>{reply['student_name']}</strong>: {reply['content']}
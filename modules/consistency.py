@@ -0,0 +1,83 @@
+"""
+读己之写一致性模块
+每个浏览器会话在 st.session_state 中记录自己最近一次写入的序号和 Neo4j bookmark：
+- 写入序号是进程内的全局写入计数（每次写入递增），结果缓存项和合并执行中的查询都带有新鲜度序号，
+  只有不早于会话最近写入的共享结果才会复用，否则直接查询数据库；
+- bookmark 随读事务发送，neo4j:// 路由到只读副本时，副本追上这次写入后才执行查询；
+- 需要立即读回的写入（课堂回复、登录）因数据库延迟偏高改为排队时记录入队序号，会话下一次读取前
+  短暂等待写入线程刷出；普通活动日志（log_activity）不登记，页面读取不等待后台写入。
+后台线程（批量写入、迁移、命令行）没有会话，不做跟踪。
+"""
+
+import threading
+
+from config.settings import CONSISTENCY_WAIT_MS
+
+# st.session_state 中的键
+SEQ_KEY = '_db_write_seq'
+BOOKMARKS_KEY = '_db_bookmarks'
+PENDING_KEY = '_db_pending_event'
+
+_routing = None
+# run_parallel 的工作线程共享同一会话的 session_state，读改写会话中的序号时加锁
+_state_lock = threading.RLock()
+
+def _session_state():
+    """当前线程所属会话的 session_state，非 Streamlit 会话线程返回 None"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        if get_script_run_ctx(suppress_warning=True) is None:
+            return None
+        import streamlit as st
+        return st.session_state
+    except Exception:
+        return None
+
+def uses_routing():
+    """连接地址是否为 neo4j:// 路由地址（读事务可能落到只读副本）"""
+    global _routing
+    if _routing is None:
+        try:
+            from modules.auth import _get_neo4j_config
+            uri = _get_neo4j_config()['uri'] or ''
+            _routing = uri.split('://', 1)[0].startswith('neo4j')
+        except Exception:
+            return False
+    return _routing
+
+def note_write(seq, bookmarks=None):
+    """记录当前会话的一次写入（写入序号和写入后的 bookmark）"""
+    state = _session_state()
+    if state is None:
+        return
+    with _state_lock:
+        state[SEQ_KEY] = max(state.get(SEQ_KEY, 0), seq)
+        if bookmarks is not None:
+            state[BOOKMARKS_KEY] = bookmarks
+
+def note_enqueued(event_seq):
+    """记录当前会话放入后台写入队列的事件序号"""
+    state = _session_state()
+    if state is None:
+        return
+    with _state_lock:
+        state[PENDING_KEY] = max(state.get(PENDING_KEY) or 0, event_seq)
+
+def read_requirements():
+    """
+    当前会话读取需要满足的 (最小写入序号, bookmark)
+    有尚未刷出的登记事件时先等待写入线程（最多 CONSISTENCY_WAIT_MS 毫秒）
+    """
+    state = _session_state()
+    if state is None:
+        return 0, None
+    pending = state.get(PENDING_KEY)
+    if pending is not None:
+        from modules.activity_writer import wait_for_flush
+        seq, bookmarks = wait_for_flush(pending, CONSISTENCY_WAIT_MS / 1000.0)
+        with _state_lock:
+            # 同一会话的其他线程可能已处理过，或期间又登记了新的事件
+            if state.get(PENDING_KEY) == pending:
+                state.pop(PENDING_KEY, None)
+            note_write(seq, bookmarks)
+    return state.get(SEQ_KEY, 0), state.get(BOOKMARKS_KEY)
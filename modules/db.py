@@ -0,0 +1,564 @@
+"""
+查询网关模块
+所有 Cypher 查询都通过这里执行，每个查询带一个名称（如 auth.get_all_students），
+按名称统计调用次数、延迟分布、返回行数和 db hits（开启 PROFILE 时），
+超过阈值的查询记入慢查询日志，供教师端查询诊断页面查看。
+配置了缓存策略的读查询先查进程内结果缓存（见 query_cache），写入时按数据标签失效。
+并发的相同读查询只执行一次（single-flight），其余调用方等待并共享结果。
+页面内互不依赖的读取可通过 run_parallel 在线程池中并行执行，并按页面统计耗时。
+导出等大结果集用 stream_query 按批流式读取，不在内存中保留整个结果。
+数据库熔断期间（见 health）查询立即失败，连接类错误和成功结果反馈给熔断器。
+读写均以托管事务（execute_read/execute_write）执行，驱动对瞬时错误做带抖动的退避重试，
+neo4j:// 路由地址下读事务分发到从节点；包含 CALL {} IN TRANSACTIONS 的语句只能自动提交。
+会话刚写入过时只复用不早于该写入的缓存和合并结果，读事务携带会话的 bookmark（见 consistency）。
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from config.settings import (
+    QUERY_SLOW_MS, QUERY_SLOW_LOG_SIZE, QUERY_PROFILE, QUERY_COALESCE_WINDOW_MS, QUERY_PARALLEL_WORKERS,
+    QUERY_TIMEOUT_S, EXPORT_FETCH_SIZE
+)
+from modules.query_cache import (
+    get_policy, make_key, cache_get, cache_put, tag_snapshot, bump_tags, get_write_seq
+)
+from modules.consistency import read_requirements, note_write, uses_routing
+from modules.pool import acquire_connection
+from modules.health import (
+    DatabaseUnavailable, CircuitOpenError, Neo4jDisabled, allow_request, record_success, record_failure,
+    get_last_error
+)
+from modules.storage import neo4j_enabled
+
+# 可选导入Neo4j（托管事务的超时设置）
+try:
+    from neo4j import unit_of_work
+except ImportError:
+    unit_of_work = None
+
+# 事务访问模式
+MODE_READ = 'read'
+MODE_WRITE = 'write'
+MODE_AUTOCOMMIT = 'autocommit'
+
+_IN_TRANSACTIONS = re.compile(r'IN\s+TRANSACTIONS', re.IGNORECASE)
+
+# 延迟直方图的桶上限（毫秒），最后一个桶收集更慢的查询
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf')]
+
+_stats_lock = threading.Lock()
+_query_stats = {}
+_slow_log = deque(maxlen=QUERY_SLOW_LOG_SIZE)
+
+# 运行时可在诊断页面切换
+_profile_enabled = QUERY_PROFILE
+
+# 正在执行（或刚完成、仍在合并窗口内）的读查询：key -> 调用状态
+_inflight_lock = threading.Lock()
+_inflight = {}
+
+# 当前线程最近一次写入后的 bookmark
+_write_state = threading.local()
+
+# 并行读取的线程池（按需创建）和按页面的耗时统计
+_executor = None
+_executor_lock = threading.Lock()
+_worker_state = threading.local()
+_page_stats = {}
+
+def _get_driver():
+    """获取驱动，嵌入式存储模式下立即抛出 Neo4jDisabled，熔断期间立即抛出 CircuitOpenError"""
+    if not neo4j_enabled():
+        raise Neo4jDisabled("嵌入式存储模式下不使用 Neo4j")
+    if not allow_request():
+        raise CircuitOpenError(f"Neo4j熔断中: {get_last_error()}")
+    from modules.auth import get_neo4j_driver
+    driver = get_neo4j_driver()
+    if driver is None:
+        raise DatabaseUnavailable("Neo4j驱动不可用")
+    return driver
+
+def _new_stat():
+    return {
+        'count': 0,
+        'errors': 0,
+        'total_ms': 0.0,
+        'max_ms': 0.0,
+        'last_ms': 0.0,
+        'rows': 0,
+        'db_hits': 0,
+        'profiled': 0,
+        'cache_hits': 0,
+        'coalesced': 0,
+        'retries': 0,
+        'buckets': [0] * len(LATENCY_BUCKETS_MS),
+    }
+
+def _sum_db_hits(plan):
+    """累加 PROFILE 执行计划各算子的 db hits"""
+    if not plan:
+        return 0
+    hits = plan.get('dbHits', 0) or 0
+    for child in plan.get('children', []) or []:
+        hits += _sum_db_hits(child)
+    return hits
+
+def _short_params(parameters):
+    """慢查询日志中只保留参数的简短表示"""
+    if not parameters:
+        return ""
+    text = ", ".join(f"{k}={v!r}" for k, v in parameters.items())
+    return text if len(text) <= 200 else text[:200] + "..."
+
+def _record(name, elapsed_ms, rows=0, db_hits=None, error=None, parameters=None, retries=0):
+    """记录一次查询的耗时和结果"""
+    with _stats_lock:
+        stat = _query_stats.get(name)
+        if stat is None:
+            stat = _query_stats[name] = _new_stat()
+        stat['count'] += 1
+        stat['retries'] += retries
+        stat['total_ms'] += elapsed_ms
+        stat['last_ms'] = elapsed_ms
+        stat['max_ms'] = max(stat['max_ms'], elapsed_ms)
+        stat['rows'] += rows
+        if error is not None:
+            stat['errors'] += 1
+        if db_hits is not None:
+            stat['db_hits'] += db_hits
+            stat['profiled'] += 1
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                stat['buckets'][i] += 1
+                break
+        if elapsed_ms >= QUERY_SLOW_MS:
+            _slow_log.append({
+                'name': name,
+                'ms': round(elapsed_ms, 1),
+                'rows': rows,
+                'db_hits': db_hits,
+                'error': str(error) if error is not None else None,
+                'params': _short_params(parameters),
+                'at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            })
+    if elapsed_ms >= QUERY_SLOW_MS:
+        print(f"[查询网关] 慢查询 {name}: {elapsed_ms:.0f}ms, {rows} 行")
+
+def _incr_stat(name, key):
+    with _stats_lock:
+        stat = _query_stats.get(name)
+        if stat is None:
+            stat = _query_stats[name] = _new_stat()
+        stat[key] += 1
+
+def _copy(records):
+    return [dict(record) for record in records]
+
+def _with_timeout(work):
+    """为事务函数设置超时（QUERY_TIMEOUT_S 为 0 时不限制）"""
+    if unit_of_work is None or QUERY_TIMEOUT_S <= 0:
+        return work
+    return unit_of_work(timeout=QUERY_TIMEOUT_S)(work)
+
+def last_write_bookmarks():
+    """当前线程最近一次成功写入后的 bookmark（供后台写入线程转交给等待的会话）"""
+    return getattr(_write_state, 'bookmarks', None)
+
+def _execute(name, cypher, parameters, profile=False, mode=MODE_READ, bookmarks=None):
+    """执行单条语句，返回 (记录字典列表, 结果摘要)；bookmarks 为读取需要追上的写入"""
+    parameters = parameters or {}
+    text = "PROFILE " + cypher if profile else cypher
+    attempts = [0]
+
+    def work(tx):
+        # 驱动遇到瞬时错误会重新调用事务函数，每次调用计一次尝试
+        attempts[0] += 1
+        result = tx.run(text, parameters)
+        records = [dict(record) for record in result]
+        return records, result.consume()
+
+    if mode != MODE_READ:
+        _write_state.bookmarks = None
+    session_config = {'bookmarks': bookmarks} if bookmarks is not None else {}
+    start = time.perf_counter()
+    try:
+        driver = _get_driver()
+        with acquire_connection(name, driver), driver.session(**session_config) as session:
+            if mode == MODE_AUTOCOMMIT:
+                attempts[0] = 1
+                result = session.run(text, parameters)
+                records = [dict(record) for record in result]
+                summary = result.consume()
+            elif mode == MODE_WRITE:
+                records, summary = session.execute_write(_with_timeout(work))
+            else:
+                records, summary = session.execute_read(_with_timeout(work))
+            if mode != MODE_READ:
+                _write_state.bookmarks = session.last_bookmarks()
+    except (CircuitOpenError, Neo4jDisabled):
+        raise
+    except Exception as e:
+        record_failure(e)
+        _record(name, (time.perf_counter() - start) * 1000, error=e, parameters=parameters,
+                retries=max(attempts[0] - 1, 0))
+        raise
+    record_success()
+    db_hits = _sum_db_hits(summary.profile) if profile else None
+    _record(name, (time.perf_counter() - start) * 1000, len(records), db_hits, parameters=parameters,
+            retries=max(attempts[0] - 1, 0))
+    return records, summary
+
+def _purge_inflight(now):
+    """清理合并窗口已过的调用状态（调用方持有 _inflight_lock）"""
+    window = QUERY_COALESCE_WINDOW_MS / 1000.0
+    expired = [key for key, call in _inflight.items()
+               if call['done'].is_set() and now - call['finished_at'] > window]
+    for key in expired:
+        del _inflight[key]
+
+def _drop_finished_inflight():
+    """写入后丢弃窗口内已完成的结果，之后的读取重新查询"""
+    with _inflight_lock:
+        for key in [key for key, call in _inflight.items() if call['done'].is_set()]:
+            del _inflight[key]
+
+def _single_flight(name, key, fetch, fresh, min_fresh=0):
+    """
+    相同 key 的并发读查询只执行一次：第一个调用方执行 fetch，
+    其余调用方等待其完成并共享结果（或异常），每个调用方拿到独立的副本
+    fresh 为本次执行结果的新鲜度序号，早于调用方 min_fresh 的执行不合并，由调用方重新执行
+    """
+    window = QUERY_COALESCE_WINDOW_MS / 1000.0
+    now = time.monotonic()
+    with _inflight_lock:
+        call = _inflight.get(key)
+        if (call is not None and call['fresh'] >= min_fresh
+                and (not call['done'].is_set() or now - call['finished_at'] <= window)):
+            leader = False
+        else:
+            _purge_inflight(now)
+            call = {'done': threading.Event(), 'records': None, 'error': None, 'finished_at': 0.0,
+                    'fresh': fresh}
+            _inflight[key] = call
+            leader = True
+
+    if leader:
+        try:
+            call['records'] = fetch()
+        except Exception as e:
+            call['error'] = e
+        finally:
+            call['finished_at'] = time.monotonic()
+            call['done'].set()
+            if call['records'] is None or window <= 0:
+                # 失败的结果不在窗口内复用
+                with _inflight_lock:
+                    if _inflight.get(key) is call:
+                        del _inflight[key]
+    else:
+        call['done'].wait()
+        _incr_stat(name, 'coalesced')
+
+    if call['error'] is not None:
+        raise call['error']
+    if call['records'] is None:
+        raise RuntimeError(f"查询 {name} 被中断")
+    return _copy(call['records'])
+
+def run_query(name, cypher, parameters=None, **kwargs):
+    """
+    执行读查询，返回记录字典列表（配置了缓存策略的查询优先读缓存，并发的相同查询合并执行）
+    当前会话写入过数据时，只复用不早于该写入的共享结果
+    """
+    if kwargs:
+        parameters = {**(parameters or {}), **kwargs}
+    min_seq, bookmarks = read_requirements()
+    # 结果的新鲜度：路由到只读副本时只保证追上所带 bookmark 对应的写入，单机时为查询开始时的写入序号
+    fresh = min_seq if uses_routing() else get_write_seq()
+    key = make_key(name, cypher, parameters)
+    policy = get_policy(name)
+    if policy is None:
+        return _single_flight(name, key, lambda: _execute(
+            name, cypher, parameters, profile=_profile_enabled, bookmarks=bookmarks
+        )[0], fresh, min_seq)
+
+    ttl, tags = policy
+    # 单机时缓存项的标签版本已保证不受之后写入的影响，只有副本读取需要按序号比较
+    cached = cache_get(key, tags, min_fresh=min_seq if uses_routing() else 0)
+    if cached is not None:
+        _incr_stat(name, 'cache_hits')
+        return cached
+
+    def fetch():
+        versions = tag_snapshot(tags)
+        records, _ = _execute(name, cypher, parameters, profile=_profile_enabled, bookmarks=bookmarks)
+        cache_put(key, versions, ttl, records, fresh=fresh)
+        return records
+
+    return _single_flight(name, key, fetch, fresh, min_seq)
+
+def run_single(name, cypher, parameters=None, **kwargs):
+    """执行读查询，返回第一条记录（没有结果时返回 None）"""
+    records = run_query(name, cypher, parameters, **kwargs)
+    return records[0] if records else None
+
+def run_write(name, cypher, parameters=None, invalidates=(), **kwargs):
+    """
+    执行写语句，返回更新计数；普通语句以写事务执行（瞬时错误自动重试），
+    包含 CALL {} IN TRANSACTIONS 的语句自动提交且不重试
+    invalidates 为本次写入修改的数据标签，执行后依赖这些标签的缓存失效
+    """
+    if kwargs:
+        parameters = {**(parameters or {}), **kwargs}
+    mode = MODE_AUTOCOMMIT if _IN_TRANSACTIONS.search(cypher) else MODE_WRITE
+    try:
+        records, summary = _execute(name, cypher, parameters, mode=mode)
+    finally:
+        # 失败的写入也可能已部分提交（IN TRANSACTIONS），同样失效
+        seq = bump_tags(*invalidates)
+        _drop_finished_inflight()
+        note_write(seq, last_write_bookmarks())
+    counters = summary.counters
+    return {
+        'records': records,
+        'nodes_created': counters.nodes_created,
+        'nodes_deleted': counters.nodes_deleted,
+        'relationships_created': counters.relationships_created,
+        'relationships_deleted': counters.relationships_deleted,
+        'properties_set': counters.properties_set,
+    }
+
+def stream_query(name, cypher, parameters=None, fetch_size=None, **kwargs):
+    """
+    逐条读取大结果集（如数据导出），返回记录字典的生成器，驱动每批拉取 fetch_size 条，不在内存中保留整个结果
+    以自动提交事务执行，不经过结果缓存和合并，也不重试；迭代结束或关闭生成器后释放连接
+    """
+    if kwargs:
+        parameters = {**(parameters or {}), **kwargs}
+    parameters = parameters or {}
+    rows = 0
+    start = time.perf_counter()
+    try:
+        driver = _get_driver()
+        with acquire_connection(name, driver), driver.session(fetch_size=fetch_size or EXPORT_FETCH_SIZE) as session:
+            for record in session.run(cypher, parameters):
+                rows += 1
+                yield dict(record)
+    except (CircuitOpenError, Neo4jDisabled):
+        raise
+    except Exception as e:
+        record_failure(e)
+        _record(name, (time.perf_counter() - start) * 1000, rows, error=e, parameters=parameters)
+        raise
+    record_success()
+    _record(name, (time.perf_counter() - start) * 1000, rows, parameters=parameters)
+
+def run_in_transaction(name, statements, invalidates=()):
+    """
+    在一个写事务中依次执行多条写语句 [(cypher, parameters), ...]，全部成功才提交并使 invalidates 标签失效
+    瞬时错误时整个事务重试，语句需可重复执行（如按事件 ID 去重）
+    """
+    attempts = [0]
+
+    def work(tx):
+        attempts[0] += 1
+        for cypher, parameters in statements:
+            tx.run(cypher, parameters or {}).consume()
+
+    start = time.perf_counter()
+    try:
+        _write_state.bookmarks = None
+        driver = _get_driver()
+        with acquire_connection(name, driver), driver.session() as session:
+            session.execute_write(_with_timeout(work))
+            _write_state.bookmarks = session.last_bookmarks()
+    except (CircuitOpenError, Neo4jDisabled):
+        raise
+    except Exception as e:
+        record_failure(e)
+        _record(name, (time.perf_counter() - start) * 1000, error=e, retries=max(attempts[0] - 1, 0))
+        raise
+    record_success()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    _record(name, elapsed_ms, retries=max(attempts[0] - 1, 0))
+    seq = bump_tags(*invalidates)
+    _drop_finished_inflight()
+    note_write(seq, last_write_bookmarks())
+    return elapsed_ms
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=QUERY_PARALLEL_WORKERS,
+                                               thread_name_prefix="query-parallel")
+    return _executor
+
+def _get_script_ctx():
+    """当前 Streamlit 会话的脚本上下文（非 Streamlit 环境返回 None）"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        return get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        return None
+
+def _run_task(task, ctx):
+    """在线程池中执行一个读取任务，返回 (结果, 异常, 耗时毫秒)"""
+    if ctx is not None:
+        try:
+            from streamlit.runtime.scriptrunner import add_script_run_ctx
+            add_script_run_ctx(threading.current_thread(), ctx)
+        except Exception:
+            pass
+    _worker_state.active = True
+    start = time.perf_counter()
+    try:
+        return task(), None, (time.perf_counter() - start) * 1000
+    except Exception as e:
+        return None, e, (time.perf_counter() - start) * 1000
+    finally:
+        _worker_state.active = False
+
+def _record_page(page, wall_ms, task_ms, tasks):
+    with _stats_lock:
+        stat = _page_stats.get(page)
+        if stat is None:
+            stat = _page_stats[page] = {'count': 0, 'total_ms': 0.0, 'last_ms': 0.0,
+                                        'max_ms': 0.0, 'serial_ms': 0.0, 'tasks': 0}
+        stat['count'] += 1
+        stat['total_ms'] += wall_ms
+        stat['last_ms'] = wall_ms
+        stat['max_ms'] = max(stat['max_ms'], wall_ms)
+        stat['serial_ms'] += task_ms
+        stat['tasks'] = tasks
+
+def run_parallel(page, tasks, return_exceptions=False):
+    """
+    并行执行一组互不依赖的读取 {键: 无参函数}，全部完成后返回 {键: 结果}
+    任务中不应调用 st.* 渲染页面；return_exceptions 为 True 时异常作为结果返回，
+    否则全部完成后抛出第一个异常。已在线程池中的嵌套调用按顺序执行，避免线程池耗尽
+    """
+    start = time.perf_counter()
+    if getattr(_worker_state, 'active', False) or len(tasks) <= 1:
+        outcomes = {}
+        for key, task in tasks.items():
+            task_start = time.perf_counter()
+            try:
+                outcomes[key] = (task(), None, (time.perf_counter() - task_start) * 1000)
+            except Exception as e:
+                outcomes[key] = (None, e, (time.perf_counter() - task_start) * 1000)
+    else:
+        ctx = _get_script_ctx()
+        executor = _get_executor()
+        futures = {key: executor.submit(_run_task, task, ctx) for key, task in tasks.items()}
+        outcomes = {key: future.result() for key, future in futures.items()}
+
+    wall_ms = (time.perf_counter() - start) * 1000
+    _record_page(page, wall_ms, sum(ms for _, _, ms in outcomes.values()), len(tasks))
+
+    results = {}
+    for key, (value, error, _) in outcomes.items():
+        if error is not None:
+            if not return_exceptions:
+                raise error
+            value = error
+        results[key] = value
+    return results
+
+def get_page_stats():
+    """按页面汇总的并行读取耗时（serial_ms 为各任务耗时之和，即顺序执行的估计耗时）"""
+    with _stats_lock:
+        snapshot = {page: dict(stat) for page, stat in _page_stats.items()}
+    stats = []
+    for page, stat in snapshot.items():
+        count = stat['count']
+        stats.append({
+            'page': page,
+            'count': count,
+            'tasks': stat['tasks'],
+            'avg_ms': round(stat['total_ms'] / count, 1) if count else 0.0,
+            'last_ms': round(stat['last_ms'], 1),
+            'max_ms': round(stat['max_ms'], 1),
+            'avg_serial_ms': round(stat['serial_ms'] / count, 1) if count else 0.0,
+        })
+    return stats
+
+def set_profiling(enabled):
+    """开启或关闭读查询的 PROFILE 统计"""
+    global _profile_enabled
+    _profile_enabled = bool(enabled)
+
+def is_profiling():
+    return _profile_enabled
+
+def _percentile(buckets, count, p):
+    """由直方图估算分位数（返回所在桶的上限）"""
+    if not count:
+        return 0.0
+    target = count * p
+    seen = 0
+    for bound, n in zip(LATENCY_BUCKETS_MS, buckets):
+        seen += n
+        if seen >= target:
+            return bound
+    return LATENCY_BUCKETS_MS[-1]
+
+def get_query_stats():
+    """按查询名称汇总的统计列表"""
+    with _stats_lock:
+        snapshot = {name: dict(stat, buckets=list(stat['buckets'])) for name, stat in _query_stats.items()}
+    stats = []
+    for name, stat in snapshot.items():
+        count = stat['count']
+        stats.append({
+            'name': name,
+            'count': count,
+            'errors': stat['errors'],
+            'avg_ms': round(stat['total_ms'] / count, 1) if count else 0.0,
+            'p50_ms': _percentile(stat['buckets'], count, 0.5),
+            'p95_ms': _percentile(stat['buckets'], count, 0.95),
+            'max_ms': round(stat['max_ms'], 1),
+            'last_ms': round(stat['last_ms'], 1),
+            'total_ms': round(stat['total_ms'], 1),
+            'avg_rows': round(stat['rows'] / count, 1) if count else 0.0,
+            'avg_db_hits': round(stat['db_hits'] / stat['profiled']) if stat['profiled'] else None,
+            'cache_hits': stat['cache_hits'],
+            'coalesced': stat['coalesced'],
+            'retries': stat['retries'],
+            'buckets': stat['buckets'],
+        })
+    return stats
+
+def get_slow_queries(limit=50):
+    """最近的慢查询（新的在前）"""
+    with _stats_lock:
+        entries = list(_slow_log)
+    return entries[::-1][:limit]
+
+def get_coalescing_stats():
+    """合并统计：实际执行次数、共享结果的调用次数和合并比例"""
+    with _stats_lock:
+        executed = sum(stat['count'] for stat in _query_stats.values())
+        coalesced = sum(stat['coalesced'] for stat in _query_stats.values())
+    with _inflight_lock:
+        inflight = sum(1 for call in _inflight.values() if not call['done'].is_set())
+    total = executed + coalesced
+    return {
+        'executed': executed,
+        'coalesced': coalesced,
+        'ratio': round(coalesced / total, 3) if total else 0.0,
+        'inflight': inflight,
+    }
+
+def reset_query_stats():
+    """清空统计和慢查询日志"""
+    with _stats_lock:
+        _query_stats.clear()
+        _slow_log.clear()
+        _page_stats.clear()
@@ -0,0 +1,236 @@
+"""
+批量删除模块
+清空活动记录、清空全部数据和删除一批学生都分批执行：每轮最多删除 DELETE_CHUNK_SIZE 个节点，
+轮内按 DELETE_BATCH_SIZE 个一个事务提交（CALL {} IN TRANSACTIONS），不会在一个事务里持有全部节点的锁，
+也不会超出事务内存上限，活动写入在事务之间照常进行。轮与轮之间更新进度并检查取消请求。
+清空活动或全部数据的收尾阶段暂停后台写入（见 activity_writer.writes_paused）：再删除一轮删除期间新写入的活动，
+然后清空汇总，期间的新事件转存本地，汇总清空后回放，与重新计数的汇总一致。
+
+删除任务在后台线程执行（start_deletion_job），页面读取 get_deletion_status 显示进度，可随时取消：
+- 已删除的数据不会恢复；清空活动或全部数据中途取消时，按天汇总仍包含已删除的活动，
+  需要重建汇总（python -m modules.rollups --backfill）
+- 删除学生按 DELETE_STUDENT_GROUP 名一组完成汇总扣除、删除和草图重建，取消只发生在组与组之间
+dry_run_counts 按标签统计将要删除的数量，不修改数据。
+"""
+
+import threading
+import time
+
+from config.settings import DELETE_BATCH_SIZE, DELETE_CHUNK_SIZE, DELETE_STUDENT_GROUP
+
+SCOPES = {
+    'activities': '清空学习记录',
+    'all': '清空学生和学习记录',
+    'students': '删除学生',
+}
+
+_job_lock = threading.Lock()
+_job_state = {
+    'running': False,
+    'scope': None,
+    'total': {},
+    'deleted': {},
+    'cancel_requested': False,
+    'cancelled': False,
+    'error': None,
+    'started_at': None,
+    'finished_at': None,
+}
+
+class DeletionCancelled(Exception):
+    """删除任务被取消"""
+
+def _as_list(student_ids):
+    return [student_ids] if isinstance(student_ids, str) else list(student_ids or [])
+
+def _delete_chunked(name, match, label, state, parameters=None, cancellable=True):
+    """
+    分轮删除 match 匹配的节点（match 需以 MATCH ... 绑定变量 n 结尾），返回删除数
+    cancellable 为 True 时每轮之前检查取消请求
+    """
+    from modules.db import run_write
+    from modules.query_cache import TAG_STUDENT, TAG_ACTIVITY
+
+    total = 0
+    while True:
+        if cancellable and state['cancel_requested']:
+            raise DeletionCancelled()
+        # IN TRANSACTIONS 只能在自动提交事务中执行（run_write 自动识别）
+        result = run_write(name, match + """
+            WITH n LIMIT $chunk_size
+            CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF $batch_size ROWS
+            RETURN count(*) as deleted
+        """, parameters, chunk_size=DELETE_CHUNK_SIZE, batch_size=DELETE_BATCH_SIZE,
+            invalidates=(TAG_STUDENT, TAG_ACTIVITY))
+        deleted = result['records'][0]['deleted'] if result['records'] else 0
+        total += deleted
+        state['deleted'][label] = state['deleted'].get(label, 0) + deleted
+        if deleted < DELETE_CHUNK_SIZE:
+            return total
+
+def dry_run_counts(scope, student_ids=None):
+    """按标签统计将要删除的数量（不修改数据），冷归档中的活动计为 cold_activities"""
+    from modules.db import run_single
+    from modules.retention import cold_enabled, read_cold
+
+    if scope not in SCOPES:
+        raise ValueError(f"未知的删除范围: {scope}")
+    student_ids = _as_list(student_ids)
+    counts = {}
+    if scope == 'students':
+        counts['mfx_Student'] = run_single("deletion.dry_run.students", """
+            MATCH (s:mfx_Student) WHERE s.student_id IN $student_ids
+            RETURN count(s) as count
+        """, student_ids=student_ids)['count']
+        counts['mfx_Activity'] = run_single("deletion.dry_run.student_activities", """
+            MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity) WHERE s.student_id IN $student_ids
+            RETURN count(a) as count
+        """, student_ids=student_ids)['count']
+        counts['mfx_StudentSessions'] = run_single("deletion.dry_run.student_sessions", """
+            MATCH (ss:mfx_StudentSessions) WHERE ss.student_id IN $student_ids
+            RETURN count(ss) as count
+        """, student_ids=student_ids)['count']
+    else:
+        counts['mfx_Activity'] = run_single("deletion.dry_run.activities", """
+            MATCH (a:mfx_Activity) RETURN count(a) as count
+        """)['count']
+        if scope == 'all':
+            counts['mfx_Student'] = run_single("deletion.dry_run.all_students", """
+                MATCH (s:mfx_Student) RETURN count(s) as count
+            """)['count']
+        counts['mfx_StudentSessions'] = run_single("deletion.dry_run.sessions", """
+            MATCH (ss:mfx_StudentSessions) RETURN count(ss) as count
+        """)['count']
+    if cold_enabled():
+        table = read_cold(student_id=student_ids if scope == 'students' else None, columns=['id'])
+        counts['cold_activities'] = table.num_rows if table is not None else 0
+    return counts
+
+def _delete_student_group(student_ids, state):
+    """删除一组学生：扣除汇总、分批删除活动、删除学生和会话汇总、清理冷归档并重建草图"""
+    from modules.db import run_write
+    from modules.query_cache import TAG_STUDENT, TAG_ACTIVITY, TAG_SESSION
+    from modules.rollups import subtract_student_rollups
+    from modules.sketches import student_sketch_keys, rebuild_sketches
+    from modules.retention import delete_cold_student
+    from modules.activity_writer import writes_paused
+
+    # 先记下需要重建的草图并从按天汇总中扣除（都要读取待删除的活动）
+    sketch_keys = student_sketch_keys(student_ids)
+    subtract_student_rollups(student_ids)
+
+    _delete_chunked("deletion.students.activities", """
+        MATCH (s:mfx_Student)-[:PERFORMED]->(n:mfx_Activity)
+        WHERE s.student_id IN $student_ids
+    """, 'mfx_Activity', state, {'student_ids': student_ids}, cancellable=False)
+    _delete_chunked("deletion.students.students", """
+        MATCH (n:mfx_Student) WHERE n.student_id IN $student_ids
+    """, 'mfx_Student', state, {'student_ids': student_ids}, cancellable=False)
+    result = run_write("deletion.students.sessions", """
+        MATCH (ss:mfx_StudentSessions) WHERE ss.student_id IN $student_ids
+        DELETE ss
+    """, student_ids=student_ids, invalidates=(TAG_STUDENT, TAG_ACTIVITY, TAG_SESSION))
+    state['deleted']['mfx_StudentSessions'] = state['deleted'].get('mfx_StudentSessions', 0) + result['nodes_deleted']
+    state['deleted']['cold_activities'] = state['deleted'].get('cold_activities', 0) + delete_cold_student(student_ids)
+
+    # 草图不能扣除，按这组学生涉及的 (日期, 模块) 重建（期间后台写入转存本地，重建后回放）
+    with writes_paused():
+        rebuild_sketches(sketch_keys)
+
+def _clear_derived(state):
+    """活动清空后删除汇总、学习会话汇总和冷归档"""
+    from modules.db import run_write
+    from modules.query_cache import TAG_SESSION
+    from modules.rollups import clear_rollups
+    from modules.retention import clear_cold_archive
+
+    clear_rollups()
+    result = run_write("deletion.clear.sessions", """
+        MATCH (ss:mfx_StudentSessions)
+        CALL { WITH ss DELETE ss } IN TRANSACTIONS OF 10000 ROWS
+    """, invalidates=(TAG_SESSION,))
+    state['deleted']['mfx_StudentSessions'] = result['nodes_deleted']
+    clear_cold_archive()
+
+def run_deletion(scope, student_ids=None, state=None):
+    """
+    同步执行删除，返回各标签的删除数；state 为进度状态（默认新建，后台任务传入共享状态）
+    被取消时抛出 DeletionCancelled
+    """
+    from modules.activity_snapshot import invalidate_snapshot
+
+    if scope not in SCOPES:
+        raise ValueError(f"未知的删除范围: {scope}")
+    if state is None:
+        state = {'deleted': {}, 'cancel_requested': False}
+    try:
+        if scope == 'students':
+            student_ids = _as_list(student_ids)
+            for i in range(0, len(student_ids), DELETE_STUDENT_GROUP):
+                if state['cancel_requested']:
+                    raise DeletionCancelled()
+                _delete_student_group(student_ids[i:i + DELETE_STUDENT_GROUP], state)
+        else:
+            from modules.activity_writer import writes_paused
+            _delete_chunked("deletion.activities", "MATCH (n:mfx_Activity)", 'mfx_Activity', state)
+            if scope == 'all':
+                _delete_chunked("deletion.all_students", "MATCH (n:mfx_Student)", 'mfx_Student', state)
+            # 删除期间写入的活动不能留下（汇总即将清空），暂停写入后再删一轮并清空汇总，不再响应取消
+            with writes_paused():
+                _delete_chunked("deletion.activities.final", "MATCH (n:mfx_Activity)", 'mfx_Activity', state,
+                                cancellable=False)
+                if scope == 'all':
+                    _delete_chunked("deletion.all_students.final", "MATCH (n:mfx_Student)", 'mfx_Student', state,
+                                    cancellable=False)
+                _clear_derived(state)
+    finally:
+        invalidate_snapshot()
+    return dict(state['deleted'])
+
+def start_deletion_job(scope, student_ids=None):
+    """在后台线程执行删除，已有任务在执行时直接返回 False"""
+    if scope not in SCOPES:
+        raise ValueError(f"未知的删除范围: {scope}")
+    with _job_lock:
+        if _job_state['running']:
+            return False
+        _job_state.update({
+            'running': True, 'scope': scope, 'total': {}, 'deleted': {}, 'cancel_requested': False,
+            'cancelled': False, 'error': None, 'started_at': time.time(), 'finished_at': None,
+        })
+
+    def _run():
+        try:
+            _job_state['total'] = dry_run_counts(scope, student_ids)
+            run_deletion(scope, student_ids, _job_state)
+            print(f"[批量删除] {SCOPES[scope]}完成: {_job_state['deleted']}")
+        except DeletionCancelled:
+            _job_state['cancelled'] = True
+            print(f"[批量删除] {SCOPES[scope]}已取消: {_job_state['deleted']}")
+        except Exception as e:
+            _job_state['error'] = str(e)
+            print(f"[批量删除] {SCOPES[scope]}失败: {e}")
+        finally:
+            _job_state['running'] = False
+            _job_state['finished_at'] = time.time()
+
+    threading.Thread(target=_run, name="bulk-deletion", daemon=True).start()
+    return True
+
+def cancel_deletion_job():
+    """请求取消正在执行的删除任务（当前这一轮完成后停止），没有任务时返回 False"""
+    if not _job_state['running']:
+        return False
+    _job_state['cancel_requested'] = True
+    return True
+
+def get_deletion_status():
+    """删除任务进度（供数据管理页面展示）"""
+    status = dict(_job_state)
+    status['total'] = dict(status['total'])
+    status['deleted'] = dict(status['deleted'])
+    status['label'] = SCOPES.get(status['scope'])
+    total = sum(status['total'].get(label, 0) for label in ('mfx_Activity', 'mfx_Student'))
+    done = sum(status['deleted'].get(label, 0) for label in ('mfx_Activity', 'mfx_Student'))
+    status['progress'] = min(done / total, 1.0) if total else (0.0 if status['running'] else 1.0)
+    return status
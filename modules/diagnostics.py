@@ -0,0 +1,249 @@
+"""
+查询诊断模块
+教师端查看数据库健康状态、连接池和查询网关的统计：最慢/最频繁的查询、延迟分布、结果缓存命中、相同查询合并、页面并行读取耗时和慢查询日志
+"""
+
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from modules.db import (
+    LATENCY_BUCKETS_MS, get_query_stats, get_slow_queries, reset_query_stats,
+    get_coalescing_stats, get_page_stats, set_profiling, is_profiling
+)
+from modules.query_cache import get_cache_stats, clear_query_cache
+from modules.health import get_health, probe_now, STATE_CLOSED, STATE_HALF_OPEN
+from modules.pool import get_pool_stats, get_slow_waits
+from modules.activity_snapshot import get_snapshot_stats
+from modules.sketches import get_sketch_stats
+from modules.sessions import get_session_stats
+from config.settings import QUERY_SLOW_MS, QUERY_COALESCE_WINDOW_MS, POOL_WAIT_LOG_MS
+
+def _bucket_labels():
+    labels = []
+    lower = 0
+    for bound in LATENCY_BUCKETS_MS:
+        labels.append(f">{lower}ms" if bound == float('inf') else f"≤{bound}ms")
+        if bound != float('inf'):
+            lower = bound
+    return labels
+
+def _stats_table(stats):
+    """统计列表转为展示用表格"""
+    rows = []
+    for s in stats:
+        rows.append({
+            "查询": s['name'],
+            "次数": s['count'],
+            "缓存命中": s['cache_hits'],
+            "合并": s['coalesced'],
+            "错误": s['errors'],
+            "重试": s['retries'],
+            "平均(ms)": s['avg_ms'],
+            "P50(ms)": s['p50_ms'],
+            "P95(ms)": s['p95_ms'],
+            "最大(ms)": s['max_ms'],
+            "总耗时(ms)": s['total_ms'],
+            "平均行数": s['avg_rows'],
+            "平均db hits": s['avg_db_hits'] if s['avg_db_hits'] is not None else "-",
+        })
+    return pd.DataFrame(rows)
+
+def _render_health():
+    """熔断器状态和探测延迟"""
+    health = get_health()
+    labels = {STATE_CLOSED: "🟢 正常", STATE_HALF_OPEN: "🟡 半开（试探恢复）"}
+    cols = st.columns([1, 1, 1, 1, 1])
+    with cols[0]:
+        st.metric("数据库状态", labels.get(health['state'], "🔴 熔断"))
+    with cols[1]:
+        st.metric("探测延迟(ms)", health['latency_ms'] if health['latency_ms'] is not None else "-",
+                  delta="偏高" if health['latency_degraded'] else None, delta_color="inverse")
+    with cols[2]:
+        st.metric("熔断次数", health['opens'])
+    with cols[3]:
+        st.metric("熔断期间拒绝", health['rejected'])
+    with cols[4]:
+        if st.button("🔌 立即探测", key="diag_probe", use_container_width=True):
+            probe_now()
+            st.rerun()
+    if health['state'] != STATE_CLOSED:
+        st.warning(f"最近错误：{health['last_error']}，{health['next_probe_in_s']}s 后重新探测"
+                   f"（当前退避 {health['backoff_s']}s）")
+    st.caption(f"探测 {health['probes']} 次，失败 {health['probe_failures']} 次"
+               + (f"，状态变更于 {health['changed_at']}" if health['changed_at'] else ""))
+
+def _render_pool():
+    """连接池使用情况和获取等待"""
+    pool = get_pool_stats()
+    cols = st.columns(5)
+    with cols[0]:
+        st.metric("连接池大小", f"{pool['size']} / {pool['max_size']}",
+                  delta=f"扩容 {pool['resizes']} 次" if pool['resizes'] else None)
+    with cols[1]:
+        st.metric("使用中（峰值）", f"{pool['in_use']}（{pool['peak_in_use']}）")
+    with cols[2]:
+        st.metric("空闲连接", pool['driver_idle'] if pool['driver_idle'] is not None else "-")
+    with cols[3]:
+        st.metric("平均/最大等待(ms)", f"{pool['avg_wait_ms']} / {pool['max_wait_ms']}")
+    with cols[4]:
+        st.metric("每分钟新建连接", pool['creations_per_minute'] if pool['creations_per_minute'] is not None else "-")
+    st.caption(f"获取连接 {pool['acquisitions']} 次，需要等待 {pool['waited']} 次，"
+               f"超过 {POOL_WAIT_LOG_MS}ms {pool['slow_waits']} 次，超时 {pool['timeouts']} 次"
+               + (f"，{pool['retiring_drivers']} 个旧驱动等待查询结束后关闭" if pool['retiring_drivers'] else ""))
+
+    waits = get_slow_waits()
+    if waits:
+        st.dataframe(pd.DataFrame([{
+            "时间": w['at'],
+            "查询": w['name'],
+            "等待(ms)": w['wait_ms'],
+            "使用中": w['in_use'],
+            "连接池": w['size'],
+        } for w in waits]), use_container_width=True, hide_index=True)
+    else:
+        st.success(f"✅ 暂无超过 {POOL_WAIT_LOG_MS}ms 的连接等待")
+
+def render_query_diagnostics():
+    """渲染查询诊断页面（仅教师可用）"""
+    st.markdown("## 🩺 查询诊断")
+    st.markdown(f"统计本进程启动以来经过查询网关的所有查询，耗时超过 {QUERY_SLOW_MS}ms 的记入慢查询日志")
+    st.markdown("---")
+
+    _render_health()
+    st.markdown("---")
+
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        top_n = st.slider("显示前N条", min_value=5, max_value=50, value=10, step=5, key="diag_top_n")
+    with col2:
+        profiling = st.checkbox("PROFILE 统计 db hits（会增加查询开销）", value=is_profiling(), key="diag_profiling")
+        if profiling != is_profiling():
+            set_profiling(profiling)
+    with col3:
+        if st.button("🔄 重置统计", key="diag_reset", use_container_width=True):
+            reset_query_stats()
+            st.rerun()
+        if st.button("🧹 清空结果缓存", key="diag_clear_cache", use_container_width=True):
+            clear_query_cache()
+            st.rerun()
+
+    cache = get_cache_stats()
+    cache_cols = st.columns(4)
+    with cache_cols[0]:
+        st.metric("缓存命中率", f"{cache['hit_ratio'] * 100:.1f}%")
+    with cache_cols[1]:
+        st.metric("缓存条目", cache['size'])
+    with cache_cols[2]:
+        st.metric("写入失效次数", cache['invalidations'])
+    with cache_cols[3]:
+        st.metric("过期/失效淘汰", cache['stale'] + cache['evictions'])
+    st.caption(f"全局写入序号 {cache['write_seq']}，因会话刚写入而绕过缓存 {cache['bypassed']} 次")
+
+    snapshot = get_snapshot_stats()
+    st.caption(f"活动快照 {snapshot['rows']} 条（{snapshot['memory_mb']}MB），刷新 {snapshot['refreshes']} 次，"
+               f"全量重建 {snapshot['rebuilds']} 次，增量追加 {snapshot['appended']} 条，"
+               f"最近一次刷新 {snapshot['last_refresh_ms']}ms")
+    sketches = get_sketch_stats()
+    st.caption(f"去重计数草图 {sketches['sketches']} 个（{sketches['days']} 天，{sketches['memory_kb']}KB），"
+               f"精度 {sketches['precision']}，标准误差约 {sketches['std_error'] * 100:.1f}%")
+    sessions = get_session_stats()
+    st.caption(f"学习会话汇总刷新 {sessions['refreshes']} 次，累计更新 {sessions['students_updated']} 名学生，"
+               f"上次耗时 {sessions['last_refresh_ms']}ms")
+
+    flight = get_coalescing_stats()
+    flight_cols = st.columns(4)
+    with flight_cols[0]:
+        st.metric("合并比例", f"{flight['ratio'] * 100:.1f}%",
+                  help=f"相同查询并发或在 {QUERY_COALESCE_WINDOW_MS}ms 内重复时共享一次数据库调用")
+    with flight_cols[1]:
+        st.metric("共享结果次数", flight['coalesced'])
+    with flight_cols[2]:
+        st.metric("实际执行次数", flight['executed'])
+    with flight_cols[3]:
+        st.metric("执行中查询", flight['inflight'])
+
+    stats = get_query_stats()
+    if not stats:
+        st.info("暂无查询统计，浏览其他页面后再来查看")
+        return
+
+    total_count = sum(s['count'] for s in stats)
+    total_errors = sum(s['errors'] for s in stats)
+    total_ms = sum(s['total_ms'] for s in stats)
+
+    metric_cols = st.columns(4)
+    with metric_cols[0]:
+        st.metric("查询种类", len(stats))
+    with metric_cols[1]:
+        st.metric("查询次数", total_count)
+    with metric_cols[2]:
+        st.metric("错误次数", total_errors)
+    with metric_cols[3]:
+        st.metric("平均耗时(ms)", round(total_ms / total_count, 1) if total_count else 0)
+
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["🐢 最慢查询", "🔁 最频繁查询", "⏱️ 延迟分布", "📄 页面耗时",
+                                                  "🔌 连接池", "📜 慢查询日志"])
+
+    with tab1:
+        slowest = sorted(stats, key=lambda s: (s['p95_ms'], s['avg_ms']), reverse=True)[:top_n]
+        st.dataframe(_stats_table(slowest), use_container_width=True, hide_index=True)
+
+    with tab2:
+        frequent = sorted(stats, key=lambda s: s['count'], reverse=True)[:top_n]
+        st.dataframe(_stats_table(frequent), use_container_width=True, hide_index=True)
+
+        st.markdown("##### 总耗时占比")
+        by_total = sorted(stats, key=lambda s: s['total_ms'], reverse=True)[:top_n]
+        fig = px.bar(
+            pd.DataFrame([{"查询": s['name'], "总耗时(ms)": s['total_ms']} for s in by_total]),
+            x="总耗时(ms)", y="查询", orientation='h'
+        )
+        fig.update_layout(height=max(300, 30 * len(by_total)), margin=dict(l=20, r=20, t=20, b=20),
+                          yaxis={'categoryorder': 'total ascending'})
+        st.plotly_chart(fig, use_container_width=True)
+
+    with tab3:
+        names = [s['name'] for s in sorted(stats, key=lambda s: s['total_ms'], reverse=True)]
+        selected = st.selectbox("选择查询", names, key="diag_histogram_query")
+        stat = next(s for s in stats if s['name'] == selected)
+        df = pd.DataFrame({"延迟区间": _bucket_labels(), "次数": stat['buckets']})
+        fig = px.bar(df, x="延迟区间", y="次数")
+        fig.update_traces(marker_color='#667eea')
+        fig.update_layout(height=300, margin=dict(l=20, r=20, t=20, b=20))
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"共 {stat['count']} 次，平均 {stat['avg_ms']}ms，最近一次 {stat['last_ms']}ms")
+
+    with tab4:
+        pages = get_page_stats()
+        if pages:
+            st.dataframe(pd.DataFrame([{
+                "页面": p['page'],
+                "加载次数": p['count'],
+                "并行任务数": p['tasks'],
+                "平均耗时(ms)": p['avg_ms'],
+                "最近(ms)": p['last_ms'],
+                "最大(ms)": p['max_ms'],
+                "顺序执行估计(ms)": p['avg_serial_ms'],
+            } for p in sorted(pages, key=lambda p: p['avg_ms'], reverse=True)]),
+                use_container_width=True, hide_index=True)
+            st.caption("顺序执行估计为各并行任务耗时之和，与平均耗时的差即并行节省的时间")
+        else:
+            st.info("暂无页面耗时统计")
+
+    with tab5:
+        _render_pool()
+
+    with tab6:
+        slow = get_slow_queries(limit=top_n * 5)
+        if slow:
+            st.dataframe(pd.DataFrame([{
+                "时间": e['at'],
+                "查询": e['name'],
+                "耗时(ms)": e['ms'],
+                "行数": e['rows'],
+                "db hits": e['db_hits'] if e['db_hits'] is not None else "-",
+                "错误": e['error'] or "",
+                "参数": e['params'],
+            } for e in slow]), use_container_width=True, hide_index=True)
+        else:
+            st.success(f"✅ 暂无超过 {QUERY_SLOW_MS}ms 的查询")
@@ -0,0 +1,94 @@
+"""
+数据导出模块
+大结果集导出为 CSV 文件：查询通过 stream_query 流式读取（驱动每批拉取 EXPORT_FETCH_SIZE 条），
+逐行写入 EXPORT_DIR 下的临时文件，内存占用与记录数无关；页面只保存文件路径，
+预览只读取文件开头几行，点击下载时才读取文件内容。页面每次展示下载按钮时刷新文件的修改时间，
+超过 EXPORT_TTL_S 秒没有被展示的导出文件在下次导出时清理，仍在某个会话页面上的文件不会被删除。
+"""
+
+import csv
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from config.settings import EXPORT_FETCH_SIZE, EXPORT_DIR, EXPORT_TTL_S
+
+_PREFIX = 'mfx_export_'
+
+# 学习记录导出的列（查询返回的列名即 CSV 表头）
+ACTIVITY_COLUMNS = ['学号', '姓名', '学习模块', '活动类型', '内容名称', '学习时间', '详情']
+MODULE_ACTIVITY_COLUMNS = ['学号', '姓名', '活动类型', '内容名称', '学习时间', '详情']
+
+def _export_dir():
+    directory = EXPORT_DIR or tempfile.gettempdir()
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+def cleanup_exports(max_age_s=EXPORT_TTL_S):
+    """删除超过 max_age_s 秒未被页面展示（修改时间未刷新）的导出文件，返回删除的文件数"""
+    directory = _export_dir()
+    now = time.time()
+    removed = 0
+    for file_name in os.listdir(directory):
+        if not file_name.startswith(_PREFIX):
+            continue
+        path = os.path.join(directory, file_name)
+        try:
+            if now - os.path.getmtime(path) > max_age_s:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+def export_csv(name, cypher, columns, parameters=None, progress=None):
+    """
+    流式执行查询并逐行写入 CSV 临时文件（utf-8-sig，Excel 可直接打开），返回 (文件路径, 记录数)
+    columns 为查询返回的列名（即 CSV 表头）；progress(已写入记录数) 每批调用一次
+    失败时删除未写完的文件
+    """
+    from modules.db import stream_query
+
+    cleanup_exports()
+    fd, path = tempfile.mkstemp(prefix=_PREFIX, suffix='.csv', dir=_export_dir())
+    rows = 0
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for record in stream_query(name, cypher, parameters, fetch_size=EXPORT_FETCH_SIZE):
+                writer.writerow(['' if record.get(c) is None else record.get(c) for c in columns])
+                rows += 1
+                if progress is not None and rows % EXPORT_FETCH_SIZE == 0:
+                    progress(rows)
+    except Exception:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+    if progress is not None:
+        progress(rows)
+    return path, rows
+
+def preview_csv(path, rows=100):
+    """导出文件的前 rows 行（DataFrame）"""
+    return pd.read_csv(path, nrows=rows, encoding='utf-8-sig')
+
+def open_export(path):
+    """
+    下载按钮的延迟数据：点击下载时才读取文件内容（读完即关闭文件）
+    同时刷新文件的修改时间，页面仍在展示的导出文件在下载窗口（EXPORT_TTL_S）内不会被清理
+    """
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    def read():
+        with open(path, 'rb') as f:
+            return f.read()
+
+    return read
@@ -0,0 +1,220 @@
+"""
+数据库健康监测模块
+以熔断器（closed/open/half-open）跟踪 Neo4j 的可用性：
+连续的连接失败达到阈值后熔断，熔断期间的查询立即失败，不再逐个等待连接超时；
+后台线程按指数退避探测，探测成功后进入半开状态，下一次真实查询成功即恢复，失败则重新熔断。
+闭合状态下也定期探测并记录延迟，延迟持续偏高时标记为降级。
+"""
+
+import random
+import threading
+import time
+from datetime import datetime
+
+from config.settings import (
+    HEALTH_FAILURE_THRESHOLD, HEALTH_PROBE_INTERVAL_S, HEALTH_BACKOFF_BASE_S,
+    HEALTH_BACKOFF_MAX_S, HEALTH_DEGRADED_LATENCY_MS
+)
+
+# 可选导入Neo4j异常类型（只有连接类错误计入熔断，语法错误等不计入）
+try:
+    from neo4j.exceptions import ServiceUnavailable, SessionExpired
+    CONNECTIVITY_ERRORS = (ServiceUnavailable, SessionExpired, OSError)
+except ImportError:
+    CONNECTIVITY_ERRORS = (OSError,)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# 延迟的指数加权平均系数
+LATENCY_EWMA_ALPHA = 0.3
+
+class DatabaseUnavailable(RuntimeError):
+    """数据库不可用（驱动无法创建或连接失败）"""
+
+class CircuitOpenError(DatabaseUnavailable):
+    """熔断期间直接拒绝的请求"""
+
+class Neo4jDisabled(DatabaseUnavailable):
+    """嵌入式存储模式下访问 Neo4j 的请求（不计入熔断）"""
+
+_lock = threading.Lock()
+_state = STATE_CLOSED
+_consecutive_failures = 0
+_backoff_s = HEALTH_BACKOFF_BASE_S
+_next_probe_at = 0.0
+_changed_at = None
+_last_error = None
+_latency_ewma_ms = None
+_stats = {
+    'probes': 0,
+    'probe_failures': 0,
+    'opens': 0,
+    'rejected': 0,
+}
+
+_monitor_thread = None
+_monitor_lock = threading.Lock()
+
+def is_connectivity_error(error):
+    """是否为连接类错误（计入熔断）"""
+    return isinstance(error, CONNECTIVITY_ERRORS) or (
+        isinstance(error, DatabaseUnavailable) and not isinstance(error, (CircuitOpenError, Neo4jDisabled))
+    )
+
+def _set_state(state, reason=None):
+    """切换状态（调用方持有 _lock）"""
+    global _state, _changed_at
+    if _state == state:
+        return
+    print(f"[健康监测] 熔断器 {_state} -> {state}" + (f": {reason}" if reason else ""))
+    _state = state
+    _changed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+def _open(error):
+    """熔断，并按退避时间安排下一次探测（调用方持有 _lock）"""
+    global _next_probe_at, _backoff_s, _last_error
+    _last_error = str(error)
+    if _state != STATE_OPEN:
+        _stats['opens'] += 1
+    # 加入抖动，避免多个进程同时探测
+    delay = _backoff_s * random.uniform(0.8, 1.2)
+    _next_probe_at = time.monotonic() + delay
+    _backoff_s = min(_backoff_s * 2, HEALTH_BACKOFF_MAX_S)
+    _set_state(STATE_OPEN, f"{error}（{delay:.0f}s 后重新探测）")
+
+def _close():
+    """恢复闭合状态（调用方持有 _lock）"""
+    global _consecutive_failures, _backoff_s, _next_probe_at
+    _consecutive_failures = 0
+    _backoff_s = HEALTH_BACKOFF_BASE_S
+    _next_probe_at = time.monotonic() + HEALTH_PROBE_INTERVAL_S
+    _set_state(STATE_CLOSED)
+
+def allow_request():
+    """查询前调用：熔断期间立即返回 False，不访问数据库"""
+    if _state != STATE_OPEN:
+        return True
+    with _lock:
+        _stats['rejected'] += 1
+    return False
+
+def record_success():
+    """查询成功：半开状态下恢复闭合，闭合状态下清零连续失败计数"""
+    global _consecutive_failures
+    if _state == STATE_CLOSED and _consecutive_failures == 0:
+        return
+    with _lock:
+        if _state == STATE_HALF_OPEN:
+            _close()
+        elif _state == STATE_CLOSED:
+            _consecutive_failures = 0
+
+def record_failure(error):
+    """查询失败：连接类错误累计到阈值后熔断，半开状态下立即重新熔断"""
+    global _consecutive_failures, _last_error
+    if not is_connectivity_error(error):
+        return
+    with _lock:
+        _last_error = str(error)
+        if _state == STATE_HALF_OPEN:
+            _open(error)
+        elif _state == STATE_CLOSED:
+            _consecutive_failures += 1
+            if _consecutive_failures >= HEALTH_FAILURE_THRESHOLD:
+                _open(error)
+
+def _probe():
+    """执行一次探测查询，返回耗时（毫秒）"""
+    from modules.auth import get_neo4j_driver
+    start = time.perf_counter()
+    driver = get_neo4j_driver()
+    if driver is None:
+        raise DatabaseUnavailable("Neo4j驱动不可用")
+    with driver.session() as session:
+        session.run("RETURN 1").consume()
+    return (time.perf_counter() - start) * 1000
+
+def probe_now():
+    """立即探测一次并更新熔断器状态，返回数据库是否可用"""
+    global _latency_ewma_ms, _next_probe_at, _consecutive_failures
+    try:
+        latency_ms = _probe()
+    except Exception as e:
+        with _lock:
+            _stats['probes'] += 1
+            _stats['probe_failures'] += 1
+            if _state == STATE_CLOSED:
+                # 探测失败直接熔断，不必等真实查询逐个超时
+                _consecutive_failures = HEALTH_FAILURE_THRESHOLD
+            _open(e)
+        _reset_driver()
+        return False
+
+    with _lock:
+        _stats['probes'] += 1
+        if _latency_ewma_ms is None:
+            _latency_ewma_ms = latency_ms
+        else:
+            _latency_ewma_ms = LATENCY_EWMA_ALPHA * latency_ms + (1 - LATENCY_EWMA_ALPHA) * _latency_ewma_ms
+        if _state == STATE_OPEN:
+            _set_state(STATE_HALF_OPEN, f"探测成功 {latency_ms:.0f}ms")
+        _next_probe_at = time.monotonic() + HEALTH_PROBE_INTERVAL_S
+    return True
+
+def _reset_driver():
+    """探测失败后丢弃旧驱动，下次探测重新创建连接"""
+    try:
+        from modules.auth import reset_neo4j_driver
+        reset_neo4j_driver()
+    except Exception as e:
+        print(f"[健康监测] 重置驱动失败: {e}")
+
+def _monitor_loop():
+    """后台探测循环：闭合时按固定间隔探测，熔断时按退避时间探测"""
+    while True:
+        wait = _next_probe_at - time.monotonic()
+        if wait > 0:
+            time.sleep(min(wait, 1.0))
+            continue
+        probe_now()
+
+def ensure_monitor_started():
+    """首次调用时同步探测一次并启动后台监测线程（每个进程一个）"""
+    global _monitor_thread
+    if _monitor_thread is not None:
+        return
+    with _monitor_lock:
+        if _monitor_thread is not None:
+            return
+        probe_now()
+        _monitor_thread = threading.Thread(target=_monitor_loop, name="neo4j-health", daemon=True)
+        _monitor_thread.start()
+
+def is_available():
+    """数据库是否可用（未熔断），O(1) 且不访问数据库"""
+    return _state != STATE_OPEN
+
+def is_latency_degraded():
+    """探测延迟的加权平均是否超过降级阈值"""
+    return _latency_ewma_ms is not None and _latency_ewma_ms > HEALTH_DEGRADED_LATENCY_MS
+
+def get_last_error():
+    return _last_error
+
+def get_health():
+    """熔断器状态和探测统计"""
+    with _lock:
+        health = dict(_stats)
+        health.update({
+            'state': _state,
+            'consecutive_failures': _consecutive_failures,
+            'backoff_s': _backoff_s,
+            'next_probe_in_s': max(0.0, round(_next_probe_at - time.monotonic(), 1)),
+            'changed_at': _changed_at,
+            'last_error': _last_error,
+            'latency_ms': round(_latency_ewma_ms, 1) if _latency_ewma_ms is not None else None,
+        })
+    health['latency_degraded'] = is_latency_degraded()
+    return health
@@ -7,6 +7,7 @@ import streamlit as st
 import streamlit.components.v1 as components
 from pyvis.network import Network
 from config.settings import *
+from modules.storage import embedded_store
 
 def check_neo4j_available():
     """检查Neo4j是否可用"""
@@ -42,35 +43,48 @@ def log_graph_activity(activity_type, content_id=None, content_name=None, detail
 
 def get_knowledge_graph_data(module_id=None):
     """从Neo4j获取知识图谱数据"""
+    store = embedded_store()
+    if store is not None:
+        return store.get_knowledge_graph_data(module_id)
+    
     if not check_neo4j_available():
         return []
     
+    from modules.db import run_query
+    
     try:
-        driver = get_neo4j_driver()
-        
-        with driver.session() as session:
-            if module_id:
-                # 获取特定模块的知识图谱
-                result = session.run("""
-                    MATCH path = (m:glx_Module {id: $module_id})-[:HAS_CHAPTER]->(c:glx_Chapter)-[:HAS_KNOWLEDGE]->(k:glx_Knowledge)
-                    OPTIONAL MATCH (k)-[r:PREREQUISITE]->(k2:glx_Knowledge)
-                    RETURN m, c, k, r, k2
-                """, module_id=module_id)
-            else:
-                # 获取所有模块
-                result = session.run("""
-                    MATCH (m:glx_Module)-[:HAS_CHAPTER]->(c:glx_Chapter)-[:HAS_KNOWLEDGE]->(k:glx_Knowledge)
-                    RETURN m, c, k
-                    LIMIT 50
-                """)
-            
-            data = [dict(record) for record in result]
-        
-        # 不关闭driver，保持连接池复用
-        return data
+        if module_id:
+            # 获取特定模块的知识图谱
+            return run_query("knowledge_graph.module_graph", """
+                MATCH path = (m:glx_Module {id: $module_id})-[:HAS_CHAPTER]->(c:glx_Chapter)-[:HAS_KNOWLEDGE]->(k:glx_Knowledge)
+                OPTIONAL MATCH (k)-[r:PREREQUISITE]->(k2:glx_Knowledge)
+                RETURN m, c, k, r, k2
+            """, module_id=module_id)
+        # 获取所有模块
+        return run_query("knowledge_graph.all_modules", """
+            MATCH (m:glx_Module)-[:HAS_CHAPTER]->(c:glx_Chapter)-[:HAS_KNOWLEDGE]->(k:glx_Knowledge)
+            RETURN m, c, k
+            LIMIT 50
+        """)
     except Exception:
         return []
 
+def count_knowledge_points():
+    """知识点总数"""
+    store = embedded_store()
+    if store is not None:
+        return store.count_knowledge_points()
+    
+    if not check_neo4j_available():
+        return 0
+    
+    from modules.db import run_single
+    
+    try:
+        return run_single("app.home.knowledge_count", "MATCH (k:glx_Knowledge) RETURN count(k) as count")['count']
+    except Exception:
+        return 0
+
 def create_knowledge_graph_viz(module_id=None):
     """创建知识图谱可视化"""
     # 使用浅色背景
@@ -0,0 +1,256 @@
+"""
+连接池模块
+Neo4j 驱动的连接池大小、连接寿命和获取超时来自配置，并根据观测到的并发自动扩容：
+查询网关打开会话前先占用一个连接名额（名额数与连接池大小一致，同步和异步驱动共用），驱动内部不再隐式排队，
+占用名额的等待即连接获取等待，超过阈值时记录查询名称；并发达到上限且出现等待时，
+按步长扩大连接池（重建驱动），不超过配置的最大值。旧驱动不再分配新查询，
+占用名额时登记所用的驱动，旧驱动上的查询（包括流式导出、归档）全部结束后才关闭。
+扩容依据的并发峰值按 GROW_COOLDOWN_S 的时间窗口统计，扩容后重新计算。
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from config.settings import (
+    NEO4J_POOL_SIZE, NEO4J_POOL_MAX_SIZE, NEO4J_CONNECTION_LIFETIME_S, NEO4J_ACQUISITION_TIMEOUT_S,
+    POOL_WAIT_LOG_MS, POOL_AUTO_GROW
+)
+
+# 两次扩容之间的最短间隔（秒）
+GROW_COOLDOWN_S = 60
+# 连接创建的采样间隔（秒）
+SAMPLE_INTERVAL_S = 1.0
+
+_cond = threading.Condition()
+_size = max(1, NEO4J_POOL_SIZE)
+_in_use = 0
+_peak_in_use = 0
+_peak_window_at = 0.0
+_last_grow_at = 0.0
+_growing = False
+_stats = {
+    'acquisitions': 0,
+    'waited': 0,
+    'total_wait_ms': 0.0,
+    'max_wait_ms': 0.0,
+    'slow_waits': 0,
+    'timeouts': 0,
+    'resizes': 0,
+}
+_slow_waits = deque(maxlen=100)
+
+# 各驱动占用中的名额数（按对象 id）和等待查询结束后关闭的旧驱动（id -> 关闭函数）
+_leases = {}
+_retiring = {}
+
+# 驱动连接池中见过的连接（按对象 id）和新连接出现的时间，用于统计每分钟新建连接数
+_seen_connections = set()
+_creations = deque(maxlen=1000)
+_last_sample_at = 0.0
+
+class PoolTimeout(RuntimeError):
+    """等待连接名额超时（连接池已满）"""
+
+def driver_pool_config():
+    """创建驱动时使用的连接池参数"""
+    return {
+        'max_connection_pool_size': _size,
+        'max_connection_lifetime': NEO4J_CONNECTION_LIFETIME_S,
+        'connection_acquisition_timeout': NEO4J_ACQUISITION_TIMEOUT_S,
+    }
+
+def _driver_connections():
+    """驱动连接池中的连接列表（读取驱动内部结构，驱动版本不提供时返回 None，统计项显示为空）"""
+    try:
+        from modules.auth import get_cached_driver
+        driver = get_cached_driver()
+    except Exception:
+        return None
+    connections = getattr(getattr(driver, '_pool', None), 'connections', None)
+    if not hasattr(connections, 'values'):
+        return None
+    try:
+        return [conn for conns in list(connections.values()) for conn in list(conns)]
+    except Exception:
+        return None
+
+def _sample_creations(force=False):
+    """对比驱动连接池中的连接，记录新建的连接，返回连接列表"""
+    global _last_sample_at
+    now = time.monotonic()
+    if not force and now - _last_sample_at < SAMPLE_INTERVAL_S:
+        return None
+    _last_sample_at = now
+    connections = _driver_connections()
+    if connections is None:
+        return None
+    current = {id(conn) for conn in connections}
+    with _cond:
+        for conn_id in current - _seen_connections:
+            _creations.append(now)
+        _seen_connections.clear()
+        _seen_connections.update(current)
+    return connections
+
+def _maybe_grow(name, wait_ms):
+    """并发已达上限且出现等待时扩大连接池"""
+    global _size, _last_grow_at, _growing, _peak_in_use, _peak_window_at
+    now = time.monotonic()
+    with _cond:
+        if (not POOL_AUTO_GROW or _growing or _size >= NEO4J_POOL_MAX_SIZE
+                or now - _last_grow_at < GROW_COOLDOWN_S or _peak_in_use < _size):
+            return
+        new_size = min(NEO4J_POOL_MAX_SIZE, max(_size + 2, int(_size * 1.5)))
+        _growing = True
+    try:
+        # 先用新的大小重建驱动，再放开名额
+        from modules.auth import rebuild_neo4j_driver
+        rebuild_neo4j_driver(new_size)
+        with _cond:
+            _size = new_size
+            _stats['resizes'] += 1
+            # 扩容后按新的大小重新统计峰值
+            _peak_in_use = _in_use
+            _peak_window_at = time.monotonic()
+            _cond.notify_all()
+        print(f"[连接池] {name} 等待连接 {wait_ms:.0f}ms，连接池扩容到 {new_size}")
+    except Exception as e:
+        print(f"[连接池] 扩容失败: {e}")
+    finally:
+        with _cond:
+            _growing = False
+            _last_grow_at = time.monotonic()
+
+def _close_driver(driver):
+    try:
+        driver.close()
+    except Exception as e:
+        print(f"[连接池] 关闭旧驱动失败: {e}")
+
+def retire_driver(driver, grace_s, close=None):
+    """
+    旧驱动（已被新驱动替换）在 grace_s 秒后关闭：仍有查询占用名额时等最后一个名额释放再关闭
+    宽限期兜底直接使用驱动、不经过连接名额的旧代码；close 为关闭函数（默认 driver.close，异步驱动另行传入）
+    """
+    close = close or (lambda: _close_driver(driver))
+
+    def _retire():
+        with _cond:
+            if _leases.get(id(driver), 0) > 0:
+                _retiring[id(driver)] = close
+                return
+        close()
+
+    timer = threading.Timer(grace_s, _retire)
+    timer.daemon = True
+    timer.start()
+
+def acquire_slot(name, driver=None):
+    """
+    占用一个连接名额（最多等待 NEO4J_ACQUISITION_TIMEOUT_S 秒），记录等待时间，需与 release_slot 成对调用
+    driver 为本次使用的驱动，占用期间该驱动不会被扩容后的延迟关闭关掉；同步和异步驱动共用同一组名额
+    """
+    global _in_use, _peak_in_use, _peak_window_at
+    start = time.perf_counter()
+    with _cond:
+        if not _cond.wait_for(lambda: _in_use < _size, NEO4J_ACQUISITION_TIMEOUT_S):
+            _stats['timeouts'] += 1
+            size = _size
+        else:
+            size = None
+            _in_use += 1
+            now = time.monotonic()
+            if now - _peak_window_at >= GROW_COOLDOWN_S:
+                # 峰值只看最近一个窗口，避免很久以前的高峰一直触发扩容
+                _peak_in_use = _in_use
+                _peak_window_at = now
+            _peak_in_use = max(_peak_in_use, _in_use)
+            if driver is not None:
+                _leases[id(driver)] = _leases.get(id(driver), 0) + 1
+    if size is not None:
+        print(f"[连接池] {name} 获取连接超时（{NEO4J_ACQUISITION_TIMEOUT_S}s，连接池 {size}）")
+        raise PoolTimeout(f"获取数据库连接超时（连接池 {size} 已满）")
+
+    wait_ms = (time.perf_counter() - start) * 1000
+    slow = wait_ms >= POOL_WAIT_LOG_MS
+    with _cond:
+        _stats['acquisitions'] += 1
+        _stats['total_wait_ms'] += wait_ms
+        _stats['max_wait_ms'] = max(_stats['max_wait_ms'], wait_ms)
+        if wait_ms >= 1:
+            _stats['waited'] += 1
+        if slow:
+            _stats['slow_waits'] += 1
+            _slow_waits.append({
+                'name': name,
+                'wait_ms': round(wait_ms, 1),
+                'in_use': _in_use,
+                'size': _size,
+                'at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            })
+    if slow:
+        print(f"[连接池] {name} 等待连接 {wait_ms:.0f}ms（使用中 {_in_use}/{_size}）")
+        _maybe_grow(name, wait_ms)
+
+def release_slot(driver=None):
+    """释放 acquire_slot 占用的名额，旧驱动的最后一个名额释放时关闭旧驱动"""
+    global _in_use
+    retired = None
+    with _cond:
+        _in_use -= 1
+        if driver is not None:
+            remaining = _leases.get(id(driver), 1) - 1
+            if remaining > 0:
+                _leases[id(driver)] = remaining
+            else:
+                _leases.pop(id(driver), None)
+                retired = _retiring.pop(id(driver), None)
+        _cond.notify()
+    if retired is not None:
+        retired()
+    _sample_creations()
+
+@contextmanager
+def acquire_connection(name, driver=None):
+    """占用一个连接名额的上下文（见 acquire_slot），退出时释放"""
+    acquire_slot(name, driver)
+    try:
+        yield
+    finally:
+        release_slot(driver)
+
+def get_pool_stats():
+    """连接池统计：大小、使用中/空闲连接、获取等待和每分钟新建连接数"""
+    connections = _sample_creations(force=True)
+    now = time.monotonic()
+    with _cond:
+        stats = dict(_stats)
+        stats.update({
+            'size': _size,
+            'max_size': NEO4J_POOL_MAX_SIZE,
+            'in_use': _in_use,
+            'peak_in_use': _peak_in_use,
+            'retiring_drivers': len(_retiring),
+            'creations_per_minute': sum(1 for t in _creations if now - t <= 60),
+        })
+    total_wait = stats.pop('total_wait_ms')
+    stats['avg_wait_ms'] = round(total_wait / stats['acquisitions'], 2) if stats['acquisitions'] else 0.0
+    stats['max_wait_ms'] = round(stats['max_wait_ms'], 1)
+    if connections is not None:
+        stats['driver_in_use'] = sum(1 for conn in connections if getattr(conn, 'in_use', False))
+        stats['driver_idle'] = len(connections) - stats['driver_in_use']
+    else:
+        # 驱动版本不提供内部连接列表时这几项无法统计
+        stats['driver_in_use'] = None
+        stats['driver_idle'] = None
+        stats['creations_per_minute'] = None
+    return stats
+
+def get_slow_waits(limit=50):
+    """最近超过阈值的连接获取等待（新的在前）"""
+    with _cond:
+        entries = list(_slow_waits)
+    return entries[::-1][:limit]
@@ -0,0 +1,158 @@
+"""
+查询结果缓存模块
+进程内共享的读查询缓存，所有会话共用，按查询名称和参数缓存结果。
+每个查询按名称前缀配置 TTL 和依赖的数据标签，写入时递增对应标签的版本号，
+依赖该标签的缓存项随即失效，不必整体清空缓存。超出容量时淘汰最久未使用的项。
+每次写入还递增全局写入序号，缓存项记录自己的新鲜度序号，刚写入过的会话只复用不早于其写入的结果（见 consistency）。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from config.settings import QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_ENABLED
+
+# 数据标签：写入方按实际修改的数据递增版本
+TAG_STUDENT = 'student'
+TAG_ACTIVITY = 'activity'
+TAG_QUESTION = 'question'
+TAG_REPLY = 'reply'
+TAG_KNOWLEDGE = 'knowledge'
+TAG_CASE = 'case'
+TAG_SESSION = 'session'
+
+# 缓存策略：查询名称前缀 -> (TTL 秒, 依赖标签)，按最长前缀匹配，未配置的查询不缓存
+CACHE_POLICIES = {
+    # 学生与活动统计（教师端概览、模块分析、学习报告）
+    'auth.get_all_students': (30, (TAG_STUDENT, TAG_ACTIVITY)),
+    'auth.get_student_activities': (15, (TAG_STUDENT, TAG_ACTIVITY)),
+    'auth.get_module_statistics': (30, (TAG_ACTIVITY,)),
+    'auth.get_all_modules_statistics': (30, (TAG_ACTIVITY,)),
+    'auth.get_single_module_statistics': (30, (TAG_ACTIVITY,)),
+    'analytics.summary': (30, (TAG_STUDENT, TAG_ACTIVITY)),
+    'analytics.daily_trend': (60, (TAG_ACTIVITY,)),
+    'analytics.module_usage': (30, (TAG_ACTIVITY,)),
+    'analytics.popular_content': (60, (TAG_ACTIVITY,)),
+    'analytics.profile': (30, (TAG_STUDENT, TAG_ACTIVITY)),
+    'storage.student_sessions': (60, (TAG_STUDENT, TAG_SESSION)),
+    'analytics.classroom': (15, (TAG_STUDENT, TAG_QUESTION, TAG_REPLY)),
+    'report.get_all_students': (60, (TAG_STUDENT,)),
+    'report.student': (60, (TAG_STUDENT, TAG_ACTIVITY)),
+    'report.module': (60, (TAG_STUDENT, TAG_ACTIVITY)),
+    'report.overall': (60, (TAG_STUDENT, TAG_ACTIVITY, TAG_KNOWLEDGE)),
+    'app.dashboard': (30, (TAG_STUDENT, TAG_ACTIVITY)),
+    'app.module': (30, (TAG_STUDENT, TAG_ACTIVITY)),
+    'app.students.list': (30, (TAG_STUDENT, TAG_ACTIVITY)),
+    # 课堂互动：写入即失效，TTL 只是兜底
+    'classroom.get_active_question': (10, (TAG_QUESTION,)),
+    'classroom.get_recent_replies': (10, (TAG_REPLY, TAG_STUDENT)),
+    # 知识图谱、能力、案例等基本不变的数据
+    'app.home.knowledge_count': (600, (TAG_KNOWLEDGE,)),
+    'knowledge_graph': (600, (TAG_KNOWLEDGE,)),
+    'teaching_design': (600, (TAG_KNOWLEDGE,)),
+    'ability': (600, (TAG_KNOWLEDGE,)),
+    'case_library': (600, (TAG_CASE, TAG_KNOWLEDGE)),
+}
+
+_lock = threading.Lock()
+# key -> (过期时间, 标签版本快照, 新鲜度序号, 结果)
+_entries = OrderedDict()
+_tag_versions = {}
+_write_seq = 0
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'stale': 0,
+    'bypassed': 0,
+    'evictions': 0,
+    'invalidations': 0,
+}
+
+def get_policy(name):
+    """查找查询名称对应的缓存策略，没有配置时返回 None"""
+    if not QUERY_CACHE_ENABLED:
+        return None
+    best = None
+    for prefix, policy in CACHE_POLICIES.items():
+        if (name == prefix or name.startswith(prefix + '.')) and (best is None or len(prefix) > len(best[0])):
+            best = (prefix, policy)
+    return best[1] if best else None
+
+def make_key(name, cypher, parameters):
+    """缓存键：查询名称 + 语句文本（字段兼容模式会改变语句）+ 参数"""
+    params = tuple(sorted((k, repr(v)) for k, v in (parameters or {}).items()))
+    return (name, cypher, params)
+
+def _copy(records):
+    # 调用方可能原地修改返回的字典，缓存中保留独立的副本
+    return [dict(record) for record in records]
+
+def cache_get(key, tags, min_fresh=0):
+    """
+    读取未过期且依赖标签未变化的缓存结果，未命中时返回 None
+    min_fresh 为调用方要求的最小新鲜度序号，更旧的缓存项对该调用方视为未命中（保留给其他会话）
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            _stats['misses'] += 1
+            return None
+        expires_at, versions, fresh, records = entry
+        if expires_at < now or any(_tag_versions.get(tag, 0) != v for tag, v in versions):
+            del _entries[key]
+            _stats['stale'] += 1
+            _stats['misses'] += 1
+            return None
+        if fresh < min_fresh:
+            _stats['bypassed'] += 1
+            _stats['misses'] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats['hits'] += 1
+    return _copy(records)
+
+def tag_snapshot(tags):
+    """执行查询前记录依赖标签的版本，查询期间发生的写入会让这次结果直接失效"""
+    with _lock:
+        return tuple((tag, _tag_versions.get(tag, 0)) for tag in tags)
+
+def cache_put(key, versions, ttl, records, fresh=0):
+    """写入缓存（fresh 为结果的新鲜度序号），超出容量时淘汰最久未使用的项"""
+    with _lock:
+        _entries[key] = (time.monotonic() + ttl, versions, fresh, _copy(records))
+        _entries.move_to_end(key)
+        while len(_entries) > QUERY_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats['evictions'] += 1
+
+def bump_tags(*tags):
+    """数据写入后递增全局写入序号和标签版本，依赖这些标签的缓存项失效，返回新的写入序号"""
+    global _write_seq
+    with _lock:
+        _write_seq += 1
+        for tag in tags:
+            _tag_versions[tag] = _tag_versions.get(tag, 0) + 1
+        if tags:
+            _stats['invalidations'] += 1
+        return _write_seq
+
+def get_write_seq():
+    """当前的全局写入序号"""
+    return _write_seq
+
+def clear_query_cache():
+    """清空全部缓存（教师端刷新数据按钮）"""
+    with _lock:
+        _entries.clear()
+
+def get_cache_stats():
+    """缓存命中统计"""
+    with _lock:
+        stats = dict(_stats)
+        stats['size'] = len(_entries)
+        stats['tag_versions'] = dict(_tag_versions)
+        stats['write_seq'] = _write_seq
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    return stats
@@ -7,12 +7,18 @@ import streamlit as st
 from datetime import datetime
 from openai import OpenAI
 from config.settings import *
+from modules.db import run_query, run_single
+from modules.async_db import gather_queries
+from modules.schema_migrations import module_field, type_field
+from modules.rollups import counters_ready, sketches_ready
+from modules.sketches import unique_students_by_module
 import pandas as pd
 
 def check_neo4j_available():
-    """检查Neo4j是否可用"""
+    """检查Neo4j是否可用（本模块只支持图数据库，嵌入式存储模式下不可用）"""
     from modules.auth import check_neo4j_available as auth_check
-    return auth_check()
+    from modules.storage import neo4j_enabled
+    return neo4j_enabled() and auth_check()
 
 def get_neo4j_driver():
     """获取Neo4j连接"""
@@ -25,15 +31,11 @@ def get_all_students():
         return []
     
     try:
-        driver = get_neo4j_driver()
-        with driver.session() as session:
-            result = session.run("""
-                MATCH (s:mfx_Student)
-                RETURN s.student_id as student_id, s.name as name
-                ORDER BY s.student_id
-            """)
-            students = [dict(record) for record in result]
-        return students
+        return run_query("report.get_all_students", """
+            MATCH (s:mfx_Student)
+            RETURN s.student_id as student_id, s.name as name
+            ORDER BY s.student_id
+        """)
     except Exception as e:
         st.error(f"获取学生列表失败: {e}")
         return []
@@ -54,45 +56,66 @@ def get_student_learning_data(student_id):
         return None
     
     try:
-        driver = get_neo4j_driver()
-        with driver.session() as session:
-            # 获取学生基本信息
-            student_info = session.run("""
-                MATCH (s:mfx_Student {student_id: $student_id})
-                RETURN s.student_id as student_id, s.name as name
-            """, student_id=student_id).single()
-            
-            if not student_info:
-                return None
-            
-            # 获取学习活动记录
-            activities = session.run("""
-                MATCH (s:mfx_Student {student_id: $student_id})-[:PERFORMED]->(a:mfx_Activity)
-                RETURN 
-                    a.activity_type as activity_type,
-                    a.module_name as module_name,
-                    a.content_name as content_name,
-                    a.timestamp as timestamp,
-                    a.details as details
-                ORDER BY a.timestamp DESC
-                LIMIT 100
-            """, student_id=student_id)
-            
-            activity_list = [dict(record) for record in activities]
-            
-            # 获取学生统计信息
-            stats = session.run("""
-                MATCH (s:mfx_Student {student_id: $student_id})-[:PERFORMED]->(a:mfx_Activity)
-                RETURN 
-                    count(a) as total_activities,
-                    count(DISTINCT a.module_name) as modules_accessed,
-                    max(a.timestamp) as last_activity
-            """, student_id=student_id).single()
-            
-            stats_dict = dict(stats) if stats else {}
+        # 获取学生基本信息
+        student_info = run_single("report.student.info", """
+            MATCH (s:mfx_Student {student_id: $student_id})
+            RETURN s.student_id as student_id, s.name as name
+        """, student_id=student_id)
+        
+        if not student_info:
+            return None
+        
+        from modules.retention import cold_enabled, query_activities
+        if cold_enabled():
+            # 部分活动已移到冷归档：合并冷热数据统计完整的学习历史
+            history = query_activities(student_id=student_id)
+            recent = history.head(100)
+            activity_list = [
+                {
+                    'activity_type': row.activity_type,
+                    'module_name': row.module,
+                    'content_name': row.content_name,
+                    'timestamp': row.timestamp.to_pydatetime(),
+                    'details': row.details,
+                }
+                for row in recent.itertuples(index=False)
+            ]
+            return {
+                'student_info': student_info,
+                'activities': activity_list,
+                'stats': {
+                    'total_activities': len(history),
+                    'modules_accessed': int(history['module'].nunique()),
+                    'last_activity': history['timestamp'].max().to_pydatetime() if len(history) else None,
+                }
+            }
+        
+        # 获取学习活动记录
+        activity_list = run_query("report.student.activities", f"""
+            MATCH (s:mfx_Student {{student_id: $student_id}})-[:PERFORMED]->(a:mfx_Activity)
+            RETURN 
+                {type_field('a')} as activity_type,
+                {module_field('a')} as module_name,
+                a.content_name as content_name,
+                a.timestamp as timestamp,
+                a.details as details
+            ORDER BY a.timestamp DESC
+            LIMIT 100
+        """, student_id=student_id)
+        
+        # 获取学生统计信息
+        stats = run_single("report.student.stats", f"""
+            MATCH (s:mfx_Student {{student_id: $student_id}})-[:PERFORMED]->(a:mfx_Activity)
+            RETURN 
+                count(a) as total_activities,
+                count(DISTINCT {module_field('a')}) as modules_accessed,
+                max(a.timestamp) as last_activity
+        """, student_id=student_id)
+        
+        stats_dict = stats if stats else {}
             
         return {
-            'student_info': dict(student_info),
+            'student_info': student_info,
             'activities': activity_list,
             'stats': stats_dict
         }
@@ -106,15 +129,26 @@ def get_module_learning_data(module_id):
         return None
     
     try:
-        driver = get_neo4j_driver()
-        with driver.session() as session:
-            # module_id 就是板块名称（案例库、知识图谱等）
-            module_name = module_id
-            
+        # module_id 就是板块名称（案例库、知识图谱等）
+        module_name = module_id
+        
+        if counters_ready():
+            # 读取学生模块计数，只涉及学过该板块的学生
+            stats_list = run_query("report.module.student_stats", """
+                MATCH (sm:mfx_StudentModule {module_name: $module_name})
+                MATCH (s:mfx_Student {student_id: sm.student_id})
+                RETURN 
+                    s.student_id as student_id,
+                    s.name as student_name,
+                    sm.count as activity_count,
+                    sm.last_activity_at as last_activity
+                ORDER BY activity_count DESC
+            """, module_name=module_name)
+        else:
             # 获取该板块的学习活动统计
-            student_stats = session.run("""
+            stats_list = run_query("report.module.student_stats.scan", f"""
                 MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
-                WHERE a.module_name = $module_name
+                WHERE {module_field('a')} = $module_name
                 RETURN 
                     s.student_id as student_id,
                     s.name as student_name,
@@ -122,36 +156,29 @@ def get_module_learning_data(module_id):
                     max(a.timestamp) as last_activity
                 ORDER BY activity_count DESC
             """, module_name=module_name)
-            
-            stats_list = [dict(record) for record in student_stats]
-            
-            # 获取板块总体统计
-            overall_stats = session.run("""
-                MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
-                WHERE a.module_name = $module_name
-                RETURN 
-                    count(DISTINCT s) as student_count,
-                    count(a) as total_activities
-            """, module_name=module_name).single()
-            
-            # 获取该板块的热门内容
-            popular_content = session.run("""
-                MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
-                WHERE a.module_name = $module_name AND a.content_name IS NOT NULL
-                RETURN 
-                    a.content_name as content_name,
-                    count(a) as access_count,
-                    count(DISTINCT s) as student_count
-                ORDER BY access_count DESC
-                LIMIT 10
-            """, module_name=module_name)
-            
-            content_list = [dict(record) for record in popular_content]
+        
+        # 板块总体统计由学生统计汇总得到
+        overall_stats = {
+            'student_count': len(stats_list),
+            'total_activities': sum(row['activity_count'] for row in stats_list)
+        }
+        
+        # 获取该板块的热门内容
+        content_list = run_query("report.module.popular_content", f"""
+            MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+            WHERE {module_field('a')} = $module_name AND a.content_name IS NOT NULL
+            RETURN 
+                a.content_name as content_name,
+                count(a) as access_count,
+                count(DISTINCT s) as student_count
+            ORDER BY access_count DESC
+            LIMIT 10
+        """, module_name=module_name)
             
         return {
             'module_info': {'module_id': module_id, 'name': module_name},
             'student_stats': stats_list,
-            'overall_stats': dict(overall_stats) if overall_stats else {'student_count': 0, 'total_activities': 0},
+            'overall_stats': overall_stats,
             'popular_content': content_list
         }
     except Exception as e:
@@ -164,28 +191,52 @@ def get_overall_learning_data():
         return None
     
     try:
-        driver = get_neo4j_driver()
-        with driver.session() as session:
-            # 获取总体统计
-            overall_stats = session.run("""
+        # 获取活跃学生Top10
+        if counters_ready():
+            active_query = ("report.overall.active_students", """
                 MATCH (s:mfx_Student)
-                WITH count(s) as total_students
-                MATCH (k:glx_Knowledge)
-                WITH total_students, count(k) as total_kp
-                OPTIONAL MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+                WHERE s.activity_count > 0
                 RETURN 
-                    total_students,
-                    total_kp,
-                    count(a) as total_activities
-            """).single()
-            
+                    s.student_id as student_id,
+                    s.name as student_name,
+                    s.activity_count as activity_count
+                ORDER BY activity_count DESC
+                LIMIT 10
+            """)
+        else:
+            active_query = ("report.overall.active_students.scan", """
+                MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+                RETURN 
+                    s.student_id as student_id,
+                    s.name as student_name,
+                    count(a) as activity_count
+                ORDER BY activity_count DESC
+                LIMIT 10
+            """)
+        
+        if sketches_ready():
+            # 各板块活动数读取模块日汇总，学生数随后由去重计数草图估算
+            module_query = ("report.overall.module_stats.rollup", """
+                MATCH (m:glx_Module)
+                OPTIONAL MATCH (m)-[:HAS_CHAPTER]->(c:glx_Chapter)-[:HAS_KNOWLEDGE]->(k:glx_Knowledge)
+                WITH m, count(DISTINCT k) as kp_count, count(DISTINCT c) as chapter_count
+                OPTIONAL MATCH (d:mfx_DailyStat {module_name: m.name})
+                WITH m, kp_count, chapter_count, COALESCE(sum(d.count), 0) as activity_count
+                RETURN 
+                    m.name as module_name,
+                    kp_count,
+                    chapter_count,
+                    activity_count
+                ORDER BY m.id
+            """)
+        else:
             # 获取各板块学习情况
-            module_stats = session.run("""
+            module_query = ("report.overall.module_stats", f"""
                 MATCH (m:glx_Module)
                 OPTIONAL MATCH (m)-[:HAS_CHAPTER]->(c:glx_Chapter)-[:HAS_KNOWLEDGE]->(k:glx_Knowledge)
                 WITH m, count(DISTINCT k) as kp_count, count(DISTINCT c) as chapter_count
                 OPTIONAL MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
-                WHERE a.module_name = m.name
+                WHERE {module_field('a')} = m.name
                 RETURN 
                     m.name as module_name,
                     kp_count,
@@ -194,42 +245,47 @@ def get_overall_learning_data():
                     count(a) as activity_count
                 ORDER BY m.id
             """)
-            
-            module_list = [dict(record) for record in module_stats]
-            
-            # 获取活跃学生Top10
-            active_students = session.run("""
-                MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+        
+        # 四组数据互不依赖，并发查询
+        data = gather_queries("report.overall", {
+            # 获取总体统计
+            'overall_stats': ("report.overall.totals", """
+                MATCH (s:mfx_Student)
+                WITH count(s) as total_students
+                MATCH (k:glx_Knowledge)
+                WITH total_students, count(k) as total_kp
+                OPTIONAL MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
                 RETURN 
-                    s.student_id as student_id,
-                    s.name as student_name,
-                    count(a) as activity_count
-                ORDER BY activity_count DESC
-                LIMIT 10
-            """)
-            
-            active_list = [dict(record) for record in active_students]
-            
+                    total_students,
+                    total_kp,
+                    count(a) as total_activities
+            """),
+            'module_stats': module_query,
+            'active_students': active_query,
             # 获取热门学习内容
-            popular_content = session.run("""
+            'popular_content': ("report.overall.popular_content", f"""
                 MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
                 WHERE a.content_name IS NOT NULL
                 RETURN 
                     a.content_name as content_name,
-                    a.module_name as module_name,
+                    {module_field('a')} as module_name,
                     count(DISTINCT s) as student_count,
                     count(a) as access_count
                 ORDER BY access_count DESC
                 LIMIT 10
-            """)
+            """),
+        })
             
-            popular_list = [dict(record) for record in popular_content]
+        module_stats = data['module_stats']
+        if sketches_ready():
+            unique = unique_students_by_module()
+            module_stats = [dict(row, student_count=unique.get(row['module_name'], 0)) for row in module_stats]
             
         return {
-            'overall_stats': dict(overall_stats) if overall_stats else {},
-            'module_stats': module_list,
-            'active_students': active_list,
-            'popular_content': popular_list
+            'overall_stats': data['overall_stats'][0] if data['overall_stats'] else {},
+            'module_stats': module_stats,
+            'active_students': data['active_students'],
+            'popular_content': data['popular_content']
         }
     except Exception as e:
         st.error(f"获取整体数据失败: {e}")
@@ -451,6 +507,11 @@ def render_report_generator():
     st.markdown("## 📊 学习报告生成")
     st.markdown("---")
     
+    from modules.storage import neo4j_enabled
+    if not neo4j_enabled():
+        st.info("ℹ️ 当前使用嵌入式存储，学习报告需要 Neo4j 数据库")
+        return
+    
     if not check_neo4j_available():
         st.error("❌ Neo4j数据库连接失败，无法生成报告")
         return
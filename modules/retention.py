@@ -0,0 +1,398 @@
+"""
+活动保留模块
+图中只保留最近 ACTIVITY_RETENTION_DAYS 天的活动（热数据），更早的活动按批（RETENTION_BATCH_SIZE）
+移到本地冷归档：COLD_ARCHIVE_DIR 下按日期和模块分区的 zstd 压缩 Parquet（需要 pyarrow，列与 archive 相同）。
+每批先写冷归档文件（文件名由该批活动 ID 决定，中途失败重跑时覆盖同一文件），再从图中删除。
+
+按天汇总、学生计数和去重计数草图都是增量维护的，移出活动不改变历史总数；
+从活动重建汇总（rollups.backfill_rollups）、重建草图和删除学生时同时计入冷归档（cold_* 函数）。
+活动快照、学习会话和分页记录只覆盖热数据；跨越保留期的长周期报表用 query_activities 合并冷热数据。
+
+    python -m modules.retention              # 按配置的保留天数移出一次
+    python -m modules.retention --days 90    # 指定保留天数
+    python -m modules.retention --status     # 查看冷归档的天数和大小
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+import pandas as pd
+
+from config.settings import (
+    ACTIVITY_RETENTION_DAYS, RETENTION_BATCH_SIZE, RETENTION_INTERVAL_S, COLD_ARCHIVE_DIR
+)
+from modules.archive import HAS_PYARROW, COMPRESSION, PARTITIONS, pa, pq
+
+DAY_MS = 86400 * 1000
+
+_worker_started = False
+_worker_lock = threading.Lock()
+_run_lock = threading.Lock()
+_stats = {
+    'runs': 0,
+    'moved': 0,
+    'last_run_at': None,
+    'last_error': None,
+}
+
+# 保留期之前最早的一批活动（按 ts_ms 索引读取；没有学生的孤立活动同样移出）
+_BATCH_QUERY = """
+    MATCH (a:mfx_Activity)
+    WHERE a.ts_ms < $cutoff_ms
+    WITH a ORDER BY a.ts_ms LIMIT $limit
+    OPTIONAL MATCH (s:mfx_Student)-[:PERFORMED]->(a)
+    RETURN elementId(a) as element_id,
+           COALESCE(a.id, '') as id,
+           s.student_id as student_id,
+           s.name as student_name,
+           {module} as module,
+           {type} as activity_type,
+           a.content_id as content_id,
+           a.content_name as content_name,
+           a.details as details,
+           a.ts_ms as ts,
+           toString(date(a.timestamp)) as day
+"""
+
+def _activities_root():
+    return os.path.join(COLD_ARCHIVE_DIR, 'activities')
+
+def _schema():
+    from modules.archive import _schemas
+    return _schemas()['activities']
+
+def cold_enabled():
+    """冷归档中是否有数据"""
+    return HAS_PYARROW and os.path.isdir(_activities_root())
+
+def retention_cutoff_ms(days=None):
+    """保留期起点（UTC 零点的毫秒时间戳），早于它的活动移到冷归档"""
+    days = ACTIVITY_RETENTION_DAYS if days is None else days
+    today = int(time.time() * 1000) // DAY_MS * DAY_MS
+    return today - days * DAY_MS
+
+def _dataset():
+    import pyarrow.dataset as ds
+    schema = _schema()
+    partitioning = ds.partitioning(
+        pa.schema([(name, schema.field(name).type) for name in PARTITIONS['activities']]), flavor='hive'
+    )
+    return ds.dataset(_activities_root(), format='parquet', partitioning=partitioning, schema=schema)
+
+def read_cold(student_id=None, module=None, start_day=None, end_day=None, columns=None):
+    """
+    读取冷归档中的活动（pyarrow Table），按学生（学号或学号列表）、模块和日期范围 [start_day, end_day] 过滤
+    日期和模块是分区列，过滤时只读取对应目录下的文件；冷归档为空时返回 None
+    """
+    import pyarrow.dataset as ds
+
+    if not cold_enabled():
+        return None
+    condition = None
+    if student_id is not None and not isinstance(student_id, str):
+        student_filter = ds.field('student_id').isin(list(student_id))
+    else:
+        student_filter = ds.field('student_id') == student_id if student_id is not None else None
+    for expression in (
+        student_filter,
+        ds.field('module') == module if module is not None else None,
+        ds.field('day') >= str(start_day)[:10] if start_day is not None else None,
+        ds.field('day') <= str(end_day)[:10] if end_day is not None else None,
+    ):
+        if expression is not None:
+            condition = expression if condition is None else condition & expression
+    return _dataset().to_table(columns=columns, filter=condition)
+
+def _write_batch(rows):
+    """一批活动写入冷归档，文件名由活动 ID 的哈希决定"""
+    schema = _schema()
+    digest = hashlib.blake2b(
+        '\n'.join(row['element_id'] for row in rows).encode('utf-8'), digest_size=8
+    ).hexdigest()
+    records = []
+    for row in rows:
+        record = {name: row.get(name) for name in schema.names}
+        for name in schema.names:
+            if name != 'ts' and record[name] is not None:
+                record[name] = str(record[name])
+        records.append(record)
+    pq.write_to_dataset(
+        pa.Table.from_pylist(records, schema=schema), _activities_root(),
+        partition_cols=PARTITIONS['activities'], compression=COMPRESSION,
+        basename_template=f"part-{digest}-{{i}}.parquet", existing_data_behavior='overwrite_or_ignore'
+    )
+
+def evict_activities(days=None, max_batches=None):
+    """
+    把保留期之前的活动按批移到冷归档并从图中删除，返回移出的活动数
+    days 为空时使用 ACTIVITY_RETENTION_DAYS；max_batches 限制本次最多处理的批数
+    """
+    from modules.db import run_query, run_write
+    from modules.query_cache import TAG_ACTIVITY, TAG_SESSION
+    from modules.schema_migrations import module_field, type_field
+    from modules.activity_snapshot import invalidate_snapshot
+
+    if not HAS_PYARROW:
+        raise RuntimeError("活动保留需要安装 pyarrow（pip install pyarrow）")
+    days = ACTIVITY_RETENTION_DAYS if days is None else days
+    if days <= 0:
+        return 0
+
+    cutoff_ms = retention_cutoff_ms(days)
+    query = _BATCH_QUERY.format(module=module_field('a'), type=type_field('a'))
+    moved = 0
+    batches = 0
+    with _run_lock:
+        while max_batches is None or batches < max_batches:
+            rows = run_query("retention.batch", query, cutoff_ms=cutoff_ms, limit=RETENTION_BATCH_SIZE)
+            if not rows:
+                break
+            _write_batch(rows)
+            run_write("retention.delete", """
+                UNWIND $element_ids AS element_id
+                MATCH (a:mfx_Activity) WHERE elementId(a) = element_id
+                DETACH DELETE a
+            """, element_ids=[row['element_id'] for row in rows], invalidates=(TAG_ACTIVITY, TAG_SESSION))
+            moved += len(rows)
+            batches += 1
+        _stats['runs'] += 1
+        _stats['moved'] += moved
+        _stats['last_run_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    if moved:
+        invalidate_snapshot()
+        print(f"[活动保留] 已将 {moved} 条 {days} 天前的活动移到冷归档")
+    return moved
+
+def _run_worker():
+    while True:
+        try:
+            evict_activities()
+            _stats['last_error'] = None
+        except Exception as e:
+            _stats['last_error'] = str(e)
+            print(f"[活动保留] 移出失败: {e}")
+        time.sleep(RETENTION_INTERVAL_S)
+
+def start_retention_worker():
+    """配置了保留天数且安装了 pyarrow 时，启动每 RETENTION_INTERVAL_S 秒执行一次的后台线程"""
+    global _worker_started
+    if ACTIVITY_RETENTION_DAYS <= 0 or not HAS_PYARROW:
+        return False
+    with _worker_lock:
+        if _worker_started:
+            return True
+        _worker_started = True
+    threading.Thread(target=_run_worker, name="activity-retention", daemon=True).start()
+    return True
+
+def _cold_frame(columns, **filters):
+    table = read_cold(columns=columns, **filters)
+    if table is None or table.num_rows == 0:
+        return None
+    return table.to_pandas()
+
+def cold_daily_counts(student_id=None):
+    """冷归档按 (日期, 模块, 活动类型) 的活动数（可限定学生），格式同 rollups 回填的模块日汇总"""
+    frame = _cold_frame(['day', 'module', 'activity_type'], student_id=student_id)
+    if frame is None:
+        return []
+    frame = frame.fillna('')
+    counts = frame.groupby(['day', 'module', 'activity_type']).size().reset_index(name='count')
+    return [
+        {'day': row.day, 'module_name': row.module, 'activity_type': row.activity_type, 'count': int(row.count)}
+        for row in counts.itertuples(index=False)
+    ]
+
+def cold_module_counts():
+    """冷归档各模块的活动数 {模块: 活动数}（汇总尚未回填时与图中的统计相加）"""
+    frame = _cold_frame(['module'])
+    if frame is None:
+        return {}
+    counts = frame['module'].fillna('').value_counts()
+    return {module: int(count) for module, count in counts.items()}
+
+def cold_student_day_counts(student_id=None):
+    """冷归档按 (日期, 学生) 的活动数"""
+    frame = _cold_frame(['day', 'student_id'], student_id=student_id)
+    if frame is None:
+        return []
+    counts = frame.dropna(subset=['student_id']).groupby(['day', 'student_id']).size().reset_index(name='count')
+    return [
+        {'day': row.day, 'student_id': row.student_id, 'count': int(row.count)}
+        for row in counts.itertuples(index=False)
+    ]
+
+def cold_student_module_counts(student_id=None):
+    """冷归档按 (学生, 模块) 的活动数和最后活动时间（ISO 字符串）"""
+    frame = _cold_frame(['student_id', 'module', 'ts'], student_id=student_id)
+    if frame is None:
+        return []
+    frame = frame.dropna(subset=['student_id'])
+    frame['module'] = frame['module'].fillna('')
+    grouped = frame.groupby(['student_id', 'module'])['ts'].agg(['size', 'max']).reset_index()
+    return [
+        {'student_id': row.student_id, 'module_name': row.module, 'count': int(row.size),
+         'last_activity_at': row.max.isoformat(), 'last_ms': int(row.max.value // 1000000)}
+        for row in grouped.itertuples(index=False)
+    ]
+
+def cold_sketch_students(keys=None, student_id=None):
+    """
+    冷归档中各 (日期, 模块) 的学号集合 {(日期, 模块): set(学号)}
+    keys 为 [(日期, 模块)] 时只读取这些键；student_id 不为空时只返回该学生出现过的键
+    """
+    frame = _cold_frame(['day', 'module', 'student_id'], student_id=student_id)
+    if frame is None:
+        return {}
+    frame = frame.dropna(subset=['student_id'])
+    frame['module'] = frame['module'].fillna('')
+    if keys is not None:
+        wanted = pd.MultiIndex.from_tuples(list(keys), names=['day', 'module']) if keys else None
+        if wanted is None:
+            return {}
+        frame = frame[pd.MultiIndex.from_frame(frame[['day', 'module']]).isin(wanted)]
+    return {key: set(group) for key, group in frame.groupby(['day', 'module'])['student_id']}
+
+def delete_cold_student(student_ids):
+    """
+    从冷归档中删除学生（单个学号或学号列表）的全部活动，返回删除的活动数
+    逐个文件过滤后重写，只剩这些学生的文件直接删除
+    """
+    import pyarrow.compute as pc
+
+    if not cold_enabled():
+        return 0
+    student_ids = [student_ids] if isinstance(student_ids, str) else list(student_ids)
+    removed = 0
+    for fragment in _dataset().get_fragments():
+        table = pq.read_table(fragment.path)
+        mask = pc.is_in(table['student_id'], value_set=pa.array(student_ids, type=pa.string()))
+        hits = pc.sum(mask).as_py() or 0
+        if not hits:
+            continue
+        removed += hits
+        if hits == table.num_rows:
+            os.remove(fragment.path)
+            continue
+        tmp = fragment.path + '.tmp'
+        pq.write_table(table.filter(pc.invert(pc.fill_null(mask, False))), tmp, compression=COMPRESSION)
+        os.replace(tmp, fragment.path)
+    return removed
+
+def clear_cold_archive():
+    """删除全部冷归档（清空活动记录时调用）"""
+    import shutil
+    shutil.rmtree(_activities_root(), ignore_errors=True)
+
+def query_activities(student_id=None, module=None, start=None, end=None, limit=None):
+    """
+    合并热数据（图）和冷归档的活动记录（DataFrame，按时间倒序），用于跨越保留期的长周期报表
+    start / end 为日期或时间（end 不含），列：id, student_id, student_name, module, activity_type,
+    content_id, content_name, details, timestamp（UTC）
+    """
+    from modules.db import stream_query
+    from modules.schema_migrations import module_field, type_field
+    from modules.timestamps import to_epoch_ms
+
+    conditions = ["a.ts_ms IS NOT NULL"]
+    params = {}
+    if student_id is not None:
+        conditions.append("s.student_id = $student_id")
+        params['student_id'] = student_id
+    if module is not None:
+        conditions.append(f"{module_field('a')} = $module")
+        params['module'] = module
+    start_ms = int(to_epoch_ms([start])[0]) if start is not None else None
+    end_ms = int(to_epoch_ms([end])[0]) if end is not None else None
+    if start_ms is not None:
+        conditions.append("a.ts_ms >= $start_ms")
+        params['start_ms'] = start_ms
+    if end_ms is not None:
+        conditions.append("a.ts_ms < $end_ms")
+        params['end_ms'] = end_ms
+    order = f"ORDER BY a.ts_ms DESC LIMIT {int(limit)}" if limit else ""
+    hot = pd.DataFrame(list(stream_query("retention.query.hot", f"""
+        MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+        WHERE {' AND '.join(conditions)}
+        RETURN COALESCE(a.id, '') as id, s.student_id as student_id, s.name as student_name,
+               {module_field('a')} as module, {type_field('a')} as activity_type,
+               a.content_id as content_id, a.content_name as content_name, a.details as details,
+               a.ts_ms as ts
+        {order}
+    """, params)), columns=['id', 'student_id', 'student_name', 'module', 'activity_type',
+                              'content_id', 'content_name', 'details', 'ts'])
+    hot['timestamp'] = pd.to_datetime(hot['ts'].astype('int64'), unit='ms', utc=True)
+    hot = hot.drop(columns='ts')
+
+    # 冷归档只会早于热数据：按时间倒序取满 limit 条时不必读取
+    if limit and len(hot) >= limit:
+        return hot
+    cold = _cold_frame(None, student_id=student_id, module=module,
+                       start_day=pd.Timestamp(start_ms, unit='ms').date() if start_ms is not None else None,
+                       end_day=pd.Timestamp(end_ms, unit='ms').date() if end_ms is not None else None)
+    if cold is None:
+        return hot
+    cold = cold.rename(columns={'ts': 'timestamp'})
+    times = cold['timestamp'].values.astype('datetime64[ms]').astype('int64')
+    mask = pd.Series(True, index=cold.index)
+    if start_ms is not None:
+        mask &= times >= start_ms
+    if end_ms is not None:
+        mask &= times < end_ms
+    cold = cold[mask.values].drop(columns='day')
+    combined = pd.concat([hot, cold[hot.columns]], ignore_index=True) if not hot.empty else cold[hot.columns]
+    combined = combined.drop_duplicates('id').sort_values('timestamp', ascending=False, ignore_index=True)
+    return combined.head(limit) if limit else combined
+
+def get_retention_status():
+    """保留配置、冷归档大小和统计（供数据管理页面展示）"""
+    size = 0
+    files = 0
+    days = set()
+    root = _activities_root()
+    for path, _, file_names in os.walk(root):
+        parquet = [f for f in file_names if f.endswith('.parquet')]
+        if not parquet:
+            continue
+        files += len(parquet)
+        size += sum(os.path.getsize(os.path.join(path, f)) for f in parquet)
+        day = next((part for part in os.path.relpath(path, root).split(os.sep) if part.startswith('day=')), None)
+        if day:
+            days.add(day[4:])
+    return {
+        'retention_days': ACTIVITY_RETENTION_DAYS,
+        'cold_files': files,
+        'cold_days': len(days),
+        'cold_range': (min(days), max(days)) if days else None,
+        'cold_size_mb': round(size / 1024 / 1024, 2),
+        **_stats,
+    }
+
+def main():
+    """命令行入口"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="活动保留：把保留期之前的活动移到冷归档")
+    parser.add_argument("--days", type=int, default=None, help="保留天数（默认 ACTIVITY_RETENTION_DAYS）")
+    parser.add_argument("--max-batches", type=int, default=None, help="本次最多处理的批数")
+    parser.add_argument("--status", action="store_true", help="只显示冷归档统计")
+    args = parser.parse_args()
+
+    if args.status:
+        status = get_retention_status()
+        print(f"保留天数: {status['retention_days'] or '不限'}，冷归档 {status['cold_days']} 天 / "
+              f"{status['cold_files']} 个文件（{status['cold_size_mb']}MB），范围 {status['cold_range']}")
+        return 0
+
+    days = ACTIVITY_RETENTION_DAYS if args.days is None else args.days
+    if days <= 0:
+        print("未配置保留天数（ACTIVITY_RETENTION_DAYS），可用 --days 指定")
+        return 1
+    moved = evict_activities(days=days, max_batches=args.max_batches)
+    print(f"✅ 已移出 {moved} 条 {days} 天前的活动")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,300 @@
+"""
+活动汇总模块
+维护按天汇总的计数节点，教师端概况卡片和趋势图只读取几十个汇总节点：
+    (:mfx_DailyStat {day, module_name, activity_type, count})  每天/模块/活动类型的活动数
+    (:mfx_StudentDay {day, student_id, count})                每天/学生的活动数
+    (:mfx_StudentModule {student_id, module_name, count, last_activity_at})  学生在各模块的活动数
+学生节点上另外维护 activity_count / last_activity_at / modules_touched 计数，
+学生列表和导出不再逐个统计 PERFORMED 关系。
+(日期, 模块) 的去重学生数草图 (:mfx_ModuleDay) 见 sketches，随汇总一起清空和回填。
+移到冷归档的活动（见 retention）不会改变汇总；回填和删除学生时把冷归档中的活动一并计入。
+增量部分与活动写入在同一事务中完成（见 activity_writer），历史数据用回填命令生成：
+
+    python -m modules.rollups --backfill
+"""
+
+import threading
+
+# 追加到活动写入语句之后，输入为学生 s、新创建的活动 a 和事件 e
+ROLLUP_WRITE_CLAUSE = """
+    WITH e, a, s, date(a.timestamp) AS day
+    MERGE (d:mfx_DailyStat {
+        day: day,
+        module_name: COALESCE(e.module_name, ''),
+        activity_type: COALESCE(e.activity_type, '')
+    })
+    SET d.count = COALESCE(d.count, 0) + 1
+    MERGE (sd:mfx_StudentDay {day: day, student_id: e.student_id})
+    SET sd.count = COALESCE(sd.count, 0) + 1
+    WITH e, a, s
+    SET s.activity_count = COALESCE(s.activity_count, 0) + 1,
+        s.last_activity_at = CASE
+            WHEN s.last_activity_at IS NULL OR s.last_activity_at < a.timestamp
+            THEN a.timestamp ELSE s.last_activity_at END,
+        s.modules_touched = CASE
+            WHEN e.module_name IS NULL OR e.module_name IN COALESCE(s.modules_touched, [])
+            THEN COALESCE(s.modules_touched, [])
+            ELSE COALESCE(s.modules_touched, []) + e.module_name END
+    MERGE (sm:mfx_StudentModule {student_id: e.student_id, module_name: COALESCE(e.module_name, '')})
+    SET sm.count = COALESCE(sm.count, 0) + 1,
+        sm.last_activity_at = CASE
+            WHEN sm.last_activity_at IS NULL OR sm.last_activity_at < a.timestamp
+            THEN a.timestamp ELSE sm.last_activity_at END
+"""
+
+# 回填写入的批大小
+_BACKFILL_BATCH_SIZE = 1000
+
+# 回填状态（rollups_built：按天汇总，counters_built：学生计数，sketches_built：去重计数草图）：
+# 未出现的键表示尚未从图中读取
+_flags = {}
+_flag_lock = threading.Lock()
+
+def _flag_ready(name):
+    if name in _flags:
+        return _flags[name]
+    with _flag_lock:
+        if name in _flags:
+            return _flags[name]
+        try:
+            from modules.db import run_single
+            record = run_single("rollups.flags", """
+                MATCH (v:mfx_SchemaVersion {id: 'schema'})
+                RETURN v.rollups_built as rollups_built, v.counters_built as counters_built,
+                       v.sketches_built as sketches_built
+            """)
+            _flags['rollups_built'] = bool(record and record['rollups_built'])
+            _flags['counters_built'] = bool(record and record['counters_built'])
+            _flags['sketches_built'] = bool(record and record['sketches_built'])
+        except Exception as e:
+            print(f"[活动汇总] 读取回填状态失败: {e}")
+            return False
+    return _flags[name]
+
+def rollups_ready():
+    """汇总节点是否可用于查询（完成回填前仍直接统计活动日志）"""
+    return _flag_ready('rollups_built')
+
+def counters_ready():
+    """学生计数是否可用于查询（完成回填前仍直接统计 PERFORMED 关系）"""
+    return _flag_ready('counters_built')
+
+def sketches_ready():
+    """去重计数草图是否可用于查询（完成回填前仍用 count(DISTINCT) 统计）"""
+    return _flag_ready('sketches_built')
+
+def _write_in_batches(name, query, rows):
+    from modules.db import run_write
+    for i in range(0, len(rows), _BACKFILL_BATCH_SIZE):
+        run_write(name, query, rows=rows[i:i + _BACKFILL_BATCH_SIZE])
+
+def _merge_cold(rows, cold_rows, keys):
+    """把冷归档的计数按 keys 合并到图中扫描的结果（同键计数相加，日期统一为字符串）"""
+    merged = {}
+    for row in list(rows) + list(cold_rows):
+        row = dict(row, day=str(row['day'])) if 'day' in row else dict(row)
+        key = tuple(row[k] for k in keys)
+        if key in merged:
+            merged[key]['count'] += row['count']
+        else:
+            merged[key] = row
+    return list(merged.values())
+
+def _merge_cold_modules(rows, cold_rows):
+    """学生模块计数合并冷归档：计数相加，最后活动时间取较晚者"""
+    from modules.timestamps import to_epoch_ms
+    merged = {}
+    for row, last_ms in zip(rows, to_epoch_ms([row['last_activity_at'] for row in rows]).tolist()):
+        merged[(row['student_id'], row['module_name'])] = dict(row, last_ms=last_ms)
+    for row in cold_rows:
+        key = (row['student_id'], row['module_name'])
+        if key not in merged:
+            merged[key] = dict(row)
+            continue
+        merged[key]['count'] += row['count']
+        if row['last_ms'] > merged[key]['last_ms']:
+            merged[key]['last_activity_at'] = row['last_activity_at']
+            merged[key]['last_ms'] = row['last_ms']
+    for row in merged.values():
+        del row['last_ms']
+    return list(merged.values())
+
+def backfill_rollups():
+    """根据现有活动日志重建全部汇总节点和学生计数（期间新事件转存本地、结束后回放，避免增量与回填重复计数）"""
+    from modules.activity_writer import writes_paused
+    from modules.db import run_query, run_write
+    from modules.query_cache import TAG_STUDENT, TAG_ACTIVITY
+    from modules.schema_migrations import module_field, type_field
+    from modules import retention
+
+    with writes_paused():
+        clear_rollups()
+        cold = retention.cold_enabled()
+
+        daily_rows = run_query("rollups.backfill.daily_scan", f"""
+            MATCH (a:mfx_Activity)
+            WHERE a.timestamp IS NOT NULL
+            RETURN date(a.timestamp) as day,
+                   COALESCE({module_field('a')}, '') as module_name,
+                   COALESCE({type_field('a')}, '') as activity_type,
+                   count(*) as count
+        """)
+        if cold:
+            daily_rows = _merge_cold(daily_rows, retention.cold_daily_counts(),
+                                     ('day', 'module_name', 'activity_type'))
+        _write_in_batches("rollups.backfill.daily_write", """
+            UNWIND $rows AS row
+            CREATE (:mfx_DailyStat {
+                day: date(row.day), module_name: row.module_name,
+                activity_type: row.activity_type, count: row.count
+            })
+        """, daily_rows)
+
+        student_rows = run_query("rollups.backfill.student_day_scan", """
+            MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+            WHERE a.timestamp IS NOT NULL AND s.student_id IS NOT NULL
+            RETURN date(a.timestamp) as day, s.student_id as student_id, count(*) as count
+        """)
+        if cold:
+            student_rows = _merge_cold(student_rows, retention.cold_student_day_counts(), ('day', 'student_id'))
+        _write_in_batches("rollups.backfill.student_day_write", """
+            UNWIND $rows AS row
+            CREATE (:mfx_StudentDay {day: date(row.day), student_id: row.student_id, count: row.count})
+        """, student_rows)
+
+        module_rows = run_query("rollups.backfill.student_module_scan", f"""
+            MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+            WHERE s.student_id IS NOT NULL
+            RETURN s.student_id as student_id,
+                   COALESCE({module_field('a')}, '') as module_name,
+                   count(a) as count,
+                   max(a.timestamp) as last_activity_at
+        """)
+        if cold:
+            module_rows = _merge_cold_modules(module_rows, retention.cold_student_module_counts())
+        _write_in_batches("rollups.backfill.student_module_write", """
+            UNWIND $rows AS row
+            CREATE (:mfx_StudentModule {
+                student_id: row.student_id, module_name: row.module_name,
+                count: row.count, last_activity_at: datetime(row.last_activity_at)
+            })
+        """, module_rows)
+        # 学生计数由模块计数汇总得到，没有活动的学生归零
+        run_write("rollups.backfill.student_counters", """
+            MATCH (s:mfx_Student)
+            OPTIONAL MATCH (sm:mfx_StudentModule {student_id: s.student_id})
+            WITH s, sum(sm.count) as activity_count, max(sm.last_activity_at) as last_activity_at,
+                 [m IN collect(sm.module_name) WHERE m <> ''] as modules_touched
+            CALL {
+                WITH s, activity_count, last_activity_at, modules_touched
+                SET s.activity_count = activity_count,
+                    s.last_activity_at = last_activity_at,
+                    s.modules_touched = modules_touched
+            } IN TRANSACTIONS OF 1000 ROWS
+        """, invalidates=(TAG_STUDENT, TAG_ACTIVITY))
+
+        from modules.sketches import rebuild_sketches
+        sketch_count = rebuild_sketches()
+
+        run_write("rollups.backfill.mark_built", """
+            MERGE (v:mfx_SchemaVersion {id: 'schema'})
+            SET v.rollups_built = true, v.rollups_built_at = datetime(),
+                v.counters_built = true, v.sketches_built = true
+        """)
+    _flags['rollups_built'] = True
+    _flags['counters_built'] = True
+    _flags['sketches_built'] = True
+    print(f"[活动汇总] 回填完成: {len(daily_rows)} 个模块日汇总，{len(student_rows)} 个学生日汇总，"
+          f"{len(module_rows)} 个学生模块计数，{sketch_count} 个去重计数草图")
+    return len(daily_rows), len(student_rows)
+
+def clear_rollups():
+    """删除全部汇总节点并把学生计数归零（清空活动记录时调用）"""
+    from modules.db import run_write
+    from modules.query_cache import TAG_STUDENT, TAG_ACTIVITY
+    run_write("rollups.clear.daily", """
+        MATCH (d:mfx_DailyStat)
+        CALL { WITH d DELETE d } IN TRANSACTIONS OF 10000 ROWS
+    """)
+    run_write("rollups.clear.student_day", """
+        MATCH (sd:mfx_StudentDay)
+        CALL { WITH sd DELETE sd } IN TRANSACTIONS OF 10000 ROWS
+    """)
+    run_write("rollups.clear.student_module", """
+        MATCH (sm:mfx_StudentModule)
+        CALL { WITH sm DELETE sm } IN TRANSACTIONS OF 10000 ROWS
+    """)
+    run_write("rollups.clear.module_day", """
+        MATCH (md:mfx_ModuleDay)
+        CALL { WITH md DELETE md } IN TRANSACTIONS OF 10000 ROWS
+    """)
+    run_write("rollups.clear.student_counters", """
+        MATCH (s:mfx_Student)
+        WHERE s.activity_count IS NOT NULL
+        CALL {
+            WITH s
+            SET s.activity_count = 0, s.modules_touched = []
+            REMOVE s.last_activity_at
+        } IN TRANSACTIONS OF 10000 ROWS
+    """, invalidates=(TAG_STUDENT, TAG_ACTIVITY))
+    from modules.sketches import reset_sketch_cache
+    reset_sketch_cache()
+
+def subtract_student_rollups(student_ids):
+    """删除学生前，从模块日汇总中扣除学生（单个学号或学号列表）的活动并删除其学生日汇总和模块计数"""
+    from modules.db import run_write
+    from modules.query_cache import TAG_STUDENT, TAG_ACTIVITY
+    from modules.schema_migrations import module_field, type_field
+
+    student_ids = [student_ids] if isinstance(student_ids, str) else list(student_ids)
+    run_write("rollups.subtract_student.daily", f"""
+        MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+        WHERE s.student_id IN $student_ids AND a.timestamp IS NOT NULL
+        WITH date(a.timestamp) as day,
+             COALESCE({module_field('a')}, '') as module_name,
+             COALESCE({type_field('a')}, '') as activity_type,
+             count(*) as c
+        MATCH (d:mfx_DailyStat {{day: day, module_name: module_name, activity_type: activity_type}})
+        SET d.count = d.count - c
+        WITH d WHERE d.count <= 0
+        DELETE d
+    """, student_ids=student_ids)
+    # 冷归档中的活动同样计入过模块日汇总
+    from modules.retention import cold_enabled, cold_daily_counts
+    cold_rows = cold_daily_counts(student_ids) if cold_enabled() else []
+    if cold_rows:
+        run_write("rollups.subtract_student.cold_daily", """
+            UNWIND $rows AS row
+            MATCH (d:mfx_DailyStat {day: date(row.day), module_name: row.module_name,
+                                    activity_type: row.activity_type})
+            SET d.count = d.count - row.count
+            WITH d WHERE d.count <= 0
+            DELETE d
+        """, rows=cold_rows)
+    run_write("rollups.subtract_student.student_day", """
+        MATCH (sd:mfx_StudentDay) WHERE sd.student_id IN $student_ids
+        DELETE sd
+    """, student_ids=student_ids)
+    run_write("rollups.subtract_student.student_module", """
+        MATCH (sm:mfx_StudentModule) WHERE sm.student_id IN $student_ids
+        DELETE sm
+    """, student_ids=student_ids, invalidates=(TAG_STUDENT, TAG_ACTIVITY))
+
+def main():
+    """命令行入口"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="活动汇总维护")
+    parser.add_argument("--backfill", action="store_true", help="根据历史活动重建全部汇总节点和学生计数")
+    args = parser.parse_args()
+
+    if not args.backfill:
+        parser.print_help()
+        return 0
+
+    daily_count, student_count = backfill_rollups()
+    print(f"✅ 回填完成：模块日汇总 {daily_count} 个，学生日汇总 {student_count} 个")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,459 @@
+"""
+数据库结构迁移模块
+按版本号顺序创建热点查询所需的唯一约束和索引，已应用的版本记录在图中
+(:mfx_SchemaVersion {id: 'schema'})，启动时自动执行，也可以命令行执行：
+
+    python -m modules.schema_migrations                    # 应用所有未执行的迁移
+    python -m modules.schema_migrations --status           # 查看当前版本
+    python -m modules.schema_migrations --normalize-fields # 归一化历史活动字段
+    python -m modules.schema_migrations --backfill-timestamps # 回填活动的规范时间戳
+
+另外负责把历史活动节点的旧字段（module / type）归一化为 module_name / activity_type，
+归一化完成前查询通过 module_field() / type_field() 兼容旧字段，按时间排序和续页通过 ts_ms_field()；
+以及把字符串和 LocalDateTime 形式的历史活动时间改写为 datetime，并回填毫秒时间戳 ts_ms（见 timestamps），
+无法解析的时间标记 ts_invalid 后跳过。
+"""
+
+import re
+import threading
+import time
+
+from config.settings import (
+    ACTIVITY_LEGACY_FIELDS, FIELD_NORMALIZE_BATCH_SIZE, TIMESTAMP_BACKFILL_BATCH_SIZE, NAIVE_TIMESTAMP_TZ
+)
+
+# 迁移列表：(版本号, 说明, 语句列表)，只能追加，不能修改已发布的版本
+MIGRATIONS = [
+    (1, "学生/活动/问题/案例的唯一约束与热点查询索引", [
+        # 唯一约束（同时提供索引）
+        "CREATE CONSTRAINT mfx_student_id_unique IF NOT EXISTS "
+        "FOR (s:mfx_Student) REQUIRE s.student_id IS UNIQUE",
+        "CREATE CONSTRAINT mfx_activity_id_unique IF NOT EXISTS "
+        "FOR (a:mfx_Activity) REQUIRE a.id IS UNIQUE",
+        "CREATE CONSTRAINT mfx_question_id_unique IF NOT EXISTS "
+        "FOR (q:mfx_Question) REQUIRE q.id IS UNIQUE",
+        "CREATE CONSTRAINT mfx_case_id_unique IF NOT EXISTS "
+        "FOR (c:mfx_Case) REQUIRE c.id IS UNIQUE",
+        # submit_reply 按姓名 MERGE 学生
+        "CREATE INDEX mfx_student_name IF NOT EXISTS FOR (s:mfx_Student) ON (s.name)",
+        # 活动日志的时间、模块、类型过滤
+        "CREATE INDEX mfx_activity_timestamp IF NOT EXISTS FOR (a:mfx_Activity) ON (a.timestamp)",
+        "CREATE INDEX mfx_activity_module_name IF NOT EXISTS FOR (a:mfx_Activity) ON (a.module_name)",
+        "CREATE INDEX mfx_activity_module_timestamp IF NOT EXISTS "
+        "FOR (a:mfx_Activity) ON (a.module_name, a.timestamp)",
+        "CREATE INDEX mfx_activity_type IF NOT EXISTS FOR (a:mfx_Activity) ON (a.activity_type)",
+        "CREATE TEXT INDEX mfx_activity_content_name IF NOT EXISTS FOR (a:mfx_Activity) ON (a.content_name)",
+        # 课堂问题
+        "CREATE INDEX mfx_question_status IF NOT EXISTS FOR (q:mfx_Question) ON (q.status)",
+        "CREATE INDEX mfx_question_created_at IF NOT EXISTS FOR (q:mfx_Question) ON (q.created_at)",
+        # 回复关系属性索引
+        "CREATE INDEX mfx_replied_timestamp IF NOT EXISTS FOR ()-[r:REPLIED]-() ON (r.timestamp)",
+        "CREATE INDEX mfx_replied_id IF NOT EXISTS FOR ()-[r:REPLIED]-() ON (r.id)",
+        # 版本记录节点
+        "CREATE CONSTRAINT mfx_schema_version_id_unique IF NOT EXISTS "
+        "FOR (v:mfx_SchemaVersion) REQUIRE v.id IS UNIQUE",
+    ]),
+    (2, "旧字段索引（供字段归一化按批定位历史记录）", [
+        "CREATE INDEX mfx_activity_legacy_module IF NOT EXISTS FOR (a:mfx_Activity) ON (a.module)",
+        "CREATE INDEX mfx_activity_legacy_type IF NOT EXISTS FOR (a:mfx_Activity) ON (a.type)",
+    ]),
+    (3, "按天汇总节点索引", [
+        "CREATE INDEX mfx_daily_stat_key IF NOT EXISTS "
+        "FOR (d:mfx_DailyStat) ON (d.day, d.module_name, d.activity_type)",
+        "CREATE INDEX mfx_student_day_key IF NOT EXISTS "
+        "FOR (sd:mfx_StudentDay) ON (sd.day, sd.student_id)",
+        "CREATE INDEX mfx_student_day_student IF NOT EXISTS "
+        "FOR (sd:mfx_StudentDay) ON (sd.student_id)",
+    ]),
+    (4, "学生计数与学生模块计数索引", [
+        "CREATE INDEX mfx_student_activity_count IF NOT EXISTS "
+        "FOR (s:mfx_Student) ON (s.activity_count)",
+        "CREATE INDEX mfx_student_module_key IF NOT EXISTS "
+        "FOR (sm:mfx_StudentModule) ON (sm.student_id, sm.module_name)",
+        "CREATE INDEX mfx_student_module_module IF NOT EXISTS "
+        "FOR (sm:mfx_StudentModule) ON (sm.module_name)",
+    ]),
+    (5, "活动毫秒时间戳索引", [
+        "CREATE INDEX mfx_activity_ts_ms IF NOT EXISTS FOR (a:mfx_Activity) ON (a.ts_ms)",
+    ]),
+    (6, "模块日去重计数草图索引", [
+        "CREATE INDEX mfx_module_day_key IF NOT EXISTS "
+        "FOR (md:mfx_ModuleDay) ON (md.day, md.module_name)",
+        "CREATE INDEX mfx_module_day_updated_at IF NOT EXISTS "
+        "FOR (md:mfx_ModuleDay) ON (md.updated_at)",
+    ]),
+    (7, "学生会话汇总唯一约束", [
+        "CREATE CONSTRAINT mfx_student_sessions_id_unique IF NOT EXISTS "
+        "FOR (ss:mfx_StudentSessions) REQUIRE ss.student_id IS UNIQUE",
+    ]),
+    (8, "活动和回复写入时间索引（归档补录晚到事件）", [
+        "CREATE INDEX mfx_activity_ingested_ms IF NOT EXISTS FOR (a:mfx_Activity) ON (a.ingested_ms)",
+        "CREATE INDEX mfx_replied_ingested_ms IF NOT EXISTS FOR ()-[r:REPLIED]-() ON (r.ingested_ms)",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+_startup_lock = threading.Lock()
+_startup_started = False
+
+# 字段归一化状态：None 表示尚未从图中读取
+_fields_normalized = None
+_normalize_lock = threading.Lock()
+_normalize_state = {
+    'running': False,
+    'updated': 0,
+    'remaining': None,
+    'error': None,
+    'finished_at': None,
+}
+
+# 每轮处理的节点数，轮与轮之间更新进度，中断后下次从剩余节点继续
+_NORMALIZE_CHUNK_SIZE = 20000
+
+# 只有带旧字段的节点会被匹配，重复执行是安全的
+_NORMALIZE_CHUNK_QUERY = """
+    MATCH (a:mfx_Activity)
+    WHERE a.module IS NOT NULL OR a.type IS NOT NULL
+    WITH a LIMIT $chunk_size
+    CALL {
+        WITH a
+        SET a.module_name = COALESCE(a.module_name, a.module),
+            a.activity_type = COALESCE(a.activity_type, a.type)
+        REMOVE a.module, a.type
+    } IN TRANSACTIONS OF $batch_size ROWS
+"""
+
+# 时间戳回填：读取一轮还没有 ts_ms 的活动，在客户端解析时间（见 timestamps.canonical_iso），
+# 再把字符串、LocalDateTime 和 Date 改写为 datetime 并写入毫秒时间戳 ts_ms；
+# 无法解析的标记 ts_invalid，不再参与回填，单条坏数据不会让整轮失败。重复执行是安全的
+_TIMESTAMP_SCAN_QUERY = """
+    MATCH (a:mfx_Activity)
+    WHERE a.ts_ms IS NULL AND a.timestamp IS NOT NULL AND a.ts_invalid IS NULL
+    RETURN elementId(a) as element_id, a.timestamp as timestamp
+    LIMIT $chunk_size
+"""
+
+_TIMESTAMP_WRITE_QUERY = """
+    UNWIND $rows AS row
+    CALL {
+        WITH row
+        MATCH (a:mfx_Activity) WHERE elementId(a) = row.element_id
+        SET a.timestamp = CASE WHEN row.rewrite THEN datetime(row.iso) ELSE a.timestamp END,
+            a.ts_ms = CASE WHEN row.iso IS NULL THEN null ELSE datetime(row.iso).epochMillis END,
+            a.ts_invalid = CASE WHEN row.iso IS NULL THEN true ELSE null END
+    } IN TRANSACTIONS OF $batch_size ROWS
+"""
+
+def get_schema_version():
+    """读取图中记录的已应用版本（未初始化时为0）"""
+    from modules.db import run_single
+    record = run_single("schema_migrations.get_version", """
+        MATCH (v:mfx_SchemaVersion {id: 'schema'})
+        RETURN v.version as version
+    """)
+    return record['version'] if record and record['version'] is not None else 0
+
+def _record_version(version, description):
+    from modules.db import run_write
+    run_write("schema_migrations.record_version", """
+        MERGE (v:mfx_SchemaVersion {id: 'schema'})
+        SET v.version = $version,
+            v.applied_at = datetime(),
+            v.history = COALESCE(v.history, []) + [toString($version) + ': ' + $description]
+    """, version=version, description=description)
+
+def legacy_fields_enabled():
+    """查询是否需要兼容旧字段名（ACTIVITY_LEGACY_FIELDS=auto 时以归一化是否完成为准）"""
+    mode = str(ACTIVITY_LEGACY_FIELDS).lower()
+    if mode in ("1", "true", "yes"):
+        return True
+    if mode in ("0", "false", "no"):
+        return False
+    return _fields_normalized is not True
+
+def module_field(alias='a'):
+    """活动模块字段的查询表达式"""
+    if legacy_fields_enabled():
+        return f"COALESCE({alias}.module_name, {alias}.module)"
+    return f"{alias}.module_name"
+
+def type_field(alias='a'):
+    """活动类型字段的查询表达式"""
+    if legacy_fields_enabled():
+        return f"COALESCE({alias}.activity_type, {alias}.type)"
+    return f"{alias}.activity_type"
+
+# 无法解析的时间在 ts_ms_field() 中的排序键（排在所有有效时间之前，按活动ID区分）
+UNPARSED_TS_MS = -(1 << 62)
+
+# 时间的字符串形式（字符串原值，或 DateTime / LocalDateTime / Date 的 toString）：带时区的和不带时区的
+_ZONED_TS_PATTERN = r'\\d{4}-\\d{2}-\\d{2}[T ]\\d{2}:\\d{2}(:\\d{2}(\\.\\d{1,9})?)?(Z|[+-]\\d{2}:?\\d{2})(\\[[^\\]]*\\])?'
+_NAIVE_TS_PATTERN = r'\\d{4}-\\d{2}-\\d{2}([T ]\\d{2}:\\d{2}(:\\d{2}(\\.\\d{1,9})?)?)?'
+
+def ts_ms_field(alias='a'):
+    """
+    活动毫秒时间戳的查询表达式（按时间排序和续页的键，结果不为 null）：
+    优先 ts_ms；还没有回填的字符串 / LocalDateTime 按 timestamps 的规则在查询中解析（无时区的按 NAIVE_TIMESTAMP_TZ），
+    无法解析的为 UNPARSED_TS_MS，不会因为与 datetime 比较得到 null 而被跳过
+    """
+    zone = NAIVE_TIMESTAMP_TZ if re.fullmatch(r'[+-]\d{2}:\d{2}', str(NAIVE_TIMESTAMP_TZ)) else '+00:00'
+    text = f"toString({alias}.timestamp)"
+    return f"""COALESCE({alias}.ts_ms, CASE
+        WHEN {text} =~ '{_ZONED_TS_PATTERN}' THEN datetime(replace({text}, ' ', 'T')).epochMillis
+        WHEN {text} =~ '{_NAIVE_TS_PATTERN}' THEN datetime({{
+            datetime: localdatetime(CASE WHEN size({text}) = 10 THEN {text} + 'T00:00' ELSE replace({text}, ' ', 'T') END),
+            timezone: '{zone}'
+        }}).epochMillis
+        ELSE {UNPARSED_TS_MS} END)"""
+
+def _load_normalization_flag():
+    global _fields_normalized
+    from modules.db import run_single
+    record = run_single("schema_migrations.normalization_flag", """
+        MATCH (v:mfx_SchemaVersion {id: 'schema'})
+        RETURN v.fields_normalized as normalized
+    """)
+    _fields_normalized = bool(record and record['normalized'])
+    return _fields_normalized
+
+def count_legacy_activities():
+    """统计仍使用旧字段名的活动节点数"""
+    from modules.db import run_single
+    return run_single("schema_migrations.count_legacy", """
+        MATCH (a:mfx_Activity)
+        WHERE a.module IS NOT NULL OR a.type IS NOT NULL
+        RETURN count(a) as count
+    """)['count']
+
+def normalize_activity_fields(batch_size=None):
+    """
+    分批把旧字段 module / type 改写为 module_name / activity_type
+    使用 CALL {} IN TRANSACTIONS 分事务提交，可随时中断后重新执行
+    """
+    global _fields_normalized
+    from modules.db import run_write
+    from modules.query_cache import TAG_ACTIVITY
+    batch_size = batch_size or FIELD_NORMALIZE_BATCH_SIZE
+
+    remaining = count_legacy_activities()
+    _normalize_state['remaining'] = remaining
+    while remaining > 0:
+        # IN TRANSACTIONS 只能在自动提交事务中执行
+        run_write("schema_migrations.normalize_chunk", _NORMALIZE_CHUNK_QUERY,
+                  chunk_size=_NORMALIZE_CHUNK_SIZE, batch_size=batch_size,
+                  invalidates=(TAG_ACTIVITY,))
+        left = count_legacy_activities()
+        _normalize_state['updated'] += remaining - left
+        _normalize_state['remaining'] = left
+        if left >= remaining:
+            raise RuntimeError(f"字段归一化没有进展，剩余 {left} 条")
+        remaining = left
+        print(f"[字段归一化] 剩余 {remaining} 条旧字段记录")
+    run_write("schema_migrations.mark_normalized", """
+        MERGE (v:mfx_SchemaVersion {id: 'schema'})
+        SET v.fields_normalized = true, v.fields_normalized_at = datetime()
+    """)
+    _fields_normalized = True
+    print("[字段归一化] 完成，查询切换为索引字段")
+
+def _claim_normalization():
+    """标记字段归一化开始执行，已在执行时返回 False"""
+    with _normalize_lock:
+        if _normalize_state['running']:
+            return False
+        _normalize_state.update({'running': True, 'updated': 0, 'error': None, 'finished_at': None})
+    return True
+
+def _run_normalization():
+    try:
+        normalize_activity_fields()
+    except Exception as e:
+        _normalize_state['error'] = str(e)
+        print(f"[字段归一化] 失败: {e}")
+    finally:
+        _normalize_state['running'] = False
+        _normalize_state['finished_at'] = time.time()
+
+def start_field_normalization():
+    """在后台线程执行字段归一化，已在执行时直接返回 False"""
+    if not _claim_normalization():
+        return False
+    threading.Thread(target=_run_normalization, name="field-normalization", daemon=True).start()
+    return True
+
+def count_unstamped_activities():
+    """统计还没有毫秒时间戳 ts_ms 的活动节点数（不含已标记为无法解析的）"""
+    from modules.db import run_single
+    return run_single("schema_migrations.count_unstamped", """
+        MATCH (a:mfx_Activity)
+        WHERE a.ts_ms IS NULL AND a.timestamp IS NOT NULL AND a.ts_invalid IS NULL
+        RETURN count(a) as count
+    """)['count']
+
+def count_invalid_timestamps():
+    """统计时间无法解析、已标记 ts_invalid 的活动节点数"""
+    from modules.db import run_single
+    return run_single("schema_migrations.count_invalid_timestamps", """
+        MATCH (a:mfx_Activity) WHERE a.ts_invalid = true
+        RETURN count(a) as count
+    """)['count']
+
+def backfill_activity_timestamps(batch_size=None):
+    """
+    分批把历史活动的字符串 / LocalDateTime 时间改写为 datetime 并回填 ts_ms，返回处理的节点数
+    无法解析的时间标记 ts_invalid 后跳过；与字段归一化相同，使用 CALL {} IN TRANSACTIONS 分事务提交，
+    可随时中断后重新执行
+    """
+    from modules.db import run_query, run_write
+    from modules.query_cache import TAG_ACTIVITY
+    from modules.timestamps import canonical_iso
+    batch_size = batch_size or TIMESTAMP_BACKFILL_BATCH_SIZE
+
+    updated = 0
+    invalid = 0
+    remaining = count_unstamped_activities()
+    while remaining > 0:
+        rows = run_query("schema_migrations.timestamp_scan", _TIMESTAMP_SCAN_QUERY, chunk_size=_NORMALIZE_CHUNK_SIZE)
+        isos = canonical_iso([row['timestamp'] for row in rows])
+        params = [{
+            'element_id': row['element_id'],
+            'iso': iso,
+            # 已是带时区的 datetime 时只补 ts_ms，保留原值
+            'rewrite': iso is not None and (isinstance(row['timestamp'], str)
+                                            or getattr(row['timestamp'], 'tzinfo', None) is None),
+        } for row, iso in zip(rows, isos)]
+        invalid += sum(1 for row in params if row['iso'] is None)
+        run_write("schema_migrations.timestamp_chunk", _TIMESTAMP_WRITE_QUERY,
+                  rows=params, batch_size=batch_size, invalidates=(TAG_ACTIVITY,))
+        left = count_unstamped_activities()
+        if left >= remaining:
+            raise RuntimeError(f"时间戳回填没有进展，剩余 {left} 条")
+        updated += remaining - left
+        remaining = left
+        print(f"[时间戳回填] 剩余 {remaining} 条")
+    if invalid:
+        print(f"[时间戳回填] {invalid} 条活动的时间无法解析，已标记 ts_invalid 并跳过")
+    run_write("schema_migrations.mark_timestamps", """
+        MERGE (v:mfx_SchemaVersion {id: 'schema'})
+        SET v.timestamps_normalized = true, v.timestamps_normalized_at = datetime()
+    """)
+    print(f"[时间戳回填] 完成，共处理 {updated} 条")
+    return updated
+
+def timestamps_backfilled():
+    """历史活动时间戳是否已回填完成"""
+    from modules.db import run_single
+    record = run_single("schema_migrations.timestamps_flag", """
+        MATCH (v:mfx_SchemaVersion {id: 'schema'})
+        RETURN v.timestamps_normalized as normalized
+    """)
+    return bool(record and record['normalized'])
+
+def get_normalization_status():
+    """字段归一化进度（供数据修复页面展示）"""
+    status = dict(_normalize_state)
+    status['normalized'] = _fields_normalized is True
+    status['legacy_fields_enabled'] = legacy_fields_enabled()
+    return status
+
+def run_migrations():
+    """依次应用所有未执行的迁移，返回本次应用的版本号列表"""
+    from modules.db import run_write
+
+    applied = []
+    current = get_schema_version()
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"[结构迁移] 应用版本 {version}: {description}")
+        # 结构语句不能与数据写入放在同一事务，逐条自动提交
+        for statement in statements:
+            run_write(f"schema_migrations.v{version}", statement)
+        _record_version(version, description)
+        applied.append(version)
+    _load_normalization_flag()
+    if applied:
+        print(f"[结构迁移] 已升级到版本 {applied[-1]}")
+    return applied
+
+def ensure_schema_async():
+    """进程启动后在后台执行一次迁移，不阻塞首次页面渲染"""
+    global _startup_started
+    with _startup_lock:
+        if _startup_started:
+            return
+        _startup_started = True
+
+    def _run():
+        # 迁移、字段归一化、时间戳回填各自独立，前一步失败只记录日志，后续步骤照常执行
+        try:
+            try:
+                run_migrations()
+            except Exception as e:
+                print(f"[结构迁移] 自动迁移失败，继续执行后续步骤: {e}")
+            if _fields_normalized is None:
+                try:
+                    _load_normalization_flag()
+                except Exception as e:
+                    print(f"[字段归一化] 读取归一化状态失败: {e}")
+            # 字段归一化和时间戳回填改写同一批节点，在本线程中依次执行
+            if not _fields_normalized and _claim_normalization():
+                _run_normalization()
+            try:
+                if not timestamps_backfilled():
+                    backfill_activity_timestamps()
+            except Exception as e:
+                print(f"[时间戳回填] 自动回填失败: {e}")
+        finally:
+            # 活动保留只选取已有 ts_ms 的活动，迁移或回填失败、未完成时照常启动
+            from modules.retention import start_retention_worker
+            start_retention_worker()
+
+    threading.Thread(target=_run, name="schema-migrations", daemon=True).start()
+
+def main():
+    """命令行入口"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Neo4j 结构迁移")
+    parser.add_argument("--status", action="store_true", help="只显示当前版本，不执行迁移")
+    parser.add_argument("--normalize-fields", action="store_true", help="归一化历史活动节点的旧字段名")
+    parser.add_argument("--backfill-timestamps", action="store_true", help="回填历史活动的规范时间戳")
+    args = parser.parse_args()
+
+    from modules.auth import get_neo4j_driver
+    driver = get_neo4j_driver()
+    if driver is None:
+        print("❌ 无法连接 Neo4j")
+        return 1
+
+    if args.status:
+        current = get_schema_version()
+        normalized = _load_normalization_flag()
+        legacy_count = count_legacy_activities()
+        print(f"当前版本: {current}，最新版本: {LATEST_VERSION}")
+        print(f"字段归一化: {'已完成' if normalized else '未完成'}，旧字段记录 {legacy_count} 条")
+        print(f"时间戳回填: {'已完成' if timestamps_backfilled() else '未完成'}，"
+              f"待回填记录 {count_unstamped_activities()} 条，无法解析 {count_invalid_timestamps()} 条")
+        return 0
+
+    if args.normalize_fields:
+        normalize_activity_fields()
+        print("✅ 字段归一化完成")
+        return 0
+
+    if args.backfill_timestamps:
+        updated = backfill_activity_timestamps()
+        print(f"✅ 时间戳回填完成，处理 {updated} 条")
+        return 0
+
+    applied = run_migrations()
+    if applied:
+        print(f"✅ 已应用迁移: {applied}")
+    else:
+        print(f"✅ 已是最新版本 {LATEST_VERSION}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
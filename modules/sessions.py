@@ -0,0 +1,173 @@
+"""
+学习会话模块
+把每个学生的活动流按不活跃间隔（SESSION_GAP_S）切分为学习会话，得到会话数、会话时长和各模块的学习时长：
+在活动快照（见 activity_snapshot）上按 (学生, 时间) 排序后做差分，全部为向量化计算。
+每条活动的停留时间为到同一会话中下一条活动的间隔，会话最后一条活动按 SESSION_TAIL_S 秒计。
+结果按学生物化到存储后端（save_student_sessions），教师端页面直接读取，不再扫描活动：
+
+    python -m modules.sessions --rebuild   # 全量重算全部学生
+
+增量部分：活动数或最后活动时间与已物化结果不一致的学生重新计算，最多每 SESSION_REFRESH_S 秒一次。
+"""
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from config.settings import SESSION_GAP_S, SESSION_TAIL_S, SESSION_REFRESH_S
+
+_refresh_lock = threading.Lock()
+_refreshed_at = 0.0
+_stats = {
+    'refreshes': 0,
+    'students_updated': 0,
+    'last_refresh_ms': 0.0,
+}
+
+def sessionize(frame):
+    """
+    活动快照（需含 student_id, module, ts 列）切分会话，返回每个学生的汇总记录列表：
+    student_id, session_count, total_seconds, avg_seconds, longest_seconds, last_session_at（毫秒时间戳）,
+    event_count, last_activity_ms, module_seconds（{模块: 秒}）
+    """
+    frame = frame[frame['student_id'].notna()]
+    if frame.empty:
+        return []
+    codes, students = pd.factorize(frame['student_id'])
+    order = np.lexsort((frame['ts'].values, codes))
+    codes = codes[order]
+    ts = frame['ts'].values[order]
+    modules = frame['module'].astype(object).fillna('').values[order]
+
+    # 换学生或间隔超过阈值时开始新会话
+    new_student = np.r_[True, codes[1:] != codes[:-1]]
+    gaps = np.r_[0, np.diff(ts)]
+    new_session = new_student | (gaps > SESSION_GAP_S * 1000)
+    session_ids = np.cumsum(new_session) - 1
+    last_in_session = np.r_[new_session[1:], True]
+    dwell_ms = np.where(last_in_session, SESSION_TAIL_S * 1000, np.r_[gaps[1:], 0])
+
+    session_student = codes[new_session]
+    session_ms = np.bincount(session_ids, weights=dwell_ms)
+    count = len(students)
+    session_count = np.bincount(session_student, minlength=count)
+    total_ms = np.bincount(session_student, weights=session_ms, minlength=count)
+    longest_ms = np.zeros(count)
+    np.maximum.at(longest_ms, session_student, session_ms)
+    last_session_at = np.zeros(count, dtype=np.int64)
+    np.maximum.at(last_session_at, session_student, ts[new_session])
+    event_count = np.bincount(codes, minlength=count)
+    last_activity_ms = ts[np.r_[new_student[1:], True]]
+
+    module_ms = pd.DataFrame({'student': codes, 'module': modules, 'ms': dwell_ms}) \
+        .groupby(['student', 'module'], sort=False)['ms'].sum()
+    module_seconds = [{} for _ in range(count)]
+    for (student, module), ms in module_ms.items():
+        module_seconds[student][module] = int(round(ms / 1000))
+
+    return [{
+        'student_id': students[i],
+        'session_count': int(session_count[i]),
+        'total_seconds': int(round(total_ms[i] / 1000)),
+        'avg_seconds': int(round(total_ms[i] / 1000 / session_count[i])),
+        'longest_seconds': int(round(longest_ms[i] / 1000)),
+        'last_session_at': int(last_session_at[i]),
+        'event_count': int(event_count[i]),
+        'last_activity_ms': int(last_activity_ms[i]),
+        'module_seconds': module_seconds[i],
+    } for i in range(count)]
+
+def _stale_students(frame, stored):
+    """活动数或最后活动时间与已物化结果不一致的学生"""
+    if frame.empty:
+        return []
+    current = frame.groupby('student_id', sort=False)['ts'].agg(['size', 'max'])
+    known = pd.DataFrame(
+        [(r['student_id'], r['event_count'], r['last_activity_ms']) for r in stored],
+        columns=['student_id', 'size', 'max']
+    ).set_index('student_id')
+    joined = current.join(known, rsuffix='_stored', how='left')
+    stale = (joined['size'] != joined['size_stored']) | (joined['max'] != joined['max_stored'])
+    return joined.index[stale.values].tolist()
+
+def refresh_sessions(force=False):
+    """
+    重新计算需要更新的学生并物化，返回更新的学生数
+    force 为 True 时全部学生重算；其他线程正在刷新时直接返回 0
+    """
+    global _refreshed_at
+    from modules.activity_snapshot import get_activity_frame
+    from modules.storage import get_store
+
+    if not _refresh_lock.acquire(blocking=False):
+        return 0
+    try:
+        start = time.perf_counter()
+        store = get_store()
+        frame = get_activity_frame()
+        if force:
+            rows = sessionize(frame)
+        else:
+            stale = _stale_students(frame, store.get_student_sessions())
+            rows = sessionize(frame[frame['student_id'].isin(stale)]) if stale else []
+        if rows:
+            store.save_student_sessions(rows)
+        _refreshed_at = time.monotonic()
+        _stats['refreshes'] += 1
+        _stats['students_updated'] += len(rows)
+        _stats['last_refresh_ms'] = (time.perf_counter() - start) * 1000
+        return len(rows)
+    finally:
+        _refresh_lock.release()
+
+def _ensure_fresh():
+    if time.monotonic() - _refreshed_at >= SESSION_REFRESH_S:
+        try:
+            refresh_sessions()
+        except Exception as e:
+            print(f"[学习会话] 刷新失败: {e}")
+
+def get_student_sessions(student_id):
+    """学生的会话汇总（没有活动时为 None）"""
+    from modules.storage import get_store
+    _ensure_fresh()
+    rows = get_store().get_student_sessions(student_id)
+    return rows[0] if rows else None
+
+def get_all_student_sessions():
+    """全部学生的会话汇总 {学号: 汇总}"""
+    from modules.storage import get_store
+    _ensure_fresh()
+    return {row['student_id']: row for row in get_store().get_student_sessions()}
+
+def format_duration(seconds):
+    """时长显示为 X小时Y分 / Y分 / Z秒"""
+    seconds = int(seconds or 0)
+    if seconds >= 3600:
+        return f"{seconds // 3600}小时{seconds % 3600 // 60}分"
+    if seconds >= 60:
+        return f"{seconds // 60}分"
+    return f"{seconds}秒"
+
+def get_session_stats():
+    """会话刷新统计"""
+    stats = dict(_stats)
+    stats['last_refresh_ms'] = round(stats['last_refresh_ms'], 1)
+    return stats
+
+def main():
+    """命令行入口"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="学习会话汇总")
+    parser.add_argument("--rebuild", action="store_true", help="全量重算全部学生的会话汇总")
+    args = parser.parse_args()
+
+    updated = refresh_sessions(force=args.rebuild)
+    print(f"✅ 已更新 {updated} 名学生的会话汇总")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
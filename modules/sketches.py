@@ -0,0 +1,287 @@
+"""
+去重计数草图模块
+按 (日期, 模块) 维护学生的 HyperLogLog 草图，任意日期范围、任意模块组合的去重学生数
+由草图逐寄存器取最大值合并后估算（标准误差约 1.04 / sqrt(2^HLL_PRECISION)），不再扫描活动日志：
+    (:mfx_ModuleDay {day, module_name, hll, updated_at})  hll 为 2^HLL_PRECISION 个寄存器的整数列表
+增量部分与活动写入在同一事务中完成（见 activity_writer），只发送本批学生命中的 (寄存器, 值)，
+没有寄存器变大时不改写寄存器数组；合并取最大值，重复回放不影响结果；
+历史数据随汇总回填生成（见 rollups）。草图不能扣除，删除学生后按受影响的 (日期, 模块) 重建。
+重建时冷归档中的活动（见 retention）一并计入。
+各进程在内存中缓存全部草图，按 updated_at 增量刷新，查询只做数组合并。
+修改 HLL_PRECISION 后需要重建汇总。
+"""
+
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+from config.settings import HLL_PRECISION, SKETCH_REFRESH_S, SKETCH_RELOAD_S
+
+REGISTERS = 1 << HLL_PRECISION
+
+_HASH_BITS = 64 - HLL_PRECISION
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+
+# 合并到草图节点：先写 updated_at 取得节点写锁，再读取寄存器，避免并发事务互相覆盖；
+# u.indexes / u.ranks 为稀疏的 (寄存器, 值)，只有某个寄存器变大时才改写整个数组属性
+SKETCH_WRITE_QUERY = f"""
+    UNWIND $sketches AS u
+    MERGE (md:mfx_ModuleDay {{day: date(u.day), module_name: u.module_name}})
+    SET md.updated_at = datetime()
+    WITH md, u, COALESCE(md.hll, [i IN range(0, {REGISTERS - 1}) | 0]) AS hll
+    WHERE md.hll IS NULL OR any(j IN range(0, size(u.indexes) - 1) WHERE u.ranks[j] > hll[u.indexes[j]])
+    SET md.hll = reduce(h = hll, j IN range(0, size(u.indexes) - 1) |
+                        CASE WHEN u.ranks[j] > h[u.indexes[j]]
+                             THEN h[..u.indexes[j]] + [u.ranks[j]] + h[u.indexes[j] + 1..]
+                             ELSE h END)
+"""
+
+_lock = threading.Lock()
+_sketches = {}
+_merged = {}
+_high_water_ms = None
+_refreshed_at = 0.0
+_reloaded_at = 0.0
+# 每次 reset_sketch_cache 递增，重置前开始的刷新结果直接丢弃
+_generation = 0
+
+def _register(student_id):
+    """学号的寄存器位置和值（前导零个数 + 1），使用与进程无关的稳定哈希"""
+    digest = hashlib.blake2b(str(student_id).encode('utf-8'), digest_size=8).digest()
+    value = int.from_bytes(digest, 'big')
+    index = value >> _HASH_BITS
+    rest = value & ((1 << _HASH_BITS) - 1)
+    return index, _HASH_BITS - rest.bit_length() + 1
+
+def build_sketch(student_ids):
+    """一组学号的草图（uint8 寄存器数组）"""
+    registers = np.zeros(REGISTERS, dtype=np.uint8)
+    for student_id in student_ids:
+        index, rank = _register(student_id)
+        if rank > registers[index]:
+            registers[index] = rank
+    return registers
+
+def estimate(registers):
+    """草图的去重计数估算（基数较小时使用线性计数修正）"""
+    registers = np.asarray(registers, dtype=np.float64)
+    raw = _ALPHA * REGISTERS * REGISTERS / np.sum(np.exp2(-registers))
+    zeros = int(np.count_nonzero(registers == 0))
+    if raw <= 2.5 * REGISTERS and zeros:
+        return int(round(REGISTERS * np.log(REGISTERS / zeros)))
+    return int(round(raw))
+
+def sparse_registers(student_ids):
+    """一组学号命中的寄存器 (位置列表, 值列表)，同一位置取最大值，按位置排序"""
+    registers = {}
+    for student_id in student_ids:
+        index, rank = _register(student_id)
+        if rank > registers.get(index, 0):
+            registers[index] = rank
+    indexes = sorted(registers)
+    return indexes, [registers[index] for index in indexes]
+
+def sketch_updates(events):
+    """
+    一批活动事件按 (UTC 日期, 模块) 分组生成稀疏的草图更新，作为 SKETCH_WRITE_QUERY 的参数
+    日期与按天汇总的 date(a.timestamp) 一致
+    """
+    from modules.timestamps import day_buckets
+
+    days = day_buckets([e.get('timestamp') for e in events]).astype(str).tolist()
+    groups = {}
+    for e, day in zip(events, days):
+        if day == 'NaT' or not e.get('student_id'):
+            continue
+        groups.setdefault((day, e.get('module_name') or ''), set()).add(e['student_id'])
+    updates = []
+    for (day, module_name), student_ids in groups.items():
+        indexes, ranks = sparse_registers(student_ids)
+        updates.append({'day': day, 'module_name': module_name, 'indexes': indexes, 'ranks': ranks})
+    return updates
+
+def _load(since_ms=None):
+    """读取 updated_at 不早于 since_ms 的草图节点（为空时读取全部）"""
+    from modules.db import run_query
+    if since_ms is None:
+        where, params = "md.hll IS NOT NULL", {}
+    else:
+        where, params = "md.updated_at >= datetime({epochMillis: $since_ms})", {'since_ms': since_ms}
+    return run_query("sketches.load", f"""
+        MATCH (md:mfx_ModuleDay)
+        WHERE {where}
+        RETURN toString(md.day) as day, md.module_name as module_name, md.hll as hll,
+               md.updated_at.epochMillis as updated_ms
+    """, params)
+
+def _refresh():
+    """每 SKETCH_RELOAD_S 秒全量重新读取（兜底其他进程的重建），其余时间按 updated_at 增量读取"""
+    global _sketches, _merged, _high_water_ms, _refreshed_at, _reloaded_at
+    generation = _generation
+    now = time.monotonic()
+    full = now - _reloaded_at >= SKETCH_RELOAD_S or _high_water_ms is None
+    # 回看一个刷新周期，兜底数据库时钟与事务提交顺序的差异
+    rows = _load(None if full else _high_water_ms - SKETCH_REFRESH_S * 1000)
+    sketches = {} if full else dict(_sketches)
+    high_water = None if full else _high_water_ms
+    for row in rows:
+        if len(row['hll']) != REGISTERS:
+            continue
+        key = (row['day'], row['module_name'])
+        registers = np.asarray(row['hll'], dtype=np.uint8)
+        # 并发 MERGE 可能产生重复节点，同键取最大值合并
+        sketches[key] = np.maximum(sketches[key], registers) if key in sketches else registers
+        if row['updated_ms'] is not None:
+            high_water = max(high_water or 0, row['updated_ms'])
+    with _lock:
+        if generation != _generation:
+            return
+        _sketches = sketches
+        _high_water_ms = high_water or 0
+        _refreshed_at = now
+        if full:
+            _reloaded_at = now
+        if full or rows:
+            _merged = {}
+
+def _current():
+    """当前的 (草图, 合并结果缓存)，两者总是同一次刷新的结果"""
+    if time.monotonic() - _refreshed_at >= SKETCH_REFRESH_S:
+        _refresh()
+    with _lock:
+        return _sketches, _merged
+
+def reset_sketch_cache():
+    """草图被删除或重建后调用，下次查询时全量重新读取"""
+    global _sketches, _merged, _high_water_ms, _refreshed_at, _generation
+    with _lock:
+        # 换成新字典而不是原地清空，正在遍历旧字典的查询不受影响
+        _generation += 1
+        _high_water_ms = None
+        _refreshed_at = 0.0
+        _sketches = {}
+        _merged = {}
+
+def _day(value):
+    return str(value)[:10] if value is not None else None
+
+def unique_students(module=None, start_day=None, end_day=None):
+    """
+    日期范围 [start_day, end_day]（含两端，可为 date 或 'YYYY-MM-DD'，为空表示不限）内的去重学生数估算
+    module 为空时统计全部模块；modules 也可以传入模块名称列表
+    """
+    modules = None if module is None else ((module,) if isinstance(module, str) else tuple(module))
+    key = (modules, _day(start_day), _day(end_day))
+    sketches, merged = _current()
+    with _lock:
+        cached = merged.get(key)
+    if cached is not None:
+        return cached
+    start, end = key[1], key[2]
+    selected = [
+        registers for (day, module_name), registers in sketches.items()
+        if (modules is None or module_name in modules)
+        and (start is None or day >= start) and (end is None or day <= end)
+    ]
+    count = estimate(np.maximum.reduce(selected)) if selected else 0
+    with _lock:
+        merged[key] = count
+    return count
+
+def unique_students_by_module(start_day=None, end_day=None):
+    """日期范围内各模块的去重学生数估算 {模块: 学生数}"""
+    modules = {module_name for _, module_name in _current()[0]}
+    return {module_name: unique_students(module_name, start_day, end_day) for module_name in modules}
+
+def student_sketch_keys(student_ids):
+    """学生（单个学号或学号列表）有活动的 (日期, 模块)（删除学生前读取，删除后据此重建草图）"""
+    from modules.db import run_query
+    from modules.schema_migrations import module_field
+    student_ids = [student_ids] if isinstance(student_ids, str) else list(student_ids)
+    rows = run_query("sketches.student_keys", f"""
+        MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+        WHERE s.student_id IN $student_ids AND a.timestamp IS NOT NULL
+        RETURN DISTINCT toString(date(a.timestamp)) as day, COALESCE({module_field('a')}, '') as module_name
+    """, student_ids=student_ids)
+    keys = {(row['day'], row['module_name']) for row in rows}
+    from modules.retention import cold_enabled, cold_sketch_students
+    if cold_enabled():
+        keys.update(cold_sketch_students(student_id=student_ids))
+    return sorted(keys)
+
+def rebuild_sketches(keys=None):
+    """
+    根据活动日志重建草图，keys 为 [(日期, 模块)] 时只重建这些草图（已没有活动的删除），为空时重建全部
+    返回写入的草图数
+    """
+    from modules.db import run_query, run_write
+    from modules.schema_migrations import module_field
+    from modules.rollups import _write_in_batches
+    from modules.retention import cold_enabled, cold_sketch_students
+
+    if keys is not None and not keys:
+        return 0
+    if keys is None:
+        rows = run_query("sketches.rebuild.scan", f"""
+            MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+            WHERE a.timestamp IS NOT NULL AND s.student_id IS NOT NULL
+            RETURN toString(date(a.timestamp)) as day,
+                   COALESCE({module_field('a')}, '') as module_name,
+                   collect(DISTINCT s.student_id) as student_ids
+        """)
+        run_write("sketches.rebuild.clear", """
+            MATCH (md:mfx_ModuleDay)
+            CALL { WITH md DELETE md } IN TRANSACTIONS OF 10000 ROWS
+        """)
+    else:
+        targets = [{'day': day, 'module_name': module_name} for day, module_name in keys]
+        rows = run_query("sketches.rebuild.scan_keys", f"""
+            UNWIND $keys AS k
+            MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+            WHERE a.timestamp >= datetime(k.day) AND a.timestamp < datetime(k.day) + duration('P1D')
+              AND COALESCE({module_field('a')}, '') = k.module_name AND s.student_id IS NOT NULL
+            RETURN k.day as day, k.module_name as module_name, collect(DISTINCT s.student_id) as student_ids
+        """, keys=targets)
+
+    # 合并冷归档中的学生
+    if cold_enabled():
+        merged = {(row['day'], row['module_name']): set(row['student_ids']) for row in rows}
+        for key, student_ids in cold_sketch_students(keys).items():
+            merged.setdefault(key, set()).update(student_ids)
+        rows = [
+            {'day': day, 'module_name': module_name, 'student_ids': list(student_ids)}
+            for (day, module_name), student_ids in merged.items()
+        ]
+
+    if keys is not None:
+        rebuilt = {(row['day'], row['module_name']) for row in rows}
+        run_write("sketches.rebuild.delete_empty", """
+            UNWIND $keys AS k
+            MATCH (md:mfx_ModuleDay {day: date(k.day), module_name: k.module_name})
+            DELETE md
+        """, keys=[k for k in targets if (k['day'], k['module_name']) not in rebuilt])
+
+    _write_in_batches("sketches.rebuild.write", """
+        UNWIND $rows AS row
+        MERGE (md:mfx_ModuleDay {day: date(row.day), module_name: row.module_name})
+        SET md.hll = row.hll, md.updated_at = datetime()
+    """, [
+        {'day': row['day'], 'module_name': row['module_name'], 'hll': build_sketch(row['student_ids']).tolist()}
+        for row in rows
+    ])
+    reset_sketch_cache()
+    return len(rows)
+
+def get_sketch_stats():
+    """草图缓存大小（供诊断页面展示）"""
+    with _lock:
+        sketches = dict(_sketches)
+    return {
+        'sketches': len(sketches),
+        'days': len({day for day, _ in sketches}),
+        'memory_kb': round(len(sketches) * REGISTERS / 1024, 1),
+        'precision': HLL_PRECISION,
+        'std_error': round(1.04 / REGISTERS ** 0.5, 4),
+    }
@@ -0,0 +1,81 @@
+"""
+存储接口模块
+学生、活动、课堂问题/回复、案例和知识图谱的数据访问接口，按 STORAGE_BACKEND 选择实现：
+- neo4j：图数据库（默认），见 storage_neo4j，委托给各业务模块现有的查询函数；
+- sqlite：嵌入式实现，见 storage_sqlite，不需要数据库服务，适合小规模部署和 CI。
+后端实现为模块，必须提供 INTERFACE 中的全部函数，返回的记录格式相同。
+业务模块的数据函数在嵌入式模式下直接转发到 embedded_store()；
+只支持图数据库的功能（报告、教学设计、数据管理等）以 neo4j_enabled() 判断，嵌入式模式下不访问 Neo4j。
+"""
+
+import importlib
+
+from config.settings import STORAGE_BACKEND
+
+BACKENDS = {
+    'neo4j': 'modules.storage_neo4j',
+    'sqlite': 'modules.storage_sqlite',
+}
+
+INTERFACE = (
+    # 事件写入：活动、课堂回复、登录（事件格式见 activity_writer.build_*_event），按事件 ID 去重
+    'write_events',
+    # 学生与活动
+    'get_all_students',
+    'get_student_activities',
+    'get_student_activities_page',
+    'get_student_activity_summary',
+    'get_module_statistics',
+    'get_single_module_statistics',
+    'get_activity_summary',
+    'get_daily_activity_trend',
+    'get_module_usage',
+    'get_popular_content',
+    'get_student_learning_profile',
+    'get_student_leaderboard',
+    'get_module_leaderboard',
+    'get_activities_since',
+    'delete_student_data',
+    'delete_all_activities',
+    # 学习会话汇总（见 sessions），删除学生或活动时一并删除
+    'save_student_sessions',
+    'get_student_sessions',
+    # 课堂问题与回复
+    'create_question',
+    'get_active_question',
+    'get_recent_replies',
+    'get_classroom_interaction_stats',
+    # 案例
+    'save_case',
+    'get_case_detail',
+    # 知识图谱
+    'get_knowledge_graph_data',
+    'count_knowledge_points',
+)
+
+_backends = {}
+
+def get_store(name=None):
+    """按名称加载存储后端模块（默认为配置的 STORAGE_BACKEND），并检查接口是否完整"""
+    name = name or STORAGE_BACKEND
+    backend = _backends.get(name)
+    if backend is not None:
+        return backend
+    if name not in BACKENDS:
+        raise ValueError(f"未知的存储后端: {name}（可选: {', '.join(BACKENDS)}）")
+    backend = importlib.import_module(BACKENDS[name])
+    missing = [func for func in INTERFACE if not callable(getattr(backend, func, None))]
+    if missing:
+        raise NotImplementedError(f"存储后端 {name} 缺少接口: {', '.join(missing)}")
+    _backends[name] = backend
+    return backend
+
+def embedded_store():
+    """配置为嵌入式存储时返回其后端模块，使用 Neo4j 时返回 None"""
+    if STORAGE_BACKEND == 'neo4j':
+        return None
+    return get_store()
+
+def neo4j_enabled():
+    """是否使用 Neo4j（嵌入式存储模式下为 False，查询网关直接拒绝，不尝试连接）"""
+    return STORAGE_BACKEND == 'neo4j'
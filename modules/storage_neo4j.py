@@ -0,0 +1,200 @@
+"""
+Neo4j 存储后端
+存储接口（见 storage）的图数据库实现：查询委托给各业务模块现有的函数（经查询网关执行，
+共享缓存、熔断和统计），事件写入使用后台写入线程的批量写入语句。
+"""
+
+def write_events(events):
+    """在一个事务中写入一批事件，返回耗时（毫秒）"""
+    from modules.activity_writer import _run_write
+    if not events:
+        return 0.0
+    return _run_write(events)
+
+def get_all_students():
+    from modules.auth import get_all_students
+    return get_all_students()
+
+def get_student_activities(student_id=None, module=None, limit=100):
+    from modules.auth import get_student_activities
+    return get_student_activities(student_id, module, limit)
+
+def get_student_activities_page(student_id=None, module=None, cursor=None, page_size=None):
+    from modules.auth import get_student_activities_page
+    return get_student_activities_page(student_id, module, cursor, page_size)
+
+def get_student_activity_summary(student_id=None, module=None):
+    from modules.auth import get_student_activity_summary
+    return get_student_activity_summary(student_id, module)
+
+def get_module_statistics():
+    from modules.auth import get_module_statistics
+    return get_module_statistics()
+
+def get_single_module_statistics(module_name):
+    from modules.auth import get_single_module_statistics
+    return get_single_module_statistics(module_name)
+
+def get_activity_summary():
+    from modules.analytics import get_activity_summary
+    return get_activity_summary()
+
+def get_daily_activity_trend(days=7):
+    from modules.analytics import get_daily_activity_trend
+    return get_daily_activity_trend(days)
+
+def get_module_usage():
+    from modules.analytics import get_module_usage
+    return get_module_usage()
+
+def get_popular_content(module=None, limit=10):
+    from modules.analytics import get_popular_content
+    return get_popular_content(module, limit)
+
+def get_student_learning_profile(student_id):
+    from modules.analytics import get_student_learning_profile
+    return get_student_learning_profile(student_id)
+
+def get_student_leaderboard(limit=10):
+    from modules.analytics import get_student_leaderboard
+    return get_student_leaderboard(limit)
+
+def get_module_leaderboard(module_name, limit=10):
+    from modules.analytics import get_module_leaderboard
+    return get_module_leaderboard(module_name, limit)
+
+def get_activities_since(after=None, since_ms=None, limit=5000):
+    """
+    按 (毫秒时间戳, 活动ID) 正序读取一批活动（活动快照的增量刷新），返回 (记录, 续读位置)
+    after 为上一批返回的续读位置；没有 after 时从 since_ms（毫秒时间戳）开始，都为空时从头读取
+    排序键见 schema_migrations.ts_ms_field()，还没有回填 ts_ms 的历史时间同样按时间排序
+    记录字段：id, student_id, student_name, module, activity_type, content_name, ts（毫秒时间戳，无法解析时为 None）
+    """
+    from modules.db import run_query
+    from modules.schema_migrations import module_field, type_field, ts_ms_field, UNPARSED_TS_MS
+
+    params = {'limit': limit}
+    if after is not None:
+        prefilter = "a.ts_ms IS NULL OR a.ts_ms >= $after_ms"
+        where = "ts_key > $after_ms OR (ts_key = $after_ms AND id > $after_id)"
+        params['after_ms'], params['after_id'] = after
+    elif since_ms is not None:
+        prefilter = "a.ts_ms IS NULL OR a.ts_ms >= $since_ms"
+        where = "ts_key >= $since_ms"
+        params['since_ms'] = since_ms
+    else:
+        prefilter = where = "true"
+    rows = run_query("storage.activities_since", f"""
+        MATCH (s:mfx_Student)-[:PERFORMED]->(a:mfx_Activity)
+        WHERE {prefilter}
+        WITH s, a, {ts_ms_field('a')} as ts_key, COALESCE(a.id, '') as id
+        WHERE {where}
+        RETURN id,
+               s.student_id as student_id,
+               s.name as student_name,
+               {module_field('a')} as module,
+               {type_field('a')} as activity_type,
+               a.content_name as content_name,
+               ts_key
+        ORDER BY ts_key, id
+        LIMIT $limit
+    """, params)
+    next_after = (rows[-1]['ts_key'], rows[-1]['id']) if rows else after
+    for row in rows:
+        key = row.pop('ts_key')
+        row['ts'] = None if key == UNPARSED_TS_MS else key
+    return rows, next_after
+
+def save_student_sessions(rows):
+    """写入学生的会话汇总（记录格式见 sessions.sessionize），各模块时长存为并列的两个列表"""
+    from modules.db import run_write
+    from modules.query_cache import TAG_SESSION
+
+    params = [{
+        'student_id': row['student_id'],
+        'stats': {key: value for key, value in row.items() if key not in ('student_id', 'module_seconds')},
+        'modules': list(row['module_seconds']),
+        'module_seconds': list(row['module_seconds'].values()),
+    } for row in rows]
+    for i in range(0, len(params), 1000):
+        run_write("storage.save_student_sessions", """
+            UNWIND $rows AS row
+            MERGE (ss:mfx_StudentSessions {student_id: row.student_id})
+            SET ss += row.stats,
+                ss.modules = row.modules,
+                ss.module_seconds = row.module_seconds,
+                ss.computed_at = datetime()
+        """, rows=params[i:i + 1000], invalidates=(TAG_SESSION,))
+
+def get_student_sessions(student_id=None):
+    """学生的会话汇总列表（student_id 为空时返回全部学生）"""
+    from modules.db import run_query
+
+    where = "WHERE ss.student_id = $student_id" if student_id else ""
+    rows = run_query("storage.student_sessions", f"""
+        MATCH (ss:mfx_StudentSessions)
+        {where}
+        RETURN ss.student_id as student_id, ss.session_count as session_count,
+               ss.total_seconds as total_seconds, ss.avg_seconds as avg_seconds,
+               ss.longest_seconds as longest_seconds, ss.last_session_at as last_session_at,
+               ss.event_count as event_count, ss.last_activity_ms as last_activity_ms,
+               ss.modules as modules, ss.module_seconds as module_seconds
+    """, {'student_id': student_id} if student_id else None)
+    for row in rows:
+        row['module_seconds'] = dict(zip(row.pop('modules') or [], row['module_seconds'] or []))
+    return rows
+
+def delete_student_data(student_id):
+    from modules.auth import delete_student_data
+    return delete_student_data(student_id)
+
+def delete_all_activities():
+    from modules.auth import delete_all_activities
+    return delete_all_activities()
+
+def create_question(question_text):
+    from modules.classroom_interaction import create_question
+    return create_question(question_text)
+
+def get_active_question():
+    from modules.classroom_interaction import get_active_question
+    return get_active_question()
+
+def get_recent_replies(question_id, limit=20):
+    from modules.classroom_interaction import get_recent_replies
+    return get_recent_replies(question_id, limit)
+
+def get_classroom_interaction_stats():
+    from modules.analytics import get_classroom_interaction_stats
+    return get_classroom_interaction_stats()
+
+def save_case(case, knowledge_points=()):
+    """保存案例节点（只保存基本类型的属性）及其与知识点的关联"""
+    from modules.db import run_in_transaction
+    from modules.query_cache import TAG_CASE
+    props = {
+        key: value for key, value in case.items()
+        if isinstance(value, (str, int, float, bool))
+        or (isinstance(value, list) and all(isinstance(v, (str, int, float, bool)) for v in value))
+    }
+    run_in_transaction("storage.save_case", [
+        ("MERGE (c:mfx_Case {id: $id}) SET c += $props", {'id': case['id'], 'props': props}),
+        ("""
+            MATCH (c:mfx_Case {id: $id})
+            UNWIND $knowledge AS kp
+            MATCH (k:mfx_Knowledge {id: kp.id})
+            MERGE (c)-[:RELATES_TO]->(k)
+        """, {'id': case['id'], 'knowledge': [{'id': k['id']} for k in knowledge_points]}),
+    ], invalidates=(TAG_CASE,))
+
+def get_case_detail(case_id):
+    from modules.case_library import get_case_detail
+    return get_case_detail(case_id)
+
+def get_knowledge_graph_data(module_id=None):
+    from modules.knowledge_graph import get_knowledge_graph_data
+    return get_knowledge_graph_data(module_id)
+
+def count_knowledge_points():
+    from modules.knowledge_graph import count_knowledge_points
+    return count_knowledge_points()
@@ -0,0 +1,732 @@
+"""
+嵌入式存储后端（SQLite，可选 DuckDB）
+不需要数据库服务：学生、活动、课堂问题/回复、案例和知识图谱保存在本地 SQLite 文件（WAL 模式），
+适合小规模部署和 CI。每个线程使用自己的连接，WAL 下读互不阻塞，写入由 SQLite 串行化。
+安装了 duckdb 时，统计类查询（概况、趋势、模块统计、排行榜）由 DuckDB 只读挂载同一文件执行，
+挂载失败（例如无法加载 sqlite 扩展）时退回 SQLite。
+查询耗时记入查询网关的统计（见 db），诊断面板中与 Neo4j 查询一起显示。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from config.settings import EMBEDDED_DB_PATH, EMBEDDED_ANALYTICS_DUCKDB, ACTIVITY_PAGE_SIZE
+
+# 可选导入DuckDB（统计查询）
+try:
+    import duckdb
+    HAS_DUCKDB = True
+except ImportError:
+    HAS_DUCKDB = False
+    duckdb = None
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS students (
+        student_id TEXT PRIMARY KEY,
+        name TEXT,
+        last_login TEXT,
+        login_count INTEGER NOT NULL DEFAULT 0,
+        activity_count INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS students_activity_count ON students (activity_count)",
+    """CREATE TABLE IF NOT EXISTS login_events (
+        id TEXT PRIMARY KEY,
+        student_id TEXT NOT NULL,
+        timestamp TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS activities (
+        id TEXT PRIMARY KEY,
+        student_id TEXT NOT NULL,
+        activity_type TEXT,
+        module_name TEXT,
+        content_id TEXT,
+        content_name TEXT,
+        details TEXT,
+        timestamp TEXT NOT NULL
+    )""",
+    # 游标分页按 (timestamp, id) 倒序，学生/模块过滤各有复合索引
+    "CREATE INDEX IF NOT EXISTS activities_timestamp ON activities (timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS activities_student ON activities (student_id, module_name, timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS activities_module ON activities (module_name, timestamp, id)",
+    # 学习会话汇总（见 sessions），各模块时长存为 JSON
+    """CREATE TABLE IF NOT EXISTS student_sessions (
+        student_id TEXT PRIMARY KEY,
+        session_count INTEGER NOT NULL,
+        total_seconds INTEGER NOT NULL,
+        avg_seconds INTEGER NOT NULL,
+        longest_seconds INTEGER NOT NULL,
+        last_session_at INTEGER,
+        event_count INTEGER NOT NULL,
+        last_activity_ms INTEGER,
+        module_seconds TEXT NOT NULL DEFAULT '{}'
+    )""",
+    """CREATE TABLE IF NOT EXISTS questions (
+        id TEXT PRIMARY KEY,
+        text TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        status TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS questions_status ON questions (status, created_at)",
+    """CREATE TABLE IF NOT EXISTS replies (
+        id TEXT PRIMARY KEY,
+        question_id TEXT NOT NULL,
+        student_name TEXT,
+        content TEXT,
+        timestamp TEXT NOT NULL,
+        length INTEGER
+    )""",
+    "CREATE INDEX IF NOT EXISTS replies_question ON replies (question_id, timestamp)",
+    """CREATE TABLE IF NOT EXISTS cases (
+        id TEXT PRIMARY KEY,
+        title TEXT,
+        difficulty TEXT,
+        data TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS case_knowledge (
+        case_id TEXT NOT NULL,
+        knowledge_id TEXT NOT NULL,
+        name TEXT,
+        PRIMARY KEY (case_id, knowledge_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS kg_modules (
+        id TEXT PRIMARY KEY,
+        name TEXT,
+        description TEXT,
+        sort INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS kg_chapters (
+        id TEXT PRIMARY KEY,
+        module_id TEXT NOT NULL,
+        name TEXT,
+        sort INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS kg_knowledge (
+        id TEXT PRIMARY KEY,
+        chapter_id TEXT NOT NULL,
+        name TEXT,
+        description TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS kg_prerequisites (
+        from_id TEXT NOT NULL,
+        to_id TEXT NOT NULL,
+        PRIMARY KEY (from_id, to_id)
+    )""",
+]
+
+_db_path = EMBEDDED_DB_PATH
+# 切换数据库文件时递增，线程发现代数变化后重新打开连接
+_generation = 0
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+_duck = None
+_duck_generation = None
+_duck_lock = threading.Lock()
+_duck_failed = False
+
+def use_database(path):
+    """切换数据库文件（基准测试、CI 使用临时文件）"""
+    global _db_path, _generation
+    _db_path = path
+    _generation += 1
+
+def get_database_path():
+    return _db_path
+
+def _conn():
+    """当前线程的 SQLite 连接（首次使用时建表）"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.generation == _generation:
+        return conn
+    if conn is not None:
+        conn.close()
+    path = _db_path
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _schema_lock:
+        if path not in _schema_ready:
+            for statement in SCHEMA:
+                conn.execute(statement)
+            _schema_ready.add(path)
+    _local.conn = conn
+    _local.generation = _generation
+    return conn
+
+def _record(name, start, rows=0, error=None, parameters=None):
+    """把查询耗时记入查询网关统计"""
+    try:
+        from modules.db import _record as record_query
+        record_query("sqlite." + name, (time.perf_counter() - start) * 1000, rows,
+                     error=error, parameters=parameters)
+    except Exception:
+        pass
+
+def _query(name, sql, params=()):
+    """执行读查询，返回记录字典列表"""
+    start = time.perf_counter()
+    try:
+        rows = [dict(row) for row in _conn().execute(sql, params).fetchall()]
+    except Exception as e:
+        _record(name, start, error=e, parameters=params)
+        raise
+    _record(name, start, len(rows), parameters=params)
+    return rows
+
+def _single(name, sql, params=()):
+    rows = _query(name, sql, params)
+    return rows[0] if rows else None
+
+def _write(name, work):
+    """在一个事务中执行 work(conn)，返回其结果"""
+    conn = _conn()
+    start = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = work(conn)
+        conn.execute("COMMIT")
+    except Exception as e:
+        conn.execute("ROLLBACK")
+        _record(name, start, error=e)
+        raise
+    _record(name, start)
+    return result
+
+def _duck_conn():
+    """只读挂载 SQLite 文件的 DuckDB 连接，不可用时返回 None"""
+    global _duck, _duck_generation, _duck_failed
+    if not (HAS_DUCKDB and EMBEDDED_ANALYTICS_DUCKDB) or _duck_failed:
+        return None
+    if _duck is not None and _duck_generation == _generation:
+        return _duck
+    _conn()  # 确保文件和表已创建
+    try:
+        if _duck is not None:
+            _duck.close()
+        conn = duckdb.connect()
+        conn.execute(f"ATTACH '{_db_path}' AS embedded (TYPE SQLITE, READ_ONLY)")
+        conn.execute("USE embedded")
+        _duck, _duck_generation = conn, _generation
+        return conn
+    except Exception as e:
+        _duck_failed = True
+        print(f"[嵌入式存储] DuckDB 挂载失败，统计查询改用 SQLite: {e}")
+        return None
+
+def _analytics_query(name, sql, params=()):
+    """统计查询：优先 DuckDB（列式扫描、并行聚合），否则 SQLite（语句两者通用）"""
+    with _duck_lock:
+        conn = _duck_conn()
+        if conn is not None:
+            start = time.perf_counter()
+            try:
+                cursor = conn.execute(sql, list(params))
+                columns = [d[0] for d in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            except Exception as e:
+                _record(name + ".duckdb", start, error=e, parameters=params)
+                raise
+            _record(name + ".duckdb", start, len(rows), parameters=params)
+            return rows
+    return _query(name, sql, params)
+
+def _normalize_ts(value):
+    """统一为定长的 UTC ISO 字符串，字符串顺序即时间顺序"""
+    if isinstance(value, datetime):
+        ts = value
+    else:
+        ts = datetime.fromisoformat(str(value))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+def _now_ts():
+    return _normalize_ts(datetime.now(timezone.utc))
+
+def _days_ago(days):
+    return _normalize_ts(datetime.now(timezone.utc) - timedelta(days=days))
+
+def _today():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+# ==================== 事件写入 ====================
+
+def _write_activity(conn, e):
+    inserted = conn.execute("""
+        INSERT OR IGNORE INTO activities
+            (id, student_id, activity_type, module_name, content_id, content_name, details, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (e['id'], e['student_id'], e.get('activity_type'), e.get('module_name'), e.get('content_id'),
+          e.get('content_name'), e.get('details'), _normalize_ts(e['timestamp']))).rowcount
+    if inserted:
+        conn.execute("""
+            INSERT INTO students (student_id, activity_count) VALUES (?, 1)
+            ON CONFLICT (student_id) DO UPDATE SET activity_count = activity_count + 1
+        """, (e['student_id'],))
+
+def _write_reply(conn, e):
+    timestamp = _normalize_ts(e['timestamp'])
+    content = e.get('content') or ''
+    conn.execute("""
+        INSERT OR IGNORE INTO replies (id, question_id, student_name, content, timestamp, length)
+        SELECT ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM questions WHERE id = ?)
+    """, (e['id'], e['question_id'], e.get('student_name'), content, timestamp, len(content), e['question_id']))
+
+def _write_login(conn, e):
+    timestamp = _normalize_ts(e['timestamp'])
+    inserted = conn.execute(
+        "INSERT OR IGNORE INTO login_events (id, student_id, timestamp) VALUES (?, ?, ?)",
+        (e['id'], e['student_id'], timestamp)
+    ).rowcount
+    if inserted:
+        conn.execute("""
+            INSERT INTO students (student_id, name, last_login, login_count) VALUES (?, ?, ?, 1)
+            ON CONFLICT (student_id) DO UPDATE SET
+                name = excluded.name,
+                last_login = MAX(COALESCE(last_login, ''), excluded.last_login),
+                login_count = login_count + 1
+        """, (e['student_id'], e.get('name'), timestamp))
+
+_EVENT_WRITERS = {
+    'activity': _write_activity,
+    'reply': _write_reply,
+    'login': _write_login,
+}
+
+def write_events(events):
+    """在一个事务中写入一批事件（活动、课堂回复、登录），按事件 ID 去重，返回耗时（毫秒）"""
+    if not events:
+        return 0.0
+    start = time.perf_counter()
+
+    def work(conn):
+        for e in events:
+            _EVENT_WRITERS[e.get('kind', 'activity')](conn, e)
+
+    _write("write_events", work)
+    return (time.perf_counter() - start) * 1000
+
+# ==================== 学生与活动 ====================
+
+def get_all_students():
+    """获取所有学生列表（按活动数倒序）"""
+    return _query("get_all_students", """
+        SELECT student_id, name, activity_count FROM students ORDER BY activity_count DESC
+    """)
+
+def _activity_filter(student_id=None, module=None):
+    clauses, params = [], []
+    if student_id:
+        clauses.append("a.student_id = ?")
+        params.append(student_id)
+    if module:
+        clauses.append("a.module_name = ?")
+        params.append(module)
+    return clauses, params
+
+_ACTIVITY_COLUMNS = """
+    a.student_id as student_id,
+    s.name as student_name,
+    a.activity_type as activity_type,
+    a.module_name as module,
+    a.content_id as content_id,
+    a.content_name as content_name,
+    a.details as details,
+    a.timestamp as timestamp,
+    a.id as activity_id
+"""
+
+def _activities(name, student_id, module, cursor, limit):
+    clauses, params = _activity_filter(student_id, module)
+    if cursor:
+        clauses.append("(a.timestamp, a.id) < (?, ?)")
+        params.extend(cursor)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    return _query(name, f"""
+        SELECT {_ACTIVITY_COLUMNS}
+        FROM activities a LEFT JOIN students s ON s.student_id = a.student_id
+        {where}
+        ORDER BY a.timestamp DESC, a.id DESC
+        LIMIT ?
+    """, params + [limit])
+
+def get_student_activities(student_id=None, module=None, limit=100):
+    """获取学生活动记录（按时间倒序）"""
+    return _activities("get_student_activities", student_id, module, None, limit)
+
+def get_student_activities_page(student_id=None, module=None, cursor=None, page_size=None):
+    """按游标分页获取学生活动记录，返回 (本页记录, 下一页令牌)"""
+    from modules.auth import encode_activity_cursor, decode_activity_cursor
+    page_size = page_size or ACTIVITY_PAGE_SIZE
+    activities = _activities("get_student_activities_page", student_id, module,
+                             decode_activity_cursor(cursor) if cursor else None, page_size + 1)
+    next_cursor = None
+    if len(activities) > page_size:
+        activities = activities[:page_size]
+        last = activities[-1]
+        next_cursor = encode_activity_cursor(last['timestamp'], last['activity_id'])
+    return activities, next_cursor
+
+def get_student_activity_summary(student_id=None, module=None):
+    """活动记录的总数、活跃天数和学习内容数"""
+    clauses, params = _activity_filter(student_id, module)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    return _analytics_query("get_student_activity_summary", f"""
+        SELECT count(*) as total,
+               count(DISTINCT substr(a.timestamp, 1, 10)) as active_days,
+               count(DISTINCT a.content_name) as content_count
+        FROM activities a {where}
+    """, params)[0]
+
+def get_module_statistics():
+    """获取各模块使用统计"""
+    return _analytics_query("get_module_statistics", """
+        SELECT module_name as module,
+               count(*) as total_activities,
+               count(DISTINCT student_id) as unique_students,
+               0 as today_count
+        FROM activities
+        GROUP BY module_name
+        ORDER BY total_activities DESC
+    """)
+
+def get_single_module_statistics(module_name):
+    """获取单个模块的详细统计"""
+    record = _analytics_query("get_single_module_statistics", """
+        SELECT count(*) as total_activities,
+               count(DISTINCT student_id) as unique_students,
+               COALESCE(sum(CASE WHEN timestamp > ? THEN 1 ELSE 0 END), 0) as recent_count
+        FROM activities
+        WHERE module_name = ?
+    """, (_days_ago(7), module_name))[0]
+    total, students = record['total_activities'], record['unique_students']
+    return {
+        'module': module_name,
+        'total_visits': total,
+        'unique_students': students,
+        'avg_visits_per_student': round(total / students, 1) if students > 0 else 0,
+        'recent_7d_visits': record['recent_count'],
+    }
+
+def get_activity_summary():
+    """获取活动概况"""
+    return _analytics_query("get_activity_summary", """
+        SELECT (SELECT count(*) FROM students) as total_students,
+               (SELECT count(*) FROM activities) as total_activities,
+               (SELECT count(*) FROM activities WHERE timestamp >= ?) as today_activities,
+               (SELECT count(DISTINCT student_id) FROM activities WHERE timestamp > ?) as active_students
+    """, (_today(), _days_ago(7)))[0]
+
+def get_daily_activity_trend(days=7):
+    """获取每日活动趋势"""
+    return _analytics_query("get_daily_activity_trend", """
+        SELECT substr(timestamp, 1, 10) as date, count(*) as count
+        FROM activities
+        WHERE timestamp > ?
+        GROUP BY substr(timestamp, 1, 10)
+        ORDER BY date
+    """, (_days_ago(days),))
+
+def get_module_usage():
+    """获取各模块使用情况"""
+    return _analytics_query("get_module_usage", """
+        SELECT module_name as module, count(*) as count
+        FROM activities
+        GROUP BY module_name
+        ORDER BY count DESC
+    """)
+
+def get_popular_content(module=None, limit=10):
+    """获取热门学习内容"""
+    where, params = "WHERE content_name IS NOT NULL", []
+    if module:
+        where += " AND module_name = ?"
+        params.append(module)
+    return _analytics_query("get_popular_content", f"""
+        SELECT module_name as module,
+               content_name,
+               count(*) as view_count,
+               count(DISTINCT content_id) as unique_views
+        FROM activities {where}
+        GROUP BY module_name, content_name
+        ORDER BY view_count DESC
+        LIMIT ?
+    """, (*params, limit))
+
+def get_student_learning_profile(student_id):
+    """获取学生学习画像（学生不存在时返回 None）"""
+    info = _single("get_student_learning_profile.info", """
+        SELECT name, last_login, login_count FROM students WHERE student_id = ?
+    """, (student_id,))
+    if not info:
+        return None
+    return {
+        'info': info,
+        'module_stats': _query("get_student_learning_profile.module_stats", """
+            SELECT module_name as module, count(*) as count
+            FROM activities WHERE student_id = ?
+            GROUP BY module_name
+            ORDER BY count DESC
+        """, (student_id,)),
+        'time_distribution': _query("get_student_learning_profile.time_distribution", """
+            SELECT CAST(substr(timestamp, 12, 2) AS INTEGER) as hour, count(*) as count
+            FROM activities WHERE student_id = ?
+            GROUP BY hour
+            ORDER BY hour
+        """, (student_id,)),
+        'recent_content': _query("get_student_learning_profile.recent_content", """
+            SELECT module_name as module, content_name as content, timestamp as time
+            FROM activities WHERE student_id = ? AND content_name IS NOT NULL
+            ORDER BY timestamp DESC, id DESC
+            LIMIT 20
+        """, (student_id,)),
+    }
+
+def get_student_leaderboard(limit=10):
+    """学习排行榜：活动数最多的学生及其活跃天数"""
+    return _analytics_query("get_student_leaderboard", """
+        SELECT s.student_id, s.name, s.activity_count,
+               (SELECT count(DISTINCT substr(a.timestamp, 1, 10)) FROM activities a
+                WHERE a.student_id = s.student_id) as active_days
+        FROM students s
+        WHERE s.activity_count > 0
+        ORDER BY s.activity_count DESC
+        LIMIT ?
+    """, (limit,))
+
+def get_module_leaderboard(module_name, limit=10):
+    """单个模块的学习排行榜：该模块活动数最多的学生"""
+    return _analytics_query("get_module_leaderboard", """
+        SELECT student_id, count(*) as activity_count
+        FROM activities
+        WHERE module_name = ?
+        GROUP BY student_id
+        ORDER BY activity_count DESC
+        LIMIT ?
+    """, (module_name, limit))
+
+def get_activities_since(after=None, since_ms=None, limit=5000):
+    """按 (时间, 活动ID) 正序读取一批活动，返回 (记录, 续读位置)，参数和字段同 Neo4j 实现"""
+    if after is not None:
+        where, params = "WHERE (a.timestamp, a.id) > (?, ?)", list(after)
+    elif since_ms is not None:
+        where, params = "WHERE a.timestamp >= ?", [_normalize_ts(datetime.fromtimestamp(since_ms / 1000, timezone.utc))]
+    else:
+        where, params = "", []
+    rows = _query("get_activities_since", f"""
+        SELECT a.id as id,
+               a.student_id as student_id,
+               s.name as student_name,
+               a.module_name as module,
+               a.activity_type as activity_type,
+               a.content_name as content_name,
+               CAST(strftime('%s', substr(a.timestamp, 1, 19)) AS INTEGER) * 1000
+                   + CAST(substr(a.timestamp, 21, 3) AS INTEGER) as ts,
+               a.timestamp as cursor_ts
+        FROM activities a LEFT JOIN students s ON s.student_id = a.student_id
+        {where}
+        ORDER BY a.timestamp, a.id
+        LIMIT ?
+    """, params + [limit])
+    next_after = (rows[-1]['cursor_ts'], rows[-1]['id']) if rows else after
+    for row in rows:
+        del row['cursor_ts']
+    return rows, next_after
+
+def delete_student_data(student_id):
+    """删除学生及其所有活动数据"""
+    def work(conn):
+        conn.execute("DELETE FROM activities WHERE student_id = ?", (student_id,))
+        conn.execute("DELETE FROM student_sessions WHERE student_id = ?", (student_id,))
+        conn.execute("DELETE FROM login_events WHERE student_id = ?", (student_id,))
+        conn.execute("DELETE FROM students WHERE student_id = ?", (student_id,))
+    _write("delete_student_data", work)
+
+def delete_all_activities():
+    """删除所有活动记录"""
+    def work(conn):
+        conn.execute("DELETE FROM activities")
+        conn.execute("DELETE FROM student_sessions")
+        conn.execute("UPDATE students SET activity_count = 0")
+    _write("delete_all_activities", work)
+
+def save_student_sessions(rows):
+    """写入学生的会话汇总（记录格式见 sessions.sessionize）"""
+    def work(conn):
+        conn.executemany("""
+            INSERT OR REPLACE INTO student_sessions
+                (student_id, session_count, total_seconds, avg_seconds, longest_seconds,
+                 last_session_at, event_count, last_activity_ms, module_seconds)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(row['student_id'], row['session_count'], row['total_seconds'], row['avg_seconds'],
+               row['longest_seconds'], row['last_session_at'], row['event_count'], row['last_activity_ms'],
+               json.dumps(row['module_seconds'], ensure_ascii=False)) for row in rows])
+    _write("save_student_sessions", work)
+
+def get_student_sessions(student_id=None):
+    """学生的会话汇总列表（student_id 为空时返回全部学生）"""
+    where, params = ("WHERE student_id = ?", (student_id,)) if student_id else ("", ())
+    rows = _query("get_student_sessions", f"SELECT * FROM student_sessions {where}", params)
+    for row in rows:
+        row['module_seconds'] = json.loads(row['module_seconds'])
+    return rows
+
+# ==================== 课堂问题与回复 ====================
+
+def create_question(question_text):
+    """创建问题（同时关闭其他活跃问题），返回问题 ID"""
+    question_id = str(uuid.uuid4())
+
+    def work(conn):
+        conn.execute("UPDATE questions SET status = 'closed' WHERE status = 'active'")
+        conn.execute(
+            "INSERT INTO questions (id, text, created_at, status) VALUES (?, ?, ?, 'active')",
+            (question_id, question_text, _now_ts())
+        )
+
+    _write("create_question", work)
+    return question_id
+
+def get_active_question():
+    """获取当前活跃问题"""
+    return _single("get_active_question", """
+        SELECT id, text, created_at FROM questions
+        WHERE status = 'active'
+        ORDER BY created_at DESC
+        LIMIT 1
+    """)
+
+def get_recent_replies(question_id, limit=20):
+    """获取最新回复"""
+    return _query("get_recent_replies", """
+        SELECT student_name, content, timestamp FROM replies
+        WHERE question_id = ?
+        ORDER BY timestamp DESC
+        LIMIT ?
+    """, (question_id, limit))
+
+def get_classroom_interaction_stats():
+    """获取课中互动统计：最近的问题及回复数、回复最多的学生（回复只记录姓名，学号按姓名匹配）"""
+    questions = _query("get_classroom_interaction_stats.questions", """
+        SELECT q.id as question_id, q.text as question_text, q.created_at, q.status,
+               (SELECT count(*) FROM replies r WHERE r.question_id = q.id) as reply_count
+        FROM questions q
+        ORDER BY q.created_at DESC
+        LIMIT 20
+    """)
+    participation = _query("get_classroom_interaction_stats.participation", """
+        SELECT r.student_name,
+               (SELECT s.student_id FROM students s WHERE s.name = r.student_name LIMIT 1) as student_id,
+               count(*) as reply_count
+        FROM replies r
+        GROUP BY r.student_name
+        ORDER BY reply_count DESC
+        LIMIT 20
+    """)
+    return {'questions': questions, 'participation': participation}
+
+# ==================== 案例 ====================
+
+def save_case(case, knowledge_points=()):
+    """保存案例及其关联的知识点 [{'id': ..., 'name': ...}]"""
+    def work(conn):
+        conn.execute(
+            "INSERT OR REPLACE INTO cases (id, title, difficulty, data) VALUES (?, ?, ?, ?)",
+            (case['id'], case.get('title'), case.get('difficulty'), json.dumps(case, ensure_ascii=False))
+        )
+        conn.execute("DELETE FROM case_knowledge WHERE case_id = ?", (case['id'],))
+        conn.executemany(
+            "INSERT OR IGNORE INTO case_knowledge (case_id, knowledge_id, name) VALUES (?, ?, ?)",
+            [(case['id'], k['id'], k.get('name')) for k in knowledge_points]
+        )
+    _write("save_case", work)
+
+def get_case_detail(case_id):
+    """获取案例详情（含关联的知识点）"""
+    record = _single("get_case_detail", "SELECT data FROM cases WHERE id = ?", (case_id,))
+    if not record:
+        return None
+    case_data = json.loads(record['data'])
+    case_data['knowledge_points'] = _query("get_case_knowledge", """
+        SELECT knowledge_id as id, name FROM case_knowledge WHERE case_id = ?
+    """, (case_id,))
+    return case_data
+
+# ==================== 知识图谱 ====================
+
+def import_knowledge_graph(modules):
+    """
+    导入知识图谱（覆盖同 ID 的数据）
+    modules: [{'id', 'name', 'description', 'chapters': [{'id', 'name',
+              'knowledge': [{'id', 'name', 'description', 'prerequisites': [知识点ID]}]}]}]
+    """
+    def work(conn):
+        for m_sort, m in enumerate(modules):
+            conn.execute("INSERT OR REPLACE INTO kg_modules (id, name, description, sort) VALUES (?, ?, ?, ?)",
+                         (m['id'], m.get('name'), m.get('description'), m_sort))
+            for c_sort, c in enumerate(m.get('chapters', [])):
+                conn.execute("INSERT OR REPLACE INTO kg_chapters (id, module_id, name, sort) VALUES (?, ?, ?, ?)",
+                             (c['id'], m['id'], c.get('name'), c_sort))
+                for k in c.get('knowledge', []):
+                    conn.execute(
+                        "INSERT OR REPLACE INTO kg_knowledge (id, chapter_id, name, description) VALUES (?, ?, ?, ?)",
+                        (k['id'], c['id'], k.get('name'), k.get('description'))
+                    )
+                    conn.executemany("INSERT OR IGNORE INTO kg_prerequisites (from_id, to_id) VALUES (?, ?)",
+                                     [(k['id'], to_id) for to_id in k.get('prerequisites', [])])
+    _write("import_knowledge_graph", work)
+
+def get_knowledge_graph_data(module_id=None):
+    """
+    获取知识图谱数据，记录格式与 Neo4j 实现一致：
+    [{'m': 模块, 'c': 章节, 'k': 知识点, 'r': 前置关系, 'k2': 前置知识点}]
+    """
+    columns = """
+        m.id as m_id, m.name as m_name, m.description as m_description,
+        c.id as c_id, c.name as c_name,
+        k.id as k_id, k.name as k_name, k.description as k_description
+    """
+    if module_id:
+        rows = _query("knowledge_graph.module_graph", f"""
+            SELECT {columns}, k2.id as k2_id, k2.name as k2_name, k2.description as k2_description
+            FROM kg_modules m
+            JOIN kg_chapters c ON c.module_id = m.id
+            JOIN kg_knowledge k ON k.chapter_id = c.id
+            LEFT JOIN kg_prerequisites p ON p.from_id = k.id
+            LEFT JOIN kg_knowledge k2 ON k2.id = p.to_id
+            WHERE m.id = ?
+            ORDER BY c.sort, k.id
+        """, (module_id,))
+    else:
+        rows = _query("knowledge_graph.all_modules", f"""
+            SELECT {columns}
+            FROM kg_modules m
+            JOIN kg_chapters c ON c.module_id = m.id
+            JOIN kg_knowledge k ON k.chapter_id = c.id
+            ORDER BY m.sort, c.sort, k.id
+            LIMIT 50
+        """)
+
+    records = []
+    for row in rows:
+        record = {}
+        for alias in ('m', 'c', 'k', 'k2'):
+            node = {key[len(alias) + 1:]: value for key, value in row.items() if key.startswith(alias + '_')}
+            record[alias] = node if node.get('id') is not None else None
+        record['r'] = {} if record['k2'] else None
+        records.append(record)
+    return records
+
+def count_knowledge_points():
+    """知识点总数"""
+    return _single("count_knowledge_points", "SELECT count(*) as count FROM kg_knowledge")['count']
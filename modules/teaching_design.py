@@ -43,9 +43,10 @@ TEACHING_METHODS = {
 }
 
 def check_neo4j_available():
-    """检查Neo4j是否可用"""
+    """检查Neo4j是否可用（本模块只支持图数据库，嵌入式存储模式下不可用）"""
     from modules.auth import check_neo4j_available as auth_check
-    return auth_check()
+    from modules.storage import neo4j_enabled
+    return neo4j_enabled() and auth_check()
 
 def get_neo4j_driver():
     """获取Neo4j连接"""
@@ -57,16 +58,14 @@ def get_all_chapters():
     if not check_neo4j_available():
         return []
     
+    from modules.db import run_query
+    
     try:
-        driver = get_neo4j_driver()
-        with driver.session() as session:
-            result = session.run("""
-                MATCH (m:glx_Module)-[:HAS_CHAPTER]->(c:glx_Chapter)
-                RETURN m.name as module_name, c.id as chapter_id, c.name as chapter_name
-                ORDER BY m.id, c.id
-            """)
-            chapters = [dict(record) for record in result]
-        return chapters
+        return run_query("teaching_design.get_all_chapters", """
+            MATCH (m:glx_Module)-[:HAS_CHAPTER]->(c:glx_Chapter)
+            RETURN m.name as module_name, c.id as chapter_id, c.name as chapter_name
+            ORDER BY m.id, c.id
+        """)
     except Exception as e:
         st.error(f"获取章节列表失败: {e}")
         return []
@@ -76,16 +75,14 @@ def get_chapter_knowledge_points(chapter_id):
     if not check_neo4j_available():
         return []
     
+    from modules.db import run_query
+    
     try:
-        driver = get_neo4j_driver()
-        with driver.session() as session:
-            result = session.run("""
-                MATCH (c:glx_Chapter {id: $chapter_id})-[:HAS_KNOWLEDGE]->(k:glx_Knowledge)
-                RETURN k.name as name, COALESCE(k.importance, 80) as importance
-                ORDER BY COALESCE(k.importance, 80) DESC
-            """, chapter_id=chapter_id)
-            knowledge_points = [dict(record) for record in result]
-        return knowledge_points
+        return run_query("teaching_design.get_chapter_knowledge_points", """
+            MATCH (c:glx_Chapter {id: $chapter_id})-[:HAS_KNOWLEDGE]->(k:glx_Knowledge)
+            RETURN k.name as name, COALESCE(k.importance, 80) as importance
+            ORDER BY COALESCE(k.importance, 80) DESC
+        """, chapter_id=chapter_id)
     except Exception as e:
         st.error(f"获取知识点失败: {e}")
         return []
@@ -190,6 +187,11 @@ def render_teaching_design():
     st.markdown("根据章节内容和教学方法，AI辅助生成教学设计方案")
     st.markdown("---")
     
+    from modules.storage import neo4j_enabled
+    if not neo4j_enabled():
+        st.info("ℹ️ 当前使用嵌入式存储，教学方案设计需要 Neo4j 数据库")
+        return
+    
     if not check_neo4j_available():
         st.error("❌ Neo4j数据库连接失败，无法获取章节信息")
         return
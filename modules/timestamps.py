@@ -0,0 +1,120 @@
+"""
+时间戳归一化模块
+活动时间在图中有两种历史形态：datetime 值（驱动返回 neo4j.time.DateTime）和旧版本写入的字符串
+（"2025-01-01 10:30:00" 或 "2026-01-05T16:40:02.977000000+00:00"）。
+这里把一整列混合形态的时间一次性转换为 numpy datetime64[ns]（UTC）或毫秒时间戳数组：
+字符串先用正则统一成固定格式再整体解析，不再逐条尝试多种格式；
+按天分桶、时间范围过滤和显示格式化都在数组上完成。
+活动节点另存规范的毫秒时间戳 ts_ms（写入时设置，历史数据用 schema_migrations 回填），
+查询直接返回整数即可，不必让驱动构造时间对象。
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from config.settings import NAIVE_TIMESTAMP_TZ
+
+# 缺失或无法解析的毫秒时间戳（即 NaT 的整数表示）
+MISSING_MS = np.iinfo(np.int64).min
+
+DISPLAY_FORMAT = '%Y-%m-%d %H:%M'
+
+# 日期、时间（可省略）、秒的小数部分（最多 9 位）和时区
+_ISO_RE = re.compile(r'\s*(\d{4}-\d{2}-\d{2})(?:[T ](\d{2}:\d{2})(?::(\d{2}))?(?:\.(\d{1,9}))?)?\s*'
+                     r'(Z|[+-]\d{2}:?\d{2})?(?:\[[^\]]*\])?\s*$')
+
+def _canonical(text):
+    """统一为 YYYY-MM-DDTHH:MM:SS.ffffff+HH:MM（无时区的按 NAIVE_TIMESTAMP_TZ），无法识别的返回 None"""
+    match = _ISO_RE.match(text)
+    if match is None:
+        return None
+    date, minute, second, fraction, zone = match.groups()
+    if not zone or zone == 'Z':
+        zone = NAIVE_TIMESTAMP_TZ if not zone else '+00:00'
+    elif ':' not in zone:
+        zone = zone[:3] + ':' + zone[3:]
+    return f"{date}T{minute or '00:00'}:{second or '00'}.{(fraction or '')[:6]:0<6}{zone}"
+
+def _utc_ns(parsed):
+    """带时区的解析结果转为 datetime64[ns]（UTC）数组"""
+    return pd.DatetimeIndex(parsed).tz_convert(None).values.astype('datetime64[ns]')
+
+def _parse_strings(strings):
+    """字符串去重后统一格式，再按固定格式整体解析"""
+    codes, uniques = pd.factorize(strings)
+    canonical = pd.Series([_canonical(text) for text in uniques], dtype=object)
+    parsed = pd.to_datetime(canonical, format='%Y-%m-%dT%H:%M:%S.%f%z', utc=True, errors='coerce')
+    return _utc_ns(parsed)[codes]
+
+def to_datetime64(values):
+    """
+    混合形态的时间列转为 datetime64[ns] 数组（UTC，缺失或无法解析为 NaT）
+    支持 neo4j.time.DateTime、datetime、字符串和毫秒时间戳整数
+    """
+    series = pd.Series(values.values if isinstance(values, pd.Series) else list(values), dtype=object)
+    result = np.full(len(series), np.datetime64('NaT'), dtype='datetime64[ns]')
+    if series.empty:
+        return result
+
+    kinds = series.map(type).values
+    strings = kinds == str
+    if strings.any():
+        result[strings] = _parse_strings(series.values[strings])
+    numbers = np.isin(kinds, (int, float, np.int64, np.float64))
+    if numbers.any():
+        result[numbers] = _utc_ns(pd.to_datetime(series.values[numbers].astype('float64'), unit='ms', utc=True))
+    others = ~(strings | numbers) & series.notna().values
+    if others.any():
+        # 驱动的时间类型先转为原生 datetime，再整体转换
+        native = [v.to_native() if hasattr(v, 'to_native') else v for v in series.values[others]]
+        result[others] = _utc_ns(pd.to_datetime(native, utc=True, errors='coerce'))
+    return result
+
+def canonical_iso(values):
+    """
+    时间列转为 Cypher datetime() 可直接解析的规范字符串列表（无时区的按 NAIVE_TIMESTAMP_TZ），
+    无法解析的为 None；支持字符串、驱动的 DateTime / LocalDateTime / Date 和原生 datetime
+    """
+    texts = []
+    for value in values:
+        if isinstance(value, str):
+            text = value
+        elif hasattr(value, 'isoformat'):
+            text = value.isoformat()
+        else:
+            text = None
+        texts.append(_canonical(text) if text else None)
+    # 格式合法但日期本身无效（如 13 月）的同样视为无法解析
+    parsed = pd.to_datetime(pd.Series(texts, dtype=object), format='%Y-%m-%dT%H:%M:%S.%f%z',
+                            utc=True, errors='coerce')
+    return [text if not pd.isna(moment) else None for text, moment in zip(texts, parsed)]
+
+def to_epoch_ms(values):
+    """混合形态的时间列转为 int64 毫秒时间戳数组，缺失为 MISSING_MS"""
+    ns = to_datetime64(values).view('int64')
+    return np.where(ns == MISSING_MS, MISSING_MS, ns // 1000000)
+
+def day_buckets(values):
+    """按 UTC 日期分桶（datetime64[D] 数组）"""
+    return to_datetime64(values).astype('datetime64[D]')
+
+def in_range(values, start=None, end=None):
+    """时间落在 [start, end) 内的布尔掩码，start / end 可以是任意受支持的时间形态"""
+    times = to_datetime64(values)
+    mask = ~np.isnat(times)
+    if start is not None:
+        mask &= times >= to_datetime64([start])[0]
+    if end is not None:
+        mask &= times < to_datetime64([end])[0]
+    return mask
+
+def format_times(values, fmt=DISPLAY_FORMAT, missing='-'):
+    """时间列格式化为显示字符串列表，缺失或无法解析的显示为 missing"""
+    times = pd.Series(to_datetime64(values))
+    return times.dt.strftime(fmt).fillna(missing).tolist()
+
+def format_time(value, fmt=DISPLAY_FORMAT, missing='-'):
+    """单个时间的显示字符串"""
+    return format_times([value], fmt, missing)[0]
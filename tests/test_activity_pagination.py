@@ -0,0 +1,101 @@
+"""
+活动记录游标分页测试：续页令牌的编码和排序键类型校验，以及嵌入式存储上按 (时间, 活动ID)
+的键集分页（时间为不同时区和无时区写法混合、含相同时刻）不重不漏。不需要数据库服务：
+
+    python -m unittest discover tests
+"""
+
+import base64
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+# 必须在导入 config.settings 之前设置
+_tmpdir = tempfile.mkdtemp(prefix="glx_test_")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("EMBEDDED_DB_PATH", os.path.join(_tmpdir, "test.db"))
+
+from modules import storage_sqlite
+from modules.activity_writer import build_activity_event, build_login_event
+from modules.auth import decode_activity_cursor, encode_activity_cursor
+from modules.timestamps import to_epoch_ms
+
+def tearDownModule():
+    shutil.rmtree(_tmpdir, ignore_errors=True)
+
+class CursorTokenTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        token = encode_activity_cursor(1735698600000, "a1")
+        self.assertEqual(decode_activity_cursor(token, key_type=int), (1735698600000, "a1"))
+        token = encode_activity_cursor("2025-01-01T02:30:00.000000+00:00", None)
+        self.assertEqual(decode_activity_cursor(token), ("2025-01-01T02:30:00.000000+00:00", ""))
+
+    def test_key_type_mismatch(self):
+        # 切换存储后端或升级前的旧令牌从第一页开始
+        self.assertIsNone(decode_activity_cursor(encode_activity_cursor("2025-01-01", "a1"), key_type=int))
+        self.assertIsNone(decode_activity_cursor(encode_activity_cursor(1735698600000, "a1")))
+        self.assertIsNone(decode_activity_cursor(encode_activity_cursor(True, "a1"), key_type=int))
+
+    def test_invalid_tokens(self):
+        bad = base64.urlsafe_b64encode(json.dumps({'ts': 1}).encode('utf-8')).decode('ascii')
+        for token in ("", "not-base64!", bad):
+            self.assertIsNone(decode_activity_cursor(token, key_type=int), token)
+
+class KeysetPaginationTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls._previous_db = storage_sqlite._db_path
+        storage_sqlite.use_database(os.path.join(_tmpdir, "pages.db"))
+        timestamps = [
+            "2025-01-01T10:30:00+08:00",
+            "2025-01-01T02:30:00Z",          # 与上一条同一时刻，按活动ID区分先后
+            "2025-01-01 03:00:00",           # 无时区按 UTC
+            "2025-01-01T01:00:00.500000+00:00",
+            "2024-12-31T23:59:59-05:00",     # 晚于前几条（UTC 2025-01-01 04:59:59）
+            "2025-01-01T09:00:00+08:00",
+            "2025-01-01T01:00:00.250+00:00",
+        ]
+        events = [build_login_event("s001", "张三")]
+        for i, timestamp in enumerate(timestamps):
+            event = build_activity_event("s001", "查看案例", "案例库", content_id=f"c{i}")
+            event['timestamp'] = timestamp
+            events.append(event)
+        storage_sqlite.write_events(events)
+        cls.expected = sorted(
+            ((int(ms), e['id']) for ms, e in zip(to_epoch_ms(timestamps), events[1:])), reverse=True
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        storage_sqlite.use_database(cls._previous_db)
+
+    def _walk(self, page_size):
+        seen, cursor, pages = [], None, 0
+        while True:
+            page, cursor = storage_sqlite.get_student_activities_page("s001", None, cursor, page_size)
+            seen.extend(row['activity_id'] for row in page)
+            pages += 1
+            if cursor is None or pages > 20:
+                return seen
+
+    def test_pages_cover_all_in_order(self):
+        for page_size in (1, 2, 3, 7, 10):
+            self.assertEqual(self._walk(page_size), [activity_id for _, activity_id in self.expected], page_size)
+
+    def test_first_page_matches_list(self):
+        page, cursor = storage_sqlite.get_student_activities_page("s001", None, None, 3)
+        self.assertIsNotNone(cursor)
+        listed = storage_sqlite.get_student_activities("s001", None, 3)
+        self.assertEqual([row['activity_id'] for row in page], [row['activity_id'] for row in listed])
+
+    def test_activities_since_ascending(self):
+        rows, after = storage_sqlite.get_activities_since(limit=4)
+        rest, _ = storage_sqlite.get_activities_since(after=after, limit=10)
+        self.assertEqual([(row['ts'], row['id']) for row in rows + rest], sorted(self.expected))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+"""
+活动写入队列的本地暂存与回放测试
+用假的 _run_write 代替 Neo4j：数据库故障时整批转存并降级，恢复后按批回放；
+数据或语句错误不降级，回放逐条定位问题事件，累计失败达到上限后移到死信表。不需要数据库服务：
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+# 必须在导入 config.settings 之前设置
+_tmpdir = tempfile.mkdtemp(prefix="glx_test_")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("EMBEDDED_DB_PATH", os.path.join(_tmpdir, "test.db"))
+
+from neo4j.exceptions import ServiceUnavailable
+
+from modules import activity_spool, activity_writer
+from modules.activity_writer import build_activity_event
+
+def tearDownModule():
+    shutil.rmtree(_tmpdir, ignore_errors=True)
+
+class FakeWriter:
+    """记录写入的事件 ID；error 为异常（或按事件返回异常的函数）时抛出"""
+
+    def __init__(self):
+        self.written = []
+        self.calls = 0
+        self.error = None
+
+    def __call__(self, events):
+        self.calls += 1
+        error = self.error
+        if callable(error):
+            error = next((error(e) for e in events if error(e) is not None), None)
+        if error is not None:
+            raise error
+        self.written.extend(e['id'] for e in events)
+        return 1.0
+
+class SpoolReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeWriter()
+        path = tempfile.mkdtemp(dir=_tmpdir)
+        self._patches = [
+            mock.patch.object(activity_spool, 'ACTIVITY_SPOOL_PATH', os.path.join(path, "spool.db")),
+            mock.patch.object(activity_spool, '_spool_conn', None),
+            mock.patch.object(activity_writer, '_run_write', self.fake),
+            mock.patch.object(activity_writer, 'is_available', lambda: True),
+            mock.patch.object(activity_writer, 'is_latency_degraded', lambda: False),
+            mock.patch.object(activity_writer, 'ACTIVITY_SPOOL_MAX_ATTEMPTS', 2),
+            mock.patch.object(activity_writer, '_degraded_until', 0.0),
+        ]
+        for patch in self._patches:
+            patch.start()
+
+    def tearDown(self):
+        if activity_spool._spool_conn is not None:
+            activity_spool._spool_conn.close()
+        for patch in reversed(self._patches):
+            patch.stop()
+
+    def _events(self, count):
+        return [build_activity_event(f"s{i:03d}", "查看案例", "案例库", content_id=f"c{i}") for i in range(count)]
+
+    def test_successful_batch(self):
+        events = self._events(3)
+        self.assertTrue(activity_writer._write_batch(events))
+        self.assertEqual(self.fake.written, [e['id'] for e in events])
+        self.assertEqual(activity_spool.spool_size(), 0)
+
+    def test_outage_spools_then_replays(self):
+        events = self._events(3)
+        self.fake.error = ServiceUnavailable("连接失败")
+        self.assertFalse(activity_writer._write_batch(events))
+        self.assertEqual(activity_spool.spool_size(), 3)
+        self.assertTrue(activity_writer.is_write_degraded())
+
+        # 降级冷却期内既不写入也不回放
+        calls = self.fake.calls
+        activity_writer._replay_spool()
+        self.assertEqual(self.fake.calls, calls)
+
+        activity_writer._degraded_until = 0.0
+        self.fake.error = None
+        activity_writer._replay_spool()
+        self.assertEqual(self.fake.written, [e['id'] for e in events])
+        self.assertEqual(activity_spool.spool_size(), 0)
+
+    def test_spool_is_idempotent(self):
+        events = self._events(2)
+        self.assertEqual(activity_spool.spool_events(events), 2)
+        self.assertEqual(activity_spool.spool_events(events), 0)
+        self.assertEqual(activity_spool.spool_size(), 2)
+
+    def test_data_error_does_not_degrade(self):
+        events = self._events(3)
+        poison = events[1]['id']
+        self.fake.error = lambda e: ValueError("无效的事件") if e['id'] == poison else None
+        self.assertFalse(activity_writer._write_batch(events))
+        self.assertFalse(activity_writer.is_write_degraded())
+        self.assertEqual(activity_spool.spool_size(), 3)
+
+        # 整批回放失败后逐条写入：正常事件确认删除，问题事件累计失败次数
+        activity_writer._replay_spool()
+        self.assertEqual(sorted(self.fake.written), sorted([events[0]['id'], events[2]['id']]))
+        self.assertEqual(activity_spool.spool_size(), 1)
+        self.assertEqual(activity_spool.dead_letter_size(), 0)
+
+        # 达到 ACTIVITY_SPOOL_MAX_ATTEMPTS 后移到死信表，不再阻塞回放
+        activity_writer._replay_spool()
+        self.assertEqual(activity_spool.spool_size(), 0)
+        self.assertEqual(activity_spool.dead_letter_size(), 1)
+        self.assertNotIn(poison, self.fake.written)
+
+    def test_outage_during_one_by_one_keeps_events(self):
+        events = self._events(2)
+        activity_spool.spool_events(events)
+        self.fake.error = ServiceUnavailable("连接失败")
+        with mock.patch.object(activity_writer, '_mark_degraded') as degraded:
+            rows = activity_spool.read_spooled(10)
+            activity_writer._replay_one_by_one(rows, ValueError("整批失败"))
+            degraded.assert_called_once()
+        self.assertEqual(activity_spool.spool_size(), 2)
+        self.assertEqual(activity_spool.dead_letter_size(), 0)
+
+    def test_paused_writes_are_spooled(self):
+        events = self._events(2)
+        with activity_writer.writes_paused():
+            self.assertFalse(activity_writer._write_batch(events))
+            activity_writer._replay_spool()
+        self.assertEqual(self.fake.calls, 0)
+        self.assertEqual(activity_spool.spool_size(), 2)
+
+        activity_writer._replay_spool()
+        self.assertEqual(sorted(self.fake.written), sorted(e['id'] for e in events))
+
+    def test_is_outage(self):
+        from modules.health import CircuitOpenError
+        from modules.pool import PoolTimeout
+
+        self.assertTrue(activity_writer.is_outage(ServiceUnavailable("down")))
+        self.assertTrue(activity_writer.is_outage(CircuitOpenError("open")))
+        self.assertTrue(activity_writer.is_outage(PoolTimeout("busy")))
+        self.assertFalse(activity_writer.is_outage(ValueError("bad data")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+"""
+查询网关测试：结果缓存的标签失效、并发相同查询的合并执行（single-flight）和熔断器状态切换
+只调用缓存、合并和健康监测的内部函数，不需要数据库服务：
+
+    python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+# 必须在导入 config.settings 之前设置
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("EMBEDDED_DB_PATH", os.path.join(tempfile.gettempdir(), "glx_test_gateway.db"))
+
+from neo4j.exceptions import ServiceUnavailable
+
+from modules import db, health, query_cache
+from modules.query_cache import (
+    TAG_ACTIVITY, TAG_STUDENT, bump_tags, cache_get, cache_put, make_key, tag_snapshot
+)
+
+class QueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        query_cache.clear_query_cache()
+
+    def test_hit_returns_copy(self):
+        key = make_key("test.cache.copy", "RETURN 1", {'x': 1})
+        cache_put(key, tag_snapshot((TAG_ACTIVITY,)), 60, [{'n': 1}])
+        records = cache_get(key, (TAG_ACTIVITY,))
+        self.assertEqual(records, [{'n': 1}])
+        records[0]['n'] = 2
+        self.assertEqual(cache_get(key, (TAG_ACTIVITY,)), [{'n': 1}])
+
+    def test_write_invalidates_tagged_entries(self):
+        activity_key = make_key("test.cache.activity", "RETURN 1", None)
+        student_key = make_key("test.cache.student", "RETURN 2", None)
+        cache_put(activity_key, tag_snapshot((TAG_ACTIVITY,)), 60, [{'n': 1}])
+        cache_put(student_key, tag_snapshot((TAG_STUDENT,)), 60, [{'n': 2}])
+        bump_tags(TAG_ACTIVITY)
+        self.assertIsNone(cache_get(activity_key, (TAG_ACTIVITY,)))
+        self.assertEqual(cache_get(student_key, (TAG_STUDENT,)), [{'n': 2}])
+
+    def test_write_during_query_discards_result(self):
+        key = make_key("test.cache.race", "RETURN 1", None)
+        versions = tag_snapshot((TAG_ACTIVITY,))
+        bump_tags(TAG_ACTIVITY)
+        cache_put(key, versions, 60, [{'n': 1}])
+        self.assertIsNone(cache_get(key, (TAG_ACTIVITY,)))
+
+    def test_freshness_bypass_and_expiry(self):
+        key = make_key("test.cache.fresh", "RETURN 1", None)
+        cache_put(key, tag_snapshot(()), 60, [{'n': 1}], fresh=3)
+        self.assertIsNone(cache_get(key, (), min_fresh=4))
+        self.assertEqual(cache_get(key, (), min_fresh=3), [{'n': 1}])
+        cache_put(key, tag_snapshot(()), -1, [{'n': 1}])
+        self.assertIsNone(cache_get(key, ()))
+
+    def test_parameters_change_key(self):
+        self.assertNotEqual(make_key("q", "RETURN $x", {'x': 1}), make_key("q", "RETURN $x", {'x': 2}))
+        self.assertEqual(make_key("q", "RETURN $x", {'x': 1, 'y': 2}), make_key("q", "RETURN $x", {'y': 2, 'x': 1}))
+
+class SingleFlightTest(unittest.TestCase):
+
+    def _run_concurrently(self, fetch, count=5):
+        results = [None] * count
+        errors = [None] * count
+        key = ("test.single_flight", time.monotonic())
+
+        def call(i):
+            try:
+                results[i] = db._single_flight("test.single_flight", key, fetch, 0)
+            except Exception as e:
+                errors[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return results, errors
+
+    def test_concurrent_calls_share_one_execution(self):
+        calls = []
+        release = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return [{'n': 1}]
+
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        results, errors = self._run_concurrently(fetch)
+        timer.cancel()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(errors, [None] * 5)
+        self.assertTrue(all(r == [{'n': 1}] for r in results))
+        # 每个调用方拿到独立的副本
+        results[0][0]['n'] = 2
+        self.assertEqual(results[1], [{'n': 1}])
+
+    def test_error_is_shared_and_not_reused(self):
+        release = threading.Event()
+
+        def fetch():
+            release.wait(5)
+            raise ValueError("查询失败")
+
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        _, errors = self._run_concurrently(fetch)
+        timer.cancel()
+        self.assertTrue(all(isinstance(e, ValueError) for e in errors))
+        self.assertEqual(db._single_flight("test.single_flight.retry", ("retry",), lambda: [{'n': 3}], 0),
+                         [{'n': 3}])
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._patches = [
+            mock.patch.object(health, 'HEALTH_FAILURE_THRESHOLD', 2),
+            mock.patch.object(health, '_reset_driver', lambda: None),
+        ]
+        for patch in self._patches:
+            patch.start()
+        with health._lock:
+            health._close()
+
+    def tearDown(self):
+        with health._lock:
+            health._close()
+        for patch in reversed(self._patches):
+            patch.stop()
+
+    def test_opens_after_threshold(self):
+        health.record_failure(ServiceUnavailable("连接失败"))
+        self.assertEqual(health.get_health()['state'], health.STATE_CLOSED)
+        health.record_failure(ServiceUnavailable("连接失败"))
+        self.assertEqual(health.get_health()['state'], health.STATE_OPEN)
+        self.assertFalse(health.allow_request())
+        self.assertFalse(health.is_available())
+
+    def test_success_resets_failure_count(self):
+        health.record_failure(ServiceUnavailable("连接失败"))
+        health.record_success()
+        health.record_failure(ServiceUnavailable("连接失败"))
+        self.assertEqual(health.get_health()['state'], health.STATE_CLOSED)
+
+    def test_non_connectivity_errors_ignored(self):
+        for _ in range(5):
+            health.record_failure(ValueError("语法错误"))
+            health.record_failure(health.CircuitOpenError("熔断中"))
+        self.assertEqual(health.get_health()['state'], health.STATE_CLOSED)
+
+    def test_probe_half_open_then_close(self):
+        health.record_failure(ServiceUnavailable("连接失败"))
+        health.record_failure(ServiceUnavailable("连接失败"))
+        with mock.patch.object(health, '_probe', return_value=5.0):
+            self.assertTrue(health.probe_now())
+        self.assertEqual(health.get_health()['state'], health.STATE_HALF_OPEN)
+        self.assertTrue(health.allow_request())
+        health.record_success()
+        self.assertEqual(health.get_health()['state'], health.STATE_CLOSED)
+
+    def test_half_open_failure_reopens_with_backoff(self):
+        health.record_failure(ServiceUnavailable("连接失败"))
+        health.record_failure(ServiceUnavailable("连接失败"))
+        backoff = health.get_health()['backoff_s']
+        with mock.patch.object(health, '_probe', return_value=5.0):
+            health.probe_now()
+        health.record_failure(ServiceUnavailable("连接失败"))
+        state = health.get_health()
+        self.assertEqual(state['state'], health.STATE_OPEN)
+        self.assertGreaterEqual(state['backoff_s'], backoff)
+
+    def test_failed_probe_opens_immediately(self):
+        with mock.patch.object(health, '_probe', side_effect=ServiceUnavailable("连接失败")):
+            self.assertFalse(health.probe_now())
+        self.assertEqual(health.get_health()['state'], health.STATE_OPEN)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+活动保留测试：保留期之前的活动按批移到冷归档并从图中删除（图用内存中的假实现代替），
+冷归档的计数函数、按学生删除，以及 query_activities 合并冷热数据（去重、排序、限制条数）。
+需要 pyarrow，不需要数据库服务：
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+# 必须在导入 config.settings 之前设置
+_tmpdir = tempfile.mkdtemp(prefix="glx_test_")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("EMBEDDED_DB_PATH", os.path.join(_tmpdir, "test.db"))
+
+import pandas as pd
+
+from modules import db, retention
+from modules.retention import DAY_MS
+
+def tearDownModule():
+    shutil.rmtree(_tmpdir, ignore_errors=True)
+
+def _row(i, student_id, module, ts):
+    return {
+        'element_id': f"e{i}", 'id': f"a{i}", 'student_id': student_id, 'student_name': student_id,
+        'module': module, 'activity_type': "查看案例", 'content_id': f"c{i}", 'content_name': f"案例{i}",
+        'details': None, 'ts': ts, 'day': pd.Timestamp(ts, unit='ms').strftime('%Y-%m-%d'),
+    }
+
+class FakeGraph:
+    """按 ts 升序返回早于截止时间的一批活动，删除语句按 element_id 移除"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def run_query(self, name, cypher, parameters=None, **kwargs):
+        return sorted((r for r in self.rows if r['ts'] < kwargs['cutoff_ms']),
+                      key=lambda r: r['ts'])[:kwargs['limit']]
+
+    def run_write(self, name, cypher, parameters=None, **kwargs):
+        removed = set(kwargs['element_ids'])
+        self.rows = [r for r in self.rows if r['element_id'] not in removed]
+
+    def stream_query(self, name, cypher, parameters=None, **kwargs):
+        params = parameters or {}
+        for r in sorted(self.rows, key=lambda r: -r['ts']):
+            if 'student_id' in params and r['student_id'] != params['student_id']:
+                continue
+            yield {k: v for k, v in r.items() if k not in ('element_id', 'day')}
+
+@unittest.skipUnless(retention.HAS_PYARROW, "需要 pyarrow")
+class RetentionTest(unittest.TestCase):
+
+    def setUp(self):
+        cold_dir = tempfile.mkdtemp(dir=_tmpdir)
+        today = retention.retention_cutoff_ms(0)
+        self.old = [_row(i, f"s{i % 2}", "案例库" if i % 3 else None, today - (40 + i) * DAY_MS) for i in range(7)]
+        self.recent = [_row(10 + i, f"s{i % 2}", "案例库", today - i * DAY_MS + 1000) for i in range(3)]
+        self.graph = FakeGraph(self.old + self.recent)
+        self._patches = [
+            mock.patch.object(retention, 'COLD_ARCHIVE_DIR', cold_dir),
+            mock.patch.object(retention, 'RETENTION_BATCH_SIZE', 3),
+            mock.patch.object(db, 'run_query', self.graph.run_query),
+            mock.patch.object(db, 'run_write', self.graph.run_write),
+            mock.patch.object(db, 'stream_query', self.graph.stream_query),
+        ]
+        for patch in self._patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in reversed(self._patches):
+            patch.stop()
+
+    def test_evict_moves_old_activities(self):
+        self.assertFalse(retention.cold_enabled())
+        self.assertEqual(retention.evict_activities(days=30, max_batches=1), 3)
+        self.assertEqual(retention.evict_activities(days=30), 4)
+        self.assertEqual(retention.evict_activities(days=30), 0)
+        self.assertEqual(sorted(r['id'] for r in self.graph.rows), sorted(r['id'] for r in self.recent))
+
+        cold = retention.read_cold()
+        self.assertEqual(sorted(cold.column('id').to_pylist()), sorted(r['id'] for r in self.old))
+        self.assertEqual(retention.read_cold(student_id="s0").num_rows, 4)
+        self.assertEqual(retention.cold_module_counts(), {"案例库": 4, '': 3})
+        daily = retention.cold_daily_counts()
+        self.assertEqual(sum(row['count'] for row in daily), 7)
+        self.assertEqual(retention.cold_sketch_students(student_id="s1").keys(),
+                         {(r['day'], r['module'] or '') for r in self.old if r['student_id'] == "s1"})
+
+    def test_eviction_disabled(self):
+        self.assertEqual(retention.evict_activities(days=0), 0)
+        self.assertEqual(len(self.graph.rows), 10)
+
+    def test_query_activities_union(self):
+        retention.evict_activities(days=30)
+        # 移出中途失败时同一活动可能同时在图和冷归档中
+        self.graph.rows.append(self.old[0])
+        combined = retention.query_activities()
+        self.assertEqual(len(combined), 10)
+        self.assertEqual(combined['id'].tolist()[:3], [r['id'] for r in self.recent])
+        self.assertTrue(combined['timestamp'].is_monotonic_decreasing)
+
+        limited = retention.query_activities(student_id="s1", limit=3)
+        expected = [r['id'] for r in sorted(self.recent + self.old, key=lambda r: -r['ts'])
+                    if r['student_id'] == "s1"][:3]
+        self.assertEqual(limited['id'].tolist(), expected)
+
+    def test_delete_cold_student(self):
+        retention.evict_activities(days=30)
+        self.assertEqual(retention.delete_cold_student("s0"), 4)
+        self.assertEqual(set(retention.read_cold().column('student_id').to_pylist()), {"s1"})
+        retention.clear_cold_archive()
+        self.assertFalse(retention.cold_enabled())
+
+if __name__ == "__main__":
+    unittest.main()
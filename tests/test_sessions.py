@@ -0,0 +1,78 @@
+"""
+学习会话切分测试：按不活跃间隔切分会话，会话时长、最长会话、各模块学习时长和缺少学号的活动。
+直接在构造的活动快照上调用 sessionize，不需要数据库服务：
+
+    python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# 必须在导入 config.settings 之前设置
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("EMBEDDED_DB_PATH", os.path.join(tempfile.gettempdir(), "glx_test_sessions.db"))
+
+from modules import sessions
+
+MINUTE_MS = 60 * 1000
+START_MS = 1735698600000
+
+def _frame(rows):
+    """rows: [(学号, 模块, 距 START_MS 的分钟数)]，顺序故意打乱"""
+    return pd.DataFrame({
+        'student_id': [r[0] for r in rows],
+        'module': pd.Categorical([r[1] for r in rows]),
+        'ts': [START_MS + r[2] * MINUTE_MS for r in rows],
+    })
+
+class SessionizeTest(unittest.TestCase):
+
+    def setUp(self):
+        for name, value in (('SESSION_GAP_S', 1800), ('SESSION_TAIL_S', 60)):
+            patch = mock.patch.object(sessions, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_split_on_gap(self):
+        result = sessions.sessionize(_frame([
+            ("s1", "案例库", 10),
+            ("s1", "案例库", 0),
+            ("s1", "知识图谱", 5),
+            ("s1", "案例库", 100),     # 间隔 90 分钟，开始新会话
+            ("s1", "案例库", 130),     # 间隔正好 30 分钟，不切分
+        ]))
+        self.assertEqual(len(result), 1)
+        row = result[0]
+        self.assertEqual(row['session_count'], 2)
+        # 第一个会话 0→5→10 分钟加尾部 1 分钟；第二个 100→130 分钟加尾部 1 分钟
+        self.assertEqual(row['total_seconds'], 11 * 60 + 31 * 60)
+        self.assertEqual(row['longest_seconds'], 31 * 60)
+        self.assertEqual(row['avg_seconds'], 21 * 60)
+        self.assertEqual(row['event_count'], 5)
+        self.assertEqual(row['last_session_at'], START_MS + 100 * MINUTE_MS)
+        self.assertEqual(row['last_activity_ms'], START_MS + 130 * MINUTE_MS)
+        self.assertEqual(row['module_seconds'], {"案例库": 5 * 60 + 60 + 30 * 60 + 60, "知识图谱": 5 * 60})
+
+    def test_students_are_independent(self):
+        result = {r['student_id']: r for r in sessions.sessionize(_frame([
+            ("s1", "案例库", 0),
+            ("s2", "案例库", 1),
+            ("s1", "案例库", 2),
+            ("s2", None, 3),
+            (None, "案例库", 4),
+        ]))}
+        self.assertEqual(set(result), {"s1", "s2"})
+        self.assertEqual(result["s1"]['total_seconds'], 2 * 60 + 60)
+        self.assertEqual(result["s2"]['session_count'], 1)
+        self.assertEqual(result["s2"]['module_seconds'], {"案例库": 2 * 60, '': 60})
+
+    def test_empty(self):
+        self.assertEqual(sessions.sessionize(_frame([])), [])
+        self.assertEqual(sessions.sessionize(_frame([(None, "案例库", 0)])), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+去重计数草图（HyperLogLog）测试：寄存器合并、估算误差、稀疏更新与完整草图一致，
+以及按 (日期, 模块) 分组生成写入参数。不需要数据库服务：
+
+    python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+# 必须在导入 config.settings 之前设置
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("EMBEDDED_DB_PATH", os.path.join(tempfile.gettempdir(), "glx_test_sketches.db"))
+
+from modules.activity_writer import build_activity_event
+from modules.sketches import REGISTERS, build_sketch, estimate, sketch_updates, sparse_registers
+
+def _ids(start, stop):
+    return [f"s{i:05d}" for i in range(start, stop)]
+
+class SketchTest(unittest.TestCase):
+
+    def test_empty_and_small(self):
+        self.assertEqual(estimate(build_sketch([])), 0)
+        self.assertEqual(estimate(build_sketch(["s1"])), 1)
+        self.assertEqual(estimate(build_sketch(["s1", "s1", "s2"])), 2)
+
+    def test_estimate_error(self):
+        for count in (100, 5000, 50000):
+            self.assertLess(abs(estimate(build_sketch(_ids(0, count))) - count) / count, 0.05, count)
+
+    def test_merge_is_union(self):
+        a = build_sketch(_ids(0, 3000))
+        b = build_sketch(_ids(2000, 5000))
+        merged = np.maximum(a, b)
+        np.testing.assert_array_equal(merged, build_sketch(_ids(0, 5000)))
+        np.testing.assert_array_equal(np.maximum(merged, a), merged)
+        self.assertLess(abs(estimate(merged) - 5000) / 5000, 0.05)
+
+    def test_sparse_matches_dense(self):
+        student_ids = _ids(0, 700) + _ids(0, 50)
+        indexes, ranks = sparse_registers(student_ids)
+        self.assertEqual(indexes, sorted(set(indexes)))
+        self.assertTrue(all(0 <= i < REGISTERS for i in indexes))
+        dense = np.zeros(REGISTERS, dtype=np.uint8)
+        dense[indexes] = ranks
+        np.testing.assert_array_equal(dense, build_sketch(student_ids))
+
+    def test_updates_grouped_by_day_and_module(self):
+        events = []
+        for student_id, module, timestamp in [
+            ("s1", "案例库", "2025-01-01T10:00:00+00:00"),
+            ("s2", "案例库", "2025-01-02T07:00:00+08:00"),     # UTC 仍是 1 日
+            ("s1", "知识图谱", "2025-01-01T11:00:00+00:00"),
+            ("s3", None, "2025-01-02T10:00:00+00:00"),
+            (None, "案例库", "2025-01-01T10:00:00+00:00"),     # 没有学号的不计入
+        ]:
+            event = build_activity_event(student_id, "查看案例", module)
+            event['timestamp'] = timestamp
+            events.append(event)
+        updates = {(u['day'], u['module_name']): u for u in sketch_updates(events)}
+        self.assertEqual(set(updates), {('2025-01-01', "案例库"), ('2025-01-01', "知识图谱"), ('2025-01-02', '')})
+        case = updates[('2025-01-01', "案例库")]
+        self.assertEqual((case['indexes'], case['ranks']), sparse_registers(["s1", "s2"]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+嵌入式存储端到端冒烟测试
+以 STORAGE_BACKEND=sqlite 和临时数据库文件运行：事件写入、各读接口，以及业务模块在嵌入式模式下
+经存储接口读取、不访问 Neo4j（查询网关直接拒绝且不计入熔断）。不需要数据库服务：
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+# 必须在导入 config.settings 之前设置
+_tmpdir = tempfile.mkdtemp(prefix="glx_test_")
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["EMBEDDED_DB_PATH"] = os.path.join(_tmpdir, "test.db")
+
+from modules import storage, storage_sqlite
+from modules.activity_writer import build_activity_event, build_login_event, build_reply_event
+
+def tearDownModule():
+    shutil.rmtree(_tmpdir, ignore_errors=True)
+
+class SqliteBackendTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        storage_sqlite.use_database(os.path.join(_tmpdir, "smoke.db"))
+        cls.store = storage.get_store()
+        now = datetime.now(timezone.utc)
+        events = [build_login_event("s001", "张三"), build_login_event("s002", "李四")]
+        for i, (student_id, module) in enumerate([
+            ("s001", "案例库"), ("s001", "案例库"), ("s001", "知识图谱"), ("s002", "案例库"),
+        ]):
+            event = build_activity_event(student_id, "查看案例", module, content_id=f"c{i}", content_name=f"案例{i % 2}")
+            event['timestamp'] = (now - timedelta(days=i)).isoformat()
+            events.append(event)
+        cls.events = events
+        cls.store.write_events(events)
+        cls.question_id = cls.store.create_question("什么是SWOT分析？")
+        cls.store.write_events([build_reply_event(cls.question_id, "张三", "优势、劣势、机会、威胁")])
+        storage_sqlite.import_knowledge_graph([{
+            'id': 'm1', 'name': '管理概论', 'chapters': [{
+                'id': 'c1', 'name': '第一章',
+                'knowledge': [{'id': 'k1', 'name': '计划'}, {'id': 'k2', 'name': '组织', 'prerequisites': ['k1']}],
+            }],
+        }])
+
+    def test_embedded_mode(self):
+        self.assertIs(storage.embedded_store(), storage_sqlite)
+        self.assertFalse(storage.neo4j_enabled())
+
+    def test_write_is_idempotent(self):
+        self.store.write_events(self.events)
+        self.assertEqual(self.store.get_activity_summary()['total_activities'], 4)
+
+    def test_students_and_activities(self):
+        students = {s['student_id']: s for s in self.store.get_all_students()}
+        self.assertEqual(students['s001']['name'], "张三")
+        self.assertEqual(students['s001']['activity_count'], 3)
+        summary = self.store.get_student_activity_summary("s001")
+        self.assertEqual(summary['total'], 3)
+        self.assertEqual(summary['active_days'], 3)
+
+        page, cursor = self.store.get_student_activities_page("s001", None, None, 2)
+        rest, _ = self.store.get_student_activities_page("s001", None, cursor, 2)
+        self.assertEqual(len(page) + len(rest), 3)
+
+    def test_module_statistics(self):
+        stats = {s['module']: s for s in self.store.get_module_statistics()}
+        self.assertEqual(stats["案例库"]['total_activities'], 3)
+        self.assertEqual(stats["案例库"]['unique_students'], 2)
+        single = self.store.get_single_module_statistics("案例库")
+        self.assertEqual(single['avg_visits_per_student'], 1.5)
+        usage = {u['module']: u['count'] for u in self.store.get_module_usage()}
+        self.assertEqual(usage, {"案例库": 3, "知识图谱": 1})
+
+    def test_leaderboards(self):
+        leaderboard = self.store.get_student_leaderboard(10)
+        self.assertEqual([r['student_id'] for r in leaderboard], ["s001", "s002"])
+        self.assertEqual(leaderboard[0]['active_days'], 3)
+        module = self.store.get_module_leaderboard("案例库", 10)
+        self.assertEqual(module[0], {'student_id': "s001", 'activity_count': 2})
+
+    def test_learning_profile(self):
+        profile = self.store.get_student_learning_profile("s001")
+        self.assertEqual(profile['info']['login_count'], 1)
+        self.assertEqual(sum(row['count'] for row in profile['time_distribution']), 3)
+        self.assertEqual(len(profile['recent_content']), 3)
+        self.assertIsNone(self.store.get_student_learning_profile("nobody"))
+
+    def test_classroom(self):
+        self.assertEqual(self.store.get_active_question()['id'], self.question_id)
+        self.assertEqual(len(self.store.get_recent_replies(self.question_id)), 1)
+        stats = self.store.get_classroom_interaction_stats()
+        self.assertEqual(stats['questions'][0]['reply_count'], 1)
+        self.assertEqual(stats['participation'][0]['student_id'], "s001")
+
+    def test_knowledge_graph(self):
+        self.assertEqual(self.store.count_knowledge_points(), 2)
+        graph = self.store.get_knowledge_graph_data('m1')
+        self.assertEqual({(r['k']['id'], (r['k2'] or {}).get('id')) for r in graph}, {('k1', None), ('k2', 'k1')})
+
+    def test_business_modules_skip_neo4j(self):
+        from modules import auth, health
+        from modules.db import run_query
+        from modules.health import Neo4jDisabled
+
+        self.assertIsNone(auth.get_neo4j_driver())
+        with self.assertRaises(Neo4jDisabled):
+            run_query("test.neo4j_disabled", "RETURN 1")
+        self.assertEqual(health.get_health()['state'], health.STATE_CLOSED)
+
+        self.assertEqual(auth.get_all_modules_statistics()["案例库"]['total_visits'], 3)
+        from modules import analytics
+        self.assertEqual(analytics.get_student_leaderboard(1)[0]['student_id'], "s001")
+        self.assertEqual(analytics.get_classroom_interaction_stats()['questions'][0]['reply_count'], 1)
+        # 只支持图数据库的模块在嵌入式模式下视为不可用
+        from modules.report_generator import check_neo4j_available
+        self.assertFalse(check_neo4j_available())
+
+    def test_delete_student(self):
+        storage_sqlite.use_database(os.path.join(_tmpdir, "delete.db"))
+        try:
+            self.store.write_events([build_login_event("s009", "王五"),
+                                     build_activity_event("s009", "查看案例", "案例库")])
+            self.store.delete_student_data("s009")
+            self.assertEqual(self.store.get_all_students(), [])
+        finally:
+            storage_sqlite.use_database(os.path.join(_tmpdir, "smoke.db"))
+
+if __name__ == "__main__":
+    unittest.main()
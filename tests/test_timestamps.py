@@ -0,0 +1,104 @@
+"""
+时间戳归一化测试：混合形态（旧版本字符串、驱动的 DateTime、原生 datetime、毫秒整数）的时间列
+转为规范字符串和毫秒时间戳，以及 Cypher 排序键 ts_ms_field 对各类时间字符串的分类。不需要数据库服务：
+
+    python -m unittest discover tests
+"""
+
+import os
+import re
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+# 必须在导入 config.settings 之前设置
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("EMBEDDED_DB_PATH", os.path.join(tempfile.gettempdir(), "glx_test_timestamps.db"))
+
+from neo4j.time import DateTime
+
+from modules import schema_migrations, timestamps
+from modules.timestamps import MISSING_MS, canonical_iso, day_buckets, format_times, in_range, to_epoch_ms
+
+# 2025-01-01T02:30:00Z
+MOMENT_MS = 1735698600000
+
+class TimestampTest(unittest.TestCase):
+
+    def setUp(self):
+        patch = mock.patch.object(timestamps, 'NAIVE_TIMESTAMP_TZ', '+00:00')
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_mixed_values_same_moment(self):
+        values = [
+            "2025-01-01T10:30:00+08:00",
+            "2025-01-01T10:30:00+0800",
+            "2025-01-01 02:30:00",
+            "2025-01-01T02:30:00.000000000Z",
+            datetime(2025, 1, 1, 2, 30, tzinfo=timezone.utc),
+            DateTime(2025, 1, 1, 10, 30, 0, tzinfo=timezone(timedelta(hours=8))),
+            MOMENT_MS,
+        ]
+        self.assertEqual(to_epoch_ms(values).tolist(), [MOMENT_MS] * len(values))
+
+    def test_canonical_iso(self):
+        self.assertEqual(canonical_iso([
+            "2025-01-01 10:30:00",
+            "2026-01-05T16:40:02.977000000+00:00",
+            "2025-01-01T10:30:00+0800",
+            "2025-01-01",
+            DateTime(2025, 1, 1, 10, 30, 0),
+        ]), [
+            "2025-01-01T10:30:00.000000+00:00",
+            "2026-01-05T16:40:02.977000+00:00",
+            "2025-01-01T10:30:00.000000+08:00",
+            "2025-01-01T00:00:00.000000+00:00",
+            "2025-01-01T10:30:00.000000+00:00",
+        ])
+
+    def test_naive_timezone_setting(self):
+        with mock.patch.object(timestamps, 'NAIVE_TIMESTAMP_TZ', '+08:00'):
+            self.assertEqual(canonical_iso(["2025-01-01 10:30"]), ["2025-01-01T10:30:00.000000+08:00"])
+            self.assertEqual(to_epoch_ms(["2025-01-01 10:30:00"]).tolist(), [MOMENT_MS])
+
+    def test_invalid_values(self):
+        values = [None, "garbage", "2025-13-01 00:00", ""]
+        self.assertEqual(canonical_iso(values), [None] * len(values))
+        self.assertEqual(to_epoch_ms(values).tolist(), [MISSING_MS] * len(values))
+        self.assertEqual(format_times(values), ['-'] * len(values))
+
+    def test_day_buckets_and_range(self):
+        values = ["2025-01-01T23:30:00+00:00", "2025-01-02T07:30:00+08:00", None]
+        self.assertEqual(day_buckets(values).astype(str).tolist(), ['2025-01-01', '2025-01-01', 'NaT'])
+        self.assertEqual(in_range(values, "2025-01-01T23:00:00+00:00", "2025-01-02").tolist(),
+                         [True, True, False])
+        self.assertEqual(in_range(values, end="2025-01-01T23:30:00+00:00").tolist(), [False, False, False])
+
+class SortKeyPatternTest(unittest.TestCase):
+    """ts_ms_field 中的正则写在 Cypher 字符串字面量里（反斜杠转义一次），这里还原后按整串匹配"""
+
+    @staticmethod
+    def _pattern(name):
+        return re.compile(getattr(schema_migrations, name).replace('\\\\', '\\'))
+
+    def test_zoned_and_naive_strings(self):
+        zoned = self._pattern('_ZONED_TS_PATTERN')
+        naive = self._pattern('_NAIVE_TS_PATTERN')
+        for text in ("2026-01-05T16:40:02.977000000+00:00", "2025-01-01T10:30:00Z",
+                     "2025-01-01 10:30:00+0800", "2025-01-01T10:30+08:00[Asia/Shanghai]"):
+            self.assertTrue(zoned.fullmatch(text), text)
+        for text in ("2025-01-01 10:30:00", "2025-01-01T10:30", "2025-01-01", "2025-01-01T10:30:00.123"):
+            self.assertFalse(zoned.fullmatch(text), text)
+            self.assertTrue(naive.fullmatch(text), text)
+        for text in ("garbage", "01/02/2025", ""):
+            self.assertFalse(zoned.fullmatch(text) or naive.fullmatch(text), text)
+
+    def test_field_expression(self):
+        field = schema_migrations.ts_ms_field('x')
+        self.assertTrue(field.startswith("COALESCE(x.ts_ms,"))
+        self.assertIn(str(schema_migrations.UNPARSED_TS_MS), field)
+
+if __name__ == "__main__":
+    unittest.main()